@@ -0,0 +1,6 @@
+"""
+ChatE2E 性能基准测试
+
+每个 bench_*.py 都是独立脚本，在项目根目录下运行:
+    python -m benchmarks.bench_login
+"""
@@ -0,0 +1,122 @@
+"""
+加密附件并发下载基准
+
+把一个指定大小的密文对象直接写入BlobStore，然后在进程内服务器上用C个并发客户端
+反复完整下载（file_wrapper路径）以及随机区间下载（Range + mmap路径），
+报告聚合吞吐与单次下载耗时的p50/p99。
+
+    python -m benchmarks.bench_blob_downloads --size-mb 256 --concurrency 1 4 16
+"""
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import requests
+
+import chate2e.server.app as server_app
+from benchmarks.common import base_parser, report, start_server, summarize
+from chate2e.server.blob_store import BlobStore
+
+MB = 1024 * 1024
+
+
+def prepare_blob(store: BlobStore, size: int) -> str:
+    upload_id = store.create_upload(size, "bench", ["bench_reader"])
+    block = os.urandom(MB)
+    offset = 0
+    while offset < size:
+        piece = block[:min(MB, size - offset)]
+        offset = store.write_chunk(upload_id, offset, io.BytesIO(piece))
+    return store.complete_upload(upload_id)
+
+
+def run(base_url: str, blob_id: str, size: int, concurrency: int, requests_per_client: int,
+        range_size: int) -> dict:
+    url = f"{base_url}/blobs/{blob_id}"
+
+    def full_download(http: requests.Session) -> int:
+        received = 0
+        with http.get(url, stream=True) as response:
+            for piece in response.iter_content(256 * 1024):
+                received += len(piece)
+        return received
+
+    def range_download(http: requests.Session) -> int:
+        start = random.randrange(0, max(1, size - range_size))
+        response = http.get(url, headers={'Range': f'bytes={start}-{start + range_size - 1}'})
+        return len(response.content)
+
+    results = {}
+    for mode, fetch in (('full', full_download), ('range', range_download)):
+        latencies = []
+        totals = []
+        lock = threading.Lock()
+
+        def client():
+            http = requests.Session()
+            local_latencies = []
+            received = 0
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                received += fetch(http)
+                local_latencies.append((time.perf_counter() - start) * 1000)
+            with lock:
+                latencies.extend(local_latencies)
+                totals.append(received)
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        total = sum(totals)
+        results[mode] = {
+            'requests': len(latencies),
+            'bytes_mb': total / MB,
+            'seconds': elapsed,
+            'aggregate_mb_per_sec': total / MB / elapsed if elapsed else 0.0,
+            'latency_ms': summarize(latencies),
+        }
+    return results
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=4, help='每个客户端的完整下载/区间下载次数')
+    parser.add_argument('--range-kb', type=int, default=1024)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="chate2e_bench_blob_")
+    store = BlobStore(os.path.join(work_dir, 'blobs'))
+    server_app.blob_store = store
+    size = args.size_mb * MB
+    blob_id = prepare_blob(store, size)
+
+    # 关闭werkzeug的逐请求访问日志，避免干扰输出
+    import logging
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    server, base_url = start_server()
+    try:
+        results = {
+            f"concurrency={concurrency}": run(base_url, blob_id, size, concurrency,
+                                              args.requests, args.range_kb * 1024)
+            for concurrency in args.concurrency
+        }
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    results['size_mb'] = args.size_mb
+    report('blob_downloads', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+消息压缩基准
+
+对几类典型消息（短聊天、长段落、粘贴的日志、代码块、JSON），分别在不压缩与各压缩算法下测量：
+  - wire_bytes:      消息序列化后（base64 JSON，服务器转发的内容）的字节数
+  - ciphertext_bytes: 密文字节数（含按配置策略的长度填充，见bench_padding）
+  - ratio:            wire_bytes 相对不压缩时的比例
+  - encrypt_us / decrypt_us: 协议层每条消息加密、解密的耗时（含压缩/解压）
+另外给出zlib在不使用与使用预置字典时压缩后的字节数（raw_zlib_nodict / raw_zlib_dict），用于衡量字典的作用。
+
+    python -m benchmarks.bench_compression
+    python -m benchmarks.bench_compression --iterations 5000
+"""
+import contextlib
+import json
+import os
+import time
+import zlib
+
+from benchmarks.common import base_parser, report
+from chate2e.crypto.compression import CHAT_DICTIONARY, ZLIB_CODEC, ZSTD_CODEC, zstandard
+from chate2e.crypto.padding import MessagePadding
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+
+SAMPLES = {
+    'short_chat': "好的，晚上七点老地方见",
+    # 与预置字典中的句子不同，避免高估字典的作用
+    'paragraph': ("周五的发布先推迟一天，测试环境里登录偶尔超时，我怀疑是数据库连接池太小。"
+                  "你那边方便的话把最近一小时的监控截图发我一下，我们下午一起过一遍，"
+                  "如果确认是连接池的问题，今晚改完配置明早再灰度。顺便提醒一下，"
+                  "周报记得在周四之前提交，项目经理要汇总给客户。"),
+    'pasted_log': "\n".join(
+        f"2024-05-01T12:00:{index:02d}.{index * 7 % 1000:03d}Z [ERROR] worker-{index % 4} "
+        f"request /api/messages/{index * 7919} failed: KeyError: 'user_id'"
+        for index in range(60)
+    ),
+    'code_block': "```python\n" + "\n".join(
+        f"def handler_{index}(self, message):\n"
+        f"    if not message.get('session_id'):\n"
+        f"        return None\n"
+        f"    print(f\"[Client] message {{message['id']}} from {{message['sender']}}\")\n"
+        f"    return self.dispatch(message, retries={index})\n"
+        for index in range(12)
+    ) + "```\n",
+    'json_blob': json.dumps([{'id': index, 'status': 'ok' if index % 3 else 'error',
+                              'timestamp': 1714564800 + index, 'data': None}
+                             for index in range(80)]),
+}
+
+
+def session_pair(codec):
+    alice, bob = SignalProtocol(), SignalProtocol()
+    alice.initialize_identity("alice")
+    bob.initialize_identity("bob")
+    alice.initiate_session(
+        peer_id="bob", session_id="bench",
+        recipient_identity_key=bob.identity_key_pub,
+        recipient_signed_prekey=bob.signed_prekey_pub,
+        recipient_one_time_prekey=bob.one_time_prekeys_pub[0],
+        is_initiator=True,
+        peer_codecs=bob.codecs
+    )
+    bob.initiate_session(
+        peer_id="alice", session_id="bench",
+        recipient_identity_key=alice.identity_key_pub,
+        recipient_signed_prekey=alice.signed_prekey_pub,
+        recipient_ephemeral_key=alice.ephemeral_key_pub,
+        own_one_time_prekey=bob.one_time_prekeys_pub[0],
+        is_initiator=False,
+        peer_codecs=alice.codecs
+    )
+    alice.send_codec = codec
+    # 与实际会话一样按配置的策略填充
+    alice.send_padding = MessagePadding.negotiate(alice.padding.policy, bob.codecs)
+    return alice, bob
+
+
+def measure(text: str, codec, iterations: int) -> dict:
+    alice, bob = session_pair(codec)
+    message = alice.encrypt_message(text)
+    wire_bytes = len(message.serialize().encode('utf-8'))
+    ciphertext_bytes = len(message.encrypted_content)
+    assert bob.decrypt_message(message) == text
+
+    messages = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        messages.append(alice.encrypt_message(text))
+    encrypt_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for message in messages:
+        bob.decrypt_message(message)
+    decrypt_seconds = time.perf_counter() - start
+    return {
+        'codec_used': message.encryption.codec,
+        'wire_bytes': wire_bytes,
+        'ciphertext_bytes': ciphertext_bytes,
+        'encrypt_us': encrypt_seconds / iterations * 1e6,
+        'decrypt_us': decrypt_seconds / iterations * 1e6,
+    }
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    codecs = {'none': None, 'zlib': ZLIB_CODEC}
+    if zstandard is not None:
+        codecs['zstd'] = ZSTD_CODEC
+
+    results = {}
+    # 协议实现逐条打印调试信息（各算法下开销相同），输出丢弃
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for kind, text in SAMPLES.items():
+            data = text.encode('utf-8')
+            dictionary = zlib.compressobj(zdict=CHAT_DICTIONARY)
+            row = {
+                'plaintext_bytes': len(data),
+                'raw_zlib_nodict': len(zlib.compress(data, 6)),
+                'raw_zlib_dict': len(dictionary.compress(data) + dictionary.flush()),
+            }
+            for name, codec in codecs.items():
+                row[name] = measure(text, codec, args.iterations)
+            for name in codecs:
+                row[name]['ratio'] = row[name]['wire_bytes'] / row['none']['wire_bytes']
+            results[kind] = row
+    report('compression', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+密码学原语微基准
+
+逐项测量每次操作的耗时（微秒）：
+  - keygen.*    X25519/Ed25519密钥生成，完整身份初始化（含签名预密钥与一次性预密钥）
+  - x3dh.*      四次DH + HKDF 的原始计算，以及 SignalProtocol.initiate_session 发起方/响应方
+  - ratchet.*   DoubleRatchet 根链与发送链的一步，CryptoHelper.hkdf
+  - aead.*      AES-GCM 加密/解密，按负载大小分别测量
+  - message.*   Message 的 to_dict/from_dict 与 serialize/deserialize 往返，服务器转发用的MessageView，协议层加密+解密往返
+
+每项先校准循环次数使单轮耗时不少于 --min-time，再重复 --repeat 轮，取最快一轮的每次耗时（噪声最小）。
+结果可保存为基线（--save-baseline），之后的运行与基线比较，
+慢于基线超过 --threshold 的项标记为回退，配合 --fail-on-regression 以非零状态码退出。
+基线与机器相关，更换机器后应重新保存。
+
+    python -m benchmarks.bench_crypto
+    python -m benchmarks.bench_crypto --filter aead --save-baseline
+    python -m benchmarks.bench_crypto --threshold 0.2 --fail-on-regression
+"""
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.common import base_parser, report
+from chate2e.crypto.crypto_helper import CryptoHelper
+from chate2e.crypto.protocol.ratchet import DoubleRatchet
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+from chate2e.model.message import Message, MessageView
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'crypto.json')
+AEAD_SIZES = [64, 1024, 16 * 1024, 256 * 1024, 1024 * 1024]
+
+
+def identity(user_id: str) -> SignalProtocol:
+    protocol = SignalProtocol()
+    protocol.initialize_identity(user_id)
+    return protocol
+
+
+def keygen_cases(helper: CryptoHelper) -> List[Tuple[str, Callable[[], object]]]:
+    return [
+        ('keygen.x25519', helper.generate_priv_x25519_keypair),
+        ('keygen.ed25519', helper.generate_ed25519_keypair),
+        ('keygen.identity', lambda: identity("bench")),
+    ]
+
+
+def x3dh_cases(helper: CryptoHelper) -> List[Tuple[str, Callable[[], object]]]:
+    alice, bob = identity("alice"), identity("bob")
+    one_time_key, one_time_key_pub = bob.one_time_prekeys[0]
+    ephemeral = helper.generate_priv_x25519_keypair()
+
+    def raw_x3dh():
+        shared = (helper.ecdh(alice.identity_key, bob.signed_prekey_pub)
+                  + helper.ecdh(ephemeral, bob.identity_key_pub)
+                  + helper.ecdh(ephemeral, bob.signed_prekey_pub)
+                  + helper.ecdh(ephemeral, one_time_key_pub))
+        return helper.hkdf(shared, 32, info=b"root_key")
+
+    def initiator():
+        return alice.initiate_session(
+            peer_id="bob", session_id="bench",
+            recipient_identity_key=bob.identity_key_pub,
+            recipient_signed_prekey=bob.signed_prekey_pub,
+            recipient_one_time_prekey=one_time_key_pub,
+            is_initiator=True,
+            peer_codecs=bob.codecs
+        )
+
+    def responder():
+        bob.initiate_session(
+            peer_id="alice", session_id="bench",
+            recipient_identity_key=alice.identity_key_pub,
+            recipient_signed_prekey=alice.signed_prekey_pub,
+            recipient_ephemeral_key=ephemeral.public_key(),
+            own_one_time_prekey=one_time_key_pub,
+            is_initiator=False,
+            peer_codecs=alice.codecs
+        )
+        # 响应方用过的一次性预密钥会被删除，放回去以便下一次迭代同样计算DH4
+        bob.one_time_prekeys.insert(0, (one_time_key, one_time_key_pub))
+        bob.one_time_prekeys_pub.insert(0, one_time_key_pub)
+
+    return [
+        ('x3dh.raw_4dh_hkdf', raw_x3dh),
+        ('x3dh.initiate_session.initiator', initiator),
+        ('x3dh.initiate_session.responder', responder),
+    ]
+
+
+def ratchet_cases(helper: CryptoHelper) -> List[Tuple[str, Callable[[], object]]]:
+    ratchet = DoubleRatchet()
+    chain_key = helper.get_random_bytes(32)
+    root_key = helper.get_random_bytes(32)
+    return [
+        ('ratchet.hkdf_32', lambda: helper.hkdf(chain_key, 32, info=b"message_key")),
+        ('ratchet.sending_step', lambda: ratchet.sending_ratchet(chain_key)),
+        ('ratchet.root_step', lambda: ratchet.root_ratchet(chain_key, root_key)),
+    ]
+
+
+def aead_cases(helper: CryptoHelper) -> List[Tuple[str, Callable[[], object]]]:
+    key = helper.get_random_bytes(32)
+    iv = helper.get_random_bytes(12)
+    cases = []
+    for size in AEAD_SIZES:
+        data = os.urandom(size)
+        ciphertext, tag = helper.encrypt_aes_gcm(key, data, iv)
+        cases.append((f'aead.encrypt.{size}', lambda data=data: helper.encrypt_aes_gcm(key, data, iv)))
+        cases.append((f'aead.decrypt.{size}',
+                      lambda ciphertext=ciphertext, tag=tag: helper.decrypt_aes_gcm(key, ciphertext, iv, tag)))
+    return cases
+
+
+def message_cases() -> List[Tuple[str, Callable[[], object]]]:
+    alice, bob = identity("alice"), identity("bob")
+    init = alice.initiate_session(
+        peer_id="bob", session_id="bench",
+        recipient_identity_key=bob.identity_key_pub,
+        recipient_signed_prekey=bob.signed_prekey_pub,
+        recipient_one_time_prekey=bob.one_time_prekeys_pub[0],
+        is_initiator=True,
+        peer_codecs=bob.codecs
+    )
+    bob.initiate_session(
+        peer_id="alice", session_id="bench",
+        recipient_identity_key=alice.identity_key_pub,
+        recipient_signed_prekey=alice.signed_prekey_pub,
+        recipient_ephemeral_key=alice.ephemeral_key_pub,
+        own_one_time_prekey=bob.one_time_prekeys_pub[0],
+        is_initiator=False,
+        peer_codecs=alice.codecs
+    )
+    message = alice.encrypt_message("今晚七点老地方见" * 8)
+    bob.decrypt_message(message)  # 保持双方链同步，供加密+解密往返使用
+    as_dict, as_json = message.to_dict(), message.serialize()
+    init_json = init.serialize()
+    return [
+        ('message.to_dict', message.to_dict),
+        ('message.from_dict', lambda: Message.from_dict(as_dict)),
+        ('message.view_from_dict', lambda: MessageView.from_dict(as_dict)),
+        ('message.serialize_roundtrip', lambda: Message.deserialize(message.serialize())),
+        ('message.deserialize', lambda: Message.deserialize(as_json)),
+        ('message.initiate_roundtrip', lambda: Message.deserialize(init_json).serialize()),
+        ('message.encrypt_decrypt', lambda: bob.decrypt_message(alice.encrypt_message("今晚七点老地方见"))),
+    ]
+
+
+def measure(op: Callable[[], object], min_time: float, repeat: int) -> Dict[str, float]:
+    """校准循环次数后重复测量，返回每次操作的耗时（微秒）"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number = max(number * 2, int(number * min_time / elapsed) + 1) if elapsed else number * 10
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+    timings.sort()
+    return {
+        'us_per_op': timings[0],
+        'median_us': timings[len(timings) // 2],
+        'ops_per_sec': 1e6 / timings[0] if timings[0] else 0.0,
+        'loops': number,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """与基线比较，在结果中写入比值，返回回退的项"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get('us_per_op'):
+            continue
+        ratio = result['us_per_op'] / base['us_per_op']
+        result['baseline_us'] = base['us_per_op']
+        result['ratio'] = ratio
+        if ratio > 1 + threshold:
+            result['regression'] = True
+            regressions.append(f"{name}: {base['us_per_op']:.2f}us -> {result['us_per_op']:.2f}us (x{ratio:.2f})")
+    return regressions
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--filter', nargs='+', help='只运行名称包含这些字符串的项')
+    parser.add_argument('--min-time', type=float, default=0.1, help='每轮最短耗时（秒）')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线文件')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果写入基线（与已有基线合并）')
+    parser.add_argument('--threshold', type=float, default=0.25, help='慢于基线的比例超过该值视为回退')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    helper = CryptoHelper()
+    results: Dict[str, dict] = {}
+    # 协议实现会打印调试信息（这部分开销计入协议层各项），输出丢弃
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        cases = (keygen_cases(helper) + x3dh_cases(helper) + ratchet_cases(helper)
+                 + aead_cases(helper) + message_cases())
+        for name, op in cases:
+            if args.filter and not any(pattern in name for pattern in args.filter):
+                continue
+            results[name] = measure(op, args.min_time, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    report('crypto', results, args.output)
+
+    if args.save_baseline:
+        baseline.update({name: {'us_per_op': result['us_per_op']} for name, result in results.items()})
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(dict(sorted(baseline.items())), f, indent=2)
+            f.write('\n')
+        print(f"基线已保存: {args.baseline}", file=sys.stderr)
+    if regressions:
+        print("性能回退:\n" + "\n".join(regressions), file=sys.stderr)
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+流式加密文件传输基准
+
+生成一个指定大小的随机文件，分别测量：
+  - 仅分块加密（不经网络）的吞吐
+  - 经进程内服务器的加密上传吞吐
+  - 流式下载并解密的吞吐
+以及整个过程中进程RSS峰值的增长（客户端与服务器在同一进程内），
+用于验证内存占用与文件大小无关。
+
+    python -m benchmarks.bench_file_transfer --size-mb 1024 --chunk-kb 1024
+"""
+import contextlib
+import io
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import chate2e.server.app as server_app
+from benchmarks.common import base_parser, report, start_server
+from chate2e.client.file_transfer import FileTransfer
+from chate2e.crypto.file_cipher import FileCipher
+from chate2e.server.blob_store import BlobStore
+from chate2e.server.user import User
+
+MB = 1024 * 1024
+
+
+def peak_rss_mb() -> float:
+    """进程生命周期内的RSS峰值（Linux下ru_maxrss单位为KB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_random_file(path: str, size: int):
+    block = os.urandom(MB)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:min(MB, remaining)])
+            remaining -= MB
+
+
+def throughput(size: int, seconds: float) -> float:
+    return size / MB / seconds if seconds else 0.0
+
+
+def run(base_url: str, work_dir: str, size: int, chunk_size: int) -> dict:
+    source = os.path.join(work_dir, 'source.bin')
+    target = os.path.join(work_dir, 'received.bin')
+    write_random_file(source, size)
+    rss_before = peak_rss_mb()
+
+    # 仅加密
+    cipher = FileCipher.generate(chunk_size)
+    start = time.perf_counter()
+    with open(source, 'rb') as f:
+        for _ in cipher.encrypt_stream(f, size):
+            pass
+    encrypt_seconds = time.perf_counter() - start
+
+    transfer = FileTransfer(base_url, chunk_size=chunk_size)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        descriptor = transfer.upload_file(source, "bench_uploader")
+        upload_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        received = transfer.download_file(descriptor, target)
+        download_seconds = time.perf_counter() - start
+
+    assert received == size
+    return {
+        'size_mb': size / MB,
+        'chunk_kb': chunk_size // 1024,
+        'encrypted_size_mb': descriptor['encrypted_size'] / MB,
+        'encrypt_only_mb_per_sec': throughput(size, encrypt_seconds),
+        'upload_mb_per_sec': throughput(size, upload_seconds),
+        'download_mb_per_sec': throughput(size, download_seconds),
+        'upload_seconds': upload_seconds,
+        'download_seconds': download_seconds,
+        'peak_rss_before_mb': rss_before,
+        'peak_rss_after_mb': peak_rss_mb(),
+        'peak_rss_growth_mb': peak_rss_mb() - rss_before,
+    }
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--size-mb', type=int, default=1024)
+    parser.add_argument('--chunk-kb', type=int, nargs='+', default=[1024])
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="chate2e_bench_file_")
+    server_app.blob_store = BlobStore(os.path.join(work_dir, 'blobs'))
+    server_app.chat_server.users["bench_uploader"] = User("bench_uploader", "bench_uploader")
+    server, base_url = start_server()
+    try:
+        results = {}
+        for chunk_kb in args.chunk_kb:
+            run_dir = os.path.join(work_dir, f"chunk_{chunk_kb}")
+            os.makedirs(run_dir)
+            results[f"chunk_kb={chunk_kb}"] = run(base_url, run_dir, args.size_mb * MB, chunk_kb * 1024)
+            shutil.rmtree(run_dir, ignore_errors=True)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    report('file_transfer', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
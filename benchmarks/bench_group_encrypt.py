@@ -0,0 +1,88 @@
+"""
+群消息加密开销基准：两两会话逐个加密 vs 发送者密钥加密一次
+
+对每个群组大小N，发送方与其余N-1个成员各建立一个双棘轮会话，
+比较发送一条群消息时：
+  - pairwise: 对N-1个会话分别加密并序列化（O(N)）
+  - sender_key: 用发送者密钥加密并序列化一次，由服务器扇出（O(1)）
+以及发送者密钥经两两会话分发一次的开销。
+
+    python -m benchmarks.bench_group_encrypt --sizes 2 8 32 128 512 --rounds 50
+"""
+import contextlib
+import io
+import time
+
+from benchmarks.common import base_parser, report, summarize
+from chate2e.crypto.protocol.sender_key import GroupCipher, encode_sender_key_message
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+
+TEXT = "今晚七点老地方见，记得带上周讨论的那份文档。"
+
+
+def pairwise_sessions(count: int):
+    """建立发送方到count个成员的双棘轮会话（只保留发送方一侧）"""
+    sessions = []
+    for index in range(count):
+        peer = SignalProtocol()
+        peer.initialize_identity(f"member{index}")
+        sender = SignalProtocol()
+        sender.initialize_identity("sender")
+        sender.initiate_session(
+            peer_id=f"member{index}",
+            session_id=f"s{index}",
+            recipient_identity_key=peer.identity_key_pub,
+            recipient_signed_prekey=peer.signed_prekey_pub,
+            recipient_one_time_prekey=peer.one_time_prekeys_pub[0],
+            is_initiator=True
+        )
+        sessions.append(sender)
+    return sessions
+
+
+def run(size: int, rounds: int) -> dict:
+    # 协议实现会打印调试信息，计时期间丢弃
+    with contextlib.redirect_stdout(io.StringIO()):
+        sessions = pairwise_sessions(size - 1)
+        group_cipher = GroupCipher()
+
+        start = time.perf_counter()
+        plaintext = encode_sender_key_message(group_cipher.get_distribution("group", "sender"))
+        for session in sessions:
+            session.encrypt_message(plaintext).serialize()
+        distribution_ms = (time.perf_counter() - start) * 1000
+
+        pairwise, sender_key = [], []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for session in sessions:
+                session.encrypt_message(TEXT).serialize()
+            pairwise.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            group_cipher.encrypt("group", "sender", TEXT).serialize()
+            sender_key.append((time.perf_counter() - start) * 1000)
+
+    pairwise_summary = summarize(pairwise)
+    sender_key_summary = summarize(sender_key)
+    return {
+        'members': size,
+        'pairwise_ms': pairwise_summary,
+        'sender_key_ms': sender_key_summary,
+        'speedup_p50': pairwise_summary['p50'] / sender_key_summary['p50'] if sender_key_summary['p50'] else 0.0,
+        'sender_key_distribution_ms': distribution_ms,
+    }
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2, 8, 32, 128, 512])
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    results = {f"members={size}": run(size, args.rounds) for size in args.sizes}
+    report('group_encrypt', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
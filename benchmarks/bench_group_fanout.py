@@ -0,0 +1,112 @@
+"""
+群消息扇出延迟基准
+
+在真实的python-socketio服务器（threading模式）中注册N个连接，
+只把最终的传输写出替换为内存计数，测量一条群消息扇出给全部成员的耗时：
+  - per_socket: 逐个连接emit（每次emit都重新编码数据包）
+  - engine: FanoutEngine，负载构造一次，按批emit(to=[...])，每批只编码一次
+部分成员离线（--offline-ratio），由引擎返回给调用方写入离线队列。
+
+    python -m benchmarks.bench_group_fanout --sizes 10 100 1000 --rounds 200
+"""
+import contextlib
+import io
+import random
+import time
+
+import socketio
+
+from benchmarks.common import base_parser, report, summarize
+from chate2e.crypto.protocol.sender_key import GroupCipher
+from chate2e.server.fanout import FanoutEngine
+
+NAMESPACE = '/'
+
+
+def make_server():
+    """只替换传输写出的Socket.IO服务器，返回(server, 已发送包计数)"""
+    server = socketio.Server(async_mode='threading')
+    sent = [0]
+
+    def send_eio_packet(eio_sid, eio_pkt):
+        sent[0] += 1
+
+    server._send_eio_packet = send_eio_packet
+    return server, sent
+
+
+def register_members(server, size: int, offline_ratio: float):
+    """注册成员连接，返回 user_id -> [sid]（离线成员没有连接）"""
+    sockets = {}
+    offline = set(random.sample(range(size), int(size * offline_ratio)))
+    for index in range(size):
+        user_id = f"member{index}"
+        if index in offline:
+            sockets[user_id] = []
+            continue
+        sid = server.manager.connect(f"eio{index}", NAMESPACE)
+        sockets[user_id] = [sid]
+    return sockets
+
+
+def run(size: int, rounds: int, offline_ratio: float, workers: int, batch_size: int) -> dict:
+    server, sent = make_server()
+    sockets = register_members(server, size, offline_ratio)
+    members = list(sockets)
+
+    cipher = GroupCipher()
+    with contextlib.redirect_stdout(io.StringIO()):
+        message = cipher.encrypt("group", "member0", "群消息基准" * 20)
+
+    engine = FanoutEngine(
+        sockets_of=lambda user_id: sockets.get(user_id, []),
+        emit=lambda event, payload, socket_ids: server.emit(event, payload, to=socket_ids, namespace=NAMESPACE),
+        workers=workers,
+        batch_size=batch_size
+    )
+
+    per_socket, batched = [], []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for member_id in members:
+            if member_id == "member0":
+                continue
+            for sid in sockets[member_id]:
+                server.emit('new_message', message.to_dict(), to=sid, namespace=NAMESPACE)
+        per_socket.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        engine.fanout('new_message', message.to_dict(), members, exclude="member0")
+        batched.append((time.perf_counter() - start) * 1000)
+
+    engine.shutdown()
+    online = sum(1 for ids in sockets.values() if ids)
+    return {
+        'members': size,
+        'online_sockets': online,
+        'packets_sent': sent[0],
+        'per_socket_ms': summarize(per_socket),
+        'engine_ms': summarize(batched),
+        'engine_stats': engine.stats(),
+    }
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--offline-ratio', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=FanoutEngine.BATCH_SIZE)
+    args = parser.parse_args()
+
+    random.seed(0)
+    results = {
+        f"members={size}": run(size, args.rounds, args.offline_ratio, args.workers, args.batch_size)
+        for size in args.sizes
+    }
+    report('group_fanout', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+JSON后端基准
+
+对比可用的JSON后端（orjson / msgspec / 标准库）与改动前的写法（json.dump带缩进），测量：
+  - users:     服务器users.json（N个用户，每个用户带Bundle与20个一次性预密钥）的写入/读取耗时
+  - sessions:  客户端chat_sessions.json（N条明文消息，分布在50个会话中）的写入/读取/解码为ChatSession的耗时
+  - message:   单条消息Message.serialize / Message.deserialize 的耗时
+
+    python -m benchmarks.bench_json_backend
+    python -m benchmarks.bench_json_backend --users 1000 10000 --messages 10000 100000
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from base64 import b64encode
+
+from benchmarks.common import base_parser, report
+from chate2e.client.models import ChatSession
+from chate2e.model.bundle import Bundle
+from chate2e.model.message import Encryption, Message, MessageType
+from chate2e.utils import serialization
+from chate2e.utils.serialization import create_backend
+
+
+class LegacyBackend(serialization.StdlibBackend):
+    """改动前的写法：标准库json、缩进输出"""
+    name = 'legacy'
+
+    def dumps(self, obj, pretty=False):
+        return json.dumps(obj, indent=4, ensure_ascii=False).encode('utf-8')
+
+
+def available_backends() -> list:
+    names = ['stdlib'] + [name for name, module in (('orjson', serialization.orjson),
+                                                    ('msgspec', serialization.msgspec)) if module]
+    return [LegacyBackend()] + [create_backend(name) for name in names]
+
+
+def make_users(count: int) -> dict:
+    bundle = Bundle(os.urandom(32), os.urandom(32), os.urandom(64),
+                    [os.urandom(32) for _ in range(20)]).to_dict()
+    return {'users': [{
+        'username': f"user{index:06d}",
+        'uuid': f"{index:08x}",
+        'bundle': bundle,
+        'used_pre_keys': [b64encode(os.urandom(32)).decode() for _ in range(5)],
+        'devices': [],
+        'is_online': False,
+    } for index in range(count)]}
+
+
+def make_sessions(count: int, sessions: int = 50) -> list:
+    chats = [ChatSession(participant1_id="owner", participant2_id=f"friend{index:03d}")
+             for index in range(sessions)]
+    for index in range(count):
+        session = chats[index % sessions]
+        session.messages.append(Message(
+            message_id=Message.generate_id(),
+            sender_id="owner",
+            session_id=session.session_id,
+            receiver_id=session.participant2_id,
+            encrypted_content=("你好，这是第 %d 条消息" % index).encode('utf-8'),
+            message_type=MessageType.MESSAGE,
+            encryption=None
+        ))
+    return [session.to_dict() for session in chats]
+
+
+def time_file(backend, path: str, obj, decode_cls=None) -> dict:
+    previous = serialization.set_backend(backend)
+    try:
+        start = time.perf_counter()
+        serialization.dump_file(path, obj)
+        dump_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        serialization.load_file(path)
+        load_seconds = time.perf_counter() - start
+
+        result = {
+            'file_mb': os.path.getsize(path) / (1024 * 1024),
+            'dump_ms': dump_seconds * 1000,
+            'load_ms': load_seconds * 1000,
+        }
+        if decode_cls is not None:
+            with open(path, 'rb') as f:
+                data = f.read()
+            start = time.perf_counter()
+            serialization.decode_list(data, decode_cls)
+            result['decode_models_ms'] = (time.perf_counter() - start) * 1000
+        return result
+    finally:
+        serialization.set_backend(previous)
+
+
+def time_message(backend, iterations: int) -> dict:
+    message = Message(
+        message_id=Message.generate_id(),
+        sender_id="alice",
+        session_id=Message.generate_id(),
+        receiver_id="bob",
+        encrypted_content=os.urandom(256),
+        message_type=MessageType.MESSAGE,
+        encryption=Encryption("AES-GCM", os.urandom(12), os.urandom(16), True)
+    )
+    previous = serialization.set_backend(backend)
+    try:
+        text = message.serialize()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            message.serialize()
+        serialize_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(iterations):
+            Message.deserialize(text)
+        deserialize_seconds = time.perf_counter() - start
+    finally:
+        serialization.set_backend(previous)
+    return {
+        'serialize_us': serialize_seconds / iterations * 1e6,
+        'deserialize_us': deserialize_seconds / iterations * 1e6,
+    }
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--users', type=int, nargs='+', default=[100, 1000, 10_000])
+    parser.add_argument('--messages', type=int, nargs='+', default=[1000, 10_000, 100_000])
+    parser.add_argument('--iterations', type=int, default=20_000)
+    args = parser.parse_args()
+
+    base_dir = tempfile.mkdtemp(prefix="chate2e_bench_json_")
+    path = os.path.join(base_dir, 'data.json')
+    results = {}
+    try:
+        for count in args.users:
+            users = make_users(count)
+            results[f"users={count}"] = {backend.name: time_file(backend, path, users)
+                                         for backend in available_backends()}
+        for count in args.messages:
+            sessions = make_sessions(count)
+            results[f"sessions_messages={count}"] = {
+                backend.name: time_file(backend, path, sessions, ChatSession)
+                for backend in available_backends()
+            }
+        results['message'] = {backend.name: time_message(backend, args.iterations)
+                              for backend in available_backends() if backend.name != 'legacy'}
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+    report('json_backend', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+登录流水线UI响应性基准
+
+在Qt事件循环中以固定间隔触发心跳定时器，分别测量：
+- inline: 在UI线程中同步执行登录流水线（旧实现）
+- worker: 通过QThreadPool中的LoginWorker执行
+报告登录期间心跳的最大间隔（即UI卡顿时长）以及登录总耗时。
+
+    python -m benchmarks.bench_login --kdf pbkdf2 scrypt
+"""
+import shutil
+import tempfile
+import time
+
+from PyQt6.QtCore import QCoreApplication, QThreadPool, QTimer
+
+from benchmarks.common import base_parser, report, summarize
+from chate2e.client.login_worker import LoginWorker, run_login_pipeline
+from chate2e.client.models import DataManager
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+
+HEARTBEAT_MS = 5
+USERNAME = "bench_user"
+PASSWORD = "bench_password"
+
+
+def prepare_profile(base_dir: str, kdf: str) -> None:
+    """创建一个使用指定KDF的本地用户档案"""
+    protocol = SignalProtocol()
+    protocol.initialize_identity("bench0001")
+    data_manager = DataManager(None, base_dir)
+    data_manager.register_user(USERNAME, PASSWORD, "bench0001",
+                               protocol.create_bundle(), protocol.create_local_bundle())
+    data_manager.user.set_password(PASSWORD, kdf=kdf)
+    data_manager.save_user_profile()
+
+
+def measure(app: QCoreApplication, base_dir: str, mode: str) -> dict:
+    """在事件循环中运行一次登录并记录心跳间隔"""
+    gaps = []
+    last = [time.perf_counter()]
+    started = [0.0]
+    finished = [0.0]
+    workers = []  # 持有worker引用，避免信号对象被提前回收
+
+    def heartbeat():
+        now = time.perf_counter()
+        gaps.append((now - last[0]) * 1000)
+        last[0] = now
+
+    timer = QTimer()
+    timer.setInterval(HEARTBEAT_MS)
+    timer.timeout.connect(heartbeat)
+
+    def done(*_):
+        finished[0] = time.perf_counter()
+        # 登录结束后再多跑几个心跳，确保捕获到最后一次卡顿
+        QTimer.singleShot(HEARTBEAT_MS * 4, app.quit)
+
+    def start_login():
+        started[0] = time.perf_counter()
+        data_manager = DataManager(None, base_dir)
+        protocol = SignalProtocol()
+        if mode == 'inline':
+            run_login_pipeline(data_manager, protocol, USERNAME, PASSWORD)
+            done()
+        else:
+            worker = LoginWorker(data_manager, protocol, USERNAME, PASSWORD)
+            worker.signals.succeeded.connect(done)
+            worker.signals.failed.connect(done)
+            workers.append(worker)
+            QThreadPool.globalInstance().start(worker)
+
+    timer.start()
+    QTimer.singleShot(HEARTBEAT_MS * 4, start_login)
+    app.exec()
+    timer.stop()
+
+    stats = summarize(gaps)
+    return {
+        'login_ms': (finished[0] - started[0]) * 1000,
+        'heartbeat_interval_ms': HEARTBEAT_MS,
+        'max_ui_stall_ms': stats.get('max', 0.0),
+        'p99_heartbeat_gap_ms': stats.get('p99', 0.0),
+    }
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--kdf', nargs='+', default=['pbkdf2', 'scrypt'],
+                        choices=['pbkdf2', 'scrypt'])
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    results = {}
+    for kdf in args.kdf:
+        base_dir = tempfile.mkdtemp(prefix="chate2e_bench_login_")
+        try:
+            prepare_profile(base_dir, kdf)
+            for mode in ('inline', 'worker'):
+                runs = [measure(app, base_dir, mode) for _ in range(args.rounds)]
+                results[f"{kdf}/{mode}"] = {
+                    key: max(run[key] for run in runs) for key in runs[0]
+                }
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    report('login_ui_responsiveness', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+消息对象内存基准
+
+模拟客户端加载聊天记录 / 服务器保存离线消息：从JSON解析N条消息（Message.from_dict）并全部保留，
+消息分布在少量会话与用户之间（与真实聊天记录一样，ID大量重复），测量：
+  - rss_mb_per_100k:     进程RSS增量，折算为每10万条消息
+  - bytes_per_message:   tracemalloc统计的每条消息占用（含消息体）
+  - load_seconds:        解析耗时
+
+每次测量在独立子进程中运行，避免前一次的内存碎片影响结果。
+
+    python -m benchmarks.bench_message_memory --messages 100000
+    python -m benchmarks.bench_message_memory --payload 64 1024
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+from base64 import b64encode
+
+from benchmarks.common import base_parser, report
+
+
+def rss_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def make_lines(count: int, payload: int, sessions: int = 50) -> list:
+    """生成count条消息的JSON行；每条消息在解析时得到各自独立的字符串对象"""
+    pairs = [(f"user{index:04d}", f"user{index + sessions:04d}", str(uuid.uuid4())) for index in range(sessions)]
+    content = b64encode(os.urandom(payload)).decode()
+    lines = []
+    for index in range(count):
+        sender, receiver, session_id = pairs[index % sessions]
+        lines.append(json.dumps({
+            'header': {
+                'sender_id': sender,
+                'receiver_id': receiver,
+                'session_id': session_id,
+                'message_id': str(uuid.uuid4()),
+                'message_type': 2,
+                'timestamp': time.time(),
+            },
+            'encrypted_content': content,
+            'encryption': {
+                'algorithm': 'AES-GCM',
+                'iv': b64encode(os.urandom(12)).decode(),
+                'tag': b64encode(os.urandom(16)).decode(),
+                'is_initiator': False,
+            },
+            'X3DHparams': None,
+        }))
+    return lines
+
+
+def measure(count: int, payload: int) -> dict:
+    from chate2e.model.message import Message
+
+    lines = make_lines(count, payload)
+    before = rss_bytes()
+    start = time.perf_counter()
+    messages = [Message.from_dict(json.loads(line)) for line in lines]
+    load_seconds = time.perf_counter() - start
+    rss = rss_bytes() - before
+    del messages
+
+    tracemalloc.start()
+    messages = [Message.from_dict(json.loads(line)) for line in lines]
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {
+        'messages': len(messages),
+        'payload_bytes': payload,
+        'rss_mb_per_100k': rss / (1024 * 1024) * 100_000 / count,
+        'bytes_per_message': traced / count,
+        'load_seconds': load_seconds,
+    }
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--payload', type=int, nargs='+', default=[64, 1024], help='密文字节数')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.messages, args.payload[0])))
+        return
+
+    results = {}
+    for payload in args.payload:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_message_memory', '--child',
+             '--messages', str(args.messages), '--payload', str(payload)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results[f"payload={payload}"] = json.loads(output.strip().splitlines()[-1])
+    report('message_memory', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+离线消息重连拉取基准
+
+在进程内启动服务器，向离线用户的队列中放入N条双棘轮加密消息，
+然后测量客户端 ChatClient.sync_offline_messages() 分页拉取、按会话解密、
+整页批量落盘并确认删除的总耗时。
+
+    python -m benchmarks.bench_offline_drain --messages 10000 --page-size 100 1000
+"""
+import contextlib
+import io
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import base_parser, report, start_server
+from chate2e.client.client_server import ChatClient
+from chate2e.client.models import DataManager
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+from chate2e.server.app import message_manager
+
+
+def paired_protocols(session_id: str):
+    """建立一对已完成X3DH的协议实例"""
+    alice = SignalProtocol()
+    bob = SignalProtocol()
+    alice.initialize_identity("alice_bench")
+    bob.initialize_identity("bob_bench")
+    alice.initiate_session(
+        peer_id="bob_bench",
+        session_id=session_id,
+        recipient_identity_key=bob.identity_key_pub,
+        recipient_signed_prekey=bob.signed_prekey_pub,
+        recipient_one_time_prekey=bob.one_time_prekeys_pub[0],
+        is_initiator=True,
+        peer_codecs=bob.codecs
+    )
+    bob.initiate_session(
+        peer_id="alice_bench",
+        session_id=session_id,
+        recipient_identity_key=alice.identity_key_pub,
+        recipient_signed_prekey=alice.signed_prekey_pub,
+        recipient_ephemeral_key=alice.ephemeral_key_pub,
+        own_one_time_prekey=bob.one_time_prekeys_pub[0],
+        is_initiator=False,
+        peer_codecs=alice.codecs
+    )
+    return alice, bob
+
+
+def run(base_url: str, count: int, page_size: int) -> dict:
+    base_dir = tempfile.mkdtemp(prefix="chate2e_bench_drain_")
+    try:
+        session_id = f"bench-session-{page_size}"
+        with contextlib.redirect_stdout(io.StringIO()):
+            alice, bob = paired_protocols(session_id)
+            for i in range(count):
+                message_manager.add_offline_message(alice.encrypt_message(f"offline message {i}"))
+
+            data_manager = DataManager(None, base_dir)
+            data_manager.register_user("bob_bench", "bench_password", "bob_bench",
+                                       bob.create_bundle(), bob.create_local_bundle())
+            data_manager.get_or_create_session_with_id(session_id, "alice_bench")
+            client = ChatClient(base_url, data_manager)
+            client.user_id = "bob_bench"
+            client.protocol = bob
+
+            start = time.perf_counter()
+            drained = 0
+            for _ in client.iter_offline_messages(limit=page_size):
+                drained += 1
+            elapsed = time.perf_counter() - start
+            client.dispatcher.shutdown()
+
+        return {
+            'messages': drained,
+            'page_size': page_size,
+            'pages': -(-count // page_size),
+            'seconds': elapsed,
+            'messages_per_sec': drained / elapsed if elapsed else 0.0,
+            'remaining_on_server': message_manager.get_offline_count("bob_bench"),
+            'stored_locally': len(data_manager.sessions[session_id].messages),
+        }
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--page-size', type=int, nargs='+', default=[100, 1000])
+    args = parser.parse_args()
+
+    server, base_url = start_server()
+    try:
+        results = {
+            f"page_size={page_size}": run(base_url, args.messages, page_size)
+            for page_size in args.page_size
+        }
+    finally:
+        server.shutdown()
+    report('offline_drain', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
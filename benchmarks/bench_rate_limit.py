@@ -0,0 +1,177 @@
+"""
+限流器开销基准
+
+分别测量：
+  - hot_key:    同一个键反复取令牌（每次请求的最小开销）
+  - many_keys:  轮流访问大量不同的键（含空闲键淘汰），以及每个活跃键占用的内存
+  - contended:  多个线程各自的键同时取令牌（共用一把锁时的吞吐）
+  - http:       经Flask测试客户端调用 /handle_message，限流开启与关闭时每次请求的耗时之差
+
+    python -m benchmarks.bench_rate_limit
+    python -m benchmarks.bench_rate_limit --keys 100000 --threads 8
+"""
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from benchmarks.common import base_parser, report, summarize
+from chate2e.server.rate_limit import RateLimiter
+
+
+class NoLimit:
+    """关闭限流时替换进去的限流器"""
+
+    def acquire(self, key, cost=1.0) -> float:
+        return 0.0
+
+
+def limiter() -> RateLimiter:
+    # 容量足够大，测量的始终是放行路径
+    return RateLimiter(rate=1e9, burst=1e9, idle_timeout=60.0)
+
+
+def bench_hot_key(iterations: int) -> dict:
+    bucket = limiter()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        bucket.acquire("alice")
+    elapsed = time.perf_counter() - start
+    return {'ns_per_op': elapsed / iterations * 1e9}
+
+
+def bench_many_keys(keys: int, iterations: int) -> dict:
+    names = [f"user{index}" for index in range(keys)]
+    bucket = limiter()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for name in names:
+        bucket.acquire(name)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for index in range(iterations):
+        bucket.acquire(names[index % keys])
+    elapsed = time.perf_counter() - start
+
+    # 空闲淘汰：时钟前进超过idle_timeout后，下一次访问淘汰全部旧键
+    evicting = RateLimiter(rate=1e9, burst=1e9, idle_timeout=60.0, clock=lambda: now[0])
+    now = [0.0]
+    for name in names:
+        evicting.acquire(name)
+    now[0] = 120.0
+    evict_start = time.perf_counter()
+    evicting.acquire("late")
+    evict_seconds = time.perf_counter() - evict_start
+    return {
+        'keys': keys,
+        'ns_per_op': elapsed / iterations * 1e9,
+        'bytes_per_key': (after - before) / keys,
+        'evict_all_ms': evict_seconds * 1000,
+        'keys_after_eviction': len(evicting),
+    }
+
+
+def bench_contended(threads: int, iterations: int) -> dict:
+    bucket = limiter()
+    barrier = threading.Barrier(threads + 1)
+
+    def work(key):
+        barrier.wait()
+        for _ in range(iterations):
+            bucket.acquire(key)
+
+    workers = [threading.Thread(target=work, args=(f"user{index}",)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    total = threads * iterations
+    return {'threads': threads, 'ops_per_sec': total / elapsed, 'ns_per_op': elapsed / total * 1e9}
+
+
+def bench_http(requests_count: int) -> dict:
+    import chate2e.server.app as server_app
+    from chate2e.model.message import Encryption, Message, MessageType
+    from chate2e.server.message_manager import MessageManager
+    from chate2e.server.session_registry import SessionRegistry
+    from chate2e.server.user import User
+
+    chat_server = server_app.chat_server
+    originals = (server_app.user_limiter, server_app.address_limiter, server_app.message_manager)
+    registry = chat_server.session_registry
+    base_dir = tempfile.mkdtemp(prefix="chate2e_bench_rate_")
+    chat_server.session_registry = SessionRegistry(os.path.join(base_dir, 'sessions.log'))
+    for user_id in ("bench_rl_alice", "bench_rl_bob"):
+        chat_server.users[user_id] = User(user_id, user_id)
+    session_id = chat_server.get_or_create_session("bench_rl_alice", "bench_rl_bob")
+    payload = Message(
+        message_id=Message.generate_id(),
+        sender_id="bench_rl_alice",
+        session_id=session_id,
+        receiver_id="bench_rl_bob",
+        encrypted_content=b"x" * 256,
+        message_type=MessageType.MESSAGE,
+        encryption=Encryption("AES-GCM", b"iv", b"tag", True)
+    ).to_dict()
+    client = server_app.app.test_client()
+
+    def run(user_limiter, address_limiter) -> list:
+        server_app.user_limiter, server_app.address_limiter = user_limiter, address_limiter
+        # 接收者离线，每次都写入离线队列；每轮使用新的队列避免累积
+        server_app.message_manager = MessageManager()
+        timings = []
+        for _ in range(requests_count):
+            start = time.perf_counter()
+            client.post("/handle_message", json=payload)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    try:
+        # 服务器逐条打印日志，输出丢弃（两种情况下开销相同）
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(NoLimit(), NoLimit())  # 预热
+            disabled = run(NoLimit(), NoLimit())
+            enabled = run(limiter(), limiter())
+    finally:
+        server_app.user_limiter, server_app.address_limiter, server_app.message_manager = originals
+        chat_server.session_registry = registry
+        shutil.rmtree(base_dir, ignore_errors=True)
+        for user_id in ("bench_rl_alice", "bench_rl_bob"):
+            chat_server.users.pop(user_id, None)
+    disabled_stats, enabled_stats = summarize(disabled), summarize(enabled)
+    return {
+        'requests': requests_count,
+        'disabled_ms': disabled_stats,
+        'enabled_ms': enabled_stats,
+        'overhead_us_p50': (enabled_stats['p50'] - disabled_stats['p50']) * 1000,
+    }
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--iterations', type=int, default=1_000_000)
+    parser.add_argument('--keys', type=int, default=10_000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000, help='http项每种情况的请求数')
+    args = parser.parse_args()
+
+    results = {
+        'hot_key': bench_hot_key(args.iterations),
+        'many_keys': bench_many_keys(args.keys, args.iterations),
+        'contended': bench_contended(args.threads, args.iterations // args.threads),
+        'http': bench_http(args.requests),
+    }
+    report('rate_limit', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""
+中继服务器负载基准
+
+在进程内启动服务器（Werkzeug多线程 + Socket.IO），创建N个无界面的ChatClient并两两配对，
+每个用户在服务器上登记主设备Bundle。客户端走与界面相同的多设备发送路径：
+send_text_sync 获取对方设备Bundle -> 首次发送时领取一次性预密钥并经X3DH建立设备会话 ->
+按设备加密 -> /handle_messages 批量中继，接收方在Socket.IO推送中按设备会话解密。
+正式计时前每对客户端先完成一次握手，统计只包含已建立会话后的消息：
+  - 吞吐：发送/送达消息数与每秒送达数
+  - 端到端延迟p50/p99：获取设备Bundle与加密 -> HTTP中继 -> Socket.IO推送 -> 接收方解密
+  - 进程CPU时间与RSS（服务器与客户端在同一进程中，CPU为两者之和）
+  - 服务器登记的socket连接数与进程打开的socket数
+
+    python -m benchmarks.bench_relay_load --clients 20 --rate 10 --duration 10
+    python -m benchmarks.bench_relay_load --clients 50 --max-p99-ms 200 --min-throughput 400
+
+设置 --max-p99-ms / --min-throughput 后，未达标时以非零状态码退出，便于在部署前发现性能回退。
+设置 CHATE2E_TRACE_FILE 后每条消息都带追踪上下文，可用 benchmarks.trace_breakdown 查看各阶段耗时。
+"""
+import contextlib
+import io
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.common import base_parser, report, start_server, summarize
+from chate2e.client.client_server import ChatClient
+from chate2e.client.models import DataManager
+from chate2e.server.app import chat_server
+from chate2e.server.prekey_ledger import PrekeyLedger
+from chate2e.server.session_registry import SessionRegistry
+from chate2e.server.user import User
+from chate2e.utils.tracing import get_tracer
+
+SEPARATOR = "|"
+
+
+class LoadClient:
+    """一个模拟用户：无界面ChatClient + 收发计时"""
+
+    def __init__(self, base_url: str, base_dir: str, user_id: str):
+        self.user_id = user_id
+        self.client = ChatClient(base_url, DataManager(None, base_dir))
+        self.client.user_id = user_id
+        protocol = self.client.protocol
+        protocol.initialize_identity(user_id)
+        # 与真实客户端一样注册本地档案并解锁加密存储，设备会话状态随每条消息加密保存
+        self.client.data_manager.register_user(user_id, "bench_password", user_id,
+                                               protocol.create_bundle(), protocol.create_local_bundle())
+        self.client.register_message_handler(self._on_message)
+        self.peer_id: Optional[str] = None
+        self.session_id: Optional[str] = None
+        self.latencies: List[float] = []
+        self.sent = 0
+        self.failed = 0
+
+    def _on_message(self, message):
+        # 解密在发送设备的会话锁内进行，与发送线程对同一会话的加密互斥
+        plaintext = self.client.decrypt_message(message)
+        sent_at = float(plaintext.split(SEPARATOR, 1)[0])
+        self.latencies.append((time.perf_counter() - sent_at) * 1000)
+        self.client.finish_trace(message)
+
+    def send(self, payload: str) -> None:
+        text = f"{time.perf_counter()!r}{SEPARATOR}{payload}"
+        if self.client.send_text_sync(self.peer_id, self.session_id, text):
+            self.sent += 1
+        else:
+            self.failed += 1
+
+    def reset(self) -> None:
+        self.latencies = []
+        self.sent = 0
+        self.failed = 0
+
+
+def create_clients(base_url: str, base_dir: str, count: int, run_id: str) -> List[LoadClient]:
+    """在服务器上登记用户（主设备Bundle）与会话，并创建两两配对的客户端"""
+    clients = []
+    for index in range(0, count - count % 2, 2):
+        pair = [LoadClient(base_url, base_dir, f"load{run_id}_{index + offset}") for offset in (0, 1)]
+        for load_client in pair:
+            # 直接写入内存中的用户表，不保存到服务器数据目录
+            user = User(load_client.user_id, load_client.user_id)
+            user.set_bundle(load_client.client.protocol.create_bundle())
+            chat_server.users[load_client.user_id] = user
+        session_id = chat_server.get_or_create_session(pair[0].user_id, pair[1].user_id)
+        pair[0].peer_id, pair[1].peer_id = pair[1].user_id, pair[0].user_id
+        for load_client in pair:
+            load_client.session_id = session_id
+        clients.extend(pair)
+    return clients
+
+
+def handshake(clients: List[LoadClient], timeout: float = 30.0) -> None:
+    """每对客户端由一方发起设备会话并往返一条消息，之后清零计数"""
+    initiators = clients[0::2]
+    for load_client in initiators:
+        load_client.send("handshake")
+    deadline = time.monotonic() + timeout
+    while any(not c.latencies for c in clients[1::2]):
+        if time.monotonic() > deadline:
+            raise TimeoutError("设备会话握手超时")
+        time.sleep(0.05)
+    for load_client in clients[1::2]:
+        load_client.send("handshake")
+    while any(not c.latencies for c in initiators):
+        if time.monotonic() > deadline:
+            raise TimeoutError("设备会话握手超时")
+        time.sleep(0.05)
+    for load_client in clients:
+        load_client.reset()
+
+
+def connect_all(clients: List[LoadClient], timeout: float = 30.0) -> None:
+    """连接Socket.IO并等待服务器登记全部连接"""
+    for load_client in clients:
+        load_client.client.connect_sync()
+    deadline = time.monotonic() + timeout
+    while any(not chat_server.get_user_sockets(c.user_id) for c in clients):
+        if time.monotonic() > deadline:
+            raise TimeoutError("客户端登录超时")
+        time.sleep(0.05)
+
+
+def drive(load_client: LoadClient, rate: float, duration: float, payload: str) -> None:
+    """开环发送：按固定间隔发送，落后时立即补发，不等待上一条送达"""
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    next_send = start
+    while next_send - start < duration:
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        load_client.send(payload)
+        next_send += interval
+
+
+def process_stats() -> Dict[str, float]:
+    """进程CPU时间、当前/峰值RSS与打开的socket数"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    stats = {
+        'cpu_seconds': usage.ru_utime + usage.ru_stime,
+        # Linux上ru_maxrss以KB为单位，macOS上以字节为单位
+        'max_rss_mb': usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+    }
+    if not os.path.isdir('/proc/self/fd'):
+        return stats
+    with open('/proc/self/statm') as f:
+        stats['rss_mb'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    sockets = 0
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            sockets += os.readlink(f'/proc/self/fd/{fd}').startswith('socket:')
+        except OSError:
+            # 统计期间被关闭的描述符
+            continue
+    stats['open_sockets'] = sockets
+    return stats
+
+
+def run(base_url: str, count: int, rate: float, duration: float, size: int, drain_timeout: float) -> dict:
+    base_dir = tempfile.mkdtemp(prefix="chate2e_bench_load_")
+    run_id = f"{count}x{rate:g}"
+    payload = "x" * size
+    # 压测会话与预密钥分配记录写在临时目录中，不写入服务器数据目录
+    registry, chat_server.session_registry = \
+        chat_server.session_registry, SessionRegistry(os.path.join(base_dir, 'sessions.log'))
+    ledger, chat_server.prekey_ledger = \
+        chat_server.prekey_ledger, PrekeyLedger(os.path.join(base_dir, 'prekeys.log'))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            clients = create_clients(base_url, base_dir, count, run_id)
+            connect_all(clients)
+            handshake(clients)
+            before = process_stats()
+            server_sockets = len(chat_server.socket_sessions)
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=drive, args=(c, rate, duration, payload), daemon=True)
+                       for c in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            send_seconds = time.perf_counter() - start
+
+            # 等待在途消息送达
+            sent = sum(c.sent for c in clients)
+            deadline = time.monotonic() + drain_timeout
+            while sum(len(c.latencies) for c in clients) < sent and time.monotonic() < deadline:
+                time.sleep(0.05)
+            elapsed = time.perf_counter() - start
+            after = process_stats()
+
+            for load_client in clients:
+                load_client.client.disconnect_sync()
+                load_client.client.dispatcher.shutdown()
+                chat_server.users.pop(load_client.user_id, None)
+
+        latencies = [latency for c in clients for latency in c.latencies]
+        cpu_seconds = after['cpu_seconds'] - before['cpu_seconds']
+        return {
+            'clients': len(clients),
+            'rate_per_client': rate,
+            'payload_bytes': size,
+            'sent': sent,
+            'send_failed': sum(c.failed for c in clients),
+            'delivered': len(latencies),
+            'lost': sent - len(latencies),
+            'send_seconds': send_seconds,
+            'sent_per_sec': sent / send_seconds if send_seconds else 0.0,
+            'delivered_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+            'latency_ms': summarize(latencies),
+            'process_cpu_seconds': cpu_seconds,
+            'process_cpu_percent': 100.0 * cpu_seconds / elapsed if elapsed else 0.0,
+            'rss_mb': after.get('rss_mb'),
+            'max_rss_mb': after['max_rss_mb'],
+            'server_sockets': server_sockets,
+            'open_sockets': after.get('open_sockets'),
+        }
+    finally:
+        chat_server.session_registry = registry
+        chat_server.prekey_ledger = ledger
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--clients', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--rate', type=float, default=10.0, help='每个客户端每秒发送的消息数')
+    parser.add_argument('--duration', type=float, default=10.0, help='发送时长（秒）')
+    parser.add_argument('--size', type=int, default=256, help='消息明文字节数')
+    parser.add_argument('--drain-timeout', type=float, default=10.0, help='发送结束后等待送达的时长（秒）')
+    parser.add_argument('--max-p99-ms', type=float, help='端到端p99延迟上限')
+    parser.add_argument('--min-throughput', type=float, help='每秒送达消息数下限')
+    args = parser.parse_args()
+
+    # 逐请求的访问日志会影响计时；开发服务器把断开时的WebSocket关闭帧记为错误请求，一并屏蔽
+    logging.getLogger('werkzeug').setLevel(logging.CRITICAL)
+    server, base_url = start_server()
+    try:
+        results = {
+            f"clients={count}": run(base_url, count, args.rate, args.duration, args.size, args.drain_timeout)
+            for count in args.clients
+        }
+    finally:
+        server.shutdown()
+        get_tracer().shutdown()
+    report('relay_load', results, args.output)
+
+    failures = []
+    for name, result in results.items():
+        if result['lost']:
+            failures.append(f"{name}: 丢失 {result['lost']} 条消息")
+        if args.max_p99_ms is not None and result['latency_ms'].get('p99', 0.0) > args.max_p99_ms:
+            failures.append(f"{name}: p99 {result['latency_ms']['p99']:.1f}ms > {args.max_p99_ms}ms")
+        if args.min_throughput is not None and result['delivered_per_sec'] < args.min_throughput:
+            failures.append(f"{name}: 吞吐 {result['delivered_per_sec']:.1f}/s < {args.min_throughput}/s")
+    if failures:
+        print("\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+本地存储吞吐量基准：明文JSON存储 vs 加密追加日志
+
+- datamanager/plaintext: 旧实现，每条消息都重写整个chat_sessions.json
+- datamanager/encrypted: 解锁加密存储后，每条消息O(1)追加一条AEAD记录
+- log/plaintext_jsonl 与 log/encrypted: 不经过DataManager的纯追加吞吐量
+
+    python -m benchmarks.bench_secure_store --messages 500
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from benchmarks.common import base_parser, report
+from chate2e.client.models import DataManager
+from chate2e.client.secure_store import SecureStore
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+from chate2e.model.message import Message, MessageType
+
+PAYLOAD = "这是一条用于基准测试的聊天消息 benchmark message " * 4
+
+
+def make_message(session_id: str) -> Message:
+    return Message(
+        message_id=str(uuid.uuid4()),
+        session_id=session_id,
+        sender_id="bench0001",
+        receiver_id="peer0001",
+        encrypted_content=PAYLOAD.encode('utf-8'),
+        message_type=MessageType.MESSAGE
+    )
+
+
+def bench_data_manager(count: int, encrypted: bool) -> dict:
+    base_dir = tempfile.mkdtemp(prefix="chate2e_bench_store_")
+    try:
+        protocol = SignalProtocol()
+        protocol.initialize_identity("bench0001")
+        data_manager = DataManager(None, base_dir)
+        data_manager.register_user("bench", "bench_password", "bench0001",
+                                   protocol.create_bundle(), protocol.create_local_bundle())
+        if not encrypted:
+            data_manager.store = None
+            data_manager._message_log = None
+        session = data_manager.get_or_create_session("peer0001")
+        messages = [make_message(session.session_id) for _ in range(count)]
+
+        start = time.perf_counter()
+        for message in messages:
+            data_manager.add_message(session.session_id, message)
+        elapsed = time.perf_counter() - start
+
+        on_disk = sum(
+            os.path.getsize(os.path.join(data_manager.user_data_dir, name))
+            for name in os.listdir(data_manager.user_data_dir)
+        )
+        return {
+            'messages': count,
+            'seconds': elapsed,
+            'messages_per_sec': count / elapsed,
+            'bytes_on_disk': on_disk,
+        }
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def bench_log(count: int, encrypted: bool) -> dict:
+    base_dir = tempfile.mkdtemp(prefix="chate2e_bench_log_")
+    try:
+        path = os.path.join(base_dir, "messages.log")
+        records = [{'session_id': 's', 'message': make_message('s').to_dict()} for _ in range(count)]
+        raw_bytes = sum(len(json.dumps(r, ensure_ascii=False).encode('utf-8')) for r in records)
+
+        start = time.perf_counter()
+        if encrypted:
+            log = SecureStore(os.urandom(32)).open_log(path, b"bench")
+            for record in records:
+                log.append(record)
+        else:
+            for record in records:
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        elapsed = time.perf_counter() - start
+        return {
+            'records': count,
+            'seconds': elapsed,
+            'records_per_sec': count / elapsed,
+            'payload_mb_per_sec': raw_bytes / elapsed / 1e6,
+        }
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--messages', type=int, default=500)
+    args = parser.parse_args()
+
+    results = {
+        'datamanager/plaintext': bench_data_manager(args.messages, encrypted=False),
+        'datamanager/encrypted': bench_data_manager(args.messages, encrypted=True),
+        'log/plaintext_jsonl': bench_log(args.messages, encrypted=False),
+        'log/encrypted': bench_log(args.messages, encrypted=True),
+    }
+    report('secure_store_throughput', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
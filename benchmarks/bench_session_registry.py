@@ -0,0 +1,95 @@
+"""
+会话登记表基准
+
+生成N个两两会话（用户数为会话数的1/8，每个用户平均与16个用户有会话），测量：
+  - create:    逐个新建会话（每个会话追加一行日志）的耗时
+  - load:      服务器重启后第一次查询时回放日志的耗时
+  - validate:  命中/未命中/非参与者三种情况下每次验证的耗时
+  - memory:    每个会话占用的内存（tracemalloc，含会话表与按用户的索引）
+
+    python -m benchmarks.bench_session_registry --sessions 100000 1000000
+"""
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import base_parser, report
+from chate2e.server.session_registry import SessionRegistry
+
+
+def write_log(path: str, count: int) -> list:
+    """构造一份count个会话的日志，返回 [(session_id, user1_id, user2_id)]"""
+    registry = SessionRegistry(path)
+    users = [f"user{index:08d}" for index in range(max(2, count // 8))]
+    sessions = []
+    while len(sessions) < count:
+        user1_id, user2_id = random.sample(users, 2)
+        session_id, created = registry.get_or_create(user1_id, user2_id)
+        if created:
+            # 返回副本，不让调用方持有登记表中驻留的字符串（否则内存统计会漏掉它们）
+            sessions.append(("".join(session_id), "".join(user1_id), "".join(user2_id)))
+    return sessions
+
+
+def time_per_op(op, keys) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        op(*key)
+    return (time.perf_counter() - start) / len(keys) * 1e9
+
+
+def run(count: int, lookups: int) -> dict:
+    base_dir = tempfile.mkdtemp(prefix="chate2e_bench_sessions_")
+    path = os.path.join(base_dir, 'sessions.log')
+    try:
+        start = time.perf_counter()
+        sessions = write_log(path, count)
+        create_seconds = time.perf_counter() - start
+
+        registry = SessionRegistry(path)
+        start = time.perf_counter()
+        registry.get("nobody", "nobody")  # 第一次查询触发加载
+        load_seconds = time.perf_counter() - start
+        del registry
+
+        # tracemalloc会拖慢加载，内存单独再加载一次统计
+        tracemalloc.start()
+        registry = SessionRegistry(path)
+        registry.get("nobody", "nobody")
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        sample = random.choices(sessions, k=lookups)
+        # 会话ID来自消息头的新字符串，与登记表中的对象不是同一个
+        hits = [(session_id, user1_id) for session_id, user1_id, _ in sample]
+        misses = [(session_id[::-1], user1_id) for session_id, user1_id, _ in sample]
+        outsiders = [(session_id, "mallory") for session_id, _, _ in sample]
+        assert all(registry.validate(*key) for key in hits[:100])
+        return {
+            'sessions': len(registry),
+            'log_mb': os.path.getsize(path) / (1024 * 1024),
+            'create_us_per_session': create_seconds / count * 1e6,
+            'load_seconds': load_seconds,
+            'bytes_per_session': memory / count,
+            'validate_hit_ns': time_per_op(registry.validate, hits),
+            'validate_miss_ns': time_per_op(registry.validate, misses),
+            'validate_outsider_ns': time_per_op(registry.validate, outsiders),
+        }
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--lookups', type=int, default=200_000)
+    args = parser.parse_args()
+    results = {f"sessions={count}": run(count, args.lookups) for count in args.sessions}
+    report('session_registry', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import json
+import math
+import threading
+from typing import Dict, Optional, Sequence
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """计算百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    """汇总一组耗时（毫秒）"""
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p99': percentile(values, 99),
+        'max': max(values),
+    }
+
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    """所有基准脚本共用的命令行参数"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--output', help='将JSON结果写入文件')
+    return parser
+
+
+def report(name: str, results: dict, output: Optional[str] = None) -> None:
+    """以JSON格式输出基准结果"""
+    payload = json.dumps({'benchmark': name, 'results': results}, indent=2, ensure_ascii=False)
+    print(payload)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(payload)
+
+
+def start_server():
+    """在后台线程中启动进程内HTTP服务器，返回(server, base_url)"""
+    from werkzeug.serving import make_server
+    from chate2e.server.app import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
@@ -0,0 +1,142 @@
+"""
+端到端延迟追踪分析
+
+读取追踪记录（CHATE2E_TRACE_FILE 写出的JSON行，或本工具作为采集器保存的OTLP/JSON），
+按追踪ID合并发送方、服务器与接收方各自导出的阶段时间戳，
+按时间排序后计算相邻阶段之间的耗时，输出每个阶段的p50/p99与端到端总耗时：
+
+    client.encrypt -> client.send        加密
+    client.send -> server.received       HTTP上传
+    server.received -> server.validated  解析与会话验证
+    server.validated -> server.emit      查找接收者连接
+    server.emit -> client.received       Socket.IO推送
+    client.received -> client.dispatched 接收方分发队列等待
+    client.dispatched -> client.decrypted 解密
+    client.decrypted -> client.stored    本地保存
+
+    python -m benchmarks.trace_breakdown traces.jsonl
+    python -m benchmarks.trace_breakdown --serve 4318 --spans traces.jsonl   # OTLP采集器替身
+"""
+import json
+import sys
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Tuple
+
+from benchmarks.common import base_parser, summarize
+
+
+def iter_records(lines: Iterable[str]) -> Iterable[Tuple[str, List[Tuple[str, int]]]]:
+    """解析一行记录，产出 (trace_id, [(阶段, 时间戳)])"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        data = json.loads(line)
+        if 'resourceSpans' not in data:
+            yield data['trace_id'], [(stage, int(ts)) for stage, ts in data['stages']]
+            continue
+        # OTLP：每个span为相邻两个阶段之间的区间，名称为 "开始阶段->结束阶段"
+        for resource_spans in data['resourceSpans']:
+            for scope_spans in resource_spans.get('scopeSpans', []):
+                for span in scope_spans.get('spans', []):
+                    start_stage, _, end_stage = span['name'].partition('->')
+                    yield span['traceId'], [(start_stage, int(span['startTimeUnixNano'])),
+                                            (end_stage, int(span['endTimeUnixNano']))]
+
+
+def merge_traces(paths: List[str]) -> Dict[str, List[Tuple[str, int]]]:
+    """按追踪ID合并各方导出的阶段，去重后按时间排序"""
+    traces: Dict[str, set] = OrderedDict()
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for trace_id, stages in iter_records(f):
+                traces.setdefault(trace_id, set()).update(stages)
+    return {trace_id: sorted(stages, key=lambda item: item[1]) for trace_id, stages in traces.items()}
+
+
+def breakdown(traces: Dict[str, List[Tuple[str, int]]]) -> Dict[str, dict]:
+    """相邻阶段之间的耗时（毫秒），按阶段在追踪中的平均位置排序"""
+    durations: Dict[str, List[float]] = {}
+    offsets: Dict[str, List[float]] = {}
+    totals = []
+    for stages in traces.values():
+        if len(stages) < 2:
+            continue
+        origin = stages[0][1]
+        for (start_stage, start), (end_stage, end) in zip(stages, stages[1:]):
+            name = f"{start_stage} -> {end_stage}"
+            durations.setdefault(name, []).append((end - start) / 1e6)
+            offsets.setdefault(name, []).append((start - origin) / 1e6)
+        totals.append((stages[-1][1] - origin) / 1e6)
+
+    order = sorted(durations, key=lambda name: sum(offsets[name]) / len(offsets[name]))
+    result = OrderedDict((name, summarize(durations[name])) for name in order)
+    result['total'] = summarize(totals)
+    return result
+
+
+def print_table(result: Dict[str, dict], trace_count: int, out=sys.stdout) -> None:
+    print(f"{trace_count} 条追踪", file=out)
+    print(f"{'阶段':<48}{'次数':>8}{'p50(ms)':>12}{'p99(ms)':>12}{'max(ms)':>12}", file=out)
+    for name, stats in result.items():
+        if not stats.get('count'):
+            continue
+        print(f"{name:<48}{stats['count']:>8}{stats['p50']:>12.3f}{stats['p99']:>12.3f}{stats['max']:>12.3f}",
+              file=out)
+
+
+def serve(port: int, spans_path: str) -> None:
+    """OTLP/HTTP JSON采集器替身：POST /v1/traces 的请求体逐行追加到文件"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/v1/traces':
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            payload = json.dumps(json.loads(body), ensure_ascii=False)
+            with open(spans_path, 'a', encoding='utf-8') as f:
+                f.write(payload + '\n')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    print(f"[Trace] 采集器监听 http://127.0.0.1:{port}/v1/traces -> {spans_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument('files', nargs='*', help='追踪记录文件')
+    parser.add_argument('--serve', type=int, metavar='PORT', help='作为OTLP采集器运行')
+    parser.add_argument('--spans', default='traces.jsonl', help='采集器保存记录的文件')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.spans)
+        return
+    if not args.files:
+        parser.error('需要至少一个追踪记录文件')
+
+    traces = merge_traces(args.files)
+    result = breakdown(traces)
+    print_table(result, len(traces))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'trace_breakdown', 'results': result}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
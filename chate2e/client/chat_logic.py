@@ -1,6 +1,8 @@
 import sys
 
-from PyQt6.QtCore import Qt, pyqtSignal
+import os
+
+from PyQt6.QtCore import Qt, QThreadPool, pyqtSignal
 from PyQt6.QtWidgets import (
     QApplication, QListWidgetItem, QMessageBox, QDialog,
     QVBoxLayout, QFormLayout, QLineEdit, QDialogButtonBox, QFileDialog, QMenu
@@ -8,6 +10,9 @@ from PyQt6.QtWidgets import (
 
 from chate2e.client.chat_ui import ChatWindowUI, ContactItem, ChatItem, DEFAULT_AVATAR_PATH
 from chate2e.client.client_server import ChatClient
+from chate2e.client.file_transfer import encode_file_message, format_size, parse_file_message
+from chate2e.client.file_worker import FileUploadWorker
+from chate2e.client.send_worker import MessageSendWorker, create_send_pool
 from chate2e.client.models import Message, DataManager, Friend, UserStatus
 from chate2e.model.message import MessageType
 
@@ -27,6 +32,10 @@ class ChatWindow(ChatWindowUI):
         # 初始化数据管理器
         self.data_manager = data_manager
 
+        # 文本消息在单线程池中按顺序发送，限流重试不阻塞UI线程
+        self._send_pool = create_send_pool()
+        self._send_workers = set()
+
         #注册消息处理器
         self.chat_client.register_message_handler(self.handle_received_message)
         
@@ -37,6 +46,9 @@ class ChatWindow(ChatWindowUI):
         # 注册好友更新处理器
         self.chat_client.register_friend_update_handler(self.on_friend_list_updated)
 
+        # 离线消息同步完成后刷新对应会话
+        self.chat_client.register_message_sync_handler(self.on_messages_synced)
+
         # 加载联系人列表
         self.load_contacts()
 
@@ -84,13 +96,14 @@ class ChatWindow(ChatWindowUI):
                         display_content = display_content.decode('utf-8')
                     except UnicodeDecodeError:
                         display_content = str(display_content)
+                display_content = self._display_text(display_content)
 
             item = QListWidgetItem()
             widget = ContactItem(
                 friend.avatar_path,
                 friend.username,
                 display_content,
-                friend.status
+                friend.status.value
             )
             item.setSizeHint(widget.sizeHint())
             # 存储 user_id 而不是整个 Friend 对象
@@ -138,6 +151,7 @@ class ChatWindow(ChatWindowUI):
 
                 except UnicodeDecodeError:
                     display_content = str(display_content)
+            display_content = self._display_text(display_content)
 
             widget = ChatItem(
                 avatar_path,
@@ -209,74 +223,97 @@ class ChatWindow(ChatWindowUI):
 
     def handle_send_message(self):
         """处理发送消息"""
-        if not self.current_session_id or not self.selected_contact:
-            return
-
         content = self.message_input.text().strip()
         if not content:
             return
 
+        if self._send_text(content):
+            # 清空输入框
+            self.message_input.clear()
+
+    def _ensure_session(self) -> bool:
+        """确保与当前联系人的会话已初始化"""
+        if not self.current_session_id or not self.selected_contact:
+            return False
+
         session = self.data_manager.sessions.get(self.current_session_id)
         if not session:
-            return
+            return False
 
-        # 检查与当前联系人的会话是否已初始化
+        # 与对方各设备的会话在发送时按需建立，这里只需确认服务器上的session_id
         peer_id = self.selected_contact.user_id
-        if not self.chat_client.sessions.get(peer_id):
-            # 初始化会话，传入当前的session_id
-            success, returned_session_id = self.chat_client.init_session_sync(peer_id, self.current_session_id)
-            if not success:
+        session_key = f"{peer_id}_session_id"
+        if not self.chat_client.sessions.get(session_key):
+            returned_session_id = self.chat_client.get_session_id_sync(peer_id)
+            if not returned_session_id:
                 QMessageBox.warning(self, "错误", "会话初始化失败")
-                return
-            
+                return False
+            self.chat_client.sessions[session_key] = returned_session_id
+
             # 确保session_id一致
             if returned_session_id != self.current_session_id:
                 print(f"[UI] 警告: 服务器返回的session_id与本地不同，更新本地session_id")
                 self.current_session_id = returned_session_id
+        return True
 
-        try:
-            # 确保协议层使用正确的session_id
-            self.chat_client.protocol.session_id = self.current_session_id
-            self.chat_client.protocol.peer_id = peer_id
-            
-            # 加密消息
-            encrypted_message = self.chat_client.protocol.encrypt_message(content)
-            print(f"[UI] 当前会话ID: {self.current_session_id}")
-            print(f"[UI] 加密消息中的session_id: {encrypted_message.header.session_id}")
-            
-            #从加密消息中重组消息，使用当前会话的session_id
-            decrypted_message =  Message(
-                message_id=encrypted_message.header.message_id,
-                sender_id=encrypted_message.header.sender_id,
-                session_id=self.current_session_id,  # 使用当前会话ID
-                receiver_id=encrypted_message.header.receiver_id,
-                encryption=encrypted_message.encryption,
-                message_type=MessageType.MESSAGE,
-                encrypted_content= content.encode('utf-8')
-            )
-
-            # 发送消息到服务器
-            if self.chat_client.send_message_sync(self.selected_contact.user_id, encrypted_message):
-                print(f"[UI] 保存消息到会话: {self.current_session_id}")
-                self.data_manager.add_message(self.current_session_id, decrypted_message)
+    def _send_text(self, content: str) -> bool:
+        """经双棘轮加密发送一条文本消息（文件描述也作为文本发送）
 
-                # 清空输入框
-                self.message_input.clear()
+        加密与发送在后台发送线程中进行，返回True表示已提交；发送成功后在主线程中保存并刷新。
+        """
+        if not self._ensure_session():
+            return False
+        peer_id = self.selected_contact.user_id
+        session_id = self.current_session_id
+
+        print(f"[UI] 当前会话ID: {session_id}")
+        # 本地保存的明文消息，使用当前会话的session_id
+        decrypted_message =  Message(
+            message_id=Message.generate_id(),
+            sender_id=self.current_user_id,
+            session_id=session_id,  # 使用当前会话ID
+            receiver_id=peer_id,
+            message_type=MessageType.MESSAGE,
+            encrypted_content= content.encode('utf-8')
+        )
 
-                # 重新加载消息
-                self.load_messages(self.current_session_id)
-            else:
-                QMessageBox.warning(self, "错误", "消息发送失败")
+        # 为对方的每个设备分别加密，一次提交给服务器
+        worker = MessageSendWorker(self.chat_client, peer_id, session_id, content)
+        worker.signals.succeeded.connect(lambda: self._on_send_succeeded(worker, decrypted_message))
+        worker.signals.failed.connect(lambda message: self._on_send_failed(worker, message))
+        self._send_workers.add(worker)
+        self._send_pool.start(worker)
+        return True
+
+    def _on_send_succeeded(self, worker: MessageSendWorker, message: Message):
+        """发送成功（主线程），保存消息并刷新"""
+        self._send_workers.discard(worker)
+        session_id = message.header.session_id
+        print(f"[UI] 保存消息到会话: {session_id}")
+        self.data_manager.add_message(session_id, message)
+        if session_id == self.current_session_id:
+            self.load_messages(session_id)
 
-        except Exception as e:
-            QMessageBox.warning(self, "错误", f"消息发送失败: {str(e)}")
+    def _on_send_failed(self, worker: MessageSendWorker, message: str):
+        self._send_workers.discard(worker)
+        QMessageBox.warning(self, "错误", message)
 
+    @staticmethod
+    def _display_text(content: str) -> str:
+        """文件消息显示为文件名与大小"""
+        descriptor = parse_file_message(content)
+        if descriptor:
+            return f"[文件] {descriptor.get('name', '')} ({format_size(descriptor.get('size', 0))})"
+        return content
 
     def handle_received_message(self, message: Message):
         """处理接收到的消息"""
         try:
             # 解密消息
-            decrypted_text = self.chat_client.protocol.decrypt_message(message)
+            decrypted_text = self.chat_client.decrypt_message(message)
+            # 群组的发送者密钥分发不作为聊天消息显示
+            if self.chat_client.consume_sender_key(decrypted_text, message.header.sender_id):
+                return
             # 获取或创建会话 - 使用消息中的session_id
             session = self.data_manager.get_or_create_session_with_id(
                 message.header.session_id,
@@ -296,6 +333,10 @@ class ChatWindow(ChatWindowUI):
 
             # 保存消息
             self.data_manager.add_message(session.session_id, message_obj)
+            self.chat_client.finish_trace(message)
+
+            # 文件消息在独立的分发队列中下载并解密
+            self.chat_client.schedule_file_download(decrypted_text)
 
             # 发送信号更新UI
             self.message_received_signal.emit(session.session_id)
@@ -305,6 +346,11 @@ class ChatWindow(ChatWindowUI):
             import traceback
             traceback.print_exc()
 
+    def on_messages_synced(self, session_ids):
+        """离线消息同步完成（工作线程），通过信号切换到主线程刷新"""
+        for session_id in session_ids:
+            self.message_received_signal.emit(session_id)
+
     def on_message_received(self, session_id: str):
         """在主线程中更新UI"""
         # 如果是当前会话，刷新消息列表
@@ -315,18 +361,51 @@ class ChatWindow(ChatWindowUI):
         self.load_contacts()
 
     def handle_file_upload(self):
-        """处理文件上传"""
+        """处理文件上传：后台线程分块加密上传，完成后经会话发送文件描述"""
+        if not self._ensure_session():
+            return
+
         file_path, _ = QFileDialog.getOpenFileName(
             self,
             "选择文件",
             "",
             "所有文件 (*.*)"
         )
+        if not file_path:
+            return
+
+        print(f"选择的文件: {file_path}")
+        session_id = self.current_session_id
+        worker = FileUploadWorker(self.chat_client.file_transfer, file_path, self.current_user_id,
+                                  [self.selected_contact.user_id])
+        worker.signals.progress.connect(
+            lambda percent: self.chat_header.setText(f"正在上传 {os.path.basename(file_path)}: {percent}%"))
+        worker.signals.succeeded.connect(lambda descriptor: self._on_upload_succeeded(session_id, descriptor))
+        worker.signals.failed.connect(self._on_upload_failed)
+        self.upload_btn.setEnabled(False)
+        self._upload_worker = worker
+        QThreadPool.globalInstance().start(worker)
+
+    def _on_upload_succeeded(self, session_id: str, descriptor: dict):
+        """上传完成（主线程），发送文件描述"""
+        self.upload_btn.setEnabled(True)
+        self._upload_worker = None
+        self._restore_chat_header()
+        if session_id != self.current_session_id:
+            QMessageBox.warning(self, "错误", "上传期间切换了会话，文件未发送")
+            return
+        self._send_text(encode_file_message(descriptor))
+
+    def _on_upload_failed(self, message: str):
+        self.upload_btn.setEnabled(True)
+        self._upload_worker = None
+        self._restore_chat_header()
+        QMessageBox.warning(self, "错误", message)
+
+    def _restore_chat_header(self):
+        if self.selected_contact:
+            self.chat_header.setText(f"与 {self.selected_contact.username} 的对话")
 
-        if file_path:
-            # TODO: 实现文件上传逻辑
-            print(f"选择的文件: {file_path}")
-    
     def on_friend_list_updated(self):
         """当好友列表更新时调用（可能在非主线程）"""
         print("好友列表已更新，发送信号刷新UI")
@@ -415,12 +494,13 @@ class ChatWindow(ChatWindowUI):
             QMessageBox.warning(self, "警告", "用户不存在")
             return
         
-        # 假设用户存在，创建一个Friend对象
+        # 假设用户存在，创建一个Friend对象，状态以服务器为准
+        presence = self.chat_client.get_presence_sync([user_id])
         new_friend = Friend(
             user_id=user_id,
             username=user_name,
             avatar_path=DEFAULT_AVATAR_PATH,  # 使用默认头像
-            status= UserStatus.ONLINE
+            status=UserStatus.from_str(presence.get(user_id, UserStatus.OFFLINE.value))
         )
 
         # 检查是否已经是联系人
@@ -1,112 +1,489 @@
+import os
+import threading
 import time
-from typing import Optional, Dict, Callable, List, Tuple
+from base64 import b64decode
+from collections import OrderedDict
+from typing import Optional, Dict, Callable, Iterator, List, Set, Tuple
 
 import requests
 import socketio
 from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PublicKey
 
-from chate2e.client.models import DataManager
+from chate2e.client.device_sessions import DeviceSessions
+from chate2e.client.dispatcher import MessageDispatcher
+from chate2e.client.file_transfer import FileTransfer, FileTransferError, format_size, parse_file_message
+from chate2e.client.models import DataManager, UserStatus
+from chate2e.client.user_cache import UserCache
+from chate2e.crypto.protocol.sender_key import GroupCipher, encode_sender_key_message, parse_sender_key_message
 from chate2e.crypto.protocol.signal_protocol import SignalProtocol
 from chate2e.model.bundle import Bundle
-from chate2e.model.message import Message, MessageType
+from chate2e.model.message import Message, MessageType, PRIMARY_DEVICE_ID
+from chate2e.utils.tracing import get_tracer, now_ns
 
 
 class ChatClient:
-    def __init__(self, server_url: str, data_manager: DataManager):
+    OFFLINE_PAGE_SIZE = 100
+    OFFLINE_SYNC_KEY = "offline-sync"
+    PRESENCE_KEY = "presence"
+    MAX_PENDING_GROUP_MESSAGES = 100  # 每个发送者等待发送者密钥的群消息上限
+    MAX_SEND_RETRIES = 3  # 服务器限流（429）时的重试次数
+    MAX_RETRY_WAIT = 5.0  # 单次退避的最长等待（秒）
+
+    def __init__(self, server_url: str, data_manager: DataManager, device_id: str = PRIMARY_DEVICE_ID):
         self.server_url = server_url
         self.sio = socketio.Client()  # 使用同步版本的 socketio 客户端
         self.protocol = SignalProtocol()
+        # 多设备：与对方每个设备分别建立会话，共享本设备的身份密钥
+        self.device_id = device_id
+        self.data_manager = data_manager
+        # 设备会话的棘轮状态每次变化后加密保存，重启后恢复，不需要重新X3DH消耗一次性预密钥
+        self.device_sessions = DeviceSessions(self.protocol, device_id,
+                                              persist=data_manager.save_device_session)
         self.user_id: Optional[str] = None
         self.username: Optional[str] = None
-        self.data_manager = data_manager
+        # 旧版单会话协议（self.protocol）的棘轮状态锁；设备会话各自加锁（DeviceSessions.lock_for），
+        # 本地存储的写入由DataManager.lock保护，不同会话的解密与保存可以在多个分发线程中并行
+        self._protocol_lock = threading.RLock()
         self.sessions: Dict[str, bool] = {}
         self.message_handlers: List[Callable] = []
         self.friend_update_handlers: List[Callable] = []  # 好友更新回调列表
+        self.message_sync_handlers: List[Callable] = []  # 离线消息同步完成回调列表
+        self.group_message_handlers: List[Callable] = []  # 群消息回调列表
+
+        # 群组：发送者密钥只经两两会话分发一次，之后每条群消息只加密一次
+        self.group_cipher = GroupCipher()
+        self.groups: Dict[str, dict] = {}  # group_id -> {group_id, name, owner, members}
+        self._sender_key_sent: Dict[str, Set[str]] = {}  # group_id -> 已收到当前发送链的成员
+        # 发送者密钥尚未到达的群消息 (group_id, sender_id) -> [Message]
+        self._pending_group_messages: Dict[Tuple[str, str], List[Message]] = {}
+        self._group_lock = threading.Lock()
+
+        # 接收线程只负责投递，耗时处理交给按会话分片的工作线程
+        self.dispatcher = MessageDispatcher()
+        # 登录后的离线同步期间暂存实时消息，同步完成后再按到达顺序处理，保证会话内顺序
+        self._live_lock = threading.Lock()
+        self._held_live: Optional[List[Tuple[dict, int]]] = None
+
+        # 用户名/密钥指纹缓存，批量查询并按etag重新验证
+        self.user_cache = UserCache(self._lookup_users)
+
+        # 流式加密文件传输
+        self.file_transfer = FileTransfer(server_url)
+
+        # 可选的端到端延迟追踪（未配置导出器时不生成追踪上下文）
+        self.tracer = get_tracer()
 
         # 注册好友请求事件
+        # 服务器推送的事件不能丢弃：分片队列满时暂存到溢出列表，接收线程从不阻塞
         @self.sio.on('friend_request')
         def on_friend_request(data):
-            try:
-                print(f"收到好友请求: {data}")
-                from chate2e.client.models import Friend, UserStatus
-                # 自动添加好友
-                new_friend = Friend(
-                    user_id=data['user_id'],
-                    username=data['username'],
-                    avatar_path='',
-                    status=UserStatus.ONLINE
-                )
-                self.data_manager.add_friend(new_friend)
-                print(f"已自动添加好友: {data['username']}")
-                
-                # 触发好友列表刷新回调
-                for handler in getattr(self, 'friend_update_handlers', []):
-                    handler()
-                    
-            except Exception as e:
-                print(f"处理好友请求失败: {e}")
+            self.dispatcher.submit(f"friend:{data.get('user_id')}", self._handle_friend_request, data, spill=True)
         
         # 注册好友删除事件
         @self.sio.on('friend_removed')
         def on_friend_removed(data):
-            try:
-                print(f"收到好友删除通知: {data}")
-                # 删除好友
-                removed_user_id = data['user_id']
-                self.data_manager.user.remove_friend(removed_user_id)
-                self.data_manager.save_user_profile()
-                print(f"已删除好友: {removed_user_id}")
-                
-                # 触发好友列表刷新回调
-                for handler in getattr(self, 'friend_update_handlers', []):
-                    handler()
-                    
-            except Exception as e:
-                print(f"处理好友删除失败: {e}")
+            self.dispatcher.submit(f"friend:{data.get('user_id')}", self._handle_friend_removed, data, spill=True)
         
+        # 注册联系人在线状态事件（服务器合并后批量推送）
+        @self.sio.on('presence')
+        def on_presence(data):
+            self.dispatcher.submit(self.PRESENCE_KEY, self._handle_presence, data, spill=True)
+
+        # 注册群组变更事件，与该群组的群消息在同一分片中按序处理
+        @self.sio.on('group_updated')
+        def on_group_updated(data):
+            self.dispatcher.submit(data.get('group_id'), self._handle_group_updated, data, spill=True)
+
         # 注册消息处理事件
         @self.sio.on('new_message')
         def on_new_message(data):
-            try:
-                # 解析接收到的消息
-                message = Message.from_dict(data)
-                
-                # 确保消息是发给自己的
-                if message.header.receiver_id != self.user_id:
+            received_at = now_ns()
+            with self._live_lock:
+                if self._held_live is not None:
+                    self._held_live.append((data, received_at))
                     return
+            session_id = (data.get('header') or {}).get('session_id')
+            self.dispatcher.submit(session_id, self._handle_new_message, data, received_at, spill=True)
+
+    def _handle_friend_request(self, data: dict):
+        """处理好友请求（工作线程）"""
+        try:
+            print(f"收到好友请求: {data}")
+            from chate2e.client.models import Friend
+            # 自动添加好友（实时请求的发起方必然在线，离线补发的请求由登录后的联系人同步修正状态）
+            new_friend = Friend(
+                user_id=data['user_id'],
+                username=data['username'],
+                avatar_path='',
+                status=UserStatus.ONLINE
+            )
+            self.data_manager.add_friend(new_friend)
+            print(f"已自动添加好友: {data['username']}")
+            
+            # 触发好友列表刷新回调
+            for handler in self.friend_update_handlers:
+                handler()
+                
+        except Exception as e:
+            print(f"处理好友请求失败: {e}")
+
+    def _handle_friend_removed(self, data: dict):
+        """处理好友删除通知（工作线程）"""
+        try:
+            print(f"收到好友删除通知: {data}")
+            # 删除好友
+            removed_user_id = data['user_id']
+            with self.data_manager.lock:
+                self.data_manager.user.remove_friend(removed_user_id)
+                self.data_manager.save_user_profile()
+            print(f"已删除好友: {removed_user_id}")
+            
+            # 触发好友列表刷新回调
+            for handler in self.friend_update_handlers:
+                handler()
+                
+        except Exception as e:
+            print(f"处理好友删除失败: {e}")
+
+    def _handle_presence(self, data: dict):
+        """处理批量在线状态更新（工作线程）"""
+        statuses = {update['user_id']: update['status'] for update in data.get('updates', [])}
+        if self.apply_presence(statuses):
+            for handler in self.friend_update_handlers:
+                handler()
+
+    def apply_presence(self, statuses: Dict[str, str]) -> bool:
+        """把在线状态应用到本地好友列表（只保存在内存中，不落盘）
+
+        Returns:
+            bool: 是否有好友状态发生变化
+        """
+        user = self.data_manager.user
+        if not user:
+            return False
+        changed = False
+        for user_id, status in statuses.items():
+            friend = user.get_friend(user_id)
+            new_status = UserStatus.from_str(status)
+            if friend and friend.status != new_status:
+                friend.status = new_status
+                changed = True
+        return changed
+
+    def get_presence_sync(self, user_ids: List[str]) -> Dict[str, str]:
+        """批量查询用户在线状态
+
+        Returns:
+            Dict[str, str]: user_id -> 状态字符串，请求失败时返回空字典
+        """
+        if not user_ids:
+            return {}
+        try:
+            response = requests.post(
+                f"{self.server_url}/presence",
+                json={'user_ids': user_ids},
+                timeout=5
+            )
+            if response.status_code == 200:
+                return response.json().get('presence', {})
+            print(f"[Client] ✗ 查询在线状态失败: {response.status_code}")
+        except Exception as e:
+            print(f"[Client] ✗ 查询在线状态失败: {e}")
+        return {}
+
+    def get_contacts_sync(self) -> Optional[List[dict]]:
+        """从服务器获取好友列表及在线状态
+
+        Returns:
+            [{'user_id', 'username', 'status'}, ...]，请求失败时返回None
+        """
+        try:
+            response = requests.get(f"{self.server_url}/contacts/{self.user_id}", timeout=5)
+            if response.status_code == 200:
+                return response.json().get('contacts', [])
+            print(f"[Client] ✗ 获取联系人失败: {response.status_code}")
+        except Exception as e:
+            print(f"[Client] ✗ 获取联系人失败: {e}")
+        return None
+
+    def sync_contacts(self):
+        """登录后一次请求同步好友列表与在线状态，之后依赖服务器推送的增量
+
+        服务器上的好友关系合并到本地；只存在于本地的好友（服务端好友关系建立之前添加的）
+        保留，并单独批量查询其在线状态。
+        """
+        user = self.data_manager.user
+        if not user:
+            return
+        contacts = self.get_contacts_sync()
+        if contacts is None:
+            return
+
+        from chate2e.client.models import Friend
+        added = False
+        statuses: Dict[str, str] = {}
+        with self.data_manager.lock:
+            for contact in contacts:
+                statuses[contact['user_id']] = contact['status']
+                if user.get_friend(contact['user_id']) is None:
+                    added |= user.add_friend(Friend(
+                        user_id=contact['user_id'],
+                        username=contact['username'],
+                        avatar_path=''
+                    ))
+            if added:
+                self.data_manager.save_user_profile()
 
-                if message.header.message_type == MessageType.INITIATE:
-                    # 初始化会话 - 使用发送方的session_id
-                    session = self.data_manager.get_or_create_session_with_id(
-                        message.header.session_id,
-                        message.header.sender_id
-                    )
-                    print(f"[Client] 接收到会话初始化请求，session_id: {message.header.session_id}")
-                    
-                    self.init_session_bob(message)
-                    self.protocol.session_initialized = True
-                    #保存消息
-                    self.data_manager.add_message(message.header.session_id, message)
+        local_only = [friend.user_id for friend in user.friends if friend.user_id not in statuses]
+        statuses.update(self.get_presence_sync(local_only))
+
+        if self.apply_presence(statuses) or added:
+            for handler in self.friend_update_handlers:
+                handler()
+
+    def _handle_new_message(self, data: dict, received_at: Optional[int] = None):
+        """处理新消息（工作线程，同一会话内按序执行）"""
+        try:
+            # 解析接收到的消息
+            message = Message.from_dict(data)
+            if message.header.trace is not None:
+                message.header.trace.mark('client.received', received_at)
+                message.header.trace.mark('client.dispatched')
+
+            # 群消息的接收者是群组
+            if message.header.message_type == MessageType.BROADCAST:
+                self._handle_group_message(message)
+                return
+            
+            # 确保消息是发给自己的
+            if message.header.receiver_id != self.user_id:
+                return
+
+            if message.header.message_type == MessageType.INITIATE:
+                # 初始化会话 - 使用发送方的session_id
+                session = self.data_manager.get_or_create_session_with_id(
+                    message.header.session_id,
+                    message.header.sender_id
+                )
+                print(f"[Client] 接收到会话初始化请求，session_id: {message.header.session_id}")
+
+                if message.header.sender_device_id is not None:
+                    # 来自设备会话：只建立该设备的会话，不需要ACK
+                    self.device_sessions.accept(message)
                     return
+                self.init_session_bob(message)
+                self.protocol.session_initialized = True
+                #保存消息
+                self.data_manager.add_message(message.header.session_id, message)
+                return
 
-                if message.header.message_type == MessageType.ACK_INITIATE:
-                    self.protocol.session_initialized = True
+            if message.header.message_type == MessageType.ACK_INITIATE:
+                self.protocol.session_initialized = True
+                return
+            
+            # 处理普通消息
+            if message.header.message_type == MessageType.MESSAGE:
+                if message.header.sender_device_id is None and not self.protocol.session_initialized:
+                    print(f"[Client] ✗ 会话未初始化，无法解密")
                     return
                 
-                # 处理普通消息
-                if message.header.message_type == MessageType.MESSAGE:
-                    if not self.protocol.session_initialized:
-                        print(f"[Client] ✗ 会话未初始化，无法解密")
-                        return
-                    
-                    # 通知所有注册的消息处理器
-                    for handler in self.message_handlers:
-                        handler(message)
+                # 通知所有注册的消息处理器；同一会话的消息由同一个分发线程按序处理，
+                # 解密只锁定发送设备的会话，保存由DataManager加锁，不阻塞其他会话
+                for handler in self.message_handlers:
+                    handler(message)
 
+        except Exception as e:
+            print(f"[Client] ✗ 消息处理失败: {e}")
+            import traceback
+            traceback.print_exc()
+
+    def _handle_group_updated(self, group: dict):
+        """处理群组变更（工作线程）：有成员离开时轮换自己的发送链，新链只分发给剩余成员"""
+        group_id = group['group_id']
+        members = set(group['members'])
+        with self._group_lock:
+            if self.user_id not in members:
+                self.groups.pop(group_id, None)
+                self._sender_key_sent.pop(group_id, None)
+                self.group_cipher.forget_group(group_id)
+                print(f"[Client] 已离开群组 {group_id}")
+                return
+            previous = self.groups.get(group_id)
+            self.groups[group_id] = group
+            removed = set(previous['members']) - members if previous else set()
+            for member_id in removed:
+                self.group_cipher.forget_sender(group_id, member_id)
+            if removed:
+                self.group_cipher.rotate(group_id)
+                self._sender_key_sent[group_id] = set()
+                print(f"[Client] 群组 {group_id} 成员离开，已轮换发送者密钥")
+
+    def _handle_group_message(self, message: Message) -> Optional[str]:
+        """解密群消息并通知群消息处理器，返回明文
+
+        发送者密钥经两两会话分发，可能晚于群消息到达，此时暂存到密钥到达后再解密。
+        解密失败与暂存在同一次加锁中完成，consume_sender_key保存密钥并取走暂存消息也持有这把锁，
+        密钥不会恰好在两者之间到达而使消息永远留在暂存区。
+        """
+        group_id = message.header.session_id
+        sender_id = message.header.sender_id
+        with self._group_lock:
+            try:
+                plaintext = self.group_cipher.decrypt(message)
+            except KeyError:
+                pending = self._pending_group_messages.setdefault((group_id, sender_id), [])
+                if len(pending) < self.MAX_PENDING_GROUP_MESSAGES:
+                    pending.append(message)
+                else:
+                    print(f"[Client] ✗ {sender_id} 在群组 {group_id} 中等待密钥的消息过多，丢弃")
+                return None
             except Exception as e:
-                print(f"[Client] ✗ 消息处理失败: {e}")
-                import traceback
-                traceback.print_exc()
+                print(f"[Client] ✗ 群消息解密失败: {e}")
+                return None
+        if message.header.trace is not None:
+            message.header.trace.mark('client.decrypted')
+        for handler in self.group_message_handlers:
+            handler(message, plaintext)
+        self.finish_trace(message)
+        self.schedule_file_download(plaintext)
+        return plaintext
+
+    def consume_sender_key(self, plaintext, sender_id: str) -> bool:
+        """如果两两会话中的明文是发送者密钥分发，保存该密钥并返回True（不作为聊天消息显示）"""
+        distribution = parse_sender_key_message(plaintext)
+        if not distribution:
+            return False
+        if distribution['sender_id'] != sender_id:
+            print(f"[Client] ✗ 忽略 {sender_id} 代发的发送者密钥")
+            return True
+        group_id = distribution['group_id']
+        with self._group_lock:
+            self.group_cipher.process_distribution(distribution)
+            pending = self._pending_group_messages.pop((group_id, sender_id), [])
+        print(f"[Client] ✓ 收到 {sender_id} 在群组 {group_id} 中的发送者密钥")
+        # 暂存的消息直接在本线程中解密，不经过可能丢弃任务的分发队列；
+        # 发送链按计数器派生消息密钥，与群组分片中新到达的消息乱序解密也没有问题
+        for message in pending:
+            self._handle_group_message(message)
+        return True
+
+    def register_group_message_handler(self, handler: Callable[[Message, str], None]):
+        """注册群消息处理器
+
+        Args:
+            handler: 回调函数，接收 (message: Message, plaintext: str)
+        """
+        if handler not in self.group_message_handlers:
+            self.group_message_handlers.append(handler)
+
+    def sync_groups(self) -> Dict[str, dict]:
+        """从服务器同步自己加入的群组"""
+        try:
+            response = requests.get(f"{self.server_url}/groups/user/{self.user_id}", timeout=5)
+            if response.status_code != 200:
+                print(f"[Client] ✗ 同步群组失败: {response.status_code}")
+                return self.groups
+            groups = {group['group_id']: group for group in response.json()['groups']}
+        except Exception as e:
+            print(f"[Client] ✗ 同步群组失败: {e}")
+            return self.groups
+        for group in groups.values():
+            self._handle_group_updated(group)
+        return self.groups
+
+    def create_group_sync(self, name: str, member_ids: List[str]) -> Optional[dict]:
+        """创建群组，返回群组信息"""
+        try:
+            response = requests.post(f"{self.server_url}/groups",
+                                     json={'user_id': self.user_id, 'name': name, 'members': member_ids},
+                                     timeout=5)
+            if response.status_code != 200:
+                print(f"[Client] ✗ 创建群组失败: {response.json().get('message')}")
+                return None
+            group = response.json()['group']
+        except Exception as e:
+            print(f"[Client] ✗ 创建群组失败: {e}")
+            return None
+        with self._group_lock:
+            self.groups[group['group_id']] = group
+        return group
+
+    def distribute_sender_key(self, group_id: str) -> List[str]:
+        """把自己当前的发送链经两两会话发给尚未收到的成员
+
+        Returns:
+            List[str]: 分发失败的成员，下次发送时重试
+        """
+        with self._group_lock:
+            group = self.groups.get(group_id)
+            if group is None:
+                return []
+            distribution = self.group_cipher.get_distribution(group_id, self.user_id)
+            sent = self._sender_key_sent.setdefault(group_id, set())
+            pending = [m for m in group['members'] if m != self.user_id and m not in sent]
+        if not pending:
+            return []
+
+        plaintext = encode_sender_key_message(distribution)
+        failed = []
+        for member_id in pending:
+            session_id = self.get_session_id_sync(member_id)
+            if session_id and self.send_text_sync(member_id, session_id, plaintext):
+                with self._group_lock:
+                    # 分发期间发送链可能已轮换，旧链不计入
+                    if self.group_cipher.own_key(group_id).key_id == distribution['key_id']:
+                        self._sender_key_sent.setdefault(group_id, set()).add(member_id)
+            else:
+                failed.append(member_id)
+        return failed
+
+    def send_group_message_sync(self, group_id: str, text: str) -> bool:
+        """发送群消息：必要时先分发发送者密钥，然后只加密一次，由服务器扇出给全部成员"""
+        if group_id not in self.groups:
+            print(f"[Client] ✗ 未加入群组 {group_id}")
+            return False
+        failed = self.distribute_sender_key(group_id)
+        if failed:
+            print(f"[Client] ⚠ {len(failed)} 个成员尚未收到发送者密钥，将在下次发送时重试")
+        trace = self.tracer.start()
+        if trace is not None:
+            trace.mark('client.encrypt')
+        with self._group_lock:
+            message = self.group_cipher.encrypt(group_id, self.user_id, text)
+        if trace is not None:
+            message.header.trace = trace
+            trace.mark('client.send')
+            self.tracer.export(trace, 'sender')
+        try:
+            response = self._post_with_backoff(f"{self.server_url}/handle_message", json=message.to_dict(), timeout=10)
+            return response.status_code == 200
+        except Exception as e:
+            print(f"[Client] ✗ 发送群消息失败: {e}")
+            return False
+
+    def schedule_file_download(self, plaintext) -> bool:
+        """如果明文是文件消息，提交后台下载（按blob_id分片，不阻塞会话内后续消息）"""
+        descriptor = parse_file_message(plaintext)
+        if not descriptor:
+            return False
+        return self.dispatcher.submit(f"file:{descriptor['blob_id']}", self.download_file, descriptor)
+
+    def download_file(self, descriptor: dict) -> Optional[str]:
+        """下载并解密接收到的文件到用户的下载目录，返回保存路径"""
+        os.makedirs(self.data_manager.downloads_dir, exist_ok=True)
+        name = os.path.basename(descriptor.get('name') or '') or descriptor['blob_id']
+        target = os.path.join(self.data_manager.downloads_dir, name)
+        try:
+            size = self.file_transfer.download_file(descriptor, target, self.user_id)
+            print(f"[Client] ✓ 文件已保存: {target} ({format_size(size)})")
+            return target
+        except FileTransferError as e:
+            print(f"[Client] ✗ {e}")
+            return None
+
+    def dispatch_stats(self) -> dict:
+        """消息分发队列的背压指标"""
+        return self.dispatcher.stats()
 
     def register_message_handler(self, handler: Callable[[Message], None]):
         """注册消息处理器
@@ -126,6 +503,15 @@ class ChatClient:
         if handler not in self.friend_update_handlers:
             self.friend_update_handlers.append(handler)
 
+    def register_message_sync_handler(self, handler: Callable[[List[str]], None]):
+        """注册离线消息同步完成处理器
+
+        Args:
+            handler: 回调函数，接收有新消息的session_id列表
+        """
+        if handler not in self.message_sync_handlers:
+            self.message_sync_handlers.append(handler)
+
     def register_sync(self, username: str) -> bool:
         """同步注册新用户"""
         try:
@@ -185,13 +571,211 @@ class ChatClient:
                 transports=['websocket', 'polling']
             )
             if self.user_id:
-                self.sio.emit('login', {'user_id': self.user_id})
-                return True
+                # 先拉取离线消息再登录，保证同一会话中离线消息先于实时消息解密；
+                # 登录任务不能丢弃，分片队列满时暂存，只有分发器已关闭时提交失败
+                if self.dispatcher.submit(self.OFFLINE_SYNC_KEY, self._login_and_sync, spill=True):
+                    return True
+                print("[Client] ✗ 无法提交登录与离线同步任务，断开连接")
+                self.sio.disconnect()
             return False
         except Exception as e:
             print(f"连接WebSocket服务器失败: {e}")
             raise ConnectionError(f"WebSocket连接失败: {str(e)}")
 
+    def restore_device_sessions(self) -> int:
+        """恢复本地保存的设备会话（登录流水线加载身份密钥之后调用）"""
+        restored = self.device_sessions.restore(self.data_manager.load_device_sessions())
+        if restored:
+            print(f"[Client] ✓ 恢复 {restored} 个设备会话")
+        return restored
+
+    def _login_and_sync(self):
+        """拉取离线消息 -> 登录socket -> 再次拉取登录前最后时刻到达的离线消息
+
+        登录后服务器立即开始推送实时消息，而第二次拉取的离线消息更早，
+        因此第二次同步期间实时消息先暂存，同步完成后在本线程中按到达顺序处理，
+        然后才恢复按会话分片的并行处理。
+        """
+        self.restore_device_sessions()
+        self.sync_groups()
+        self.sync_offline_messages()
+        with self._live_lock:
+            self._held_live = []
+        try:
+            self.sio.emit('login', {'user_id': self.user_id, 'device_id': self.device_id})
+            self.sync_offline_messages()
+        finally:
+            self._release_live_messages()
+        self.dispatcher.submit(self.PRESENCE_KEY, self.sync_contacts)
+
+    def _release_live_messages(self):
+        """处理离线同步期间暂存的实时消息，处理完毕后恢复直接分发"""
+        while True:
+            with self._live_lock:
+                held = self._held_live
+                if not held:
+                    self._held_live = None
+                    return
+                self._held_live = []
+            for data, received_at in held:
+                self._handle_new_message(data, received_at)
+
+    def sync_offline_messages(self) -> int:
+        """拉取并处理全部离线消息，完成后通知同步处理器
+
+        Returns:
+            int: 处理的离线消息数量
+        """
+        count = 0
+        session_ids = []
+        for message, _ in self.iter_offline_messages():
+            count += 1
+            if message.header.session_id not in session_ids:
+                session_ids.append(message.header.session_id)
+        if session_ids:
+            print(f"[Client] ✓ 离线消息同步完成，共 {count} 条")
+            for handler in self.message_sync_handlers:
+                handler(session_ids)
+        return count
+
+    def iter_offline_messages(self, limit: int = OFFLINE_PAGE_SIZE) -> Iterator[Tuple[Message, Optional[str]]]:
+        """分页拉取离线消息并按会话顺序解密
+
+        每一页的消息按会话分组（组内保持服务器序号顺序）依次处理，
+        整页一次性写入本地存储并向服务器确认删除之后，才逐条产出该页的结果。
+        调用方中途停止迭代不会留下已解密（棘轮已前进）但未保存的消息；
+        保存失败时不确认，该页留在服务器上。
+
+        Args:
+            limit: 每页消息数
+
+        Yields:
+            (原始消息, 解密后的明文)；会话初始化等控制消息的明文为None
+        """
+        cursor = 0
+        while True:
+            try:
+                response = requests.get(
+                    f"{self.server_url}/messages/offline/{self.user_id}",
+                    params={'cursor': cursor, 'limit': limit, 'device_id': self.device_id},
+                    timeout=10
+                )
+                if response.status_code != 200:
+                    print(f"[Client] ✗ 拉取离线消息失败: {response.status_code}")
+                    return
+                result = response.json()
+            except Exception as e:
+                print(f"[Client] ✗ 拉取离线消息失败: {e}")
+                return
+
+            messages = [Message.from_dict(data) for data in result['messages']]
+            if not messages:
+                return
+            traced = []
+            for message in messages:
+                if message.header.trace is not None:
+                    message.header.trace.mark('client.fetched')
+                    # 群消息在解密后由群消息处理流程结束追踪
+                    if message.header.message_type != MessageType.BROADCAST:
+                        traced.append(message)
+
+            by_session: Dict[str, List[Message]] = OrderedDict()
+            for message in messages:
+                by_session.setdefault(message.header.session_id, []).append(message)
+
+            batch: Dict[str, List[Message]] = {}
+            processed: List[Tuple[Message, Optional[str]]] = []
+            for session_id, session_messages in by_session.items():
+                for message in session_messages:
+                    stored, plaintext = self._process_offline_message(message)
+                    if stored is not None:
+                        batch.setdefault(session_id, []).append(stored)
+                    processed.append((message, plaintext))
+
+            # 整页一次写入，保存成功后才确认删除
+            try:
+                self.data_manager.add_messages(batch)
+            except Exception as e:
+                print(f"[Client] ✗ 保存离线消息失败，不确认该页: {e}")
+                return
+            for message in traced:
+                self.finish_trace(message)
+            cursor = result['cursor']
+            self._ack_offline_messages(cursor)
+            yield from processed
+            if not result['has_more']:
+                return
+
+    def _process_offline_message(self, message: Message) -> Tuple[Optional[Message], Optional[str]]:
+        """处理单条离线消息
+
+        Returns:
+            (需要保存到本地的消息, 明文)
+        """
+        if message.header.message_type == MessageType.BROADCAST:
+            # 群消息不保存到两两会话中，交给群消息处理器
+            return None, self._handle_group_message(message)
+
+        if message.header.receiver_id != self.user_id:
+            return None, None
+
+        if message.header.message_type == MessageType.INITIATE:
+            self.data_manager.get_or_create_session_with_id(
+                message.header.session_id,
+                message.header.sender_id
+            )
+            if message.header.sender_device_id is not None:
+                self.device_sessions.accept(message)
+                return None, None
+            self.init_session_bob(message)
+            self.protocol.session_initialized = True
+            return message, None
+
+        if message.header.message_type == MessageType.ACK_INITIATE:
+            self.protocol.session_initialized = True
+            return None, None
+
+        if message.header.message_type == MessageType.MESSAGE:
+            try:
+                plaintext = self.decrypt_message(message)
+            except Exception as e:
+                print(f"[Client] ✗ 离线消息解密失败: {e}")
+                return None, None
+            if self.consume_sender_key(plaintext, message.header.sender_id):
+                return None, None
+            self.data_manager.get_or_create_session_with_id(
+                message.header.session_id,
+                message.header.sender_id
+            )
+            # 与实时消息一致，本地保存解密后的内容
+            stored = Message(
+                message_id=message.header.message_id,
+                session_id=message.header.session_id,
+                sender_id=message.header.sender_id,
+                receiver_id=message.header.receiver_id,
+                encrypted_content=plaintext,
+                message_type=MessageType.MESSAGE,
+                encryption=message.encryption,
+                timestamp=message.header.timestamp
+            )
+            self.schedule_file_download(plaintext)
+            return stored, plaintext
+
+        return None, None
+
+    def _ack_offline_messages(self, cursor: int) -> bool:
+        """确认离线消息已持久化"""
+        try:
+            response = requests.post(
+                f"{self.server_url}/messages/offline/{self.user_id}/ack",
+                json={'cursor': cursor, 'device_id': self.device_id},
+                timeout=5
+            )
+            return response.status_code == 200
+        except Exception as e:
+            print(f"[Client] ✗ 确认离线消息失败: {e}")
+            return False
+
     def init_session_bob(self, message: Message):
         """Bob端初始化会话"""
         try:
@@ -202,16 +786,18 @@ class ChatClient:
             ephemeral_key = X25519PublicKey.from_public_bytes(x3dh_params.ephemeral_key_pub)
 
             # 初始化Signal会话
-            ack_message = self.protocol.initiate_session(
-                peer_id=message.header.sender_id,
-                session_id=message.header.session_id,
-                recipient_identity_key=identity_key,
-                recipient_signed_prekey=signed_prekey,
-                recipient_one_time_prekey=None,  # 这个参数只在Alice作为发起方时使用
-                recipient_ephemeral_key=ephemeral_key,
-                own_one_time_prekey=one_time_prekey,  # Bob自己的one_time_prekey
-                is_initiator=False
-            )
+            with self._protocol_lock:
+                ack_message = self.protocol.initiate_session(
+                    peer_id=message.header.sender_id,
+                    session_id=message.header.session_id,
+                    recipient_identity_key=identity_key,
+                    recipient_signed_prekey=signed_prekey,
+                    recipient_one_time_prekey=None,  # 这个参数只在Alice作为发起方时使用
+                    recipient_ephemeral_key=ephemeral_key,
+                    own_one_time_prekey=one_time_prekey,  # Bob自己的one_time_prekey
+                    is_initiator=False,
+                    peer_codecs=x3dh_params.codecs
+                )
             
             # 标记会话已初始化并保存session_id映射
             self.sessions[message.header.sender_id] = True
@@ -220,7 +806,7 @@ class ChatClient:
             # 发送确认消息（直接发送HTTP请求，避免递归）
             print(f"[Client] 发送ACK_INITIATE消息，session_id: {message.header.session_id}")
             message_dict = ack_message.to_dict()
-            response = requests.post(
+            response = self._post_with_backoff(
                 f"{self.server_url}/handle_message",
                 json=message_dict
             )
@@ -264,55 +850,41 @@ class ChatClient:
         try:
             # 1. 从服务器获取或创建session_id
             if not session_id:
-                print(f"[Client] 从服务器获取会话ID")
-                response = requests.post(
-                    f"{self.server_url}/session/get",
-                    json={
-                        'user1_id': self.user_id,
-                        'user2_id': peer_id
-                    },
-                    timeout=5
-                )
-                
-                if response.status_code != 200:
-                    print(f"获取会话ID失败: {response.status_code}")
+                session_id = self.get_session_id_sync(peer_id)
+                if not session_id:
                     return False, None
-                
-                result = response.json()
-                session_id = result['session_id']
-                is_new = result['is_new']
-                print(f"[Client] 获得会话ID: {session_id} (新会话: {is_new})")
             
             print(f"[Client] 正在初始化与 {peer_id} 的会话，session_id: {session_id}")
             
-            # 2. 获取对方的Bundle
-            response = requests.get(f"{self.server_url}/key_bundle/{peer_id}")
-            if response.status_code != 200:
-                print(f"获取对方Bundle失败: {response.status_code}")
+            # 2. 获取对方的Bundle（长期密钥走缓存+条件请求）与一个新的一次性预密钥
+            one_time_prekey_pub = self.claim_one_time_prekey(peer_id)
+            if one_time_prekey_pub is None:
+                return False, None
+            peer_bundle = self.get_user_bundle(peer_id)
+            if peer_bundle is None:
                 return False, None
-
-            bundle_data = response.json()['key_bundle']
-            peer_bundle = Bundle.from_dict(bundle_data)
 
             # 3. 将bytes转换为X25519PublicKey对象
             identity_key = X25519PublicKey.from_public_bytes(peer_bundle.identity_key_pub)
             signed_prekey = X25519PublicKey.from_public_bytes(peer_bundle.signed_pre_key_pub)
-            one_time_prekey = X25519PublicKey.from_public_bytes(next(iter(peer_bundle.one_time_pre_keys_pub)))
+            one_time_prekey = X25519PublicKey.from_public_bytes(one_time_prekey_pub)
 
             # 4. 初始化Signal会话
-            x3dh_message = self.protocol.initiate_session(
-                peer_id=peer_id,
-                session_id=session_id,
-                recipient_identity_key=identity_key,
-                recipient_signed_prekey=signed_prekey,
-                recipient_one_time_prekey=one_time_prekey,
-                is_initiator=True
-            )
+            with self._protocol_lock:
+                x3dh_message = self.protocol.initiate_session(
+                    peer_id=peer_id,
+                    session_id=session_id,
+                    recipient_identity_key=identity_key,
+                    recipient_signed_prekey=signed_prekey,
+                    recipient_one_time_prekey=one_time_prekey,
+                    is_initiator=True,
+                    peer_codecs=peer_bundle.codecs
+                )
 
             # 5. 发送X3DH消息（直接发送，不检查会话状态，避免递归）
             print(f"[Client] 发送会话初始化消息到服务器")
             message_dict = x3dh_message.to_dict()
-            response = requests.post(
+            response = self._post_with_backoff(
                 f"{self.server_url}/handle_message",
                 json=message_dict
             )
@@ -346,6 +918,164 @@ class ChatClient:
             traceback.print_exc()
             return False, None
 
+    def get_session_id_sync(self, peer_id: str) -> Optional[str]:
+        """从服务器获取（或创建）与peer的会话ID"""
+        print(f"[Client] 从服务器获取会话ID")
+        try:
+            response = requests.post(
+                f"{self.server_url}/session/get",
+                json={
+                    'user1_id': self.user_id,
+                    'user2_id': peer_id
+                },
+                timeout=5
+            )
+            if response.status_code != 200:
+                print(f"获取会话ID失败: {response.status_code}")
+                return None
+            result = response.json()
+        except Exception as e:
+            print(f"获取会话ID失败: {e}")
+            return None
+        print(f"[Client] 获得会话ID: {result['session_id']} (新会话: {result['is_new']})")
+        return result['session_id']
+
+    def get_device_bundles(self, peer_id: str) -> List[Tuple[str, Bundle]]:
+        """获取对方全部设备的Bundle [(device_id, bundle)]"""
+        try:
+            response = requests.get(f"{self.server_url}/key_bundle/{peer_id}/devices", timeout=5)
+            if response.status_code != 200:
+                print(f"获取设备列表失败: {response.status_code}")
+                return []
+            devices = response.json()['devices']
+        except Exception as e:
+            print(f"获取设备列表失败: {e}")
+            return []
+        return [(device['device_id'], Bundle.from_dict(device['key_bundle'])) for device in devices]
+
+    def send_text_sync(self, peer_id: str, session_id: str, text: str) -> bool:
+        """把一条文本发给对方的全部设备
+
+        与尚未建立会话的设备先经X3DH建立会话（INITIATE不需要等待ACK），
+        然后为每个设备分别加密，全部消息在一次请求中提交给服务器按序投递。
+        被限流时会阻塞等待重试，界面中经MessageSendWorker在后台线程调用。
+        """
+        devices = self.get_device_bundles(peer_id)
+        if not devices:
+            print(f"[Client] ✗ {peer_id} 没有可用的设备")
+            return False
+
+        # 领取一次性预密钥是网络请求，在加锁之外完成
+        prekeys: Dict[str, bytes] = {}
+        for device_id, _ in devices:
+            if self.device_sessions.get(peer_id, device_id) is None:
+                one_time_prekey = self.claim_one_time_prekey(peer_id, device_id)
+                if one_time_prekey is not None:
+                    prekeys[device_id] = one_time_prekey
+
+        messages: List[Message] = []
+        for device_id, bundle in devices:
+            # “没有会话则建立”与加密在该设备会话的锁内完成，不影响与其他设备的会话
+            with self.device_sessions.lock_for(peer_id, device_id):
+                if self.device_sessions.get(peer_id, device_id) is None:
+                    if device_id not in prekeys:
+                        continue
+                    messages.append(self.device_sessions.initiate(peer_id, device_id, session_id,
+                                                                  bundle, prekeys[device_id]))
+                trace = self.tracer.start()
+                if trace is not None:
+                    trace.mark('client.encrypt')
+                message = self.device_sessions.encrypt(peer_id, device_id, text, session_id)
+            message.header.trace = trace
+            messages.append(message)
+        if not messages:
+            return False
+        for message in messages:
+            if message.header.trace is not None:
+                message.header.trace.mark('client.send')
+                self.tracer.export(message.header.trace, 'sender')
+
+        failed = []
+        for attempt in range(self.MAX_SEND_RETRIES + 1):
+            try:
+                response = self._post_with_backoff(
+                    f"{self.server_url}/handle_messages",
+                    json={'messages': [message.to_dict() for message in messages]},
+                    timeout=10
+                )
+                if response.status_code != 200:
+                    print(f"[Client] ✗ 批量发送失败: {response.status_code}")
+                    return False
+                results = response.json()['results']
+            except Exception as e:
+                print(f"[Client] ✗ 批量发送失败: {e}")
+                return False
+            # 接收方拥塞（429）的消息退避后单独重发，其余结果即为最终结果
+            retry = [(message, result) for message, result in zip(messages, results) if result.get('code') == 429]
+            failed.extend(result for result in results if result.get('code') not in (200, 429))
+            if not retry or attempt == self.MAX_SEND_RETRIES:
+                failed.extend(result for _, result in retry)
+                break
+            self._backoff(max(result.get('retry_after', 1.0) for _, result in retry))
+            messages = [message for message, _ in retry]
+        for result in failed:
+            print(f"[Client] ✗ 消息被拒绝: {result.get('message')}")
+        return not failed
+
+    def _backoff(self, wait: float) -> None:
+        print(f"[Client] 服务器要求退避 {wait:.2f} 秒")
+        time.sleep(min(max(wait, 0.0), self.MAX_RETRY_WAIT))
+
+    def _post_with_backoff(self, url: str, **kwargs) -> requests.Response:
+        """POST请求；服务器返回429时按其给出的等待时间退避后重试"""
+        for attempt in range(self.MAX_SEND_RETRIES + 1):
+            response = requests.post(url, **kwargs)
+            if response.status_code != 429 or attempt == self.MAX_SEND_RETRIES:
+                return response
+            try:
+                wait = float(response.json().get('retry_after'))
+            except (ValueError, TypeError, AttributeError):
+                wait = float(response.headers.get('Retry-After', 1))
+            self._backoff(wait)
+        return response
+
+    def decrypt_message(self, message: Message) -> str:
+        """解密两两会话消息：带发送设备ID的消息使用对应设备的会话，否则使用单会话协议"""
+        if message.header.sender_device_id is not None:
+            plaintext = self.device_sessions.decrypt(message)
+        else:
+            with self._protocol_lock:
+                plaintext = self.protocol.decrypt_message(message)
+        if message.header.trace is not None:
+            message.header.trace.mark('client.decrypted')
+        return plaintext
+
+    def finish_trace(self, message: Message) -> None:
+        """消息已保存到本地后结束追踪，导出接收方视角的完整记录"""
+        trace = message.header.trace
+        if trace is None:
+            return
+        trace.mark('client.stored')
+        self.tracer.export(trace, 'recipient')
+
+    def register_device_sync(self) -> bool:
+        """把本机作为已有账号(self.user_id)的新设备注册：生成本设备的身份密钥并上传Bundle"""
+        try:
+            self.protocol.initialize_identity(self.user_id)
+            bundle = self.protocol.create_bundle()
+            response = requests.put(
+                f"{self.server_url}/devices/{self.user_id}/{self.device_id}",
+                json={'key_bundle': bundle.to_dict()},
+                timeout=5
+            )
+            if response.status_code != 200:
+                print(f"[Client] ✗ 设备注册失败: {response.json().get('message')}")
+                return False
+            return True
+        except Exception as e:
+            print(f"[Client] ✗ 设备注册失败: {e}")
+            return False
+
     def send_message_sync(self, peer_id: str, message: Message) -> bool:
         """同步发送加密消息"""
         # 注意：不在这里检查会话状态，由调用方负责初始化会话
@@ -357,11 +1087,13 @@ class ChatClient:
             print(f"[DEBUG] 发送前encrypted_content类型: {type(message.encrypted_content)}")
             print(f"[DEBUG] 发送前encrypted_content长度: {len(message.encrypted_content) if hasattr(message.encrypted_content, '__len__') else 'N/A'}")
             
+            if message.header.trace is not None:
+                message.header.trace.mark('client.send')
             message_dict = message.to_dict()
             print(f"[DEBUG] to_dict后encrypted_content: {message_dict['encrypted_content'][:50]}...")
             
             # 发送到服务器
-            response = requests.post(
+            response = self._post_with_backoff(
                 f"{self.server_url}/handle_message",
                 json=message_dict
             )
@@ -386,19 +1118,29 @@ class ChatClient:
         """
         获取指定用户的密钥Bundle
 
+        Bundle按用户缓存在SignalProtocol中，带上缓存版本做条件请求，
+        长期密钥未变化时服务器返回304，直接复用缓存，不重新解析。
+        缓存中的一次性预密钥可能已被他人使用，建立会话时应通过claim_one_time_prekey获取。
+
         Args:
             user_id: 目标用户ID
 
         Returns:
             Bundle: 用户的密钥Bundle，如果获取失败则返回None
         """
+        cached, version = self.protocol.get_peer_bundle(user_id)
+        headers = {'If-None-Match': f'"{version}"'} if cached is not None and version else {}
         try:
-            # 发送GET请求获取用户Bundle
+            # 发送条件GET请求获取用户Bundle
             response = requests.get(
                 f"{self.server_url}/key_bundle/{user_id}",
+                headers=headers,
                 timeout=5
             )
 
+            if response.status_code == 304:
+                return cached
+
             # 检查响应状态码
             if response.status_code != 200:
                 print(f"获取Bundle失败: 服务器返回状态码 {response.status_code}")
@@ -410,8 +1152,9 @@ class ChatClient:
                 print(f"获取Bundle失败: {result.get('message')}")
                 return None
 
-            # 将字典转换为Bundle对象
+            # 将字典转换为Bundle对象并缓存
             bundle = Bundle.from_dict(result['key_bundle'])
+            self.protocol.set_peer_bundle(user_id, bundle, result.get('version'))
             return bundle
 
         except requests.exceptions.ConnectionError:
@@ -423,7 +1166,28 @@ class ChatClient:
         except Exception as e:
             print(f"获取Bundle失败: {str(e)}")
             return None
-    
+
+    def claim_one_time_prekey(self, user_id: str, device_id: str = PRIMARY_DEVICE_ID) -> Optional[bytes]:
+        """向服务器申请目标用户某个设备的一个一次性预密钥（服务器保证不重复分配）
+
+        如果返回的版本与缓存的Bundle不一致，说明对方已更新长期密钥，缓存失效。
+        """
+        try:
+            response = requests.post(f"{self.server_url}/key_bundle/{user_id}/prekey",
+                                     json={'device_id': device_id}, timeout=5)
+            if response.status_code != 200:
+                print(f"获取一次性预密钥失败: {response.status_code}")
+                return None
+            result = response.json()
+            _, version = self.protocol.get_peer_bundle(user_id)
+            if device_id == PRIMARY_DEVICE_ID and version and result.get('version') != version:
+                self.protocol.peer_key_bundle.pop(user_id, None)
+                self.protocol.peer_bundle_versions.pop(user_id, None)
+            return b64decode(result['one_time_pre_key'])
+        except Exception as e:
+            print(f"获取一次性预密钥失败: {e}")
+            return None
+
     def add_friend_sync(self, friend_id: str) -> bool:
         """同步添加好友并通知对方
         
@@ -489,16 +1253,30 @@ class ChatClient:
             print(f"删除好友失败: {str(e)}")
             return False
 
-    def get_user_name(self, user_id):
-        """获取用户昵称"""
+    def _lookup_users(self, user_ids: List[str], known: Dict[str, str]) -> Optional[dict]:
+        """批量查询用户信息（UserCache的回源函数）"""
         try:
-            response = requests.get(
-                f"{self.server_url}/user/{user_id}",
+            response = requests.post(
+                f"{self.server_url}/users/lookup",
+                json={'user_ids': user_ids, 'known': known},
                 timeout=5
             )
             if response.status_code == 200:
-                return response.json().get('username')
+                return response.json()
+            print(f"[Client] ✗ 批量查询用户失败: {response.status_code}")
         except Exception as e:
-            print(f"获取用户昵称失败: {e}")
+            print(f"[Client] ✗ 批量查询用户失败: {e}")
         return None
 
+    def get_users(self, user_ids: List[str]) -> Dict[str, dict]:
+        """批量获取用户信息 {user_id: {'username', 'fingerprint', 'etag'}}"""
+        return self.user_cache.get_many(user_ids)
+
+    def get_user_name(self, user_id):
+        """获取用户昵称"""
+        info = self.user_cache.get(user_id)
+        return info.get('username') if info else None
+
+    def user_cache_stats(self) -> dict:
+        """用户信息缓存的命中指标"""
+        return self.user_cache.stats()
@@ -0,0 +1,255 @@
+import threading
+import time
+from base64 import b64decode, b64encode
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PublicKey
+
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+from chate2e.model.bundle import Bundle
+from chate2e.model.message import Message
+
+# (对方用户, 对方设备, 会话记录或None) -> None，None表示会话已删除
+PersistCallback = Callable[[str, str, Optional[dict]], None]
+
+
+class DeviceSessions:
+    """按 (对方用户, 对方设备) 管理的双棘轮会话
+
+    每个会话由本设备的SignalProtocol.fork()创建，共享本设备的身份密钥与一次性预密钥，
+    棘轮状态相互独立。发出的消息在消息头中标记双方设备ID，服务器据此投递到指定设备。
+    响应方收到INITIATE后即可计算出会话密钥，不需要回复ACK_INITIATE，
+    因此发起方可以把INITIATE与第一条消息在同一个批次中发送。
+
+    双方同时发起（glare）时，两端按 (用户ID, 设备ID) 较小一方发起的会话达成一致；
+    被替换的会话保留PREVIOUS_SESSION_TTL秒，用于解密对方切换会话前已发出的消息。
+    每次棘轮状态变化后通过persist回调保存，重启后恢复，不需要重新进行X3DH。
+
+    每个 (对方用户, 对方设备) 有自己的锁（lock_for），棘轮步进与保存在该锁内完成，
+    不同设备会话的加解密可以在多个分发线程中并行；self._lock只保护各个字典。
+    """
+    PREVIOUS_SESSION_TTL = 7 * 24 * 3600
+
+    def __init__(self, identity: SignalProtocol, device_id: str,
+                 persist: Optional[PersistCallback] = None):
+        """
+        Args:
+            identity: 本设备的协议实例（身份密钥与预密钥）
+            device_id: 本设备ID
+            persist: 会话状态变化后的保存回调，为None时只保存在内存中
+        """
+        self.identity = identity
+        self.device_id = device_id
+        self.persist = persist
+        self._sessions: Dict[Tuple[str, str], SignalProtocol] = {}
+        # 建立当前会话的INITIATE中的临时公钥，用于识别重复投递的INITIATE
+        self._handshakes: Dict[Tuple[str, str], bytes] = {}
+        # 本设备发起、尚未收到对方任何消息的会话
+        self._pending: Set[Tuple[str, str]] = set()
+        # 被替换的会话及替换时间
+        self._previous: Dict[Tuple[str, str], Tuple[SignalProtocol, float]] = {}
+        self._key_locks: Dict[Tuple[str, str], threading.RLock] = {}
+        self._lock = threading.Lock()
+
+    def lock_for(self, peer_id: str, device_id: str) -> threading.RLock:
+        """与对方某个设备的会话锁，调用方需要“检查后建立会话”等组合操作时持有"""
+        key = (peer_id, device_id)
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.RLock()
+            return lock
+
+    def get(self, peer_id: str, device_id: str) -> Optional[SignalProtocol]:
+        return self._sessions.get((peer_id, device_id))
+
+    def devices_of(self, peer_id: str) -> List[str]:
+        """已与对方建立会话的设备"""
+        with self._lock:
+            return [device_id for (user_id, device_id) in self._sessions if user_id == peer_id]
+
+    def _stamp(self, message: Message, receiver_device_id: str) -> Message:
+        message.header.sender_device_id = self.device_id
+        message.header.receiver_device_id = receiver_device_id
+        return message
+
+    def _record(self, key: Tuple[str, str]) -> Optional[dict]:
+        """会话的持久化记录（调用方持有self._lock）"""
+        session = self._sessions.get(key)
+        if session is None:
+            return None
+        handshake = self._handshakes.get(key)
+        record = {
+            'session': session.export_session_state(),
+            'handshake': b64encode(handshake).decode('utf-8') if handshake else None,
+            'pending': key in self._pending,
+            'previous': None,
+            'replaced_at': None,
+        }
+        previous = self._previous.get(key)
+        if previous is not None:
+            record['previous'] = previous[0].export_session_state()
+            record['replaced_at'] = previous[1]
+        return record
+
+    def _save(self, key: Tuple[str, str]):
+        if self.persist is None:
+            return
+        with self._lock:
+            record = self._record(key)
+        self.persist(key[0], key[1], record)
+
+    def restore(self, records: Dict[Tuple[str, str], dict]) -> int:
+        """从持久化记录恢复会话（身份密钥需已加载），已存在的会话不被覆盖
+
+        Returns:
+            int: 恢复的会话数
+        """
+        restored = 0
+        with self._lock:
+            for key, record in records.items():
+                if key in self._sessions:
+                    continue
+                session = self.identity.fork()
+                session.import_session_state(record['session'])
+                self._sessions[key] = session
+                if record.get('handshake'):
+                    self._handshakes[key] = b64decode(record['handshake'])
+                if record.get('pending'):
+                    self._pending.add(key)
+                if record.get('previous') and record.get('replaced_at') is not None:
+                    previous = self.identity.fork()
+                    previous.import_session_state(record['previous'])
+                    self._previous[key] = (previous, record['replaced_at'])
+                restored += 1
+        return restored
+
+    def initiate(self, peer_id: str, device_id: str, session_id: str,
+                 bundle: Bundle, one_time_prekey: bytes) -> Message:
+        """作为发起方与对方的一个设备建立会话，返回需要发送的INITIATE消息"""
+        key = (peer_id, device_id)
+        with self.lock_for(peer_id, device_id):
+            session = self.identity.fork()
+            message = session.initiate_session(
+                peer_id=peer_id,
+                session_id=session_id,
+                recipient_identity_key=X25519PublicKey.from_public_bytes(bundle.identity_key_pub),
+                recipient_signed_prekey=X25519PublicKey.from_public_bytes(bundle.signed_pre_key_pub),
+                recipient_one_time_prekey=X25519PublicKey.from_public_bytes(one_time_prekey),
+                is_initiator=True,
+                peer_codecs=bundle.codecs
+            )
+            with self._lock:
+                self._replace(key, session, message.X3DHparams.ephemeral_key_pub)
+                self._pending.add(key)
+            self._save(key)
+        return self._stamp(message, device_id)
+
+    def _replace(self, key: Tuple[str, str], session: SignalProtocol, handshake: bytes):
+        """切换当前会话，旧会话转为previous（调用方持有self._lock）"""
+        current = self._sessions.get(key)
+        if current is not None:
+            self._previous[key] = (current, time.time())
+        self._sessions[key] = session
+        self._handshakes[key] = handshake
+        self._pending.discard(key)
+
+    def _wins_glare(self, key: Tuple[str, str]) -> bool:
+        """双方同时发起时，(用户ID, 设备ID)较小一方发起的会话胜出"""
+        return (self.identity.user_id, self.device_id) < key
+
+    def accept(self, message: Message) -> SignalProtocol:
+        """作为响应方处理对方设备的INITIATE消息，返回处理后的当前会话
+
+        - 重复投递的INITIATE（临时公钥与当前会话相同）被忽略，不会重置棘轮；
+        - 本设备发起的会话还未收到对方消息而又收到对方的INITIATE时为glare，
+          本设备胜出则保留自己的会话，对方的会话只作为previous用于解密，
+          否则与对方已建立的会话一样被替换，旧会话保留为previous。
+        """
+        x3dh_params = message.X3DHparams
+        key = (message.header.sender_id, message.header.sender_device_id)
+        with self.lock_for(*key):
+            with self._lock:
+                if key in self._sessions and self._handshakes.get(key) == x3dh_params.ephemeral_key_pub:
+                    print(f"[Client] 忽略重复的INITIATE: {key[0]}/{key[1]}")
+                    return self._sessions[key]
+
+            session = self.identity.fork()
+            session.initiate_session(
+                peer_id=message.header.sender_id,
+                session_id=message.header.session_id,
+                recipient_identity_key=X25519PublicKey.from_public_bytes(x3dh_params.identity_key_pub),
+                recipient_signed_prekey=X25519PublicKey.from_public_bytes(x3dh_params.signed_pre_key_pub),
+                recipient_ephemeral_key=X25519PublicKey.from_public_bytes(x3dh_params.ephemeral_key_pub),
+                own_one_time_prekey=X25519PublicKey.from_public_bytes(x3dh_params.one_time_pre_keys_pub),
+                is_initiator=False,
+                peer_codecs=x3dh_params.codecs
+            )
+            with self._lock:
+                if key in self._pending and self._wins_glare(key):
+                    print(f"[Client] 双方同时发起会话，保留本设备发起的会话: {key[0]}/{key[1]}")
+                    self._previous[key] = (session, time.time())
+                else:
+                    self._replace(key, session, x3dh_params.ephemeral_key_pub)
+                current = self._sessions[key]
+            self._save(key)
+        return current
+
+    def encrypt(self, peer_id: str, device_id: str, plaintext: str, session_id: Optional[str] = None) -> Message:
+        """用与对方某个设备的会话加密"""
+        with self.lock_for(peer_id, device_id):
+            session = self._sessions.get((peer_id, device_id))
+            if session is None:
+                raise KeyError(f"没有与 {peer_id}/{device_id} 的会话")
+            if session_id:
+                session.session_id = session_id
+            message = self._stamp(session.encrypt_message(plaintext), device_id)
+            self._save((peer_id, device_id))
+        return message
+
+    def decrypt(self, message: Message) -> str:
+        """用与发送设备的会话解密，当前会话失败时尝试未过期的previous会话
+
+        解密失败不会修改会话状态，因此可以依次尝试；
+        角色与消息互补（对方是发起方而本会话是响应方，或相反）的会话优先尝试。
+        """
+        key = (message.header.sender_id, message.header.sender_device_id)
+        with self.lock_for(*key):
+            with self._lock:
+                current = self._sessions.get(key)
+                previous = self._previous.get(key)
+                if previous is not None and time.time() - previous[1] > self.PREVIOUS_SESSION_TTL:
+                    del self._previous[key]
+                    previous = None
+            candidates = [session for session in (current, previous and previous[0]) if session is not None]
+            if not candidates:
+                raise KeyError(f"没有与 {key[0]}/{key[1]} 的会话")
+            candidates.sort(key=lambda session: session.is_initiator == message.encryption.is_initiator)
+
+            error = None
+            for session in candidates:
+                try:
+                    plaintext = session.decrypt_message(message)
+                except Exception as e:
+                    error = e
+                    continue
+                if session is current:
+                    with self._lock:
+                        # 对方已使用本设备发起的会话，不再有glare
+                        self._pending.discard(key)
+                self._save(key)
+                return plaintext
+            raise error
+
+    def forget_device(self, peer_id: str, device_id: str) -> bool:
+        """对方设备被移除后丢弃对应会话"""
+        key = (peer_id, device_id)
+        with self.lock_for(peer_id, device_id):
+            with self._lock:
+                self._handshakes.pop(key, None)
+                self._pending.discard(key)
+                self._previous.pop(key, None)
+                removed = self._sessions.pop(key, None) is not None
+            if removed and self.persist is not None:
+                self.persist(peer_id, device_id, None)
+        return removed
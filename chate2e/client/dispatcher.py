@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+
+class MessageDispatcher:
+    """客户端消息分发器
+
+    Socket.IO客户端的接收线程只负责把事件投递到这里，解密、落盘、发送ACK等
+    耗时操作由工作线程完成。按key（通常是session_id）哈希分片到固定的工作线程，
+    同一会话的消息严格按到达顺序处理（双棘轮要求按序解密），不同会话可以并行。
+
+    每个分片是一个有界队列。默认队列满时submit立即返回False并计入dropped；
+    不能丢弃的任务（如双棘轮消息）以spill=True提交，队列满时暂存到该分片的溢出列表，
+    由工作线程在队列腾出空位时按顺序移回队列。submit在任何情况下都不阻塞调用线程，
+    一个会话处理缓慢不会卡住Socket.IO接收线程（以及其他会话、ping与ack）。
+    溢出列表非空时，后续任务一律排在溢出列表之后，同一个key的顺序保持不变。
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 256, name: str = "dispatch"):
+        if workers < 1 or queue_size < 1:
+            raise ValueError("workers和queue_size必须为正数")
+        self.queue_size = queue_size
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        # 每个分片的溢出列表及保护它的锁；溢出列表中的任务总是晚于队列中的任务
+        self._overflows: List[Deque[tuple]] = [deque() for _ in range(workers)]
+        self._shard_locks = [threading.Lock() for _ in range(workers)]
+        self._stats_lock = threading.Lock()
+        self._submitted = 0
+        self._processed = 0
+        self._dropped = 0
+        self._spilled = 0
+        self._max_overflow = 0
+        self._failed = 0
+        self._max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, args=(i,), name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _shard(self, key: Optional[str]) -> int:
+        """同一个key总是映射到同一个分片"""
+        return zlib.crc32((key or "").encode('utf-8')) % len(self._queues)
+
+    def submit(self, key: Optional[str], handler: Callable, *args, spill: bool = False) -> bool:
+        """提交一个任务
+
+        Args:
+            key: 排序键，相同key的任务按提交顺序串行执行
+            handler: 在工作线程中执行的回调
+            *args: 回调参数
+            spill: 队列满时是否暂存到溢出列表；为False时立即丢弃任务
+
+        Returns:
+            bool: 是否成功入队；已关闭或（不溢出时）队列已满时返回False
+        """
+        if self._closed:
+            return False
+        index = self._shard(key)
+        shard, overflow = self._queues[index], self._overflows[index]
+        item = (time.monotonic(), handler, args)
+        spilled = 0
+        with self._shard_locks[index]:
+            if not overflow:
+                try:
+                    shard.put_nowait(item)
+                    item = None
+                except queue.Full:
+                    pass
+            if item is not None:
+                if not spill:
+                    with self._stats_lock:
+                        self._dropped += 1
+                    print(f"[Dispatcher] ✗ 队列已满，丢弃任务 (key={key})")
+                    return False
+                overflow.append(item)
+                spilled = len(overflow)
+        depth = shard.qsize()
+        with self._stats_lock:
+            self._submitted += 1
+            if depth > self._max_depth:
+                self._max_depth = depth
+            if spilled:
+                self._spilled += 1
+                if spilled > self._max_overflow:
+                    self._max_overflow = spilled
+        return True
+
+    def _refill(self, index: int) -> None:
+        """把溢出列表头部的任务移回腾出空位的队列（工作线程每取出一个任务调用一次）"""
+        shard, overflow = self._queues[index], self._overflows[index]
+        with self._shard_locks[index]:
+            while overflow:
+                try:
+                    shard.put_nowait(overflow[0])
+                except queue.Full:
+                    return
+                overflow.popleft()
+
+    def _worker(self, index: int):
+        shard = self._queues[index]
+        while True:
+            item = shard.get()
+            # 先补充队列再执行任务：溢出列表非空时队列中始终有未完成的任务，join()不会提前返回
+            self._refill(index)
+            if item is None:
+                shard.task_done()
+                return
+            enqueued_at, handler, args = item
+            waited = time.monotonic() - enqueued_at
+            failed = False
+            try:
+                handler(*args)
+            except Exception as e:
+                failed = True
+                print(f"[Dispatcher] ✗ 任务执行失败: {e}")
+                import traceback
+                traceback.print_exc()
+            finally:
+                shard.task_done()
+            with self._stats_lock:
+                self._processed += 1
+                self._failed += failed
+                self._wait_total += waited
+                if waited > self._wait_max:
+                    self._wait_max = waited
+
+    def join(self):
+        """等待所有已入队的任务执行完毕"""
+        for shard in self._queues:
+            shard.join()
+
+    def stats(self) -> Dict:
+        """背压指标快照"""
+        with self._stats_lock:
+            processed = self._processed
+            return {
+                'workers': len(self._queues),
+                'queue_size': self.queue_size,
+                'queue_depths': [q.qsize() for q in self._queues],
+                'overflow_depths': [len(overflow) for overflow in self._overflows],
+                'submitted': self._submitted,
+                'processed': processed,
+                'dropped': self._dropped,
+                'spilled': self._spilled,
+                'max_overflow': self._max_overflow,
+                'failed': self._failed,
+                'max_depth': self._max_depth,
+                'avg_wait_ms': (self._wait_total / processed * 1000) if processed else 0.0,
+                'max_wait_ms': self._wait_max * 1000,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """停止接收新任务，处理完已入队的任务后退出工作线程"""
+        if self._closed:
+            return
+        self._closed = True
+        for index, shard in enumerate(self._queues):
+            # 结束标记排在溢出任务之后，已接受的任务都会执行
+            with self._shard_locks[index]:
+                try:
+                    if self._overflows[index]:
+                        raise queue.Full
+                    shard.put_nowait(None)
+                except queue.Full:
+                    self._overflows[index].append(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
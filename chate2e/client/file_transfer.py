@@ -0,0 +1,199 @@
+import json
+import os
+from typing import BinaryIO, Callable, Iterator, List, Optional
+
+import requests
+
+from chate2e.crypto.file_cipher import FileCipher
+
+# 文件消息的明文前缀：文件描述（blob_id、文件名、文件密钥）经双棘轮加密后作为普通消息发送
+FILE_MESSAGE_PREFIX = "chate2e-file:"
+
+ProgressFn = Callable[[int, int], None]  # (已完成字节数, 总字节数)
+
+
+class FileTransferError(Exception):
+    """文件上传/下载失败"""
+
+
+def encode_file_message(descriptor: dict) -> str:
+    """把文件描述编码为消息明文"""
+    return FILE_MESSAGE_PREFIX + json.dumps(descriptor, ensure_ascii=False)
+
+
+def parse_file_message(text) -> Optional[dict]:
+    """如果消息明文是文件描述则解析返回，否则返回None"""
+    if isinstance(text, bytes):
+        try:
+            text = text.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+    if not isinstance(text, str) or not text.startswith(FILE_MESSAGE_PREFIX):
+        return None
+    try:
+        descriptor = json.loads(text[len(FILE_MESSAGE_PREFIX):])
+    except json.JSONDecodeError:
+        return None
+    return descriptor if isinstance(descriptor, dict) and 'blob_id' in descriptor else None
+
+
+def format_size(size: int) -> str:
+    """文件大小的可读形式"""
+    value = float(size)
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024 or unit == 'GB':
+            return f"{value:.0f} {unit}" if unit == 'B' else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+class FileTransfer:
+    """流式加密文件传输
+
+    上传：逐块读取、加密并以流的形式PATCH到服务器，每个请求携带SEGMENT_CHUNKS块；
+    请求失败时向服务器查询已接收的偏移，从该偏移重新生成密文续传。
+    下载：流式读取密文，按块对齐解密后写入临时文件，全部校验通过才替换为目标文件。
+    内存占用只与块大小有关，与文件大小无关。
+    """
+    SEGMENT_CHUNKS = 8
+    DOWNLOAD_BUFFER = 256 * 1024
+    MAX_RETRIES = 3
+
+    def __init__(self, server_url: str, chunk_size: int = FileCipher.DEFAULT_CHUNK_SIZE):
+        self.server_url = server_url
+        self.chunk_size = chunk_size
+        self.http = requests.Session()
+
+    def _segment(self, source: BinaryIO, cipher: FileCipher, plain_size: int,
+                 offset: int) -> Iterator[bytes]:
+        """从密文偏移offset开始生成至多SEGMENT_CHUNKS块密文"""
+        start_chunk = cipher.locate(offset)
+        skip = offset - start_chunk * cipher.encrypted_chunk_size
+        stream = cipher.encrypt_stream(source, plain_size, start_chunk)
+        for sent, chunk in enumerate(stream):
+            if sent >= self.SEGMENT_CHUNKS:
+                break
+            if skip:
+                chunk = chunk[skip:]
+                skip = 0
+            yield chunk
+
+    def _upload_offset(self, upload_id: str) -> int:
+        response = self.http.get(f"{self.server_url}/blobs/uploads/{upload_id}", timeout=10)
+        if response.status_code != 200:
+            raise FileTransferError(f"查询上传进度失败: {response.status_code}")
+        return response.json()['offset']
+
+    def upload_file(self, path: str, user_id: str, recipients: Optional[List[str]] = None,
+                    progress: Optional[ProgressFn] = None) -> dict:
+        """加密并上传文件
+
+        Args:
+            path: 本地文件路径
+            user_id: 上传者ID
+            recipients: 接收者ID，全部接收者确认下载后服务器回收附件
+            progress: 进度回调，参数为密文字节数
+
+        Returns:
+            dict: 文件描述，需通过双棘轮会话发送给接收方
+
+        Raises:
+            FileTransferError: 上传失败
+        """
+        cipher = FileCipher.generate(self.chunk_size)
+        plain_size = os.path.getsize(path)
+        total = cipher.encrypted_size(plain_size)
+
+        response = self.http.post(f"{self.server_url}/blobs/uploads",
+                                  json={'user_id': user_id, 'size': total,
+                                        'recipients': recipients or []},
+                                  timeout=10)
+        if response.status_code != 200:
+            raise FileTransferError(f"创建上传失败: {response.status_code}")
+        upload_id = response.json()['upload_id']
+
+        offset = 0
+        failures = 0  # 连续失败次数
+        with open(path, 'rb') as source:
+            while offset < total:
+                try:
+                    response = self.http.patch(
+                        f"{self.server_url}/blobs/uploads/{upload_id}",
+                        data=self._segment(source, cipher, plain_size, offset),
+                        headers={'Upload-Offset': str(offset),
+                                 'Content-Type': 'application/octet-stream'},
+                        timeout=60
+                    )
+                    if response.status_code == 200:
+                        failures = 0
+                    elif response.status_code != 409:
+                        raise FileTransferError(f"上传失败: {response.status_code}")
+                    else:
+                        # 偏移不一致，按服务器返回的偏移续传
+                        failures += 1
+                    offset = response.json()['offset']
+                except (requests.RequestException, FileTransferError) as e:
+                    failures += 1
+                    if failures > self.MAX_RETRIES:
+                        raise FileTransferError(f"上传失败: {e}")
+                    print(f"[Client] ✗ 上传中断，准备续传: {e}")
+                    offset = self._upload_offset(upload_id)
+                if failures > self.MAX_RETRIES:
+                    raise FileTransferError("上传没有进展")
+                if progress:
+                    progress(offset, total)
+
+        response = self.http.post(f"{self.server_url}/blobs/uploads/{upload_id}/complete", timeout=10)
+        if response.status_code != 200:
+            raise FileTransferError(f"完成上传失败: {response.status_code}")
+
+        result = response.json()
+        return {
+            'blob_id': result['blob_id'],
+            'name': os.path.basename(path),
+            'size': plain_size,
+            'encrypted_size': total,
+            'cipher': cipher.to_dict(),
+            # 接收者凭各自的令牌确认下载，描述只经端到端加密会话发送给接收者
+            'ack_tokens': result.get('ack_tokens', {})
+        }
+
+    def download_file(self, descriptor: dict, target_path: str, user_id: Optional[str] = None,
+                      progress: Optional[ProgressFn] = None) -> int:
+        """下载并解密文件，全部块校验通过后向服务器确认（需提供user_id，且描述中有该用户的确认令牌）
+
+        Returns:
+            int: 明文字节数
+
+        Raises:
+            FileTransferError: 下载失败或密文认证失败
+        """
+        cipher = FileCipher.from_dict(descriptor['cipher'])
+        total = descriptor['encrypted_size']
+        tmp_path = target_path + '.part'
+
+        def pieces(response) -> Iterator[bytes]:
+            received = 0
+            for piece in response.iter_content(self.DOWNLOAD_BUFFER):
+                received += len(piece)
+                if progress:
+                    progress(received, total)
+                yield piece
+
+        try:
+            with self.http.get(f"{self.server_url}/blobs/{descriptor['blob_id']}",
+                               stream=True, timeout=60) as response:
+                if response.status_code != 200:
+                    raise FileTransferError(f"下载失败: {response.status_code}")
+                with open(tmp_path, 'wb') as target:
+                    written = cipher.decrypt_stream(pieces(response), target, total)
+            os.replace(tmp_path, target_path)
+            token = (descriptor.get('ack_tokens') or {}).get(user_id) if user_id else None
+            if token:
+                self.http.post(f"{self.server_url}/blobs/{descriptor['blob_id']}/ack",
+                               json={'user_id': user_id, 'token': token}, timeout=10)
+            return written
+        except (requests.RequestException, ValueError) as e:
+            raise FileTransferError(f"下载失败: {e}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,42 @@
+from typing import List
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from chate2e.client.file_transfer import FileTransfer
+
+
+class FileUploadSignals(QObject):
+    """文件上传工作线程信号"""
+    progress = pyqtSignal(int)  # 百分比
+    succeeded = pyqtSignal(dict)  # 文件描述
+    failed = pyqtSignal(str)  # 错误信息
+
+
+class FileUploadWorker(QRunnable):
+    """在QThreadPool中加密并上传文件，避免大文件读取/加密/网络传输阻塞UI线程
+
+    文件描述上传完成后经ChatWindow._send_text进入与普通消息相同的发送线程，保证发送顺序一致。
+    """
+
+    def __init__(self, file_transfer: FileTransfer, path: str, user_id: str, recipients: List[str]):
+        super().__init__()
+        self.file_transfer = file_transfer
+        self.path = path
+        self.user_id = user_id
+        self.recipients = recipients
+        self.signals = FileUploadSignals()
+        self._last_percent = -1
+
+    def _on_progress(self, done: int, total: int):
+        percent = done * 100 // total if total else 100
+        if percent != self._last_percent:
+            self._last_percent = percent
+            self.signals.progress.emit(percent)
+
+    def run(self):
+        try:
+            descriptor = self.file_transfer.upload_file(self.path, self.user_id, self.recipients,
+                                                        progress=self._on_progress)
+            self.signals.succeeded.emit(descriptor)
+        except Exception as e:
+            self.signals.failed.emit(f"文件上传失败: {str(e)}")
@@ -1,11 +1,12 @@
 from typing import Optional, Callable
 from chate2e.client.client_server import ChatClient
 from chate2e.client.login_ui import LoginUI
+from chate2e.client.login_worker import LoginWorker, LoginStage
 from PyQt6.QtWidgets import QMessageBox, QApplication
 from PyQt6.QtCore import QObject
 from chate2e.client.models import DataManager
 import sys
-from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtCore import QObject, QThreadPool, pyqtSignal
 
 class LoginWindow(QObject):
     login_success = pyqtSignal(str, str)
@@ -16,27 +17,45 @@ class LoginWindow(QObject):
         self.chat_client = chat_client
         self.data_manager = data_manager
         self.on_login_success = None
+        self._login_worker: Optional[LoginWorker] = None
 
         # 绑定信号
         self.login_window.login_clicked.connect(self._handle_login)
         self.login_window.register_clicked.connect(self._handle_register)
         
     def _handle_login(self, username: str, password: str):
-        """处理登录逻辑"""
-        try:
-            # 验证本地密码
-            uuid = self.data_manager.verify_user(username, password)
-            if not uuid:
-                self.login_window.show_error("错误", "用户名或密码错误")
-                self.login_window.clear_password()
-                return
-            self.chat_client.user_id = uuid
-            self.chat_client.username = username
-            self.chat_client.protocol.user_id = uuid
-            self.chat_client.protocol.load_signal_from_local_bundle(self.data_manager.get_local_bundle())
-            self.login_success.emit(username, uuid)
-        except Exception as e:
-            self.login_window.show_error("错误", f"登录失败: {str(e)}")
+        """处理登录逻辑
+
+        密码KDF、档案解析和密钥导入都在线程池中执行，UI线程只负责展示进度。
+        """
+        if self._login_worker is not None:
+            return
+        worker = LoginWorker(self.data_manager, self.chat_client.protocol, username, password)
+        worker.signals.progress.connect(self._on_login_progress)
+        worker.signals.succeeded.connect(self._on_login_succeeded)
+        worker.signals.failed.connect(self._on_login_failed)
+        self._login_worker = worker
+        self.login_window.set_busy(True, LoginStage.PROFILE.value)
+        QThreadPool.globalInstance().start(worker)
+
+    def _on_login_progress(self, stage_index: int, description: str):
+        """登录进度更新（UI线程）"""
+        self.login_window.set_busy(True, description)
+
+    def _on_login_succeeded(self, username: str, uuid: str):
+        """登录成功（UI线程）"""
+        self._login_worker = None
+        self.login_window.set_busy(False)
+        self.chat_client.user_id = uuid
+        self.chat_client.username = username
+        self.login_success.emit(username, uuid)
+
+    def _on_login_failed(self, message: str):
+        """登录失败（UI线程）"""
+        self._login_worker = None
+        self.login_window.set_busy(False)
+        self.login_window.show_error("错误", message)
+        self.login_window.clear_password()
             
     def _handle_register(self, username: str, password: str):
         """处理注册逻辑"""
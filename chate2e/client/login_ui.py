@@ -197,6 +197,12 @@ class LoginUI(QWidget):
         """显示成功消息"""
         QMessageBox.information(self, title, message)
         
+    def set_busy(self, busy: bool, text: str = ""):
+        """设置登录中状态：禁用按钮并在登录按钮上显示进度"""
+        self.login_btn.setEnabled(not busy)
+        self.register_btn.setEnabled(not busy)
+        self.login_btn.setText(text if busy and text else "登录")
+        
     def _handle_login_click(self):
         """处理登录按钮点击"""
         username = self.username_edit.text().strip()
@@ -0,0 +1,109 @@
+import enum
+from typing import Callable, Optional
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from chate2e.client.models import DataManager
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+
+
+class LoginStage(enum.Enum):
+    """登录流水线阶段"""
+    PROFILE = "正在读取用户档案..."
+    KDF = "正在验证密码..."
+    UNLOCK = "正在解锁本地数据..."
+    KEYS = "正在加载密钥..."
+    DONE = "登录成功"
+
+
+class LoginError(Exception):
+    """登录失败（用户不存在或密码错误）"""
+
+
+def run_login_pipeline(data_manager: DataManager,
+                       protocol: SignalProtocol,
+                       username: str,
+                       password: str,
+                       progress: Optional[Callable[[LoginStage], None]] = None) -> str:
+    """执行登录流水线：解析档案 -> 密码KDF -> 派生数据密钥并加载会话 -> 导入密钥
+
+    该函数不涉及任何UI操作，可以在工作线程中运行。
+
+    Args:
+        data_manager: 数据管理器
+        protocol: 待加载密钥的Signal协议实例
+        username: 用户名
+        password: 明文密码
+        progress: 可选的阶段回调
+
+    Returns:
+        str: 登录成功的用户UUID
+
+    Raises:
+        LoginError: 用户不存在或密码错误
+    """
+    def report(stage: LoginStage):
+        if progress:
+            progress(stage)
+
+    report(LoginStage.PROFILE)
+    user = data_manager.find_user_profile(username)
+    if not user:
+        raise LoginError("用户名或密码错误")
+
+    report(LoginStage.KDF)
+    if not user.verify_password(password):
+        raise LoginError("用户名或密码错误")
+
+    report(LoginStage.UNLOCK)
+    data_manager.unlock(password)
+    data_manager.load_sessions()
+
+    report(LoginStage.KEYS)
+    protocol.user_id = user.user_id
+    protocol.load_signal_from_local_bundle(data_manager.get_local_bundle())
+
+    report(LoginStage.DONE)
+    return user.user_id
+
+
+class LoginSignals(QObject):
+    """登录工作线程信号（QRunnable不是QObject，需要单独的信号载体）"""
+    progress = pyqtSignal(int, str)  # (阶段序号, 阶段描述)
+    succeeded = pyqtSignal(str, str)  # (username, uuid)
+    failed = pyqtSignal(str)  # 错误信息
+
+
+class LoginWorker(QRunnable):
+    """在QThreadPool中执行登录流水线，避免PBKDF2/scrypt与密钥导入阻塞UI线程"""
+    STAGES = list(LoginStage)
+
+    def __init__(self, data_manager: DataManager, protocol: SignalProtocol,
+                 username: str, password: str):
+        super().__init__()
+        self.data_manager = data_manager
+        self.protocol = protocol
+        self.username = username
+        self.password = password
+        self.signals = LoginSignals()
+
+    def _on_progress(self, stage: LoginStage):
+        self.signals.progress.emit(self.STAGES.index(stage), stage.value)
+
+    def run(self):
+        try:
+            uuid = run_login_pipeline(
+                self.data_manager,
+                self.protocol,
+                self.username,
+                self.password,
+                progress=self._on_progress
+            )
+            self.signals.succeeded.emit(self.username, uuid)
+        except LoginError as e:
+            self.signals.failed.emit(str(e))
+        except Exception as e:
+            self.signals.failed.emit(f"登录失败: {str(e)}")
+        finally:
+            # 不在工作线程中保留明文密码
+            self.password = None
@@ -3,12 +3,15 @@ from typing import List, Dict, Optional , Tuple
 from datetime import datetime, timezone
 from chate2e.model.bundle import Bundle, LocalBundle
 import hashlib
-from base64 import b64encode
+import hmac
+from base64 import b64encode, b64decode
 
-import json
 import os
+import threading
 import uuid
+from chate2e.client.secure_store import SecureStore, EncryptedRecordLog
 from chate2e.model.message import Message
+from chate2e.utils import config, serialization
 import enum
 
 class UserStatus(enum.Enum):
@@ -67,8 +70,12 @@ class UserProfile:
     friends: List[Friend] = field(default_factory=list)  # 好友列表
     password_hash: Optional[str] = None  # 密码哈希值
     salt: Optional[str] = None  # 密码哈希盐值
+    kdf: str = config.DEFAULT_PASSWORD_KDF  # 密码KDF算法
+    kdf_params: Dict[str, int] = field(default_factory=dict)  # KDF参数
     bundle: Optional[Bundle] = None  # 密钥Bundle
     localBundle: Optional[LocalBundle] = None  # 本地密钥Bundle
+    store_salt: Optional[str] = None  # 本地数据密钥派生盐值
+    sealed_local_bundle: Optional[str] = None  # 加密后的本地密钥Bundle
     
     AVATAR_DIR = "assets/avatars"
     DEFAULT_AVATAR = "default.png"
@@ -109,29 +116,58 @@ class UserProfile:
         """获取指定好友"""
         return next((f for f in self.friends if f.user_id == friend_id), None)
     
-    @staticmethod
-    def _hash_password(password: str, salt: str = None) -> Tuple[str, str]:
-        """密码加密"""
+    KDF_DEFAULT_PARAMS = {
+        'pbkdf2': {'iterations': config.PBKDF2_ITERATIONS},
+        'scrypt': {'n': config.SCRYPT_N, 'r': config.SCRYPT_R, 'p': config.SCRYPT_P},
+    }
+
+    @classmethod
+    def _hash_password(cls, password: str, salt: str = None,
+                       kdf: str = 'pbkdf2', kdf_params: Optional[Dict[str, int]] = None) -> Tuple[str, str]:
+        """密码加密
+
+        Args:
+            password: 明文密码
+            salt: 盐值，为空时随机生成
+            kdf: KDF算法，'pbkdf2' 或内存困难型的 'scrypt'
+            kdf_params: KDF参数，为空时使用默认参数
+        """
+        if kdf not in cls.KDF_DEFAULT_PARAMS:
+            raise ValueError(f"不支持的KDF算法: {kdf}")
+        params = kdf_params or cls.KDF_DEFAULT_PARAMS[kdf]
         if not salt:
             salt = b64encode(os.urandom(16)).decode('utf-8')
-        pw_hash = hashlib.pbkdf2_hmac(
-            'sha256', 
-            password.encode(), 
-            salt.encode(), 
-            100000
-        )
+        if kdf == 'scrypt':
+            n, r, p = params['n'], params['r'], params['p']
+            pw_hash = hashlib.scrypt(
+                password.encode(),
+                salt=salt.encode(),
+                n=n, r=r, p=p,
+                maxmem=128 * n * r * p + 1024 * 1024,
+                dklen=32
+            )
+        else:
+            pw_hash = hashlib.pbkdf2_hmac(
+                'sha256',
+                password.encode(),
+                salt.encode(),
+                params['iterations']
+            )
         return b64encode(pw_hash).decode('utf-8'), salt
     
-    def set_password(self, password: str):
+    def set_password(self, password: str, kdf: Optional[str] = None):
         """设置密码"""
-        self.password_hash, self.salt = self._hash_password(password)
+        self.kdf = kdf or config.DEFAULT_PASSWORD_KDF
+        self.kdf_params = dict(self.KDF_DEFAULT_PARAMS[self.kdf])
+        self.password_hash, self.salt = self._hash_password(password, kdf=self.kdf,
+                                                            kdf_params=self.kdf_params)
         
     def verify_password(self, password: str) -> bool:
         """验证密码"""
         if not self.password_hash or not self.salt:
             return False
-        pw_hash, _ = self._hash_password(password, self.salt)
-        return pw_hash == self.password_hash
+        pw_hash, _ = self._hash_password(password, self.salt, self.kdf, self.kdf_params)
+        return hmac.compare_digest(pw_hash, self.password_hash)
     
     def set_bundle(self, bundle: Bundle):
         """设置Signal Bundle"""
@@ -155,7 +191,20 @@ class UserProfile:
         """获取Signal Bundle"""
         return self.bundle  # 直接返回Bundle对象
     
-    def to_dict(self) -> dict:
+    def to_dict(self, store: Optional[SecureStore] = None) -> dict:
+        """转换为字典
+
+        Args:
+            store: 本地加密存储，提供时localBundle中的私钥加密后保存到sealedLocalBundle
+        """
+        local_bundle = self.localBundle.to_dict() if self.localBundle else None
+        sealed_local_bundle = self.sealed_local_bundle
+        if store and local_bundle:
+            sealed_local_bundle = store.seal(
+                serialization.dumps(local_bundle),
+                self.local_bundle_context()
+            )
+            local_bundle = None
         return {
             'user_id': self.user_id,
             'username': self.username,
@@ -164,10 +213,25 @@ class UserProfile:
             'last_seen': self.last_seen.isoformat(),
             'password_hash': self.password_hash,
             'salt': self.salt,
+            'kdf': self.kdf,
+            'kdf_params': self.kdf_params,
+            'store_salt': self.store_salt,
             'bundle': self.bundle.to_dict() if self.bundle else None,  # Bundle对象转字典
-            'localBundle': self.localBundle.to_dict() if self.localBundle else None,
+            'localBundle': local_bundle,
+            'sealedLocalBundle': sealed_local_bundle,
             'friends': [friend.to_dict() for friend in self.friends]
         }
+
+    def local_bundle_context(self) -> bytes:
+        """加密localBundle时使用的AAD"""
+        return f"chate2e:localBundle:{self.user_id}".encode('utf-8')
+
+    def derive_data_key(self, password: str) -> bytes:
+        """由密码派生本地数据密钥（与密码哈希使用相同的KDF，但使用独立的盐值）"""
+        if not self.store_salt:
+            self.store_salt = b64encode(os.urandom(16)).decode('utf-8')
+        key_b64, _ = self._hash_password(password, self.store_salt, self.kdf, self.kdf_params)
+        return b64decode(key_b64)
     
     @classmethod
     def from_dict(cls, data: dict) -> 'UserProfile':
@@ -185,8 +249,13 @@ class UserProfile:
             last_seen=datetime.fromisoformat(data['last_seen']),
             password_hash=data.get('password_hash'),
             salt=data.get('salt'),
+            # 旧版本档案没有kdf字段，均为100000轮PBKDF2
+            kdf=data.get('kdf', 'pbkdf2'),
+            kdf_params=data.get('kdf_params') or {'iterations': 100000},
             bundle=bundle,
             localBundle=local_bundle,
+            store_salt=data.get('store_salt'),
+            sealed_local_bundle=data.get('sealedLocalBundle'),
             friends=[Friend.from_dict(friend_data) for friend_data in data.get('friends', [])]
         )
 
@@ -245,15 +314,20 @@ class ChatSession:
         self.messages.append(message)
         self.update_last_message(message)
     
-    def to_dict(self) -> dict:
+    def to_dict(self, include_messages: bool = True) -> dict:
+        """转换为字典
+
+        Args:
+            include_messages: 为False时只导出会话元数据（消息另存于加密日志）
+        """
         return {
             'session_id': self.session_id,
             'participant1_id': self.participant1_id,
             'participant2_id': self.participant2_id,
-            'last_message': self.last_message.to_dict() if self.last_message else None,
+            'last_message': self.last_message.to_dict() if self.last_message and include_messages else None,
             'created_at': self.created_at.isoformat(),
             'last_active': self.last_active.isoformat(),
-            'messages': [msg.to_dict() for msg in self.messages]
+            'messages': [msg.to_dict() for msg in self.messages] if include_messages else []
         }
     
     @classmethod
@@ -272,48 +346,119 @@ class ChatSession:
         )
 
 class DataManager:
-    """数据管理类"""
+    """数据管理类
+
+    客户端的多个分发线程与UI线程会同时读写会话与消息，所有修改与落盘都在self.lock中进行。
+    self.lock只覆盖本地存储本身；棘轮状态由ChatClient按会话加锁，解密不在这把锁内进行。
+    """
+    DEVICE_SESSION_LOG_SLACK = 64  # 设备会话日志中允许的过期记录数，超过后压缩
+
     def __init__(self, user_id: Optional[str] = None, base_dir: str = "chat_data"):
         self.base_dir = base_dir
         self.useruuid = user_id
+        self.lock = threading.RLock()
         
         # 初始化数据
         self.user: Optional[UserProfile] = None
         self.sessions: Dict[str, ChatSession] = {}
+
+        # 本地加密存储，登录解锁后可用；为None时按明文JSON保存
+        self.store: Optional[SecureStore] = None
+        self._message_log: Optional[EncryptedRecordLog] = None
+        # 设备会话的棘轮状态，只在解锁后加密保存
+        self._device_session_log: Optional[EncryptedRecordLog] = None
         
         # 如果有用户ID，加载用户数据
         if user_id:
-            self.user_data_dir = os.path.join(base_dir, user_id)
-            self.user_file = os.path.join(self.user_data_dir, "user_profile.json")
-            self.sessions_file = os.path.join(self.user_data_dir, "chat_sessions.json")
+            self._set_user_paths(user_id)
             os.makedirs(self.user_data_dir, exist_ok=True)
             self.load_data()
 
+    def _set_user_paths(self, user_uuid: str):
+        """切换到指定用户的数据目录"""
+        self.useruuid = user_uuid
+        self.user_data_dir = os.path.join(self.base_dir, user_uuid)
+        self.user_file = os.path.join(self.user_data_dir, "user_profile.json")
+        self.sessions_file = os.path.join(self.user_data_dir, "chat_sessions.json")
+        self.messages_file = os.path.join(self.user_data_dir, "messages.log")
+        self.device_sessions_file = os.path.join(self.user_data_dir, "device_sessions.log")
+        self.downloads_dir = os.path.join(self.user_data_dir, "downloads")
+
     def load_data(self):
         """加载所有数据"""
         # 加载用户数据
         if os.path.exists(self.user_file):
-            with open(self.user_file, 'r', encoding='utf-8') as f:
-                user_data = json.load(f)
-                self.user = UserProfile.from_dict(user_data)
+            with open(self.user_file, 'rb') as f:
+                self.user = serialization.decode(f.read(), UserProfile)
         
         # 加载会话数据
-        if os.path.exists(self.sessions_file):
-            with open(self.sessions_file, 'r', encoding='utf-8') as f:
-                sessions_data = json.load(f)
-                self.sessions = {
-                    session_data['session_id']: ChatSession.from_dict(session_data)
-                    for session_data in sessions_data
-                }
+        self.load_sessions()
+
+    def load_sessions(self):
+        """加载会话数据
+
+        已解锁加密存储时，chat_sessions.json只保存会话元数据，
+        消息从加密日志中按顺序回放；旧版明文消息会被迁移到加密日志中。
+        """
+        with self.lock:
+            if os.path.exists(self.sessions_file):
+                with open(self.sessions_file, 'rb') as f:
+                    sessions = serialization.decode_list(f.read(), ChatSession)
+                self.sessions = {session.session_id: session for session in sessions}
+
+            if self._message_log is None:
+                return
+
+            legacy_records = [
+                {'session_id': session.session_id, 'message': message.to_dict()}
+                for session in self.sessions.values()
+                for message in session.messages
+            ]
+            for session in self.sessions.values():
+                session.messages = []
+                session.last_message = None
+            if legacy_records:
+                print(f"[DataManager] 迁移 {len(legacy_records)} 条明文消息到加密存储")
+                self._message_log.append_many(legacy_records)
+                self.save_data()
+
+            for record in self._message_log:
+                session = self.sessions.get(record['session_id'])
+                if session:
+                    message = Message.from_dict(record['message'])
+                    session.messages.append(message)
+                    session.last_message = message
+
+    def unlock(self, password: str):
+        """由密码派生数据密钥并解锁本地加密存储
+
+        数据密钥只在内存中保存，解锁后localBundle私钥和消息记录都以密文形式落盘。
+        旧版明文档案会在解锁时迁移为加密格式。
+        """
+        if not self.user:
+            raise ValueError("用户档案未加载")
+        migrate = not self.user.store_salt or self.user.localBundle is not None
+        self.store = SecureStore(self.user.derive_data_key(password))
+        self._message_log = self.store.open_log(
+            self.messages_file,
+            f"chate2e:messages:{self.user.user_id}".encode('utf-8')
+        )
+        self._device_session_log = self.store.open_log(
+            self.device_sessions_file,
+            f"chate2e:device_sessions:{self.user.user_id}".encode('utf-8')
+        )
+        if self.user.sealed_local_bundle:
+            local_bundle_data = self.store.unseal(self.user.sealed_local_bundle,
+                                                  self.user.local_bundle_context())
+            self.user.localBundle = serialization.decode(local_bundle_data, LocalBundle)
+        if migrate:
+            self.save_user_profile()
 
     def register_user(self, username: str, password: str, user_uuid: str, bundle: Bundle ,local_bundle: LocalBundle) -> bool:
         """注册新用户"""
         try:
             # 更新用户ID相关路径
-            self.useruuid = user_uuid
-            self.user_data_dir = os.path.join(self.base_dir, user_uuid)
-            self.user_file = os.path.join(self.user_data_dir, "user_profile.json")
-            self.sessions_file = os.path.join(self.user_data_dir, "chat_sessions.json")
+            self._set_user_paths(user_uuid)
             os.makedirs(self.user_data_dir, exist_ok=True)
             
             # 创建新用户档案
@@ -329,8 +474,9 @@ class DataManager:
             user.set_bundle(bundle)
             user.set_local_bundle(local_bundle)
             
-            # 保存用户数据
+            # 保存用户数据，私钥加密后落盘
             self.user = user
+            self.unlock(password)
             self.save_data()
             return True
             
@@ -338,30 +484,33 @@ class DataManager:
             print(f"注册用户失败: {e}")
             return False
             
+    def find_user_profile(self, username: str) -> Optional[UserProfile]:
+        """按用户名查找并解析本地用户档案，找到后切换到该用户的数据目录"""
+        # 遍历chat_data目录查找用户
+        if not os.path.exists(self.base_dir):
+            return None
+
+        for user_dir in os.listdir(self.base_dir):
+            profile_path = os.path.join(self.base_dir, user_dir, "user_profile.json")
+            if os.path.exists(profile_path):
+                user_data = serialization.load_file(profile_path)
+                if user_data['username'] == username:
+                    # 找到用户，加载数据
+                    self._set_user_paths(user_data['user_id'])
+                    self.store = None
+                    self._message_log = None
+                    self._device_session_log = None
+                    self.user = UserProfile.from_dict(user_data)
+                    return self.user
+        return None
+
     def verify_user(self, username: str, password: str) -> Optional[str]:
         """验证用户登录"""
         try:
-            # 遍历chat_data目录查找用户
-            if not os.path.exists(self.base_dir):
-                return None
-                
-            for user_dir in os.listdir(self.base_dir):
-                profile_path = os.path.join(self.base_dir, user_dir, "user_profile.json")
-                if os.path.exists(profile_path):
-                    with open(profile_path, 'r', encoding='utf-8') as f:
-                        user_data = json.load(f)
-                        if user_data['username'] == username:
-                            # 找到用户，加载数据
-                            self.useruuid = user_data['user_id']
-                            self.user_data_dir = os.path.join(self.base_dir, self.useruuid)
-                            self.user_file = os.path.join(self.user_data_dir, "user_profile.json")
-                            self.sessions_file = os.path.join(self.user_data_dir, "chat_sessions.json")
-                            self.user = UserProfile.from_dict(user_data)
-                            
-                            # 验证密码
-                            if self.user.verify_password(password):
-                                return self.user.user_id
-                            break
+            user = self.find_user_profile(username)
+            # 验证密码
+            if user and user.verify_password(password):
+                return user.user_id
             return None
             
         except Exception as e:
@@ -382,114 +531,183 @@ class DataManager:
                 
     def set_user(self, user: UserProfile):
         """设置用户数据"""
-        self.user = user
-        self.save_data()
+        with self.lock:
+            self.user = user
+            self.save_data()
 
     def add_message(self, session_id: str, message: Message):
         """添加消息到指定会话"""
-        if session_id in self.sessions:
-            self.sessions[session_id].add_message(message)
-            self.save_data()
-            print(f"[DataManager] ✓ 消息已添加到会话 {session_id}，当前消息数: {len(self.sessions[session_id].messages)}")
-        else:
-            print(f"[DataManager] ✗ 会话 {session_id} 不存在！")
-            print(f"[DataManager] 现有会话: {list(self.sessions.keys())}")
+        with self.lock:
+            if session_id in self.sessions:
+                self.sessions[session_id].add_message(message)
+                if self._message_log is not None:
+                    # 加密存储：O(1)追加单条记录，不重写整个文件
+                    self._message_log.append({'session_id': session_id, 'message': message.to_dict()})
+                else:
+                    self.save_data()
+                print(f"[DataManager] ✓ 消息已添加到会话 {session_id}，当前消息数: {len(self.sessions[session_id].messages)}")
+            else:
+                print(f"[DataManager] ✗ 会话 {session_id} 不存在！")
+                print(f"[DataManager] 现有会话: {list(self.sessions.keys())}")
     
+    def add_messages(self, batch: Dict[str, List[Message]]):
+        """批量添加消息，整批只进行一次写入
+
+        Args:
+            batch: session_id -> 按顺序排列的消息列表
+        """
+        with self.lock:
+            records = []
+            for session_id, messages in batch.items():
+                session = self.sessions.get(session_id)
+                if not session:
+                    print(f"[DataManager] ✗ 会话 {session_id} 不存在！")
+                    continue
+                for message in messages:
+                    session.add_message(message)
+                    records.append({'session_id': session_id, 'message': message.to_dict()})
+            if not records:
+                return
+            if self._message_log is not None:
+                self._message_log.append_many(records)
+            else:
+                self.save_data()
+            print(f"[DataManager] ✓ 批量保存 {len(records)} 条消息")
+    
+    def load_device_sessions(self) -> Dict[Tuple[str, str], dict]:
+        """读取设备会话记录 (对方用户, 对方设备) -> 会话记录
+
+        日志中同一会话以最后一条记录为准，过期记录过多时压缩日志。
+        未解锁加密存储时不保存棘轮状态，返回空字典。
+        """
+        with self.lock:
+            if self._device_session_log is None:
+                return {}
+            records: Dict[Tuple[str, str], dict] = {}
+            total = 0
+            for entry in self._device_session_log:
+                total += 1
+                key = (entry['peer'], entry['device'])
+                if entry['state'] is None:
+                    records.pop(key, None)
+                else:
+                    records[key] = entry['state']
+            if total > 2 * len(records) + self.DEVICE_SESSION_LOG_SLACK:
+                print(f"[DataManager] 压缩设备会话日志: {total} -> {len(records)} 条记录")
+                self._device_session_log.rewrite(
+                    {'peer': peer, 'device': device, 'state': state}
+                    for (peer, device), state in records.items()
+                )
+            return records
+
+    def save_device_session(self, peer_id: str, device_id: str, state: Optional[dict]):
+        """追加一条设备会话记录，state为None表示会话已删除"""
+        with self.lock:
+            if self._device_session_log is None:
+                return
+            self._device_session_log.append({'peer': peer_id, 'device': device_id, 'state': state})
+
     def add_friend(self, friend: Friend):
         """添加好友"""
-        if self.user:
-            if self.user.add_friend(friend):
-                self.save_data()
+        with self.lock:
+            if self.user:
+                if self.user.add_friend(friend):
+                    self.save_data()
     
     def remove_friend(self, friend_id: str):
         """删除好友"""
-        if self.user:
-            if self.user.remove_friend(friend_id):
-                self.save_data()
-                return True
-        return False
+        with self.lock:
+            if self.user:
+                if self.user.remove_friend(friend_id):
+                    self.save_data()
+                    return True
+            return False
         
     def save_data(self):
         """保存所有数据"""
-        # 保存用户数据
-        with open(self.user_file, 'w', encoding='utf-8') as f:
-            json.dump(self.user.to_dict(), f, ensure_ascii=False, indent=2)
+        with self.lock:
+            # 保存用户数据
+            self.save_user_profile()
             
-        # 保存会话数据
-        with open(self.sessions_file, 'w', encoding='utf-8') as f:
-            json.dump(
-                [session.to_dict() for session in self.sessions.values()],
-                f, ensure_ascii=False, indent=2
+            # 保存会话数据，加密存储时消息保存在加密日志中，这里只写元数据
+            include_messages = self._message_log is None
+            serialization.dump_file(
+                self.sessions_file,
+                [session.to_dict(include_messages) for session in self.sessions.values()],
+                pretty=config.JSON_PRETTY
             )
     
     def save_user_profile(self):
         """仅保存用户配置"""
-        with open(self.user_file, 'w', encoding='utf-8') as f:
-            json.dump(self.user.to_dict(), f, ensure_ascii=False, indent=2)
+        with self.lock:
+            serialization.dump_file(self.user_file, self.user.to_dict(self.store), pretty=config.JSON_PRETTY)
 
     def get_or_create_session(self, user2_id: str) -> ChatSession:
         """获取或创建两个用户之间的会话"""
-        # 确保用户ID顺序一致，避免重复会话
-        participant_ids = sorted([self.user.user_id, user2_id])
+        with self.lock:
+            # 确保用户ID顺序一致，避免重复会话
+            participant_ids = sorted([self.user.user_id, user2_id])
 
-        # 查找现有会话
-        for session in self.sessions.values():
-            if sorted([session.participant1_id, session.participant2_id]) == participant_ids:
-                return session
+            # 查找现有会话
+            for session in self.sessions.values():
+                if sorted([session.participant1_id, session.participant2_id]) == participant_ids:
+                    return session
 
-        # 创建新会话
-        session = ChatSession(
-            participant1_id=participant_ids[0],
-            participant2_id=participant_ids[1]
-        )
-        self.sessions[session.session_id] = session
-        self.save_data()
-        return session
+            # 创建新会话
+            session = ChatSession(
+                participant1_id=participant_ids[0],
+                participant2_id=participant_ids[1]
+            )
+            self.sessions[session.session_id] = session
+            self.save_data()
+            return session
     
     def get_or_create_session_with_id(self, session_id: str, user2_id: str) -> ChatSession:
         """使用指定的session_id获取或创建会话"""
-        # 检查session_id是否已存在
-        if session_id in self.sessions:
-            return self.sessions[session_id]
+        with self.lock:
+            # 检查session_id是否已存在
+            if session_id in self.sessions:
+                return self.sessions[session_id]
         
-        # 确保用户ID顺序一致
-        participant_ids = sorted([self.user.user_id, user2_id])
+            # 确保用户ID顺序一致
+            participant_ids = sorted([self.user.user_id, user2_id])
         
-        # 检查是否已经存在这两个用户的会话
-        for session in self.sessions.values():
-            if sorted([session.participant1_id, session.participant2_id]) == participant_ids:
-                # 会话已存在，但session_id不同，这不应该发生
-                print(f"[Warning] 发现重复会话，使用新的session_id: {session_id}")
-                # 删除旧会话
-                old_id = session.session_id
-                del self.sessions[old_id]
-                break
+            # 检查是否已经存在这两个用户的会话
+            for session in self.sessions.values():
+                if sorted([session.participant1_id, session.participant2_id]) == participant_ids:
+                    # 会话已存在，但session_id不同，这不应该发生
+                    print(f"[Warning] 发现重复会话，使用新的session_id: {session_id}")
+                    # 删除旧会话
+                    old_id = session.session_id
+                    del self.sessions[old_id]
+                    break
         
-        # 创建新会话，使用指定的session_id
-        session = ChatSession(
-            participant1_id=participant_ids[0],
-            participant2_id=participant_ids[1]
-        )
-        session.session_id = session_id
-        self.sessions[session_id] = session
-        self.save_data()
-        print(f"[DataManager] 创建新会话: {session_id}")
-        return session
+            # 创建新会话，使用指定的session_id
+            session = ChatSession(
+                participant1_id=participant_ids[0],
+                participant2_id=participant_ids[1]
+            )
+            session.session_id = session_id
+            self.sessions[session_id] = session
+            self.save_data()
+            print(f"[DataManager] 创建新会话: {session_id}")
+            return session
 
     def create_session_by_sender_session_id(self, session_id: str, user2_id: str) -> ChatSession:
         """根据发送者会话ID创建会话"""
-        # 确保用户ID顺序一致，避免重复会话
-        participant_ids = sorted([self.user.user_id, user2_id])
+        with self.lock:
+            # 确保用户ID顺序一致，避免重复会话
+            participant_ids = sorted([self.user.user_id, user2_id])
 
-        # 创建新会话
-        session = ChatSession(
-            participant1_id=participant_ids[0],
-            participant2_id=participant_ids[1]
-        )
-        session.session_id = session_id
-        self.sessions[session_id] = session
-        self.save_data()
-        return session
+            # 创建新会话
+            session = ChatSession(
+                participant1_id=participant_ids[0],
+                participant2_id=participant_ids[1]
+            )
+            session.session_id = session_id
+            self.sessions[session_id] = session
+            self.save_data()
+            return session
     
     def get_last_message(self, user2_id: str) -> Message:
         """获取两个用户之间的最后一条消息"""
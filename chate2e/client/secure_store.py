@@ -0,0 +1,165 @@
+import os
+import struct
+import threading
+from base64 import b64decode, b64encode
+from typing import Iterable, Iterator, List
+
+from chate2e.crypto.crypto_helper import CryptoHelper
+from chate2e.utils import serialization
+
+
+class SecureStore:
+    """本地静态加密存储
+
+    持有登录时由密码派生的数据密钥（只保存在内存中），
+    对每条记录/字段单独做AES-GCM加密，避免每次保存都重新加密整个文件。
+    加密结果格式: nonce(12) || tag(16) || ciphertext
+    """
+    KEY_SIZE = 32
+    NONCE_SIZE = 12
+    TAG_SIZE = 16
+
+    def __init__(self, key: bytes):
+        if len(key) != self.KEY_SIZE:
+            raise ValueError(f"数据密钥长度必须为{self.KEY_SIZE}字节")
+        self.crypto_helper = CryptoHelper()
+        self._key = key
+
+    def encrypt(self, data: bytes, aad: bytes) -> bytes:
+        """加密单条记录，aad用于绑定记录的上下文（文件、序号等）"""
+        nonce = self.crypto_helper.get_random_bytes(self.NONCE_SIZE)
+        ciphertext, tag = self.crypto_helper.encrypt_aes_gcm(self._key, data, nonce, aad)
+        return nonce + tag + ciphertext
+
+    def decrypt(self, blob: bytes, aad: bytes) -> bytes:
+        """解密单条记录"""
+        nonce = blob[:self.NONCE_SIZE]
+        tag = blob[self.NONCE_SIZE:self.NONCE_SIZE + self.TAG_SIZE]
+        ciphertext = blob[self.NONCE_SIZE + self.TAG_SIZE:]
+        return self.crypto_helper.decrypt_aes_gcm(self._key, ciphertext, nonce, tag, aad)
+
+    def seal(self, data: bytes, context: bytes) -> str:
+        """加密单个字段并编码为base64字符串，用于嵌入JSON文件"""
+        return b64encode(self.encrypt(data, context)).decode('utf-8')
+
+    def unseal(self, token: str, context: bytes) -> bytes:
+        """解密seal()生成的字段"""
+        return self.decrypt(b64decode(token), context)
+
+    def open_log(self, path: str, context: bytes) -> 'EncryptedRecordLog':
+        """打开一个加密的追加式记录日志"""
+        return EncryptedRecordLog(path, self, context)
+
+
+class EncryptedRecordLog:
+    """追加式加密记录日志
+
+    每条记录独立加密后以 长度(4字节大端) || SecureStore密文 的形式追加到文件末尾，
+    追加操作是O(1)的，不需要读取或重写已有内容。
+    记录序号参与AAD认证，记录被调换顺序或跨文件拷贝时解密会失败。
+    追加可能来自多个线程，分配序号、加密、写入和更新计数在同一把锁内完成，保证序号不重复。
+    """
+    LENGTH = struct.Struct('>I')
+
+    def __init__(self, path: str, store: SecureStore, context: bytes):
+        self.path = path
+        self.store = store
+        self.context = context
+        self._lock = threading.Lock()
+        self._count = self._scan_count()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _scan_count(self) -> int:
+        """只读取长度前缀统计已有记录数，不做解密
+
+        如果文件末尾有写入中断留下的残缺记录，将其截断，保证后续追加对齐。
+        """
+        if not os.path.exists(self.path):
+            return 0
+        size = os.path.getsize(self.path)
+        count = 0
+        offset = 0
+        with open(self.path, 'rb') as f:
+            while offset + self.LENGTH.size <= size:
+                (length,) = self.LENGTH.unpack(f.read(self.LENGTH.size))
+                if offset + self.LENGTH.size + length > size:
+                    break
+                f.seek(length, os.SEEK_CUR)
+                offset += self.LENGTH.size + length
+                count += 1
+        if offset < size:
+            print(f"[SecureStore] ✗ 截断残缺记录: {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+        return count
+
+    def _aad(self, index: int) -> bytes:
+        return self.context + index.to_bytes(8, 'big')
+
+    def append(self, record: dict) -> None:
+        """追加一条记录"""
+        self.append_many([record])
+
+    def append_many(self, records: Iterable[dict]) -> None:
+        """批量追加记录，只进行一次文件写入"""
+        payloads = [serialization.dumps(record) for record in records]
+        if not payloads:
+            return
+        with self._lock:
+            index = self._count
+            chunks: List[bytes] = []
+            for data in payloads:
+                blob = self.store.encrypt(data, self._aad(index))
+                chunks.append(self.LENGTH.pack(len(blob)))
+                chunks.append(blob)
+                index += 1
+            with open(self.path, 'ab') as f:
+                f.write(b''.join(chunks))
+            self._count = index
+
+    def rewrite(self, records: Iterable[dict]) -> None:
+        """用给定记录替换整个日志（用于压缩），整个文件原子替换"""
+        payloads = [serialization.dumps(record) for record in records]
+        with self._lock:
+            chunks: List[bytes] = []
+            for index, data in enumerate(payloads):
+                blob = self.store.encrypt(data, self._aad(index))
+                chunks.append(self.LENGTH.pack(len(blob)))
+                chunks.append(blob)
+            serialization.write_atomic(self.path, b''.join(chunks))
+            self._count = len(payloads)
+
+    def __iter__(self) -> Iterator[dict]:
+        """按写入顺序逐条解密记录
+
+        末尾残缺的记录直接结束读取；单条记录损坏时跳过并记录日志，不影响其余历史。
+        如果没有任何记录能解密（密钥或上下文错误），抛出ValueError。
+        """
+        if not os.path.exists(self.path):
+            return
+        decrypted = 0
+        failed = 0
+        with open(self.path, 'rb') as f:
+            index = 0
+            while True:
+                prefix = f.read(self.LENGTH.size)
+                if len(prefix) < self.LENGTH.size:
+                    break
+                (length,) = self.LENGTH.unpack(prefix)
+                blob = f.read(length)
+                if len(blob) < length:
+                    print(f"[SecureStore] ✗ 记录 {index} 不完整，停止读取: {self.path}")
+                    break
+                try:
+                    record = serialization.loads(self.store.decrypt(blob, self._aad(index)))
+                except ValueError as e:
+                    failed += 1
+                    print(f"[SecureStore] ✗ 跳过损坏的记录 {index}: {e}")
+                else:
+                    decrypted += 1
+                    yield record
+                index += 1
+        if failed and not decrypted:
+            raise ValueError(f"无法解密任何记录，密钥或上下文错误: {self.path}")
@@ -0,0 +1,42 @@
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from chate2e.client.client_server import ChatClient
+
+
+class MessageSendSignals(QObject):
+    """消息发送工作线程信号"""
+    succeeded = pyqtSignal()
+    failed = pyqtSignal(str)  # 错误信息
+
+
+class MessageSendWorker(QRunnable):
+    """在后台线程中加密并发送一条文本消息
+
+    send_text_sync在服务器限流时会按退避时间重试（最多数秒），放在UI线程中会卡住窗口。
+    工作线程应提交到create_send_pool()创建的单线程池，消息按提交顺序逐条发送，
+    与对方各设备会话中的棘轮顺序、本地显示顺序保持一致。
+    """
+
+    def __init__(self, chat_client: ChatClient, peer_id: str, session_id: str, content: str):
+        super().__init__()
+        self.chat_client = chat_client
+        self.peer_id = peer_id
+        self.session_id = session_id
+        self.content = content
+        self.signals = MessageSendSignals()
+
+    def run(self):
+        try:
+            if self.chat_client.send_text_sync(self.peer_id, self.session_id, self.content):
+                self.signals.succeeded.emit()
+            else:
+                self.signals.failed.emit("消息发送失败")
+        except Exception as e:
+            self.signals.failed.emit(f"消息发送失败: {str(e)}")
+
+
+def create_send_pool() -> QThreadPool:
+    """发送消息用的单线程池"""
+    pool = QThreadPool()
+    pool.setMaxThreadCount(1)
+    return pool
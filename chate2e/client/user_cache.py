@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+# fetch(user_ids, known_etags) -> {'users': {id: info}, 'unchanged': [...], 'missing': [...]}
+LookupFn = Callable[[List[str], Dict[str, str]], Optional[dict]]
+
+
+class UserCache:
+    """用户信息缓存（LRU + TTL）
+
+    缓存 user_id -> {'username', 'fingerprint', 'etag'}。
+    未过期的条目直接命中；过期条目带上etag向服务器重新验证，服务器确认未变化时
+    只刷新有效期，不重新传输；缺失的条目与需要验证的条目合并为一次批量请求。
+    """
+
+    def __init__(self, fetch: LookupFn, maxsize: int = 1024, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.fetch = fetch
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()  # user_id -> info
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._revalidated = 0
+        self._refreshed = 0
+        self._evictions = 0
+        self._requests = 0
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """查询单个用户，用户不存在或请求失败时返回None"""
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids: Iterable[str]) -> Dict[str, dict]:
+        """批量查询用户信息，最多发起一次网络请求"""
+        now = self.clock()
+        result: Dict[str, dict] = {}
+        missing: List[str] = []
+        known: Dict[str, str] = {}
+        with self._lock:
+            for user_id in dict.fromkeys(user_ids):
+                entry = self._entries.get(user_id)
+                if entry is None:
+                    self._misses += 1
+                    missing.append(user_id)
+                elif self._expires[user_id] <= now:
+                    missing.append(user_id)
+                    known[user_id] = entry['etag']
+                else:
+                    self._hits += 1
+                    self._entries.move_to_end(user_id)
+                    result[user_id] = entry
+
+        if not missing:
+            return result
+
+        with self._lock:
+            self._requests += 1
+        response = self.fetch(missing, known)
+        if response is None:
+            # 请求失败时退回使用过期的缓存
+            with self._lock:
+                for user_id in known:
+                    if user_id in self._entries:
+                        result[user_id] = self._entries[user_id]
+            return result
+
+        expires = self.clock() + self.ttl
+        with self._lock:
+            for user_id in response.get('unchanged', []):
+                entry = self._entries.get(user_id)
+                if entry is not None:
+                    self._revalidated += 1
+                    self._store(user_id, entry, expires)
+                    result[user_id] = entry
+            for user_id, info in response.get('users', {}).items():
+                if user_id in known:
+                    self._refreshed += 1
+                self._store(user_id, info, expires)
+                result[user_id] = info
+            for user_id in response.get('missing', []):
+                self._entries.pop(user_id, None)
+                self._expires.pop(user_id, None)
+        return result
+
+    def put(self, user_id: str, info: dict):
+        """写入从其他接口（如联系人同步）得到的用户信息"""
+        with self._lock:
+            self._store(user_id, info, self.clock() + self.ttl)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """使单个用户或全部缓存失效"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                self._expires.clear()
+            else:
+                self._entries.pop(user_id, None)
+                self._expires.pop(user_id, None)
+
+    def _store(self, user_id: str, info: dict, expires: float):
+        """写入条目并按LRU淘汰（调用方持有锁）"""
+        self._entries[user_id] = info
+        self._entries.move_to_end(user_id)
+        self._expires[user_id] = expires
+        while len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(last=False)
+            self._expires.pop(evicted, None)
+            self._evictions += 1
+
+    def stats(self) -> Dict:
+        """缓存命中指标快照"""
+        with self._lock:
+            lookups = self._hits + self._misses + self._revalidated + self._refreshed
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self._hits,
+                'misses': self._misses,
+                'revalidated': self._revalidated,
+                'refreshed': self._refreshed,
+                'evictions': self._evictions,
+                'requests': self._requests,
+                'hit_rate': (self._hits + self._revalidated) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,114 @@
+import zlib
+from typing import Optional, Sequence, Tuple
+
+from chate2e.utils import config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 预置字典：聊天短语、代码与日志中的常见片段。
+# zlib优先匹配距离近的内容，越常见的片段放得越靠后；字典一旦发布不能修改，
+# 修改时必须换新的编解码器名称（-d2），否则旧客户端会解出错误的明文。
+CHAT_DICTIONARY = (
+    '"timestamp": "level": "message": "error": "status": "result": "data": null, true, false, '
+    'Traceback (most recent call last):\n  File "", line , in \n'
+    'Exception: ValueError: KeyError: TypeError: AttributeError: RuntimeError: '
+    '[ERROR] [WARN] [INFO] [DEBUG] 2024-01-01T00:00:00.000Z INFO DEBUG WARNING ERROR '
+    'SELECT * FROM WHERE ORDER BY GROUP BY INSERT INTO UPDATE SET DELETE '
+    'http://https://www.github.com/.com/.html.json.txt.png.jpg.pdf '
+    '#include <stdio.h>\nint main(int argc, char *argv[]) {\n    return 0;\n}\n'
+    'public static void main(String[] args) {\n    System.out.println(\n'
+    'function () {\n  const let var return => undefined console.log(\n'
+    'import from def class self.__init__(self, return None\n    if not else:\n        for in range(len(print(f"'
+    '```python\n```\n'
+    '请问一下，可以吗？没问题，好的，谢谢！不客气。辛苦了。收到。明天见。晚上好。早上好。'
+    '我们开会的时间改到下午三点，地点在会议室。麻烦你帮我看一下这个问题，'
+    '是不是因为配置文件写错了？我这边已经重新部署了，你再试试。'
+    '哈哈哈哈，好的好的，没事没事。你现在在哪里？我马上到。'
+    'thanks, thank you! no problem. sounds good. see you tomorrow. '
+    'can you take a look at this? I think the issue is that the '
+    'ok, I will check it and get back to you. '
+).encode('utf-8')
+
+ZLIB_CODEC = "zlib-d1"
+ZSTD_CODEC = "zstd-d1"
+CODECS = (ZSTD_CODEC, ZLIB_CODEC)
+
+
+class MessageCompressor:
+    """消息先压缩再加密
+
+    只压缩不小于min_size的明文（短消息压缩收益很小），压缩后不比原文短时按原文发送。
+    使用的编解码器由双方协商（见negotiate），写在消息的Encryption.codec中并作为AES-GCM的附加认证数据，
+    服务器无法篡改。压缩结果与未压缩的明文一样经MessagePadding填充后再加密。
+
+    压缩后的长度与明文的可压缩程度相关，填充只能缩小、不能完全消除这一信息；
+    需要完全避免时可以关闭压缩（CHATE2E_COMPRESSION=0）。
+    """
+
+    def __init__(self, min_size: int = config.COMPRESSION_MIN_SIZE,
+                 max_size: int = config.MAX_DECOMPRESSED_SIZE,
+                 dictionary: bytes = CHAT_DICTIONARY):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.dictionary = dictionary
+        self._zstd_dict = None
+        if zstandard is not None:
+            self._zstd_dict = zstandard.ZstdCompressionDict(
+                dictionary, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+    @staticmethod
+    def available_codecs() -> Tuple[str, ...]:
+        """本机支持的编解码器，按优先级排列"""
+        if not config.MESSAGE_COMPRESSION:
+            return ()
+        if zstandard is not None:
+            return ZSTD_CODEC, ZLIB_CODEC
+        return (ZLIB_CODEC,)
+
+    @staticmethod
+    def negotiate(local: Sequence[str], remote: Sequence[str]) -> Optional[str]:
+        """双方都支持的优先级最高的编解码器，没有时不压缩"""
+        for codec in local:
+            if codec in CODECS and codec in remote:
+                return codec
+        return None
+
+    def compress(self, data: bytes, codec: Optional[str]) -> Tuple[Optional[str], bytes]:
+        """压缩，返回 (实际使用的编解码器, 数据)；不压缩时编解码器为None"""
+        if codec is None or len(data) < self.min_size:
+            return None, data
+        if codec == ZLIB_CODEC:
+            compressor = zlib.compressobj(level=6, zdict=self.dictionary)
+            compressed = compressor.compress(data) + compressor.flush()
+        elif codec == ZSTD_CODEC and self._zstd_dict is not None:
+            compressed = zstandard.ZstdCompressor(level=3, dict_data=self._zstd_dict,
+                                                  write_dict_id=False).compress(data)
+        else:
+            raise ValueError(f"不支持的压缩算法: {codec}")
+        if len(compressed) >= len(data):
+            return None, data
+        return codec, compressed
+
+    def decompress(self, compressed, codec: str) -> bytes:
+        """解压（接受bytes或memoryview），解压结果超过max_size时拒绝（防止压缩炸弹）"""
+        if codec == ZLIB_CODEC:
+            decompressor = zlib.decompressobj(zdict=self.dictionary)
+            plaintext = decompressor.decompress(compressed, self.max_size)
+            if decompressor.unconsumed_tail:
+                raise ValueError(f"解压后超过 {self.max_size} 字节")
+            if not decompressor.eof:
+                raise ValueError("压缩数据不完整")
+            return plaintext
+        if codec == ZSTD_CODEC and self._zstd_dict is not None:
+            decompressor = zstandard.ZstdDecompressor(dict_data=self._zstd_dict)
+            try:
+                # 帧头中声明的原始长度优先于max_output_size，需要单独检查
+                if zstandard.frame_content_size(compressed) > self.max_size:
+                    raise ValueError(f"解压后超过 {self.max_size} 字节")
+                return decompressor.decompress(compressed, max_output_size=self.max_size)
+            except zstandard.ZstdError as e:
+                raise ValueError(f"zstd解压失败: {e}") from e
+        raise ValueError(f"不支持的压缩算法: {codec}")
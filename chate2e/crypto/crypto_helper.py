@@ -6,6 +6,7 @@ from cryptography.hazmat.primitives.asymmetric import x25519, ed25519
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives import padding
+from cryptography.exceptions import InvalidTag
 from typing import Tuple, Optional
 
 class CryptoHelper:
@@ -54,34 +55,42 @@ class CryptoHelper:
         data = unpadder.update(padded_data) + unpadder.finalize()
         return data
      
-    def encrypt_aes_gcm(self, key: bytes, data: bytes, iv: bytes) -> Tuple[bytes, bytes]:
+    def encrypt_aes_gcm(self, key: bytes, data: bytes, iv: bytes,
+                        aad: Optional[bytes] = None) -> Tuple[bytes, bytes]:
         """
         使用 AES-GCM 模式进行加密。
         :param key: 原始密钥
         :param data: 待加密数据
         :param iv: 初始向量（通常为12或16字节，需与解密时保持一致）
+        :param aad: 附加认证数据（可选，不加密但参与认证）
         :return: 加密结果 (密文 + 认证标签)
         """
         cipher = Cipher(algorithms.AES(key), modes.GCM(iv), backend=default_backend())
         encryptor = cipher.encryptor()
+        if aad:
+            encryptor.authenticate_additional_data(aad)
         ciphertext = encryptor.update(data) + encryptor.finalize()
         return ciphertext , encryptor.tag
     
-    def decrypt_aes_gcm(self, key: bytes, data: bytes, iv: bytes, tag: Optional[bytes]) -> bytes:
+    def decrypt_aes_gcm(self, key: bytes, data: bytes, iv: bytes, tag: Optional[bytes],
+                        aad: Optional[bytes] = None) -> bytes:
         """
         使用 AES-GCM 模式进行解密。
         :param key: 原始密钥
         :param data: 待解密数据（密文部分）
         :param iv: 初始向量（必须与加密时相同）
         :param tag: 认证标签 
+        :param aad: 附加认证数据（必须与加密时相同）
         :return: 解密结果
         :raises ValueError: 如果认证标签验证失败
         """
         cipher = Cipher(algorithms.AES(key), modes.GCM(iv, tag), backend=default_backend())
         decryptor = cipher.decryptor()
+        if aad:
+            decryptor.authenticate_additional_data(aad)
         try:
             return decryptor.update(data) + decryptor.finalize()
-        except ValueError:
+        except (ValueError, InvalidTag):
             raise ValueError("AES-GCM tag verification failed (decryption error).")
     
   
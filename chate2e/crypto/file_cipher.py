@@ -0,0 +1,140 @@
+from base64 import b64decode, b64encode
+from typing import BinaryIO, Iterable, Iterator
+
+from chate2e.crypto.crypto_helper import CryptoHelper
+
+
+class FileCipher:
+    """分块流式文件加密
+
+    每个文件使用独立的随机密钥，文件按固定大小分块，每块单独做AES-GCM加密：
+        nonce = nonce_prefix(8字节) || 块序号(4字节大端)
+        aad   = FILE_AAD || 块序号(8字节) || 是否最后一块(1字节)
+    密钥和nonce前缀通过双棘轮会话发送给对方（见to_dict），服务器只看到密文。
+    块序号参与nonce与AAD，块被调换顺序、删除末尾块（截断）都会导致解密失败。
+
+    加密是确定性的：同一密钥下同一块总是产生相同的密文，
+    因此断点续传时可以从任意字节偏移重新生成并发送剩余密文。
+    内存占用只与块大小有关，与文件大小无关。
+    """
+    KEY_SIZE = 32
+    NONCE_PREFIX_SIZE = 8
+    TAG_SIZE = 16
+    DEFAULT_CHUNK_SIZE = 1024 * 1024
+    MAX_CHUNKS = 2 ** 32
+    FILE_AAD = b"chate2e-file-v1"
+
+    def __init__(self, key: bytes, nonce_prefix: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if len(key) != self.KEY_SIZE:
+            raise ValueError(f"文件密钥长度必须为{self.KEY_SIZE}字节")
+        if len(nonce_prefix) != self.NONCE_PREFIX_SIZE:
+            raise ValueError(f"nonce前缀长度必须为{self.NONCE_PREFIX_SIZE}字节")
+        if chunk_size <= 0:
+            raise ValueError("块大小必须为正数")
+        self.crypto_helper = CryptoHelper()
+        self.key = key
+        self.nonce_prefix = nonce_prefix
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def generate(cls, chunk_size: int = DEFAULT_CHUNK_SIZE) -> 'FileCipher':
+        """为一个新文件生成随机密钥"""
+        helper = CryptoHelper()
+        return cls(helper.get_random_bytes(cls.KEY_SIZE),
+                   helper.get_random_bytes(cls.NONCE_PREFIX_SIZE),
+                   chunk_size)
+
+    def to_dict(self) -> dict:
+        """文件密钥材料，作为明文的一部分经双棘轮加密后发送给接收方"""
+        return {
+            'key': b64encode(self.key).decode('utf-8'),
+            'nonce_prefix': b64encode(self.nonce_prefix).decode('utf-8'),
+            'chunk_size': self.chunk_size
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'FileCipher':
+        return cls(b64decode(data['key']), b64decode(data['nonce_prefix']), data['chunk_size'])
+
+    @property
+    def encrypted_chunk_size(self) -> int:
+        return self.chunk_size + self.TAG_SIZE
+
+    def chunk_count(self, plain_size: int) -> int:
+        """明文大小对应的块数，空文件也有一个（空的）最后一块"""
+        return max(1, -(-plain_size // self.chunk_size))
+
+    def encrypted_size(self, plain_size: int) -> int:
+        """明文大小对应的密文总大小"""
+        return plain_size + self.chunk_count(plain_size) * self.TAG_SIZE
+
+    def _nonce(self, index: int) -> bytes:
+        if index >= self.MAX_CHUNKS:
+            raise ValueError("文件块数超出上限")
+        return self.nonce_prefix + index.to_bytes(4, 'big')
+
+    def _aad(self, index: int, final: bool) -> bytes:
+        return self.FILE_AAD + index.to_bytes(8, 'big') + (b'\x01' if final else b'\x00')
+
+    def encrypt_chunk(self, index: int, data: bytes, final: bool) -> bytes:
+        """加密单个块，返回 密文 || tag"""
+        ciphertext, tag = self.crypto_helper.encrypt_aes_gcm(
+            self.key, data, self._nonce(index), self._aad(index, final))
+        return ciphertext + tag
+
+    def decrypt_chunk(self, index: int, blob: bytes, final: bool) -> bytes:
+        """解密单个块，认证失败时抛出ValueError"""
+        if len(blob) < self.TAG_SIZE:
+            raise ValueError("文件块长度不足")
+        return self.crypto_helper.decrypt_aes_gcm(
+            self.key, blob[:-self.TAG_SIZE], self._nonce(index),
+            blob[-self.TAG_SIZE:], self._aad(index, final))
+
+    def encrypt_stream(self, source: BinaryIO, plain_size: int, start_chunk: int = 0) -> Iterator[bytes]:
+        """从文件对象逐块读取并加密
+
+        Args:
+            source: 以二进制方式打开的源文件
+            plain_size: 源文件大小（用于确定最后一块）
+            start_chunk: 从第几块开始（断点续传）
+        """
+        total = self.chunk_count(plain_size)
+        source.seek(start_chunk * self.chunk_size)
+        for index in range(start_chunk, total):
+            data = source.read(self.chunk_size)
+            yield self.encrypt_chunk(index, data, index == total - 1)
+
+    def decrypt_stream(self, chunks: Iterable[bytes], target: BinaryIO, encrypted_size: int) -> int:
+        """把任意切分的密文流重新按块对齐后解密写入目标文件
+
+        Args:
+            chunks: 密文数据流（例如HTTP响应的iter_content），切分方式任意
+            target: 以二进制方式打开的目标文件
+            encrypted_size: 密文总大小
+
+        Returns:
+            int: 写入的明文字节数
+        """
+        block = self.encrypted_chunk_size
+        total = -(-encrypted_size // block)
+        buffer = bytearray()
+        index = 0
+        written = 0
+        for piece in chunks:
+            buffer += piece
+            # 最后一块要等数据全部到达后才能确定
+            while len(buffer) >= block and index < total - 1:
+                plaintext = self.decrypt_chunk(index, bytes(buffer[:block]), False)
+                del buffer[:block]
+                target.write(plaintext)
+                written += len(plaintext)
+                index += 1
+        if index != total - 1:
+            raise ValueError("密文不完整")
+        plaintext = self.decrypt_chunk(index, bytes(buffer), True)
+        target.write(plaintext)
+        return written + len(plaintext)
+
+    def locate(self, offset: int) -> int:
+        """密文字节偏移所在的块序号"""
+        return offset // self.encrypted_chunk_size
@@ -0,0 +1,243 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+from chate2e.crypto.crypto_helper import CryptoHelper
+from chate2e.crypto.protocol.ratchet import DoubleRatchet
+from chate2e.model.message import Encryption, Message, MessageType
+
+# 发送者密钥分发消息的明文前缀：分发内容经成员之间已有的双棘轮会话加密发送
+SENDER_KEY_PREFIX = "chate2e-sender-key:"
+
+
+def encode_sender_key_message(distribution: dict) -> str:
+    """把发送者密钥分发内容编码为消息明文"""
+    return SENDER_KEY_PREFIX + json.dumps(distribution)
+
+
+def parse_sender_key_message(text) -> Optional[dict]:
+    """如果消息明文是发送者密钥分发则解析返回，否则返回None"""
+    if isinstance(text, bytes):
+        try:
+            text = text.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+    if not isinstance(text, str) or not text.startswith(SENDER_KEY_PREFIX):
+        return None
+    try:
+        distribution = json.loads(text[len(SENDER_KEY_PREFIX):])
+    except json.JSONDecodeError:
+        return None
+    required = ('group_id', 'sender_id', 'key_id', 'chain_key', 'iteration', 'signing_key')
+    if not isinstance(distribution, dict) or any(k not in distribution for k in required):
+        return None
+    return distribution
+
+
+class SenderKeyState:
+    """一个成员在一个群组中的发送链
+
+    链密钥按DoubleRatchet的对称棘轮逐条推进，每条消息一个消息密钥；
+    所有成员共享同一条链，因此另附Ed25519签名密钥，接收方据此确认消息确实来自该成员。
+    接收方可以向前跳跃推进，跳过的消息密钥最多保留MAX_SKIP个，用于乱序到达的消息。
+    """
+    MAX_SKIP = 1000
+
+    def __init__(self, key_id: int, chain_key: bytes, iteration: int,
+                 signing_key_pub: bytes, signing_key: Optional[ed25519.Ed25519PrivateKey] = None):
+        self.key_id = key_id
+        self.chain_key = chain_key
+        self.iteration = iteration  # 下一条消息的序号
+        self.signing_key_pub = signing_key_pub
+        self.signing_key = signing_key
+        self.skipped_keys: "OrderedDict[int, bytes]" = OrderedDict()
+        self.ratchet = DoubleRatchet()
+
+    @classmethod
+    def generate(cls, key_id: int) -> 'SenderKeyState':
+        crypto_helper = CryptoHelper()
+        signing_key, _ = crypto_helper.generate_ed25519_keypair()
+        return cls(key_id, crypto_helper.get_random_bytes(32), 0,
+                   crypto_helper.export_ed25519_public_key(signing_key), signing_key)
+
+    def next_message_key(self) -> Tuple[int, bytes]:
+        """发送方：取出下一条消息的(序号, 消息密钥)并推进链"""
+        iteration = self.iteration
+        message_key, self.chain_key = self.ratchet.sending_ratchet(self.chain_key)
+        self.iteration += 1
+        return iteration, message_key
+
+    def message_key_for(self, iteration: int) -> Tuple[bytes, Optional[Tuple[bytes, int, "OrderedDict[int, bytes]"]]]:
+        """接收方：取出指定序号的消息密钥
+
+        Returns:
+            (消息密钥, 解密成功后需要提交的新链状态)；密钥来自跳过缓存时第二项为None
+
+        Raises:
+            ValueError: 消息重复、过旧或跳跃过多
+        """
+        if iteration < self.iteration:
+            key = self.skipped_keys.get(iteration)
+            if key is None:
+                raise ValueError("消息密钥已使用或已过期")
+            return key, None
+        if iteration - self.iteration > self.MAX_SKIP:
+            raise ValueError("跳过的消息过多")
+        chain_key = self.chain_key
+        skipped = OrderedDict()
+        for index in range(self.iteration, iteration):
+            skipped[index], chain_key = self.ratchet.receiving_ratchet(chain_key)
+        message_key, chain_key = self.ratchet.receiving_ratchet(chain_key)
+        return message_key, (chain_key, iteration + 1, skipped)
+
+    def commit(self, iteration: int, pending) -> None:
+        """解密成功后更新链状态（失败时链保持不变）"""
+        if pending is None:
+            del self.skipped_keys[iteration]
+            return
+        self.chain_key, self.iteration, skipped = pending
+        self.skipped_keys.update(skipped)
+        while len(self.skipped_keys) > self.MAX_SKIP:
+            self.skipped_keys.popitem(last=False)
+
+    def sign(self, data: bytes) -> bytes:
+        return self.signing_key.sign(data)
+
+    def verify(self, data: bytes, signature: bytes) -> None:
+        try:
+            ed25519.Ed25519PublicKey.from_public_bytes(self.signing_key_pub).verify(signature, data)
+        except InvalidSignature:
+            raise ValueError("群消息签名验证失败")
+
+    def to_distribution(self, group_id: str, sender_id: str) -> dict:
+        """导出分发给其他成员的内容（不含签名私钥）"""
+        return {
+            'group_id': group_id,
+            'sender_id': sender_id,
+            'key_id': self.key_id,
+            'chain_key': b64encode(self.chain_key).decode('utf-8'),
+            'iteration': self.iteration,
+            'signing_key': b64encode(self.signing_key_pub).decode('utf-8')
+        }
+
+    @classmethod
+    def from_distribution(cls, data: dict) -> 'SenderKeyState':
+        return cls(
+            key_id=data['key_id'],
+            chain_key=b64decode(data['chain_key']),
+            iteration=data['iteration'],
+            signing_key_pub=b64decode(data['signing_key'])
+        )
+
+
+class GroupCipher:
+    """基于发送者密钥(Sender Key)的群消息加解密
+
+    每个成员为每个群组生成自己的发送链，只在首次发送、成员变化时经两两会话分发一次；
+    此后每条群消息只加密一次，由服务器扇出给全部成员，加密开销与群组大小无关。
+    成员被移除后应调用rotate，新的发送链不再分发给被移除的成员。
+    """
+    ALGORITHM = "AES-GCM+Ed25519"
+    MAX_KEYS_PER_SENDER = 2  # 轮换后保留旧链，解密轮换前发出、尚在途中的消息
+
+    def __init__(self):
+        self.crypto_helper = CryptoHelper()
+        self.own_keys: Dict[str, SenderKeyState] = {}  # group_id -> 自己的发送链
+        # (group_id, sender_id) -> {key_id: 发送链}
+        self.peer_keys: Dict[Tuple[str, str], "OrderedDict[int, SenderKeyState]"] = {}
+
+    @staticmethod
+    def _aad(group_id: str, sender_id: str, key_id: int, iteration: int) -> bytes:
+        return f"{group_id}|{sender_id}|{key_id}|{iteration}".encode('utf-8')
+
+    def own_key(self, group_id: str) -> SenderKeyState:
+        """获取自己在群组中的发送链，不存在时生成"""
+        state = self.own_keys.get(group_id)
+        if state is None:
+            state = self.own_keys[group_id] = SenderKeyState.generate(0)
+        return state
+
+    def rotate(self, group_id: str) -> SenderKeyState:
+        """生成新的发送链（成员被移除后调用），需要重新分发"""
+        previous = self.own_keys.get(group_id)
+        key_id = previous.key_id + 1 if previous else 0
+        state = self.own_keys[group_id] = SenderKeyState.generate(key_id)
+        return state
+
+    def get_distribution(self, group_id: str, sender_id: str) -> dict:
+        """当前发送链的分发内容"""
+        return self.own_key(group_id).to_distribution(group_id, sender_id)
+
+    def process_distribution(self, distribution: dict) -> None:
+        """保存其他成员分发的发送链"""
+        state = SenderKeyState.from_distribution(distribution)
+        keys = self.peer_keys.setdefault((distribution['group_id'], distribution['sender_id']), OrderedDict())
+        keys[state.key_id] = state
+        keys.move_to_end(state.key_id)
+        while len(keys) > self.MAX_KEYS_PER_SENDER:
+            keys.popitem(last=False)
+
+    def has_sender_key(self, group_id: str, sender_id: str) -> bool:
+        return bool(self.peer_keys.get((group_id, sender_id)))
+
+    def forget_sender(self, group_id: str, sender_id: str) -> None:
+        """丢弃某成员的发送链（该成员离开群组）"""
+        self.peer_keys.pop((group_id, sender_id), None)
+
+    def forget_group(self, group_id: str) -> None:
+        """丢弃群组的全部发送链（自己离开群组）"""
+        self.own_keys.pop(group_id, None)
+        for key in [key for key in self.peer_keys if key[0] == group_id]:
+            del self.peer_keys[key]
+
+    def encrypt(self, group_id: str, sender_id: str, plaintext: str) -> Message:
+        """加密一条群消息，返回发往群组的BROADCAST消息"""
+        state = self.own_key(group_id)
+        iteration, message_key = state.next_message_key()
+        iv = self.crypto_helper.get_random_bytes(12)
+        aad = self._aad(group_id, sender_id, state.key_id, iteration)
+        ciphertext, tag = self.crypto_helper.encrypt_aes_gcm(message_key, plaintext.encode(), iv, aad)
+        encryption = Encryption(
+            algorithm=self.ALGORITHM,
+            iv=iv,
+            tag=tag,
+            is_initiator=False,
+            key_id=state.key_id,
+            counter=iteration,
+            signature=state.sign(aad + iv + ciphertext + tag)
+        )
+        return Message(
+            message_id=Message.generate_id(),
+            sender_id=sender_id,
+            session_id=group_id,
+            receiver_id=group_id,
+            encryption=encryption,
+            message_type=MessageType.BROADCAST,
+            encrypted_content=ciphertext
+        )
+
+    def decrypt(self, message: Message) -> str:
+        """解密群消息
+
+        Raises:
+            KeyError: 尚未收到该成员的发送链（分发消息可能稍后到达）
+            ValueError: 签名或认证失败、消息重复
+        """
+        group_id = message.header.session_id
+        sender_id = message.header.sender_id
+        encryption = message.encryption
+        state = self.peer_keys.get((group_id, sender_id), {}).get(encryption.key_id)
+        if state is None:
+            raise KeyError(f"缺少 {sender_id} 在群组 {group_id} 中的发送者密钥")
+        aad = self._aad(group_id, sender_id, encryption.key_id, encryption.counter)
+        ciphertext = message.encrypted_content
+        state.verify(aad + encryption.iv + ciphertext + encryption.tag, encryption.signature)
+        message_key, pending = state.message_key_for(encryption.counter)
+        plaintext = self.crypto_helper.decrypt_aes_gcm(message_key, ciphertext, encryption.iv,
+                                                       encryption.tag, aad)
+        state.commit(encryption.counter, pending)
+        return plaintext.decode('utf-8')
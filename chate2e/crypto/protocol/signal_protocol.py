@@ -1,4 +1,4 @@
-from typing import Dict, Tuple, Optional
+from typing import Dict, Tuple, Optional, Sequence
 from cryptography.hazmat.primitives.asymmetric import x25519
 from chate2e.crypto.crypto_helper import CryptoHelper
 from chate2e.crypto.mac_helper import MACHelper
@@ -8,14 +8,43 @@ from chate2e.model.bundle import Bundle, LocalBundle
 from chate2e.model.key_pair import KeyPair
 from chate2e.model.message import Message, MessageType, Encryption, X3DHparams
 from chate2e.crypto.protocol.ratchet import DoubleRatchet
+from chate2e.crypto.compression import MessageCompressor
+from chate2e.crypto.padding import PADDING_CAPABILITY, MessagePadding
 import base64
 
+
+def _plaintext_aad(codec: Optional[str], padding: Optional[str]) -> Optional[bytes]:
+    """明文编码方式（压缩算法、填充策略）作为AES-GCM的附加认证数据，两者都没有时不使用"""
+    if padding is None:
+        return codec.encode('utf-8') if codec else None
+    return f"{codec or ''};{padding}".encode('utf-8')
+
+
+def _root_key_info(initiator_codecs: Sequence[str], responder_codecs: Sequence[str]) -> bytes:
+    """派生根密钥的HKDF info，绑定双方声明的明文编码能力
+
+    能力列表经服务器转发（Bundle与INITIATE）且没有签名，写入info后被篡改（如去掉填充能力以降级）
+    的两端会派生出不同的根密钥，第一条消息即解密失败；双方都没有声明能力时与旧版本相同。
+    """
+    if not initiator_codecs and not responder_codecs:
+        return b"root_key"
+    return f"root_key|{','.join(initiator_codecs)}|{','.join(responder_codecs)}".encode('utf-8')
+
+
 class SignalProtocol:
     def __init__(self):
         self.crypto_helper = CryptoHelper()
         self.mac_helper = MACHelper()
         self.ratchet = DoubleRatchet()
 
+        # 消息压缩与长度填充：codecs为本机可以解码的明文编码（压缩算法与填充能力，写入Bundle与INITIATE），
+        # send_codec/send_padding为建立会话时与对方协商出的发送用算法与填充策略，为None时不使用
+        self.compressor = MessageCompressor()
+        self.padding = MessagePadding()
+        self.codecs = MessageCompressor.available_codecs() + (PADDING_CAPABILITY,)
+        self.send_codec: Optional[str] = None
+        self.send_padding: Optional[str] = None
+
         # 身份密钥对
         self.identity_key = None
         self.identity_key_pub = None
@@ -38,6 +67,7 @@ class SignalProtocol:
 
         #存储对方的密钥Bundle user_id: Bundle
         self.peer_key_bundle: Dict[str ,Bundle] = {}
+        self.peer_bundle_versions: Dict[str, str] = {}  # user_id -> 服务器下发的Bundle版本
 
         # 会话状态
         self.session_initialized = False
@@ -47,6 +77,59 @@ class SignalProtocol:
         self.user_id = None
         self.peer_id = None
     
+    def fork(self) -> 'SignalProtocol':
+        """创建共享身份密钥、预密钥与对方Bundle缓存的新实例，用于与另一个设备建立独立的会话
+
+        一次性预密钥列表按引用共享，任一会话使用后的预密钥对所有会话都不再可用。
+        """
+        session = SignalProtocol()
+        session.user_id = self.user_id
+        session.identity_key = self.identity_key
+        session.identity_key_pub = self.identity_key_pub
+        session.signed_prekey = self.signed_prekey
+        session.signed_prekey_pub = self.signed_prekey_pub
+        session.signed_prekey_signature = self.signed_prekey_signature
+        session.one_time_prekeys = self.one_time_prekeys
+        session.one_time_prekeys_pub = self.one_time_prekeys_pub
+        session.peer_key_bundle = self.peer_key_bundle
+        session.peer_bundle_versions = self.peer_bundle_versions
+        session.compressor = self.compressor
+        session.padding = self.padding
+        session.codecs = self.codecs
+        return session
+
+    def export_session_state(self) -> dict:
+        """导出会话的棘轮状态（不含身份密钥与预密钥），用于本地加密持久化"""
+        def encode(key: Optional[bytes]) -> Optional[str]:
+            return base64.b64encode(key).decode('utf-8') if key is not None else None
+
+        return {
+            'peer_id': self.peer_id,
+            'session_id': self.session_id,
+            'is_initiator': self.is_initiator,
+            'root_key': encode(self.root_key),
+            'sending_chain_key': encode(self.sending_chain_key),
+            'receiving_chain_key': encode(self.receiving_chain_key),
+            'send_codec': self.send_codec,
+            'send_padding': self.send_padding,
+            'session_initialized': self.session_initialized,
+        }
+
+    def import_session_state(self, state: dict):
+        """恢复export_session_state()导出的棘轮状态，身份密钥需已加载（通常是fork()出的实例）"""
+        def decode(value: Optional[str]) -> Optional[bytes]:
+            return base64.b64decode(value) if value is not None else None
+
+        self.peer_id = state['peer_id']
+        self.session_id = state['session_id']
+        self.is_initiator = state['is_initiator']
+        self.root_key = decode(state['root_key'])
+        self.sending_chain_key = decode(state['sending_chain_key'])
+        self.receiving_chain_key = decode(state['receiving_chain_key'])
+        self.send_codec = state.get('send_codec')
+        self.send_padding = state.get('send_padding')
+        self.session_initialized = state['session_initialized']
+
     def initialize_identity(self, user_id: str):
         """初始化用户身份"""
         self.user_id = user_id
@@ -70,9 +153,17 @@ class SignalProtocol:
             self.one_time_prekeys.append((private_key, public_key))
             self.one_time_prekeys_pub.append(public_key)
 
-    def set_peer_bundle(self, peer_id:str, bundle:Bundle):
+    def set_peer_bundle(self, peer_id:str, bundle:Bundle, version: Optional[str] = None):
         """设置对方的密钥Bundle"""
         self.peer_key_bundle[peer_id] = bundle
+        if version is not None:
+            self.peer_bundle_versions[peer_id] = version
+        else:
+            self.peer_bundle_versions.pop(peer_id, None)
+
+    def get_peer_bundle(self, peer_id: str) -> Tuple[Optional[Bundle], Optional[str]]:
+        """获取缓存的对方Bundle及其版本"""
+        return self.peer_key_bundle.get(peer_id), self.peer_bundle_versions.get(peer_id)
 
 
     def create_bundle(self) -> Bundle:
@@ -98,7 +189,8 @@ class SignalProtocol:
             identity_key_pub=identity_key_bytes,
             signed_pre_key_pub=signed_prekey_bytes,
             signed_pre_key_signature=self.signed_prekey_signature,
-            one_time_pre_keys_pub=one_time_prekeys
+            one_time_pre_keys_pub=one_time_prekeys,
+            codecs=self.codecs
         )
 
     def create_local_bundle(self) -> LocalBundle:
@@ -161,7 +253,8 @@ class SignalProtocol:
                              recipient_ephemeral_key: Optional[x25519.X25519PublicKey] = None,
                              recipient_one_time_prekey: Optional[x25519.X25519PublicKey] = None,
                              own_one_time_prekey: Optional[x25519.X25519PublicKey] = None,
-                             is_initiator: bool = True) -> Message:
+                             is_initiator: bool = True,
+                             peer_codecs: Sequence[str] = ()) -> Message:
         """
         根据 Signal 协议计算共享密钥：
         DH1 = DH(身份私钥, 对方签名预密钥公钥)
@@ -178,6 +271,8 @@ class SignalProtocol:
         :param own_one_time_prekey: 自己的一次性预密钥
         :param recipient_one_time_prekey: 对方的一次性预密钥
         :param is_initiator: 是否为发起方
+        :param peer_codecs: 对方可以解码的明文编码（发起方取自对方Bundle，响应方取自INITIATE），
+                            与本机的codecs一起绑定到根密钥的派生中
         :return: 共享密钥
         """
         print(f"\n[初始化] 开始会话初始化 (是否为发起方: {is_initiator})")
@@ -185,6 +280,8 @@ class SignalProtocol:
         self.is_initiator = is_initiator
         self.peer_id = peer_id
         self.session_id = session_id
+        self.send_codec = MessageCompressor.negotiate(self.codecs, peer_codecs)
+        self.send_padding = MessagePadding.negotiate(self.padding.policy, peer_codecs)
         x3dh_params = None
 
         # 计算共享密钥
@@ -212,7 +309,8 @@ class SignalProtocol:
                 identity_key_pub= self.crypto_helper.export_x25519_public_key(self.identity_key_pub),
                 signed_pre_key_pub= self.crypto_helper.export_x25519_public_key(self.signed_prekey_pub),
                 one_time_pre_keys_pub= self.crypto_helper.export_x25519_public_key(recipient_one_time_prekey),
-                ephemeral_key_pub= self.crypto_helper.export_x25519_public_key(self.ephemeral_key_pub)
+                ephemeral_key_pub= self.crypto_helper.export_x25519_public_key(self.ephemeral_key_pub),
+                codecs=self.codecs
             )
 
         else:
@@ -247,7 +345,12 @@ class SignalProtocol:
 
                     
         # 派生根密钥和链密钥
-        self.root_key = self.crypto_helper.hkdf(shared_secret, 32, info=b"root_key")
+        # 发起方的能力列表即自己写入INITIATE的codecs，响应方的即自己发布到Bundle中的codecs
+        if is_initiator:
+            info = _root_key_info(self.codecs, peer_codecs)
+        else:
+            info = _root_key_info(peer_codecs, self.codecs)
+        self.root_key = self.crypto_helper.hkdf(shared_secret, 32, info=info)
         print(f"[初始化] 生成的派生根密钥: {self.root_key.hex()}")
 
         # 为发送和接收派生初始链密钥
@@ -297,19 +400,25 @@ class SignalProtocol:
         # 生成随机IV
         iv = self.crypto_helper.get_random_bytes(12)
         
-        # 使用AES-GCM加密
-        plaintext_bytes = plaintext.encode()
+        # 先压缩、再按协商的填充策略（Padmé/pow2）填充长度，最后使用AES-GCM加密，压缩算法与填充策略作为附加认证数据
+        codec, plaintext_bytes = self.compressor.compress(plaintext.encode(), self.send_codec)
+        padding = self.send_padding
+        if padding:
+            plaintext_bytes = self.padding.pad(plaintext_bytes)
         
         ciphertext, tag = self.crypto_helper.encrypt_aes_gcm(message_key, 
                                                      plaintext_bytes, 
-                                                     iv)
+                                                     iv,
+                                                     _plaintext_aad(codec, padding))
         
         # 创建加密参数，使用bytes类型
         encryption = Encryption(
             algorithm="AES-GCM",
             iv=iv,
             tag=tag,
-            is_initiator=self.is_initiator
+            is_initiator=self.is_initiator,
+            codec=codec,
+            padding=padding
         )
         
         # 创建加密消息，使用bytes
@@ -346,13 +455,22 @@ class SignalProtocol:
             # encrypted_content 已经在 Message.from_dict 中被解码为 bytes
             ciphertext = message.encrypted_content
             
+            codec = message.encryption.codec
+            padding = message.encryption.padding
+
             # 解密消息
             plaintext = self.crypto_helper.decrypt_aes_gcm(
                 message_key,
                 ciphertext,
                 iv,
-                tag
+                tag,
+                _plaintext_aad(codec, padding)
             )
+            # 去除填充只取memoryview，不复制明文
+            if padding:
+                plaintext = MessagePadding.unpad(plaintext)
+            if codec:
+                plaintext = self.compressor.decompress(plaintext, codec)
             
             # ✅ 只有解密成功才更新链密钥
             if use_receiving_key:
@@ -360,7 +478,7 @@ class SignalProtocol:
             else:
                 self.sending_chain_key = new_chain_key
             
-            decoded = plaintext.decode('utf-8')
+            decoded = str(plaintext, 'utf-8')
             print(f"[解密] ✓ UTF-8解码成功: {decoded}")
             return decoded
             
@@ -405,7 +523,8 @@ async def main():
         recipient_identity_key=bob.identity_key_pub,
         recipient_signed_prekey=bob.signed_prekey_pub,
         recipient_one_time_prekey=bob.one_time_prekeys_pub[0],
-        is_initiator=True
+        is_initiator=True,
+        peer_codecs=bob.codecs
     )
 
     # Bob responds to session initiation
@@ -416,7 +535,8 @@ async def main():
         recipient_signed_prekey=alice.signed_prekey_pub,
         recipient_ephemeral_key=alice.ephemeral_key_pub,
         own_one_time_prekey=bob.one_time_prekeys_pub[0],
-        is_initiator=False
+        is_initiator=False,
+        peer_codecs=alice.codecs
     )
 
     print("Alice 发送链密钥:", alice.sending_chain_key[:8].hex())
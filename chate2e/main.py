@@ -35,7 +35,8 @@ async def main():
         recipient_identity_key=bob.identity_key_pub,
         recipient_signed_prekey=bob.signed_prekey_pub,
         recipient_one_time_prekey=bob.one_time_prekeys_pub[0],
-        is_initiator=True
+        is_initiator=True,
+        peer_codecs=bob.codecs
     )
 
     # Bob responds to session initiation
@@ -46,7 +47,8 @@ async def main():
         recipient_signed_prekey=alice.signed_prekey_pub,
         recipient_ephemeral_key=alice.ephemeral_key_pub,
         own_one_time_prekey=bob.one_time_prekeys_pub[0],
-        is_initiator=False
+        is_initiator=False,
+        peer_codecs=alice.codecs
     )
 
     print("Alice 发送链密钥:", alice.sending_chain_key[:8].hex())
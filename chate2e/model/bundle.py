@@ -1,4 +1,5 @@
-from typing import FrozenSet, NamedTuple
+import hashlib
+from typing import FrozenSet, NamedTuple, Tuple
 from base64 import b64encode, b64decode
 
 from chate2e.model.key_pair import KeyPair
@@ -12,16 +13,32 @@ class Bundle(NamedTuple):
     signed_pre_key_pub: bytes
     signed_pre_key_signature: bytes
     one_time_pre_keys_pub: FrozenSet[bytes]
+    # 该设备可以解压的消息压缩算法（按优先级），发起方据此选择发给该设备的消息使用的压缩算法
+    codecs: Tuple[str, ...] = ()
+
+    def fingerprint(self) -> str:
+        """长期密钥（身份公钥与签名预密钥）的指纹，一次性预密钥的消耗不影响指纹"""
+        digest = hashlib.sha256()
+        digest.update(self.identity_key_pub)
+        digest.update(self.signed_pre_key_pub)
+        digest.update(self.signed_pre_key_signature)
+        if self.codecs:
+            # 不支持压缩的Bundle指纹与以前相同，已缓存的Bundle不会全部失效
+            digest.update(','.join(self.codecs).encode('utf-8'))
+        return digest.hexdigest()
     
     def to_dict(self) -> dict:
         """将Bundle转换为可JSON序列化的字典"""
-        return {
+        result = {
             'identity_key_pub': b64encode(self.identity_key_pub).decode('utf-8'),
             'signed_pre_key_pub': b64encode(self.signed_pre_key_pub).decode('utf-8'),
             'signed_pre_key_signature': b64encode(self.signed_pre_key_signature).decode('utf-8'),
             'one_time_pre_keys_pub': [b64encode(key).decode('utf-8') 
                                     for key in self.one_time_pre_keys_pub]
         }
+        if self.codecs:
+            result['codecs'] = list(self.codecs)
+        return result
 
     @classmethod
     def from_dict(cls, data: dict) -> 'Bundle':
@@ -31,7 +48,8 @@ class Bundle(NamedTuple):
             signed_pre_key_pub=b64decode(data['signed_pre_key_pub']),
             signed_pre_key_signature=b64decode(data['signed_pre_key_signature']),
             one_time_pre_keys_pub=frozenset(b64decode(key) 
-                                          for key in data['one_time_pre_keys_pub'])
+                                          for key in data['one_time_pre_keys_pub']),
+            codecs=tuple(data.get('codecs', ()))
         )
 
 class LocalBundle(NamedTuple):
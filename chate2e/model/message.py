@@ -1,10 +1,13 @@
-from typing import Dict, Optional
-import json
+from typing import Dict, Optional, Tuple, Union
+import sys
 import uuid
 import time
 import enum
 from base64 import b64encode, b64decode
 
+from chate2e.utils import serialization
+from chate2e.utils.tracing import TraceContext
+
 
 @enum.unique
 class MessageType(enum.Enum):
@@ -15,19 +18,41 @@ class MessageType(enum.Enum):
     ACK_INITIATE = 1
     MESSAGE = 2
     BROADCAST = 3                
+
+
+# 只有一个设备的用户（以及不携带设备ID的旧客户端）使用的设备ID
+PRIMARY_DEVICE_ID = "primary"
+
+
+def _intern(value):
+    """驻留重复出现的ID（用户、会话、设备），大量消息共用同一个字符串对象"""
+    return sys.intern(value) if type(value) is str else value
+
                 
 class Header:
+    # 聊天记录与离线队列中同时保留大量消息，用__slots__省去每个实例的__dict__
+    __slots__ = ('sender_id', 'receiver_id', 'session_id', 'message_id', 'message_type', 'timestamp',
+                 'sender_device_id', 'receiver_device_id', 'trace')
+
     def __init__(self, sender_id: str, receiver_id: str, session_id: str,
-                message_id: str, message_type: MessageType, timestamp: float):
-        self.sender_id = sender_id
-        self.receiver_id = receiver_id
-        self.session_id = session_id
+                message_id: str, message_type: MessageType, timestamp: float,
+                sender_device_id: Optional[str] = None, receiver_device_id: Optional[str] = None,
+                trace: Optional[TraceContext] = None):
+        self.sender_id = _intern(sender_id)
+        self.receiver_id = _intern(receiver_id)
+        self.session_id = _intern(session_id)
         self.message_id = message_id
-        self.message_type = message_type
+        # 始终保存枚举，接受枚举或其整数值
+        self.message_type = message_type if type(message_type) is MessageType else MessageType(message_type)
         self.timestamp = timestamp
+        # 多设备：消息由哪个设备的会话加密、发往哪个设备；为None时按用户投递
+        self.sender_device_id = _intern(sender_device_id)
+        self.receiver_device_id = _intern(receiver_device_id)
+        # 可选的延迟追踪上下文，发送方、服务器与接收方在各阶段追加时间戳
+        self.trace = trace
 
     def to_dict(self) -> dict:
-        return {
+        result = {
             'sender_id': self.sender_id,
             'receiver_id': self.receiver_id,
             'session_id': self.session_id,
@@ -35,18 +60,35 @@ class Header:
             'message_type': self.message_type.value,
             'timestamp': self.timestamp
         }
+        if self.sender_device_id is not None:
+            result['sender_device_id'] = self.sender_device_id
+        if self.receiver_device_id is not None:
+            result['receiver_device_id'] = self.receiver_device_id
+        if self.trace is not None:
+            result['trace'] = self.trace.to_dict()
+        return result
 
     @classmethod
     def from_dict(cls, data: dict) -> 'Header':
-        return cls(**data)
+        trace = data.get('trace')
+        return cls(
+            sender_id=data['sender_id'],
+            receiver_id=data['receiver_id'],
+            session_id=data['session_id'],
+            message_id=data['message_id'],
+            message_type=data['message_type'],
+            timestamp=data['timestamp'],
+            sender_device_id=data.get('sender_device_id'),
+            receiver_device_id=data.get('receiver_device_id'),
+            trace=TraceContext.from_dict(trace) if trace else None
+        )
 
     def serialize(self) -> str:
-        return json.dumps(self.to_dict())
+        return serialization.dumps_str(self.to_dict())
 
     @classmethod
-    def deserialize(cls, json_str: str) -> 'Header':
-        data = json.loads(json_str)
-        return cls.from_dict(data)
+    def deserialize(cls, json_str: Union[str, bytes]) -> 'Header':
+        return serialization.decode(json_str, cls)
 
     @staticmethod
     def generate_id() -> str:
@@ -54,11 +96,24 @@ class Header:
         return str(uuid.uuid4())
     
 class Encryption:
-    def __init__(self, algorithm: str, iv: bytes, tag: bytes, is_initiator: bool):
-        self.algorithm = algorithm
+    __slots__ = ('algorithm', 'iv', 'tag', 'is_initiator', 'key_id', 'counter', 'signature', 'codec', 'padding')
+
+    def __init__(self, algorithm: str, iv: bytes, tag: bytes, is_initiator: bool,
+                 key_id: Optional[int] = None, counter: Optional[int] = None,
+                 signature: Optional[bytes] = None, codec: Optional[str] = None,
+                 padding: Optional[str] = None):
+        self.algorithm = _intern(algorithm)
         self.iv = iv
         self.tag = tag
         self.is_initiator = is_initiator
+        # 群消息（发送者密钥）专用：发送链编号、链上序号、发送者签名
+        self.key_id = key_id
+        self.counter = counter
+        self.signature = signature
+        # 明文加密前使用的压缩算法，为None时密文直接是UTF-8明文
+        self.codec = _intern(codec)
+        # 明文加密前使用的长度填充策略，为None时没有填充
+        self.padding = _intern(padding)
 
     def to_dict(self) -> dict:
         # 处理可能已经是字符串的情况
@@ -73,24 +128,43 @@ class Encryption:
             'tag': encode_if_bytes(self.tag),
             'is_initiator': self.is_initiator
         }
+        if self.key_id is not None:
+            result['key_id'] = self.key_id
+            result['counter'] = self.counter
+            result['signature'] = encode_if_bytes(self.signature)
+        if self.codec is not None:
+            result['codec'] = self.codec
+        if self.padding is not None:
+            result['padding'] = self.padding
         
         return result
 
     @classmethod
     def from_dict(cls, data: dict) -> 'Encryption':
+        signature = data.get('signature')
         return cls(
             algorithm=data['algorithm'],
             iv=b64decode(data['iv']),
             tag=b64decode(data['tag']),
-            is_initiator=data['is_initiator']
+            is_initiator=data['is_initiator'],
+            key_id=data.get('key_id'),
+            counter=data.get('counter'),
+            signature=b64decode(signature) if signature else None,
+            codec=data.get('codec'),
+            padding=data.get('padding')
         )
         
 class X3DHparams:
-    def __init__(self, identity_key_pub: bytes, signed_pre_key_pub: bytes, one_time_pre_keys_pub: bytes, ephemeral_key_pub: bytes):
+    __slots__ = ('identity_key_pub', 'signed_pre_key_pub', 'ephemeral_key_pub', 'one_time_pre_keys_pub', 'codecs')
+
+    def __init__(self, identity_key_pub: bytes, signed_pre_key_pub: bytes, one_time_pre_keys_pub: bytes, ephemeral_key_pub: bytes,
+                 codecs: Tuple[str, ...] = ()):
         self.identity_key_pub = identity_key_pub
         self.signed_pre_key_pub = signed_pre_key_pub
         self.ephemeral_key_pub = ephemeral_key_pub
         self.one_time_pre_keys_pub = one_time_pre_keys_pub
+        # 发起方可以解压的压缩算法，响应方据此选择发给发起方的消息使用的压缩算法
+        self.codecs = tuple(codecs)
 
     def to_dict(self) -> dict:
         # 处理可能已经是字符串的情况
@@ -99,12 +173,15 @@ class X3DHparams:
                 return b64encode(value).decode('utf-8')
             return value  # 已经是字符串
         
-        return {
+        result = {
             'identity_key_pub': encode_if_bytes(self.identity_key_pub),
             'signed_pre_key_pub': encode_if_bytes(self.signed_pre_key_pub),
             'one_time_pre_keys_pub': encode_if_bytes(self.one_time_pre_keys_pub),
             'ephemeral_key_pub': encode_if_bytes(self.ephemeral_key_pub)
         }
+        if self.codecs:
+            result['codecs'] = list(self.codecs)
+        return result
 
     @classmethod
     def from_dict(cls, data: dict) -> 'X3DHparams':
@@ -112,14 +189,20 @@ class X3DHparams:
             identity_key_pub=b64decode(data['identity_key_pub']),
             signed_pre_key_pub=b64decode(data['signed_pre_key_pub']),
             one_time_pre_keys_pub=b64decode(data['one_time_pre_keys_pub']),
-            ephemeral_key_pub=b64decode(data['ephemeral_key_pub'])
+            ephemeral_key_pub=b64decode(data['ephemeral_key_pub']),
+            codecs=data.get('codecs', ())
         )
 
 class Message:
+    __slots__ = ('header', 'encrypted_content', 'encryption', 'X3DHparams')
+
     def __init__(self, message_id: str, sender_id: str, session_id : str,
                  receiver_id: str, encrypted_content: bytes,
-                 message_type: MessageType.MESSAGE,encryption: Encryption = None, timestamp: float = time.time(),X3DHparams: X3DHparams = None):
-        self.header = Header(sender_id, receiver_id, session_id, message_id, message_type, timestamp)
+                 message_type: MessageType.MESSAGE,encryption: Encryption = None, timestamp: float = time.time(),X3DHparams: X3DHparams = None,
+                 sender_device_id: Optional[str] = None, receiver_device_id: Optional[str] = None,
+                 trace: Optional[TraceContext] = None):
+        self.header = Header(sender_id, receiver_id, session_id, message_id, message_type, timestamp,
+                             sender_device_id, receiver_device_id, trace)
         self.encrypted_content = encrypted_content
         self.encryption = encryption
         self.X3DHparams = X3DHparams
@@ -138,7 +221,6 @@ class Message:
     def from_dict(cls, data: dict) -> 'Message':
         # 从嵌套的header数据创建Header对象
         header_data = data['header']
-        header_data['message_type'] = MessageType(header_data['message_type'])  # 将整数转换为枚举
 
         # Handle encryption data
         encryption_data = data.get('encryption')
@@ -170,18 +252,74 @@ class Message:
             message_type=header_data['message_type'],
             timestamp=header_data['timestamp'],
             encryption=encryption,
-            X3DHparams=x3dh
+            X3DHparams=x3dh,
+            sender_device_id=header_data.get('sender_device_id'),
+            receiver_device_id=header_data.get('receiver_device_id'),
+            trace=TraceContext.from_dict(header_data['trace']) if header_data.get('trace') else None
         )
 
     def serialize(self) -> str:
-        return json.dumps(self.to_dict())
+        return serialization.dumps_str(self.to_dict())
 
     @classmethod
-    def deserialize(cls, json_str: str) -> 'Message':
-        data = json.loads(json_str)
-        return cls.from_dict(data)
+    def deserialize(cls, json_str: Union[str, bytes]) -> 'Message':
+        return serialization.decode(json_str, cls)
 
     @staticmethod
     def generate_id() -> str:
         """生成消息ID"""
-        return str(uuid.uuid4())
\ No newline at end of file
+        return str(uuid.uuid4())
+
+
+class MessageView:
+    """服务器转发用的消息视图
+
+    服务器只按消息头路由，不需要解码密文：from_dict只校验路由用到的字段，
+    构造一个Header供验证与投递逻辑使用，密文、加密参数等其余内容不解析；
+    to_dict()直接返回收到的原始dict，转发与离线保存都不再重新编码。
+    追踪上下文与原始dict共用阶段列表，服务器追加的时间戳会随原始dict一起转发。
+    """
+    __slots__ = ('header', '_data')
+
+    def __init__(self, header: Header, data: dict):
+        self.header = header
+        self._data = data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'MessageView':
+        if not isinstance(data, dict) or not isinstance(data.get('header'), dict):
+            raise ValueError("消息格式错误: 缺少消息头")
+        header_data = data['header']
+        for field in ('sender_id', 'receiver_id', 'message_id'):
+            if not isinstance(header_data.get(field), str):
+                raise ValueError(f"消息格式错误: {field}")
+        for field in ('session_id', 'sender_device_id', 'receiver_device_id'):
+            if header_data.get(field) is not None and not isinstance(header_data[field], str):
+                raise ValueError(f"消息格式错误: {field}")
+        if not isinstance(data.get('encrypted_content'), str):
+            raise ValueError("消息格式错误: encrypted_content")
+        trace = header_data.get('trace')
+        if trace:
+            if not isinstance(trace, dict) or not isinstance(trace.get('id'), str) \
+                    or not isinstance(trace.get('stages'), list):
+                raise ValueError("消息格式错误: trace")
+            trace = TraceContext(trace['id'], trace['stages'])
+        header = Header(
+            sender_id=header_data['sender_id'],
+            receiver_id=header_data['receiver_id'],
+            session_id=header_data.get('session_id'),
+            message_id=header_data['message_id'],
+            message_type=header_data.get('message_type'),
+            timestamp=header_data.get('timestamp'),
+            sender_device_id=header_data.get('sender_device_id'),
+            receiver_device_id=header_data.get('receiver_device_id'),
+            trace=trace or None
+        )
+        return cls(header, data)
+
+    def to_dict(self) -> dict:
+        return self._data
+
+    def to_message(self) -> Message:
+        """完整解析为Message（解码密文与加密参数）"""
+        return Message.from_dict(self._data)
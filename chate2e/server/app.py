@@ -1,12 +1,24 @@
-from flask import Flask, request, jsonify
+import hmac
+import os
+from base64 import b64encode
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+from werkzeug.wsgi import wrap_file
 
 from chate2e.model.bundle import Bundle
-from chate2e.model.message import Message, MessageType, Encryption
+from chate2e.model.message import MessageType, MessageView, PRIMARY_DEVICE_ID
+from chate2e.server import metrics
+from chate2e.server.blob_store import BlobStore, UploadError
 from chate2e.server.chat_server import ChatServer, generate_short_uuid
 from chate2e.server.socket_manager import socketio
 from chate2e.server.user import User
 from chate2e.server.message_manager import MessageManager
+from chate2e.server.profiling import RequestProfiler
+from chate2e.server.rate_limit import RateLimiter, retry_after_header
+from chate2e.utils import config
+from chate2e.utils.tracing import get_tracer, now_ns
 
 app = Flask(__name__)
 CORS(app)
@@ -15,24 +27,67 @@ socketio.init_app(app)
 # 创建全局的ChatServer实例
 chat_server = ChatServer()
 message_manager = MessageManager()
+blob_store = BlobStore(os.path.join(chat_server.data_dir, 'blobs'))
+# 在模块初始化时启动附件回收，经start_server.py或其他方式导入app时同样生效
+blob_store.start_gc()
+profiler = RequestProfiler(config.PROFILE_DIR or os.path.join(chat_server.data_dir, 'profiles'))
+
+MAX_LOOKUP_BATCH = 1000  # 批量用户查询的单次上限
+MAX_MESSAGE_BATCH = 256  # 批量发送的单次上限（一条消息发给对方全部设备）
+
+# 限流：单个客户端刷消息或注册（每次都可能触发emit或整体写盘）时不影响其他用户
+user_limiter = RateLimiter(*config.MESSAGE_RATE_PER_USER)
+address_limiter = RateLimiter(*config.MESSAGE_RATE_PER_ADDRESS)
+register_limiter = RateLimiter(*config.REGISTER_RATE_PER_ADDRESS)
+
+
+def _prekey_pool_depths():
+    """每个用户每个设备剩余可分配的一次性预密钥数"""
+    return [((user.uuid, device.device_id), len(device.available_pre_keys()))
+            for user in list(chat_server.users.values())
+            for device in user.active_devices()]
+
+
+# 状态类指标在采集时计算，不占用请求处理路径
+metrics.registry.gauge('chate2e_connected_sockets', '当前登录的socket连接数',
+                       lambda: len(chat_server.socket_sessions))
+metrics.registry.gauge('chate2e_online_users', '当前至少有一个连接的用户数',
+                       lambda: len(chat_server.user_sockets))
+metrics.registry.gauge('chate2e_prekey_pool_depth', '用户设备剩余的一次性预密钥数',
+                       _prekey_pool_depths, ['user', 'device'])
+
+
+@app.before_request
+def _begin_profile():
+    if profiler.enabled:
+        request.environ['chate2e.profile'] = profiler.begin(f"http.{request.endpoint}")
+
+
+@app.teardown_request
+def _end_profile(exc=None):
+    if 'chate2e.profile' in request.environ:
+        profiler.end(request.environ.pop('chate2e.profile'))
 
 
 @socketio.on('connect')
+@profiler.profiled('socket.connect')
 def handle_connect():
     """处理新连接"""
     print(f"新连接: {request.sid}")
 
 
 @socketio.on('login')
+@profiler.profiled('socket.login')
 def handle_login(data):
     """处理登录事件"""
     user_id = data.get('user_id')
     if user_id:
-        chat_server.add_socket_session(user_id, request.sid)
+        chat_server.add_socket_session(user_id, request.sid, data.get('device_id') or PRIMARY_DEVICE_ID)
         return {'status': 'success', 'message': '连接成功'}
     return {'status': 'error', 'message': '登录失败'}
 
 @socketio.on('disconnect')
+@profiler.profiled('socket.disconnect')
 def handle_disconnect():
     """处理断开连接"""
     print(f"连接断开: {request.sid}")
@@ -40,18 +95,131 @@ def handle_disconnect():
 
 
 @socketio.on('new_message')
+@profiler.profiled('socket.new_message')
 def handle_new_message(message_data):
     """处理新消息"""
     try:
-        message = Message.from_dict(message_data)
-        chat_server.forward_message(message)
+        # 只信任登录时登记的用户；未登录的连接只按地址限流，不使用客户端自报的sender_id
+        wait = check_message_rate({chat_server.socket_sessions.get(request.sid): 1})
+        if wait:
+            metrics.RATE_LIMITED_SOCKET.inc()
+            return {'status': 'error', 'message': '发送过于频繁，请稍后重试', 'retry_after': wait}
+        message = MessageView.from_dict(message_data)
+        if message.header.message_type == MessageType.BROADCAST:
+            if not chat_server.group_registry.is_member(message.header.receiver_id, message.header.sender_id):
+                return {'status': 'error', 'message': '不是群组成员'}
+            broadcast_group_message(message)
+        elif chat_server.receiver_congested(message.header.receiver_id, message.header.receiver_device_id):
+            metrics.RECEIVER_CONGESTED.inc()
+            return {'status': 'error', 'message': '接收方繁忙，请稍后重试', 'retry_after': 1.0}
+        elif not chat_server.forward_message(message):
+            message_manager.add_offline_message(message)
         return {'status': 'success'}
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
+def broadcast_group_message(message: MessageView) -> Tuple[int, int]:
+    """扇出群消息，离线成员各自保存一份离线消息，返回(实时送达数, 离线保存数)"""
+    delivered, offline = chat_server.broadcast_message(message)
+    if offline:
+        message_manager.add_offline_messages(message, offline)
+    return len(delivered), len(offline)
+
+
+def claimed_sender(message_data) -> Optional[str]:
+    """限流用的消息头sender_id；格式错误时返回None，由MessageView.from_dict返回400"""
+    header = message_data.get('header') if isinstance(message_data, dict) else None
+    sender_id = header.get('sender_id') if isinstance(header, dict) else None
+    return sender_id if isinstance(sender_id, str) else None
+
+
+def check_message_rate(costs: Dict[Optional[str], int]) -> float:
+    """按远端地址与发送者限流，costs为 {发送者: 消息数}；返回需要等待的秒数，0表示放行
+
+    发送者为None（未登录的连接）的消息只计入地址限流。
+    任一令牌桶不足时退还本次已扣除的令牌，被拒绝的请求不消耗任何配额。
+    """
+    count = sum(costs.values())
+    wait = address_limiter.acquire(request.remote_addr, count)
+    if wait:
+        return wait
+    acquired = []
+    for sender_id, cost in costs.items():
+        if sender_id is None:
+            continue
+        wait = user_limiter.acquire(sender_id, cost)
+        if wait:
+            address_limiter.refund(request.remote_addr, count)
+            for acquired_id, acquired_cost in acquired:
+                user_limiter.refund(acquired_id, acquired_cost)
+            return wait
+        acquired.append((sender_id, cost))
+    return 0.0
+
+
+def too_many_requests(wait: float, message: str = '请求过于频繁，请稍后重试'):
+    """429响应，带Retry-After头与精确的等待秒数"""
+    response = jsonify({'status': 'error', 'message': message, 'retry_after': wait})
+    response.headers['Retry-After'] = retry_after_header(wait)
+    return response, 429
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus文本格式的服务器指标"""
+    return Response(metrics.registry.exposition(), mimetype=None,
+                    content_type=metrics.MetricsRegistry.CONTENT_TYPE)
+
+
+def _is_admin() -> bool:
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(config.ADMIN_TOKEN) and hmac.compare_digest(token.encode(), config.ADMIN_TOKEN.encode())
+
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """查看或切换请求剖析（需要X-Admin-Token）
+
+    POST请求体:
+    {
+        "mode": "sample" | "cprofile" | "off",
+        "rate": 0.1,         # 被剖析请求的比例，默认1
+        "interval_ms": 5     # sample模式的采样间隔，默认5
+    }
+    切换为off时写出结果：每个接口/事件一个 <标签>.folded（折叠栈）或 <标签>.prof（pstats）
+    """
+    if not _is_admin():
+        return jsonify({'status': 'error', 'message': '无权访问'}), 403
+    if request.method == 'GET':
+        return jsonify({'status': 'success', 'profiling': profiler.status()})
+
+    data = request.get_json() or {}
+    try:
+        mode = data.get('mode', 'off')
+        if mode == 'off':
+            written = profiler.stop()
+            return jsonify({'status': 'success', 'message': '剖析已停止', 'files': written})
+        profiler.start(mode, float(data.get('rate', 1.0)), float(data.get('interval_ms', 5)) / 1000)
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'status': 'success', 'message': '剖析已开启', 'profiling': profiler.status()})
+
+
+@app.route('/admin/profiling/<label>.folded', methods=['GET'])
+def admin_profiling_folded(label):
+    """下载某个接口/事件目前为止的折叠栈（sample模式，可在剖析进行中获取）"""
+    if not _is_admin():
+        return jsonify({'status': 'error', 'message': '无权访问'}), 403
+    return Response(profiler.folded(label), mimetype='text/plain')
+
+
 @app.route('/register', methods=['POST'])
 def register_user():
     """注册新用户"""
+    wait = register_limiter.acquire(request.remote_addr)
+    if wait:
+        metrics.RATE_LIMITED_REGISTER.inc()
+        return too_many_requests(wait)
     data = request.get_json()
     username = data.get('username')
 
@@ -126,29 +294,86 @@ def get_username_by_uuid(user_uuid: str):  # Changed to match the route paramete
             'message': '用户不存在'
         }), 404
 
+    etag = user.etag
+    if etag in request.if_none_match:
+        return '', 304, {'ETag': f'"{etag}"'}
+
+    response = jsonify({
+        'status': 'success',
+        'username': user.username,
+        'fingerprint': user.fingerprint
+    })
+    response.set_etag(etag)
+    return response
+
+
+@app.route('/users/lookup', methods=['POST'])
+def lookup_users():
+    """批量解析用户UUID为用户名与密钥指纹
+
+    请求体: {'user_ids': [...], 'known': {user_id: etag}}
+    known中etag未变化的用户只返回在unchanged列表中，不重复传输用户信息。
+    """
+    data = request.get_json() or {}
+    user_ids = data.get('user_ids')
+    known = data.get('known') or {}
+    if not isinstance(user_ids, list):
+        return jsonify({
+            'status': 'error',
+            'message': '缺少用户ID列表'
+        }), 400
+    if len(user_ids) > MAX_LOOKUP_BATCH:
+        return jsonify({
+            'status': 'error',
+            'message': f'单次最多查询{MAX_LOOKUP_BATCH}个用户'
+        }), 400
+
+    users, unchanged, missing = {}, [], []
+    for user_id in user_ids:
+        user = chat_server.get_user(user_id)
+        if user is None:
+            missing.append(user_id)
+        elif known.get(user_id) == user.etag:
+            unchanged.append(user_id)
+        else:
+            users[user_id] = user.public_info()
     return jsonify({
         'status': 'success',
-        'username': user.username
+        'users': users,
+        'unchanged': unchanged,
+        'missing': missing
     })
 
 @app.route('/key_bundle/<user_uuid>', methods=['GET'])
 def get_key_bundle(user_uuid):
-    """获取指定用户的密钥Bundle,并确保返回未使用的一次性预密钥"""
+    """获取指定用户的密钥Bundle，只包含未使用的一次性预密钥
+
+    ETag为长期密钥指纹；客户端携带If-None-Match且长期密钥未变化时返回304。
+    """
     user = chat_server.get_user(user_uuid)
     if not user:
+        metrics.BUNDLE_FETCH_MISSING.inc()
         return jsonify({
             'status': 'error',
             'message': '用户不存在'
         }), 404
 
     try:
-        bundle = user.get_bundle()
+        bundle = user.public_bundle()
         if bundle:
-            return jsonify({
+            if user.fingerprint in request.if_none_match:
+                metrics.BUNDLE_FETCH_NOT_MODIFIED.inc()
+                return '', 304, {'ETag': f'"{user.fingerprint}"'}
+            metrics.BUNDLE_FETCH_OK.inc()
+            response = jsonify({
                 'status': 'success',
-                'key_bundle': bundle.to_dict()
+                'key_bundle': bundle.to_dict(),
+                'version': user.fingerprint
             })
+            response.set_etag(user.fingerprint)
+            return response
         else:
+            metrics.BUNDLE_FETCH_MISSING.inc()
             return jsonify({
                 'status': 'error',
                 'message': '用户Bundle不存在'
@@ -160,6 +385,100 @@ def get_key_bundle(user_uuid):
         }), 500
 
 
+@app.route('/key_bundle/<user_uuid>/prekey', methods=['POST'])
+def claim_one_time_prekey(user_uuid):
+    """为会话发起方分配一个一次性预密钥（分配后不再发给其他人）
+
+    请求体可选 {"device_id": ...}，默认为主设备
+    """
+    device_id = (request.get_json(silent=True) or {}).get('device_id') or PRIMARY_DEVICE_ID
+    user = chat_server.get_user(user_uuid)
+    device = user.get_device(device_id) if user else None
+    if not device or not device.bundle:
+        return jsonify({
+            'status': 'error',
+            'message': '用户Bundle不存在'
+        }), 404
+
+    key = chat_server.claim_one_time_prekey(user_uuid, device_id)
+    if key is None:
+        return jsonify({
+            'status': 'error',
+            'message': '一次性预密钥已耗尽'
+        }), 409
+    return jsonify({
+        'status': 'success',
+        'one_time_pre_key': b64encode(key).decode('utf-8'),
+        'version': device.fingerprint
+    })
+
+
+@app.route('/key_bundle/<user_uuid>/devices', methods=['GET'])
+def get_device_bundles(user_uuid):
+    """获取用户全部设备的密钥Bundle（只包含未使用的一次性预密钥），version为各设备的长期密钥指纹"""
+    user = chat_server.get_user(user_uuid)
+    if not user:
+        return jsonify({
+            'status': 'error',
+            'message': '用户不存在'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'devices': [{
+            'device_id': device.device_id,
+            'key_bundle': device.public_bundle().to_dict(),
+            'version': device.fingerprint
+        } for device in user.active_devices()]
+    })
+
+
+@app.route('/devices/<user_uuid>/<device_id>', methods=['PUT'])
+def register_device(user_uuid, device_id):
+    """为已有用户注册新设备（或更新设备的Bundle）
+
+    请求体:
+    {
+        "key_bundle": 新设备的Bundle
+    }
+    """
+    data = request.get_json() or {}
+    key_bundle = data.get('key_bundle')
+    if not key_bundle:
+        return jsonify({
+            'status': 'error',
+            'message': '缺少必要参数'
+        }), 400
+    try:
+        if not chat_server.register_device(user_uuid, device_id, key_bundle):
+            return jsonify({
+                'status': 'error',
+                'message': '用户不存在'
+            }), 404
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'设备注册失败: {str(e)}'
+        }), 400
+    return jsonify({
+        'status': 'success',
+        'device_id': device_id
+    })
+
+
+@app.route('/devices/<user_uuid>/<device_id>', methods=['DELETE'])
+def remove_device(user_uuid, device_id):
+    """移除用户的非主设备"""
+    if not chat_server.remove_device(user_uuid, device_id):
+        return jsonify({
+            'status': 'error',
+            'message': '设备不存在或不能移除'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'message': '设备已移除'
+    })
+
+
 @app.route('/key_bundle', methods=['PUT'])
 def update_key_bundle():
     """更新用户的密钥Bundle"""
@@ -194,49 +513,121 @@ def update_key_bundle():
         }), 400
 
 
+def route_message(message: MessageView, received_at: Optional[int] = None) -> Tuple[dict, int]:
+    """验证并投递一条消息，接收者（设备）不在线时存为离线消息
+
+    带追踪上下文的消息依次记录 server.received / server.validated / server.emit（或server.queued），
+    处理完成后导出服务器视角的记录。
+
+    Args:
+        message: 消息
+        received_at: 收到请求的时间戳（now_ns），默认为调用时刻
+
+    Returns:
+        (响应内容, HTTP状态码)
+    """
+    trace = message.header.trace
+    if trace is not None:
+        trace.mark('server.received', received_at)
+        try:
+            return _route_message(message)
+        finally:
+            trace.mark('server.done')
+            get_tracer().export(trace, 'server')
+    return _route_message(message)
+
+
+def _route_message(message: MessageView) -> Tuple[dict, int]:
+    trace = message.header.trace
+    print(f"[Server] 消息类型: {message.header.message_type}")
+    print(f"[Server] 发送者: {message.header.sender_id}")
+    print(f"[Server] 接收者: {message.header.receiver_id}")
+    print(f"[Server] 会话ID: {message.header.session_id}")
+
+    # 群消息：只验证发送者是群组成员，由服务器扇出给其他成员
+    if message.header.message_type == MessageType.BROADCAST:
+        if not chat_server.group_registry.is_member(message.header.receiver_id, message.header.sender_id):
+            print(f"[Server] ✗ 群组成员验证失败")
+            return {'status': 'error', 'message': '不是群组成员'}, 403
+        if trace is not None:
+            trace.mark('server.validated')
+        delivered, queued = broadcast_group_message(message)
+        print(f"[Server] 群消息已扇出: 实时 {delivered}，离线 {queued}")
+        return {
+            'status': 'success',
+            'message_id': message.header.message_id,
+            'delivered': delivered,
+            'queued': queued
+        }, 200
+
+    # 对于INITIATE消息，服务器需要先创建或验证会话
+    if message.header.message_type == MessageType.INITIATE:
+        # 确保会话存在
+        existing_session_id = chat_server.get_or_create_session(
+            message.header.sender_id,
+            message.header.receiver_id
+        )
+        print(f"[Server] INITIATE消息的会话ID: {existing_session_id}")
+        # 如果客户端发送的session_id与服务器的不同，记录警告
+        if existing_session_id != message.header.session_id:
+            print(f"[Server] ⚠ 警告: 客户端session_id ({message.header.session_id}) 与服务器 ({existing_session_id}) 不同")
+    else:
+        # 验证会话（对于非INITIATE消息）
+        if not chat_server.validate_session(message.header.session_id, message.header.sender_id):
+            metrics.SESSION_VALIDATION_FAILURES.inc()
+            print(f"[Server] ✗ 会话验证失败")
+            return {'status': 'error', 'message': '会话验证失败'}, 403
+
+    if trace is not None:
+        trace.mark('server.validated')
+    # 接收者的连接积压过多时不再继续排队，让发送方退避后重试
+    if chat_server.receiver_congested(message.header.receiver_id, message.header.receiver_device_id):
+        metrics.RECEIVER_CONGESTED.inc()
+        print(f"[Server] ✗ 接收者连接拥塞，要求发送方稍后重试")
+        return {'status': 'error', 'message': '接收方繁忙，请稍后重试', 'retry_after': 1.0}, 429
+    result = chat_server.forward_message(message)
+    print(f"[Server] forward_message返回: {result}")
+    if not result:
+        # 接收者（设备）不在线，存为离线消息，等待其重连后分页拉取
+        if trace is not None:
+            trace.mark('server.queued')
+        seq = message_manager.add_offline_message(message)
+        print(f"[Server] 接收者离线，已存为离线消息 #{seq}")
+
+    return {
+        'status': 'success',
+        'message_id': message.header.message_id,
+        'delivered': result
+    }, 200
+
+
 @app.route('/handle_message', methods=['POST'])
+@metrics.timed(metrics.HANDLE_MESSAGE_SECONDS)
 def handle_message():
     """处理HTTP消息发送请求"""
+    received_at = now_ns()
     try:
         print("\n[Server] ===== 收到handle_message请求 =====")
-        data = request.get_json()
-        print(f"[Server] 请求数据: {data.get('header', {}).get('message_type')}")
-        
-        message = Message.from_dict(data)
-        print(f"[Server] 解析消息成功")
-        print(f"[Server] 消息类型: {message.header.message_type}")
-        print(f"[Server] 发送者: {message.header.sender_id}")
-        print(f"[Server] 接收者: {message.header.receiver_id}")
-        print(f"[Server] 会话ID: {message.header.session_id}")
-        
-        # 对于INITIATE消息，服务器需要先创建或验证会话
-        if message.header.message_type == MessageType.INITIATE:
-            # 确保会话存在
-            existing_session_id = chat_server.get_or_create_session(
-                message.header.sender_id,
-                message.header.receiver_id
-            )
-            print(f"[Server] INITIATE消息的会话ID: {existing_session_id}")
-            # 如果客户端发送的session_id与服务器的不同，记录警告
-            if existing_session_id != message.header.session_id:
-                print(f"[Server] ⚠ 警告: 客户端session_id ({message.header.session_id}) 与服务器 ({existing_session_id}) 不同")
-        else:
-            # 验证会话（对于非INITIATE消息）
-            if not chat_server.validate_session(message.header.session_id, message.header.sender_id):
-                print(f"[Server] ✗ 会话验证失败")
-                return jsonify({
-                    'status': 'error',
-                    'message': '会话验证失败'
-                }), 403
-        
-        result = chat_server.forward_message(message)
-        print(f"[Server] forward_message返回: {result}")
-        
+        data = request.get_json(silent=True)
+
+        wait = check_message_rate({claimed_sender(data): 1})
+        if wait:
+            metrics.RATE_LIMITED_MESSAGE.inc()
+            return too_many_requests(wait)
+
+        # 只解析路由需要的消息头，密文原样转发
+        message = MessageView.from_dict(data)
+        print(f"[Server] 解析消息成功: {message.header.message_type}")
+        body, status = route_message(message, received_at)
+        if status == 429:
+            return too_many_requests(body['retry_after'], body['message'])
+        return jsonify(body), status
+    except ValueError as e:
+        print(f"[Server] ✗ 消息格式错误: {e}")
         return jsonify({
-            'status': 'success',
-            'message_id': message.header.message_id,
-            'delivered': result
-        })
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         print(f"[Server] ✗ 处理消息异常: {e}")
         import traceback
@@ -247,14 +638,75 @@ def handle_message():
         }), 500
 
 
+@app.route('/handle_messages', methods=['POST'])
+@metrics.timed(metrics.HANDLE_MESSAGES_SECONDS)
+def handle_messages():
+    """批量发送：客户端为接收者的每个设备分别加密后一次提交，按顺序逐条验证投递
+
+    请求体:
+    {
+        "messages": [消息, ...]
+    }
+    """
+    received_at = now_ns()
+    data = request.get_json() or {}
+    messages = data.get('messages')
+    if not isinstance(messages, list) or len(messages) > MAX_MESSAGE_BATCH:
+        return jsonify({
+            'status': 'error',
+            'message': f'消息列表无效（单次最多{MAX_MESSAGE_BATCH}条）'
+        }), 400
+    costs: Dict[str, int] = {}
+    for message_data in messages:
+        sender_id = claimed_sender(message_data)
+        costs[sender_id] = costs.get(sender_id, 0) + 1
+    wait = check_message_rate(costs)
+    if wait:
+        metrics.RATE_LIMITED_MESSAGE.inc(len(messages))
+        return too_many_requests(wait)
+    try:
+        parsed: List[MessageView] = [MessageView.from_dict(message_data) for message_data in messages]
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'消息格式错误: {str(e)}'
+        }), 400
+
+    results = []
+    for message in parsed:
+        try:
+            body, status = route_message(message, received_at)
+        except Exception as e:
+            body, status = {'status': 'error', 'message': f'消息处理失败: {str(e)}'}, 500
+        body['code'] = status
+        results.append(body)
+    return jsonify({
+        'status': 'success',
+        'results': results
+    })
+
+
 @app.route('/messages/offline/<user_id>', methods=['GET'])
 def get_offline_messages(user_id):
-    """获取并清空用户的离线消息"""
+    """分页获取用户的离线消息
+
+    查询参数:
+        cursor: 上一页返回的游标，首次为0
+        limit: 每页消息数，默认100
+        device_id: 设备ID，默认为主设备
+
+    消息在客户端调用 /messages/offline/<user_id>/ack 确认前不会被删除。
+    """
     try:
-        messages = message_manager.get_offline_messages(user_id)
+        cursor = request.args.get('cursor', 0, type=int)
+        limit = request.args.get('limit', MessageManager.DEFAULT_PAGE_SIZE, type=int)
+        queue = MessageManager.queue_key(user_id, request.args.get('device_id'))
+        messages, next_cursor, has_more = message_manager.get_offline_page(queue, cursor, limit)
         return jsonify({
             'status': 'success',
-            'messages': [msg.to_dict() for msg in messages]
+            'messages': [msg.to_dict() for msg in messages],
+            'cursor': next_cursor,
+            'has_more': has_more
         })
     except Exception as e:
         return jsonify({
@@ -263,6 +715,216 @@ def get_offline_messages(user_id):
         }), 500
 
 
+@app.route('/messages/offline/<user_id>/ack', methods=['POST'])
+def ack_offline_messages(user_id):
+    """确认离线消息已处理，删除游标之前（含）的消息
+
+    请求体:
+    {
+        "cursor": 已持久化的最后一条消息的游标,
+        "device_id": 设备ID（可选，默认为主设备）
+    }
+    """
+    data = request.get_json() or {}
+    cursor = data.get('cursor')
+    if not isinstance(cursor, int):
+        return jsonify({
+            'status': 'error',
+            'message': '缺少游标'
+        }), 400
+
+    queue = MessageManager.queue_key(user_id, data.get('device_id'))
+    removed = message_manager.ack_offline_messages(queue, cursor)
+    return jsonify({
+        'status': 'success',
+        'removed': removed,
+        'remaining': message_manager.get_offline_count(queue)
+    })
+
+
+@app.route('/contacts/<user_id>', methods=['GET'])
+def get_contacts(user_id):
+    """获取用户的好友列表及在线状态（一次请求完成联系人同步）"""
+    if chat_server.get_user(user_id) is None:
+        return jsonify({
+            'status': 'error',
+            'message': '用户不存在'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'contacts': chat_server.get_contact_list(user_id)
+    })
+
+
+@app.route('/presence', methods=['POST'])
+def get_presence():
+    """批量查询用户在线状态"""
+    data = request.get_json() or {}
+    user_ids = data.get('user_ids')
+    if not isinstance(user_ids, list):
+        return jsonify({
+            'status': 'error',
+            'message': '缺少用户ID列表'
+        }), 400
+    return jsonify({
+        'status': 'success',
+        'presence': chat_server.presence.status_of(user_ids)
+    })
+
+
+@app.route('/blobs/uploads', methods=['POST'])
+def create_blob_upload():
+    """创建一个加密附件上传"""
+    data = request.get_json() or {}
+    user_id = data.get('user_id')
+    size = data.get('size')
+    recipients = data.get('recipients') or []
+    if not user_id or not isinstance(size, int) or not isinstance(recipients, list):
+        return jsonify({
+            'status': 'error',
+            'message': '缺少必要参数'
+        }), 400
+    if chat_server.get_user(user_id) is None:
+        return jsonify({
+            'status': 'error',
+            'message': '用户不存在'
+        }), 404
+    try:
+        upload_id = blob_store.create_upload(size, user_id, recipients)
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({
+        'status': 'success',
+        'upload_id': upload_id,
+        'offset': 0
+    })
+
+
+@app.route('/blobs/uploads/<upload_id>', methods=['GET'])
+def get_blob_upload(upload_id):
+    """查询上传进度，客户端断线后据此续传"""
+    meta = blob_store.get_upload(upload_id)
+    if meta is None:
+        return jsonify({
+            'status': 'error',
+            'message': '上传不存在'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'offset': meta['offset'],
+        'size': meta['size']
+    })
+
+
+@app.route('/blobs/uploads/<upload_id>', methods=['PATCH'])
+def append_blob_upload(upload_id):
+    """从Upload-Offset处追加密文，请求体按流读取，不整体载入内存"""
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': '缺少Upload-Offset'
+        }), 400
+    try:
+        offset = blob_store.write_chunk(upload_id, offset, request.stream)
+    except UploadError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e),
+            'offset': e.offset
+        }), 409
+    return jsonify({
+        'status': 'success',
+        'offset': offset
+    })
+
+
+@app.route('/blobs/uploads/<upload_id>/complete', methods=['POST'])
+def complete_blob_upload(upload_id):
+    """结束上传，返回可供接收方下载的blob_id"""
+    meta = blob_store.get_upload(upload_id)
+    try:
+        blob_id = blob_store.complete_upload(upload_id)
+    except UploadError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e),
+            'offset': e.offset
+        }), 409
+    return jsonify({
+        'status': 'success',
+        'blob_id': blob_id,
+        # 上传者经端到端加密的文件描述转交给各接收者，用于确认下载
+        'ack_tokens': blob_store.ack_tokens(blob_id, meta['recipients'] if meta else [])
+    })
+
+
+@app.route('/blobs/<blob_id>', methods=['GET'])
+def download_blob(blob_id):
+    """下载加密附件，支持单区间Range请求
+
+    完整下载交给WSGI服务器的file_wrapper（支持时走sendfile零拷贝），
+    区间下载通过mmap按页缓存切片输出。
+    """
+    path = blob_store.open_blob(blob_id)
+    if path is None:
+        return jsonify({
+            'status': 'error',
+            'message': '附件不存在'
+        }), 404
+
+    size = os.path.getsize(path)
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{blob_id}"',
+        'Cache-Control': 'private, max-age=31536000, immutable'
+    }
+    if blob_id in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    byte_range = request.range
+    if byte_range is not None and len(byte_range.ranges) == 1:
+        span = byte_range.range_for_length(size)
+        if span is None:
+            headers['Content-Range'] = f'bytes */{size}'
+            return Response(status=416, headers=headers)
+        start, end = span
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        headers['Content-Length'] = str(end - start)
+        return Response(blob_store.iter_range(path, start, end), status=206,
+                        mimetype='application/octet-stream', headers=headers, direct_passthrough=True)
+
+    headers['Content-Length'] = str(size)
+    body = wrap_file(request.environ, open(path, 'rb'), buffer_size=BlobStore.SERVE_BUFFER)
+    return Response(body, mimetype='application/octet-stream', headers=headers, direct_passthrough=True)
+
+
+@app.route('/blobs/<blob_id>/ack', methods=['POST'])
+def acknowledge_blob(blob_id):
+    """接收者确认已下载并解密附件，全部接收者确认后附件进入回收流程
+
+    请求体: {"user_id", "token"}，token为完成上传时签发给该接收者的确认令牌
+    """
+    data = request.get_json() or {}
+    user_id = data.get('user_id')
+    token = data.get('token')
+    if not user_id or not isinstance(token, str):
+        return jsonify({
+            'status': 'error',
+            'message': '缺少必要参数'
+        }), 400
+    if not blob_store.verify_ack_token(blob_id, user_id, token):
+        return jsonify({
+            'status': 'error',
+            'message': '确认令牌无效'
+        }), 403
+    return jsonify({
+        'status': 'success',
+        'acknowledged': blob_store.acknowledge(blob_id, user_id)
+    })
+
+
 @app.route('/session/get', methods=['POST'])
 def get_session():
     """获取或创建两个用户之间的会话ID
@@ -298,13 +960,8 @@ def get_session():
                 'message': '用户不存在'
             }), 404
         
-        # 检查是否已存在会话
-        is_new = True
-        if user1_id in chat_server.user_sessions:
-            if user2_id in chat_server.user_sessions[user1_id]:
-                is_new = False
-        
         # 获取或创建会话
+        is_new = chat_server.get_session(user1_id, user2_id) is None
         session_id = chat_server.get_or_create_session(user1_id, user2_id)
         
         return jsonify({
@@ -323,6 +980,111 @@ def get_session():
         }), 500
 
 
+@app.route('/groups', methods=['POST'])
+def create_group():
+    """创建群组，创建者自动成为成员"""
+    data = request.get_json() or {}
+    user_id = data.get('user_id')
+    name = data.get('name') or ''
+    members = data.get('members') or []
+    if not user_id or not isinstance(members, list):
+        return jsonify({
+            'status': 'error',
+            'message': '缺少必要参数'
+        }), 400
+    unknown = [member_id for member_id in [user_id, *members] if chat_server.get_user(member_id) is None]
+    if unknown:
+        return jsonify({
+            'status': 'error',
+            'message': f'用户不存在: {", ".join(unknown)}'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'group': chat_server.create_group(user_id, name, members)
+    })
+
+
+@app.route('/groups/<group_id>', methods=['GET'])
+def get_group(group_id):
+    """获取群组信息及成员"""
+    group = chat_server.group_registry.get_group(group_id)
+    if group is None:
+        return jsonify({
+            'status': 'error',
+            'message': '群组不存在'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'group': group
+    })
+
+
+@app.route('/groups/user/<user_id>', methods=['GET'])
+def get_user_groups(user_id):
+    """获取用户加入的全部群组"""
+    return jsonify({
+        'status': 'success',
+        'groups': chat_server.get_user_groups(user_id)
+    })
+
+
+@app.route('/groups/<group_id>/members', methods=['POST'])
+def add_group_member(group_id):
+    """群组成员邀请新成员"""
+    data = request.get_json() or {}
+    user_id = data.get('user_id')
+    member_id = data.get('member_id')
+    if not all([user_id, member_id]):
+        return jsonify({
+            'status': 'error',
+            'message': '缺少必要参数'
+        }), 400
+    if not chat_server.group_registry.is_member(group_id, user_id):
+        return jsonify({
+            'status': 'error',
+            'message': '不是群组成员'
+        }), 403
+    if chat_server.get_user(member_id) is None:
+        return jsonify({
+            'status': 'error',
+            'message': '用户不存在'
+        }), 404
+    chat_server.add_group_member(group_id, member_id)
+    return jsonify({
+        'status': 'success',
+        'group': chat_server.group_registry.get_group(group_id)
+    })
+
+
+@app.route('/groups/<group_id>/members/remove', methods=['POST'])
+def remove_group_member(group_id):
+    """移除群组成员：群主可以移除任何成员，其他成员只能退出群组"""
+    data = request.get_json() or {}
+    user_id = data.get('user_id')
+    member_id = data.get('member_id')
+    if not all([user_id, member_id]):
+        return jsonify({
+            'status': 'error',
+            'message': '缺少必要参数'
+        }), 400
+    group = chat_server.group_registry.get_group(group_id)
+    if group is None:
+        return jsonify({
+            'status': 'error',
+            'message': '群组不存在'
+        }), 404
+    if user_id != member_id and user_id != group['owner']:
+        return jsonify({
+            'status': 'error',
+            'message': '只有群主可以移除其他成员'
+        }), 403
+    chat_server.remove_group_member(group_id, member_id)
+    return jsonify({
+        'status': 'success',
+        'group': chat_server.group_registry.get_group(group_id)
+    })
+
+
 @app.route('/friend/add', methods=['POST'])
 def add_friend():
     """添加好友并通知对方"""
@@ -338,20 +1100,14 @@ def add_friend():
                 'message': '缺少必要参数'
             }), 400
         
-        # 通过SocketIO通知对方用户
-        # 查找对方的socket连接
-        friend_socket_id = None
-        for socket_id, uid in chat_server.socket_sessions.items():
-            if uid == friend_id:
-                friend_socket_id = socket_id
-                break
-        
-        if friend_socket_id:
-            # 对方在线，发送实时通知
-            socketio.emit('friend_request', {
-                'user_id': user_id,
-                'username': username
-            }, room=friend_socket_id)
+        if chat_server.get_user(friend_id) is None:
+            return jsonify({
+                'status': 'error',
+                'message': '用户不存在'
+            }), 404
+
+        # 建立关系并通知对方；对方离线时事件暂存，上线后补发
+        chat_server.add_friend(user_id, friend_id, username)
         
         return jsonify({
             'status': 'success',
@@ -378,18 +1134,8 @@ def remove_friend():
                 'message': '缺少必要参数'
             }), 400
         
-        # 通过SocketIO通知对方用户
-        friend_socket_id = None
-        for socket_id, uid in chat_server.socket_sessions.items():
-            if uid == friend_id:
-                friend_socket_id = socket_id
-                break
-        
-        if friend_socket_id:
-            # 对方在线，发送删除通知
-            socketio.emit('friend_removed', {
-                'user_id': user_id
-            }, room=friend_socket_id)
+        # 解除关系并通知对方；对方离线时事件暂存，上线后补发
+        chat_server.remove_friend(user_id, friend_id)
         
         return jsonify({
             'status': 'success',
@@ -0,0 +1,339 @@
+import hashlib
+import hmac
+import json
+import mmap
+import os
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from chate2e.utils import serialization
+
+
+class UploadError(Exception):
+    """上传请求无效（偏移不匹配、超出声明大小等）"""
+
+    def __init__(self, message: str, offset: int = 0):
+        super().__init__(message)
+        self.offset = offset
+
+
+class BlobStore:
+    """内容寻址的加密附件存储
+
+    服务器只保存客户端加密后的密文，不接触文件密钥。
+    上传分为 创建 -> 按偏移追加（可多次、可中断后续传）-> 完成 三步：
+    未完成的上传保存在 uploads/<upload_id>.part，当前偏移就是文件大小。
+    完成时以密文的SHA-256作为blob_id，对象按哈希前缀分两级目录存放
+    objects/ab/cd/<sha256>，相同密文只保存一份（去重）。
+
+    每个对象旁有一个 .json 元数据，记录尚未确认下载的接收者；
+    所有接收者确认后经过FETCHED_GRACE秒、或对象超过MAX_TTL秒仍未取完时，
+    由collect_garbage删除。重复上传命中已有对象时重新计时。
+
+    确认下载需要出示确认令牌 HMAC(服务器密钥, blob_id:user_id)：令牌在完成上传时返回给上传者，
+    由上传者放在端到端加密的文件描述中发给对应接收者，其他人无法代替接收者确认。
+    """
+    COPY_BUFFER = 64 * 1024
+    SERVE_BUFFER = 256 * 1024
+    FETCHED_GRACE = 60 * 60  # 全部接收者取走后保留的时间
+    MAX_TTL = 7 * 24 * 60 * 60  # 对象最长保留时间
+    UPLOAD_TTL = 24 * 60 * 60  # 未完成上传的保留时间
+    ACK_KEY_SIZE = 32
+
+    def __init__(self, root: str):
+        self.root = root
+        self.uploads_dir = os.path.join(root, 'uploads')
+        self.objects_dir = os.path.join(root, 'objects')
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._meta_lock = threading.Lock()
+        # 上传过程中增量计算的哈希 upload_id -> (已哈希的偏移, hasher)；服务器重启后丢失时在完成时重新计算
+        self._hashers: Dict[str, Tuple[int, object]] = {}
+        self._gc_timer: Optional[threading.Timer] = None
+        self._gc_started = False
+        self._ack_key: Optional[bytes] = None
+
+    def _load_ack_key(self) -> bytes:
+        """读取（不存在时生成）用于签发确认令牌的密钥，重启后已发出的令牌仍然有效"""
+        with self._locks_guard:
+            if self._ack_key is not None:
+                return self._ack_key
+            path = os.path.join(self.root, 'ack.key')
+            key = b''
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    key = f.read()
+            if len(key) != self.ACK_KEY_SIZE:
+                key = os.urandom(self.ACK_KEY_SIZE)
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(key)
+            self._ack_key = key
+            return key
+
+    def ack_token(self, blob_id: str, user_id: str) -> str:
+        """接收者确认下载时需要出示的令牌"""
+        return hmac.new(self._load_ack_key(), f"{blob_id}:{user_id}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def ack_tokens(self, blob_id: str, recipients: Iterable[str]) -> Dict[str, str]:
+        return {user_id: self.ack_token(blob_id, user_id) for user_id in recipients}
+
+    def _upload_lock(self, upload_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.uploads_dir, f"{upload_id}.part")
+
+    def _upload_meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.uploads_dir, f"{upload_id}.json")
+
+    def _object_path(self, blob_id: str) -> str:
+        return os.path.join(self.objects_dir, blob_id[:2], blob_id[2:4], blob_id)
+
+    def _object_meta_path(self, blob_id: str) -> str:
+        return self._object_path(blob_id) + '.json'
+
+    @staticmethod
+    def _valid_id(value: str) -> bool:
+        return bool(value) and all(c in '0123456789abcdef' for c in value)
+
+    @staticmethod
+    def _write_json(path: str, data: dict):
+        serialization.write_atomic(path, json.dumps(data).encode('utf-8'))
+
+    # ---------------------------------------------------------------- 上传
+
+    def create_upload(self, size: int, owner: str, recipients: Iterable[str] = ()) -> str:
+        """创建上传，返回upload_id"""
+        if size < 0:
+            raise UploadError("文件大小无效")
+        upload_id = uuid.uuid4().hex
+        self._write_json(self._upload_meta_path(upload_id), {
+            'size': size,
+            'owner': owner,
+            'recipients': sorted(set(recipients)),
+            'created_at': time.time()
+        })
+        open(self._part_path(upload_id), 'wb').close()
+        self._hashers[upload_id] = (0, hashlib.sha256())
+        return upload_id
+
+    def get_upload(self, upload_id: str) -> Optional[dict]:
+        """查询上传进度 {'size', 'owner', 'recipients', 'offset'}，上传不存在时返回None"""
+        if not self._valid_id(upload_id) or not os.path.exists(self._upload_meta_path(upload_id)):
+            return None
+        with open(self._upload_meta_path(upload_id), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        meta['offset'] = os.path.getsize(self._part_path(upload_id))
+        return meta
+
+    def write_chunk(self, upload_id: str, offset: int, stream: BinaryIO) -> int:
+        """从offset开始把请求体流式追加到上传文件
+
+        offset必须等于服务器当前已接收的字节数，否则抛出UploadError（携带当前偏移），
+        客户端据此续传。连接中途断开时已写入的部分保留。
+
+        Returns:
+            int: 写入后的偏移
+        """
+        with self._upload_lock(upload_id):
+            meta = self.get_upload(upload_id)
+            if meta is None:
+                raise UploadError("上传不存在")
+            if offset != meta['offset']:
+                raise UploadError("偏移不匹配", meta['offset'])
+            hashed, hasher = self._hashers.get(upload_id, (-1, None))
+            if hashed != offset:
+                hasher = None  # 增量哈希状态已丢失，完成时重新计算
+            remaining = meta['size'] - offset
+            written = 0
+            try:
+                with open(self._part_path(upload_id), 'ab') as f:
+                    while True:
+                        data = stream.read(self.COPY_BUFFER)
+                        if not data:
+                            break
+                        if len(data) > remaining:
+                            data = data[:remaining]
+                            f.write(data)
+                            written += len(data)
+                            if hasher:
+                                hasher.update(data)
+                            raise UploadError("超出声明的文件大小", meta['size'])
+                        f.write(data)
+                        written += len(data)
+                        remaining -= len(data)
+                        if hasher:
+                            hasher.update(data)
+            finally:
+                if hasher:
+                    self._hashers[upload_id] = (offset + written, hasher)
+                else:
+                    self._hashers.pop(upload_id, None)
+            return offset + written
+
+    def _digest(self, upload_id: str, size: int) -> str:
+        hashed, hasher = self._hashers.pop(upload_id, (-1, None))
+        if hasher is not None and hashed == size:
+            return hasher.hexdigest()
+        hasher = hashlib.sha256()
+        with open(self._part_path(upload_id), 'rb') as f:
+            while True:
+                data = f.read(self.SERVE_BUFFER)
+                if not data:
+                    break
+                hasher.update(data)
+        return hasher.hexdigest()
+
+    def complete_upload(self, upload_id: str) -> str:
+        """结束上传，返回blob_id（密文SHA-256）；相同密文已存在时复用已有对象"""
+        with self._upload_lock(upload_id):
+            meta = self.get_upload(upload_id)
+            if meta is None:
+                raise UploadError("上传不存在")
+            if meta['offset'] != meta['size']:
+                raise UploadError("上传未完成", meta['offset'])
+            blob_id = self._digest(upload_id, meta['size'])
+            path = self._object_path(blob_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._meta_lock:
+                object_meta = self._read_object_meta(blob_id)
+                if object_meta is not None and os.path.exists(path):
+                    os.remove(self._part_path(upload_id))
+                    pending = set(object_meta['pending']) | set(meta['recipients'])
+                    object_meta['pending'] = sorted(pending)
+                    # 重新上传等同于新对象：重新计时，避免刚上传的对象按旧的时间被回收
+                    object_meta['created_at'] = time.time()
+                    object_meta['fetched_at'] = None
+                else:
+                    os.replace(self._part_path(upload_id), path)
+                    object_meta = {
+                        'size': meta['size'],
+                        'created_at': time.time(),
+                        'pending': meta['recipients'],
+                        'fetched_at': None
+                    }
+                self._write_json(self._object_meta_path(blob_id), object_meta)
+            os.remove(self._upload_meta_path(upload_id))
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+        return blob_id
+
+    # ---------------------------------------------------------------- 读取
+
+    def _read_object_meta(self, blob_id: str) -> Optional[dict]:
+        path = self._object_meta_path(blob_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def open_blob(self, blob_id: str) -> Optional[str]:
+        """返回密文对象的路径，不存在时返回None"""
+        if not self._valid_id(blob_id):
+            return None
+        path = self._object_path(blob_id)
+        return path if os.path.exists(path) else None
+
+    def iter_range(self, path: str, start: int, end: int) -> Iterator[bytes]:
+        """以mmap方式读取[start, end)区间，每块直接从页缓存切片，不经过read的用户态缓冲区
+
+        WSGI服务器要求应用写出bytes，因此每块切片仍有一次拷贝，内存占用不超过SERVE_BUFFER。
+        """
+        if end <= start:
+            return
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(start, end, self.SERVE_BUFFER):
+                yield mapped[offset:min(offset + self.SERVE_BUFFER, end)]
+
+    def verify_ack_token(self, blob_id: str, user_id: str, token: str) -> bool:
+        return hmac.compare_digest(self.ack_token(blob_id, user_id), token or '')
+
+    def acknowledge(self, blob_id: str, user_id: str) -> bool:
+        """接收者确认已下载，返回该用户是否在待下载列表中（调用方负责验证确认令牌）"""
+        if not self._valid_id(blob_id):
+            return False
+        with self._meta_lock:
+            meta = self._read_object_meta(blob_id)
+            if meta is None or user_id not in meta['pending']:
+                return False
+            meta['pending'].remove(user_id)
+            if not meta['pending']:
+                meta['fetched_at'] = time.time()
+            self._write_json(self._object_meta_path(blob_id), meta)
+        return True
+
+    # ---------------------------------------------------------------- 回收
+
+    def collect_garbage(self, now: Optional[float] = None) -> List[str]:
+        """删除已被全部接收者取走（超过宽限期）或超过最长保留时间的对象，以及过期的未完成上传
+
+        Returns:
+            被删除的blob_id列表
+        """
+        now = time.time() if now is None else now
+        removed = []
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for name in filenames:
+                if not name.endswith('.json'):
+                    continue
+                blob_id = name[:-5]
+                with self._meta_lock:
+                    meta = self._read_object_meta(blob_id)
+                    if meta is None:
+                        continue
+                    fetched_at = meta.get('fetched_at')
+                    expired = now - meta['created_at'] > self.MAX_TTL
+                    fetched = not meta['pending'] and fetched_at is not None \
+                        and now - fetched_at > self.FETCHED_GRACE
+                    if not (expired or fetched):
+                        continue
+                    for path in (self._object_path(blob_id), self._object_meta_path(blob_id)):
+                        if os.path.exists(path):
+                            os.remove(path)
+                removed.append(blob_id)
+
+        for name in os.listdir(self.uploads_dir):
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-5]
+            meta = self.get_upload(upload_id)
+            if meta and now - meta.get('created_at', now) > self.UPLOAD_TTL:
+                with self._upload_lock(upload_id):
+                    for path in (self._part_path(upload_id), self._upload_meta_path(upload_id)):
+                        if os.path.exists(path):
+                            os.remove(path)
+                self._hashers.pop(upload_id, None)
+        if removed:
+            print(f"[Server] 回收 {len(removed)} 个附件")
+        return removed
+
+    def start_gc(self, interval: float = 600) -> bool:
+        """启动后台定时回收，重复调用不会启动第二个定时器
+
+        Returns:
+            bool: 本次调用是否启动了回收
+        """
+        with self._locks_guard:
+            if self._gc_started:
+                return False
+            self._gc_started = True
+        self._schedule_gc(interval)
+        return True
+
+    def _schedule_gc(self, interval: float):
+        def run():
+            try:
+                self.collect_garbage()
+            except Exception as e:
+                print(f"[Server] ✗ 附件回收失败: {e}")
+            self._schedule_gc(interval)
+
+        self._gc_timer = threading.Timer(interval, run)
+        self._gc_timer.daemon = True
+        self._gc_timer.start()
@@ -1,12 +1,22 @@
-import json
 import os
+from base64 import b64decode
+import threading
 import uuid
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set, Tuple
 
 from chate2e.model.bundle import Bundle
-from chate2e.model.message import Message
+from chate2e.model.message import Message, PRIMARY_DEVICE_ID
+from chate2e.server import metrics
+from chate2e.server.device import Device
+from chate2e.server.fanout import FanoutEngine
+from chate2e.server.friend_graph import FriendGraph
+from chate2e.server.group_registry import GroupRegistry
+from chate2e.server.prekey_ledger import PrekeyLedger
+from chate2e.server.presence import PresenceService
+from chate2e.server.session_registry import SessionRegistry
 from chate2e.server.socket_manager import socketio
 from chate2e.server.user import User
+from chate2e.utils import config, serialization
 
 
 def generate_short_uuid() -> str:
@@ -18,32 +28,194 @@ class ChatServer:
         self.users: Dict[str, User] = {}  # 用户ID -> 用户实例
         self.username_map: Dict[str, str] = {}  # username -> uuid
         self.socket_sessions: Dict[str, str] = {}  # socket_id -> user_id
-        self.sessions: Dict[str, Dict] = {}  # session_id -> {participant1, participant2, created_at}
-        self.user_sessions: Dict[str, Dict[str, str]] = {}  # user_id -> {peer_id -> session_id}
+        self.user_sockets: Dict[str, Set[str]] = {}  # user_id -> socket_ids（socket_sessions的反向索引）
+        self.socket_devices: Dict[str, str] = {}  # socket_id -> device_id
         
         # 设置数据目录路径
         self.server_dir = os.path.dirname(os.path.abspath(__file__))
         self.data_dir = os.path.join(self.server_dir, 'data')
         self.users_file = os.path.join(self.data_dir, 'users.json')
+        self.friends_file = os.path.join(self.data_dir, 'friends.log')
+        self.groups_file = os.path.join(self.data_dir, 'groups.log')
+        self.sessions_file = os.path.join(self.data_dir, 'sessions.log')
+        self.prekeys_file = os.path.join(self.data_dir, 'prekeys.log')
         
         # 确保数据目录存在
         os.makedirs(self.data_dir, exist_ok=True)
+
+        self.friend_graph = FriendGraph(self.friends_file)
+        self.group_registry = GroupRegistry(self.groups_file)
+        # 两两会话登记表，按需加载，验证会话为一次哈希查找
+        self.session_registry = SessionRegistry(self.sessions_file)
+        # 一次性预密钥的分配只追加到日志，不重写users.json
+        self.prekey_ledger = PrekeyLedger(self.prekeys_file)
+        # 离线用户的待投递事件（好友请求/删除等），用户连接后按顺序补发
+        self.pending_events: Dict[str, List[Tuple[str, dict]]] = {}  # user_id -> [(event, payload)]
+        self._pending_lock = threading.Lock()
+        self._prekey_lock = threading.Lock()
+        self._users_lock = threading.Lock()  # 串行化users.json的快照与写入，后保存的快照不会被先保存的覆盖
         
+        self.presence = PresenceService(
+            contacts_of=self.get_contacts,
+            sockets_of=self.get_user_sockets,
+            emit=lambda event, payload, socket_id: socketio.emit(event, payload, room=socket_id)
+        )
+
+        # 群消息扇出：负载只构造一次，按批发送给成员的全部连接
+        self.fanout = FanoutEngine(
+            sockets_of=self.get_user_sockets,
+            emit=lambda event, payload, socket_ids: socketio.emit(event, payload, to=socket_ids)
+        )
+
         self._load_users()
     
-    def add_socket_session(self, user_id: str, socket_id: str):
+    def add_socket_session(self, user_id: str, socket_id: str, device_id: str = PRIMARY_DEVICE_ID):
         """添加socket会话"""
+        if socket_id in self.socket_sessions:
+            # 同一socket重复登录，先解除旧的绑定
+            self.remove_socket_session(socket_id)
         self.socket_sessions[socket_id] = user_id
+        self.socket_devices[socket_id] = device_id
+        self.user_sockets.setdefault(user_id, set()).add(socket_id)
         if user_id in self.users:
             self.users[user_id].is_online = True
+        self.presence.connect(user_id)
+        # 新连接立即获得联系人的当前状态，之后只接收增量
+        self.presence.send_snapshot(user_id, self.get_contacts(user_id), socket_id)
+        self._deliver_pending_events(user_id, socket_id)
     
     def remove_socket_session(self, socket_id: str):
         """移除socket会话"""
         if socket_id in self.socket_sessions:
             user_id = self.socket_sessions.pop(socket_id)
-            if user_id in self.users:
+            self.socket_devices.pop(socket_id, None)
+            sockets = self.user_sockets.get(user_id)
+            if sockets is not None:
+                sockets.discard(socket_id)
+                if not sockets:
+                    del self.user_sockets[user_id]
+            # 同一用户的其他设备/窗口仍在线时保持在线状态
+            if self.presence.disconnect(user_id) and user_id in self.users:
                 self.users[user_id].is_online = False
-    
+
+    def get_user_sockets(self, user_id: str) -> List[str]:
+        """获取用户当前的所有socket连接"""
+        return list(self.user_sockets.get(user_id, ()))
+
+    def get_device_sockets(self, user_id: str, device_id: str) -> List[str]:
+        """获取用户某个设备当前的socket连接"""
+        return [socket_id for socket_id in self.user_sockets.get(user_id, ())
+                if self.socket_devices.get(socket_id, PRIMARY_DEVICE_ID) == device_id]
+
+    def get_contacts(self, user_id: str) -> List[str]:
+        """获取用户的联系人ID（好友以及建立过会话的用户），即在线状态变更的通知对象"""
+        contacts = set(self.friend_graph.friends_of(user_id))
+        contacts.update(self.session_registry.peers_of(user_id))
+        return list(contacts)
+
+    def notify_user(self, user_id: str, event: str, payload: dict) -> bool:
+        """向用户的所有连接发送事件，用户离线时暂存，连接后补发
+
+        Returns:
+            bool: 是否已实时送达
+        """
+        sockets = self.get_user_sockets(user_id)
+        if not sockets:
+            with self._pending_lock:
+                self.pending_events.setdefault(user_id, []).append((event, payload))
+            return False
+        for socket_id in sockets:
+            socketio.emit(event, payload, room=socket_id)
+        return True
+
+    def _deliver_pending_events(self, user_id: str, socket_id: str):
+        """补发离线期间积压的事件"""
+        with self._pending_lock:
+            events = self.pending_events.pop(user_id, [])
+        for event, payload in events:
+            socketio.emit(event, payload, room=socket_id)
+        if events:
+            print(f"[Server] 补发 {len(events)} 条离线事件给 {user_id}")
+
+    def add_friend(self, user_id: str, friend_id: str, username: str) -> bool:
+        """建立好友关系并通知对方，返回是否为新关系"""
+        if not self.friend_graph.add_friend(user_id, friend_id):
+            return False
+        self.notify_user(friend_id, 'friend_request', {
+            'user_id': user_id,
+            'username': username
+        })
+        return True
+
+    def remove_friend(self, user_id: str, friend_id: str) -> bool:
+        """解除好友关系并通知对方，返回关系之前是否存在"""
+        if not self.friend_graph.remove_friend(user_id, friend_id):
+            return False
+        self.notify_user(friend_id, 'friend_removed', {'user_id': user_id})
+        return True
+
+    def get_contact_list(self, user_id: str) -> List[dict]:
+        """获取用户的好友列表（含用户名与在线状态），供客户端一次性同步"""
+        friend_ids = self.friend_graph.friends_of(user_id)
+        statuses = self.presence.status_of(friend_ids)
+        contacts = []
+        for friend_id in friend_ids:
+            friend = self.users.get(friend_id)
+            if friend is None:
+                continue
+            contacts.append({
+                'user_id': friend_id,
+                'username': friend.username,
+                'status': statuses[friend_id]
+            })
+        return contacts
+
+    def _notify_group(self, group_id: str, extra_user_ids: List[str] = ()):
+        """向群组成员（以及刚被移除的成员）推送最新的群组信息"""
+        group = self.group_registry.get_group(group_id)
+        if group is None:
+            return
+        for user_id in dict.fromkeys([*group['members'], *extra_user_ids]):
+            self.notify_user(user_id, 'group_updated', group)
+
+    def create_group(self, owner_id: str, name: str, member_ids: List[str]) -> dict:
+        """创建群组并通知全部成员，返回群组信息"""
+        group_id = self.group_registry.create_group(owner_id, name, member_ids)
+        print(f"[Server] 创建群组: {group_id} ({name})，成员 {len(member_ids) + 1} 人")
+        self._notify_group(group_id)
+        return self.group_registry.get_group(group_id)
+
+    def add_group_member(self, group_id: str, member_id: str) -> bool:
+        """添加群组成员并通知全部成员，返回是否为新成员"""
+        if not self.group_registry.add_member(group_id, member_id):
+            return False
+        self._notify_group(group_id)
+        return True
+
+    def remove_group_member(self, group_id: str, member_id: str) -> bool:
+        """移除群组成员并通知剩余成员与被移除者（剩余成员据此轮换发送者密钥）"""
+        if not self.group_registry.remove_member(group_id, member_id):
+            return False
+        self._notify_group(group_id, [member_id])
+        return True
+
+    def get_user_groups(self, user_id: str) -> List[dict]:
+        """获取用户加入的全部群组信息"""
+        groups = (self.group_registry.get_group(group_id) for group_id in self.group_registry.groups_of(user_id))
+        return [group for group in groups if group is not None]
+
+    def broadcast_message(self, message: Message) -> Tuple[List[str], List[str]]:
+        """把群消息扇出给除发送者外的全部成员
+
+        Returns:
+            (已实时送达的成员, 离线的成员)
+        """
+        if message.header.trace is not None:
+            message.header.trace.mark('server.emit')
+        return self.fanout.fanout('new_message', message.to_dict(),
+                                  self.group_registry.members_of(message.header.receiver_id),
+                                  exclude=message.header.sender_id)
+
     def get_or_create_session(self, user1_id: str, user2_id: str) -> str:
         """获取或创建两个用户之间的会话ID
         
@@ -54,36 +226,14 @@ class ChatServer:
         Returns:
             session_id: 会话ID
         """
-        # 确保用户ID顺序一致
-        participants = tuple(sorted([user1_id, user2_id]))
-        
-        # 检查是否已存在会话
-        if user1_id in self.user_sessions:
-            if user2_id in self.user_sessions[user1_id]:
-                return self.user_sessions[user1_id][user2_id]
-        
-        # 创建新会话
-        session_id = str(uuid.uuid4())
-        
-        # 存储会话信息
-        self.sessions[session_id] = {
-            'participants': participants,
-            'created_at': None,  # 可以添加时间戳
-            'user1_id': participants[0],
-            'user2_id': participants[1]
-        }
-        
-        # 建立双向映射
-        if user1_id not in self.user_sessions:
-            self.user_sessions[user1_id] = {}
-        if user2_id not in self.user_sessions:
-            self.user_sessions[user2_id] = {}
-            
-        self.user_sessions[user1_id][user2_id] = session_id
-        self.user_sessions[user2_id][user1_id] = session_id
-        
-        print(f"[Server] 创建新会话: {session_id} for {user1_id} <-> {user2_id}")
+        session_id, created = self.session_registry.get_or_create(user1_id, user2_id)
+        if created:
+            print(f"[Server] 创建新会话: {session_id} for {user1_id} <-> {user2_id}")
         return session_id
+
+    def get_session(self, user1_id: str, user2_id: str) -> Optional[str]:
+        """两个用户之间已有的会话ID，没有时返回None"""
+        return self.session_registry.get(user1_id, user2_id)
     
     def validate_session(self, session_id: str, user_id: str) -> bool:
         """验证会话是否有效且用户有权访问
@@ -95,30 +245,48 @@ class ChatServer:
         Returns:
             bool: 会话是否有效
         """
-        if session_id not in self.sessions:
-            return False
-        
-        session_info = self.sessions[session_id]
-        return user_id in session_info['participants']
+        return self.session_registry.validate(session_id, user_id)
+
+    def emit_backlog(self, socket_id: str) -> int:
+        """socket连接中已排队、尚未写出的数据包数"""
+        try:
+            server = socketio.server
+            eio_sid = server.manager.eio_sid_from_sid(socket_id, '/')
+            return server.eio.sockets[eio_sid].queue.qsize()
+        except (AttributeError, KeyError):
+            return 0
+
+    def receiver_congested(self, receiver_id: str, device_id: Optional[str] = None) -> bool:
+        """接收者（设备）在线且全部连接的待发送队列都超过上限"""
+        if device_id is None:
+            sockets = self.user_sockets.get(receiver_id, ())
+        else:
+            sockets = self.get_device_sockets(receiver_id, device_id)
+        return bool(sockets) and all(self.emit_backlog(socket_id) >= config.MAX_EMIT_BACKLOG
+                                     for socket_id in list(sockets))
 
     def forward_message(self, message: Message) -> bool:
         """将消息转发给目标用户（定向发送）"""
         try:
             receiver_id = message.header.receiver_id
+            device_id = message.header.receiver_device_id
             
-            # 查找接收者的socket连接
-            receiver_socket_id = None
-            for socket_id, user_id in self.socket_sessions.items():
-                if user_id == receiver_id:
-                    receiver_socket_id = socket_id
-                    break
+            # 通过索引查找接收者（指定设备时只查该设备）的socket连接
+            if device_id is None:
+                receiver_sockets = self.get_user_sockets(receiver_id)
+            else:
+                receiver_sockets = self.get_device_sockets(receiver_id, device_id)
             
-            if receiver_socket_id:
-                # 定向发送给特定用户
-                socketio.emit('new_message', message.to_dict(), room=receiver_socket_id)
+            if receiver_sockets:
+                if message.header.trace is not None:
+                    message.header.trace.mark('server.emit')
+                # 一次emit定向发送给接收者的全部连接，数据包只编码一次
+                socketio.emit('new_message', message.to_dict(), to=receiver_sockets)
+                metrics.MESSAGES_FORWARDED.inc()
                 return True
             else:
-                # TODO: 存储为离线消息
+                # 由调用方存储为离线消息
+                metrics.MESSAGES_UNDELIVERED.inc()
                 return False
                 
         except Exception as e:
@@ -132,29 +300,52 @@ class ChatServer:
         # 从本地或者数据库加载用户信息
         try:
             if os.path.exists(self.users_file):
-                with open(self.users_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for user_data in data['users']:
-                        user = User(user_data['username'], user_data['uuid'])
-                        if user_data.get('bundle'):
-                            user.bundle = Bundle.from_dict(user_data['bundle'])
-                        self.users[user.uuid] = user
-                        self.username_map[user.username] = user.uuid
+                data = serialization.load_file(self.users_file)
+                for user_data in data['users']:
+                    user = User(user_data['username'], user_data['uuid'])
+                    if user_data.get('bundle'):
+                        user.set_bundle(Bundle.from_dict(user_data['bundle']))
+                        user.used_pre_keys.update(b64decode(key) for key in user_data.get('used_pre_keys', []))
+                    for device_data in user_data.get('devices', []):
+                        device = Device.from_dict(device_data)
+                        user.devices[device.device_id] = device
+                    self.users[user.uuid] = user
+                    self.username_map[user.username] = user.uuid
                 print(f"成功加载 {len(self.users)} 个用户")
         except Exception as e:
             print(f"加载用户数据失败: {e}")
+        self._replay_prekey_claims()
+
+    def _replay_prekey_claims(self) -> None:
+        """把上次运行期间追加的预密钥分配记录合并到用户数据，保存后清空日志（只在启动时调用）"""
+        records = self.prekey_ledger.load()
+        if not records:
+            return
+        for user_id, device_id, key in records:
+            user = self.users.get(user_id)
+            device = user.get_device(device_id) if user else None
+            # 设备之后更换过Bundle时，旧预密钥不在新的预密钥池中，直接忽略
+            if device and device.bundle and key in device.bundle.one_time_pre_keys_pub:
+                device.used_pre_keys.add(key)
+        print(f"[Server] 回放 {len(records)} 条预密钥分配记录")
+        if self._save_users():
+            self.prekey_ledger.reset()
     
-    def _save_users(self) -> None:
-        """保存用户信息"""
+    def _save_users(self) -> bool:
+        """保存用户信息，返回是否成功"""
         try:
-            data = {
-                'users': [user.to_dict() for user in self.users.values()]
-            }
-            with open(self.users_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+            with self._users_lock, metrics.SAVE_USERS_SECONDS.time():
+                # 预密钥分配与设备变更在_prekey_lock中修改用户，快照时同样持有
+                with self._prekey_lock:
+                    data = {
+                        'users': [user.to_dict() for user in list(self.users.values())]
+                    }
+                serialization.dump_file(self.users_file, data, pretty=config.JSON_PRETTY)
             print(f"成功保存 {len(self.users)} 个用户")
+            return True
         except Exception as e:
-            print(f"保存用户数据失败: {e}")       
+            print(f"保存用户数据失败: {e}")
+            return False
             
     def register_user(self, username: str, bundle_dict: dict) -> Optional[str]:
         """注册新用户"""
@@ -184,6 +375,42 @@ class ChatServer:
             return None
         return self.users[useruuid].bundle.to_dict()
     
+    def register_device(self, useruuid: str, device_id: str, bundle_dict: dict) -> bool:
+        """为已有用户添加设备或更新设备的Bundle"""
+        user = self.users.get(useruuid)
+        if user is None:
+            return False
+        with self._prekey_lock:
+            user.set_bundle(Bundle.from_dict(bundle_dict), device_id)
+        self._save_users()
+        print(f"[Server] 用户 {useruuid} 的设备 {device_id} 已注册")
+        return True
+
+    def remove_device(self, useruuid: str, device_id: str) -> bool:
+        """移除用户的非主设备"""
+        user = self.users.get(useruuid)
+        if user is None:
+            return False
+        with self._prekey_lock:
+            removed = user.remove_device(device_id)
+        if removed:
+            self._save_users()
+        return removed
+
+    def claim_one_time_prekey(self, useruuid: str, device_id: str = PRIMARY_DEVICE_ID) -> Optional[bytes]:
+        """为会话发起方分配目标设备的一个一次性预密钥，保证同一个预密钥不会分配两次
+
+        分配记录只追加到预密钥日志（O(1)），users.json在下次整体保存或重启时合并。
+        """
+        user = self.users.get(useruuid)
+        if user is None:
+            return None
+        with self._prekey_lock:
+            key = user.claim_pre_key(device_id)
+            if key is not None:
+                self.prekey_ledger.append(useruuid, device_id, key)
+        return key
+
     def get_user(self, user_uuid: str) -> Optional[User]:
         """获取用户对象"""
         return self.users.get(user_uuid)
\ No newline at end of file
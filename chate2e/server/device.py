@@ -0,0 +1,58 @@
+from base64 import b64decode, b64encode
+from typing import List, Optional
+
+from chate2e.model.bundle import Bundle
+
+
+class Device:
+    """用户的一个设备
+
+    每个设备有独立的身份密钥、签名预密钥与一次性预密钥池，
+    发起方与对方的每个设备分别建立双棘轮会话。
+    """
+
+    def __init__(self, device_id: str, bundle: Optional[Bundle] = None):
+        self.device_id = device_id
+        self.bundle: Optional[Bundle] = None
+        self.used_pre_keys: set = set()
+        self.fingerprint: Optional[str] = None  # 长期密钥指纹，随Bundle更新
+        if bundle is not None:
+            self.set_bundle(bundle)
+
+    def set_bundle(self, bundle: Optional[Bundle]) -> None:
+        """设置设备的密钥Bundle（新的预密钥池，已分配记录清空）"""
+        self.bundle = bundle
+        self.used_pre_keys.clear()
+        self.fingerprint = bundle.fingerprint() if bundle else None
+
+    def available_pre_keys(self) -> List[bytes]:
+        """尚未分配给任何发起方的一次性预密钥"""
+        if not self.bundle:
+            return []
+        return [key for key in self.bundle.one_time_pre_keys_pub if key not in self.used_pre_keys]
+
+    def claim_pre_key(self) -> Optional[bytes]:
+        """分配一个一次性预密钥并标记为已使用，耗尽时返回None"""
+        for key in self.available_pre_keys():
+            self.used_pre_keys.add(key)
+            return key
+        return None
+
+    def public_bundle(self) -> Optional[Bundle]:
+        """对外发布的Bundle，只包含未使用的一次性预密钥"""
+        if not self.bundle:
+            return None
+        return self.bundle._replace(one_time_pre_keys_pub=frozenset(self.available_pre_keys()))
+
+    def to_dict(self) -> dict:
+        return {
+            'device_id': self.device_id,
+            'bundle': self.bundle.to_dict() if self.bundle else None,
+            'used_pre_keys': [b64encode(key).decode('utf-8') for key in self.used_pre_keys]
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Device':
+        device = cls(data['device_id'], Bundle.from_dict(data['bundle']) if data.get('bundle') else None)
+        device.used_pre_keys.update(b64decode(key) for key in data.get('used_pre_keys', []))
+        return device
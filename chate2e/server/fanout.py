@@ -0,0 +1,125 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class FanoutEngine:
+    """群消息扇出引擎
+
+    同一条消息发给多个成员时：
+      - 负载只构造一次，经 用户->socket 索引解析出全部成员连接；
+      - 连接按BATCH_SIZE分批，每批只调用一次emit(to=[socket...])，
+        Socket.IO每次emit只编码一次数据包，之后对批内各连接复用；
+      - 多个批次由工作线程并行发送（第一批在调用线程中发送）；
+      - 没有任何连接的成员作为离线成员返回，由调用方写入离线队列；
+        所在批次发送失败的成员同样作为离线成员返回，不会丢失消息。
+    最近LATENCY_WINDOW次扇出的耗时用于stats()中的百分位统计。
+    """
+    BATCH_SIZE = 256
+    LATENCY_WINDOW = 1024
+
+    def __init__(self, sockets_of: Callable[[str], List[str]],
+                 emit: Callable[[str, dict, List[str]], None],
+                 workers: int = 4, batch_size: int = BATCH_SIZE):
+        """
+        Args:
+            sockets_of: user_id -> 该用户当前的socket_id列表
+            emit: (event, payload, socket_ids) -> None，一次发送给一批连接
+            workers: 并行发送批次的工作线程数
+            batch_size: 每批连接数
+        """
+        self.sockets_of = sockets_of
+        self.emit = emit
+        self.batch_size = max(1, batch_size)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='fanout')
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)  # 毫秒
+        self._lock = threading.Lock()
+        self._fanouts = 0
+        self._sockets = 0
+        self._batches = 0
+        self._offline = 0
+
+    def _emit_batch(self, event: str, payload: dict, batch: List[str]) -> bool:
+        try:
+            self.emit(event, payload, batch)
+            return True
+        except Exception as e:
+            print(f"[Server] ✗ 扇出发送失败 ({len(batch)} 个连接): {e}")
+            return False
+
+    def fanout(self, event: str, payload: dict, member_ids: Iterable[str],
+               exclude: Optional[str] = None) -> Tuple[List[str], List[str]]:
+        """把同一负载发送给全部成员的全部连接
+
+        Args:
+            event: Socket.IO事件名
+            payload: 已构造好的负载，所有成员共用
+            member_ids: 接收者ID
+            exclude: 不发送的成员（通常是发送者自己）
+
+        Returns:
+            (已实时送达的成员, 离线的成员)
+        """
+        start = time.perf_counter()
+        online, offline = [], []
+        sockets: List[str] = []
+        owners: List[str] = []  # 与sockets一一对应的成员ID
+        for member_id in member_ids:
+            if member_id == exclude:
+                continue
+            member_sockets = self.sockets_of(member_id)
+            if member_sockets:
+                sockets.extend(member_sockets)
+                owners.extend([member_id] * len(member_sockets))
+                online.append(member_id)
+            else:
+                offline.append(member_id)
+
+        starts = range(0, len(sockets), self.batch_size)
+        batches = [sockets[i:i + self.batch_size] for i in starts]
+        failed = set()
+        if batches:
+            futures = [self._executor.submit(self._emit_batch, event, payload, batch) for batch in batches[1:]]
+            results = [self._emit_batch(event, payload, batches[0])] + [future.result() for future in futures]
+            for i, ok in zip(starts, results):
+                if not ok:
+                    failed.update(owners[i:i + self.batch_size])
+        # 任一连接所在批次发送失败的成员改为离线投递
+        delivered = [member_id for member_id in online if member_id not in failed]
+        offline.extend(member_id for member_id in online if member_id in failed)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._latencies.append(elapsed)
+            self._fanouts += 1
+            self._sockets += len(sockets)
+            self._batches += len(batches)
+            self._offline += len(offline)
+        return delivered, offline
+
+    @staticmethod
+    def _percentile(ordered: Sequence[float], pct: float) -> float:
+        """最近秩法百分位数（ordered已排序）"""
+        if not ordered:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+        return ordered[rank - 1]
+
+    def stats(self) -> Dict[str, float]:
+        """扇出统计：累计次数/连接数/批次数/离线成员数，以及最近扇出耗时的p50/p99（毫秒）"""
+        with self._lock:
+            ordered = sorted(self._latencies)
+            return {
+                'fanouts': self._fanouts,
+                'sockets': self._sockets,
+                'batches': self._batches,
+                'offline_members': self._offline,
+                'latency_p50_ms': self._percentile(ordered, 50),
+                'latency_p99_ms': self._percentile(ordered, 99),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+from typing import Dict, List, Set, Tuple
+
+from chate2e.utils import serialization
+
+
+class FriendGraph:
+    """服务端好友关系图
+
+    好友关系是无向的，按用户保存邻接集合，查询某个用户的全部好友为O(1)。
+    每次增删只向日志文件追加一行 {"op": "add"/"remove", "a": ..., "b": ...}，
+    不需要重写整个文件；启动时回放日志，日志中冗余记录过多时压缩重写。
+    """
+    COMPACT_RATIO = 2  # 日志行数超过 边数*COMPACT_RATIO 时压缩
+
+    def __init__(self, path: str):
+        self.path = path
+        self._adjacency: Dict[str, Set[str]] = {}
+        self._edges = 0
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        """回放日志重建邻接集合"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 写入中断留下的残缺行，压缩时会被丢弃
+                        continue
+                    self._log_lines += 1
+                    if record['op'] == 'add':
+                        self._link(record['a'], record['b'])
+                    elif record['op'] == 'remove':
+                        self._unlink(record['a'], record['b'])
+            print(f"[Server] 成功加载 {self._edges} 条好友关系")
+        except Exception as e:
+            print(f"[Server] ✗ 加载好友关系失败: {e}")
+            return
+        if self._log_lines > max(self._edges * self.COMPACT_RATIO, 64):
+            self.compact()
+
+    def _link(self, a: str, b: str) -> bool:
+        if b in self._adjacency.get(a, ()):
+            return False
+        self._adjacency.setdefault(a, set()).add(b)
+        self._adjacency.setdefault(b, set()).add(a)
+        self._edges += 1
+        return True
+
+    def _unlink(self, a: str, b: str) -> bool:
+        if b not in self._adjacency.get(a, ()):
+            return False
+        for x, y in ((a, b), (b, a)):
+            neighbors = self._adjacency[x]
+            neighbors.discard(y)
+            if not neighbors:
+                del self._adjacency[x]
+        self._edges -= 1
+        return True
+
+    def _append(self, op: str, a: str, b: str) -> None:
+        """追加一条变更记录（调用方持有锁）"""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'op': op, 'a': a, 'b': b}) + '\n')
+        self._log_lines += 1
+
+    def add_friend(self, user_id: str, friend_id: str) -> bool:
+        """建立好友关系，返回是否为新关系"""
+        if user_id == friend_id:
+            return False
+        with self._lock:
+            if not self._link(user_id, friend_id):
+                return False
+            self._append('add', user_id, friend_id)
+            return True
+
+    def remove_friend(self, user_id: str, friend_id: str) -> bool:
+        """解除好友关系，返回关系之前是否存在"""
+        with self._lock:
+            if not self._unlink(user_id, friend_id):
+                return False
+            self._append('remove', user_id, friend_id)
+            return True
+
+    def are_friends(self, user_id: str, friend_id: str) -> bool:
+        return friend_id in self._adjacency.get(user_id, ())
+
+    def friends_of(self, user_id: str) -> List[str]:
+        """获取用户的全部好友ID"""
+        with self._lock:
+            return list(self._adjacency.get(user_id, ()))
+
+    def edge_count(self) -> int:
+        return self._edges
+
+    def _edge_list(self) -> List[Tuple[str, str]]:
+        """全部好友关系，每条只出现一次（调用方持有锁）"""
+        return [(a, b) for a, neighbors in self._adjacency.items() for b in neighbors if a < b]
+
+    def edges(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            return self._edge_list()
+
+    def compact(self) -> None:
+        """用当前的边集合重写日志，去掉已被抵消的增删记录"""
+        with self._lock:
+            edges = self._edge_list()
+            serialization.write_atomic(self.path, ''.join(
+                json.dumps({'op': 'add', 'a': a, 'b': b}) + '\n' for a, b in edges).encode('utf-8'))
+            self._log_lines = len(edges)
+            print(f"[Server] 好友关系日志已压缩: {len(edges)} 条")
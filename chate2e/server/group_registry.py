@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Set
+
+from chate2e.utils import serialization
+
+
+class GroupRegistry:
+    """服务端群组成员表
+
+    服务器只知道群组有哪些成员，用于验证发送者并扇出群消息；群消息内容由成员的发送者密钥加密。
+    与FriendGraph一样，每次变更只向日志追加一行：
+    {"op": "create", "group", "name", "owner"} / {"op": "add"/"remove", "group", "user"}，
+    启动时回放，冗余记录过多时压缩重写。
+    """
+    COMPACT_RATIO = 2  # 日志行数超过 (群组数+成员关系数)*COMPACT_RATIO 时压缩
+
+    def __init__(self, path: str):
+        self.path = path
+        self._groups: Dict[str, dict] = {}  # group_id -> {name, owner, created_at}
+        self._members: Dict[str, Set[str]] = {}  # group_id -> 成员ID
+        self._user_groups: Dict[str, Set[str]] = {}  # user_id -> group_id（反向索引）
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        """回放日志重建成员表"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 写入中断留下的残缺行，压缩时会被丢弃
+                        continue
+                    self._log_lines += 1
+                    self._apply(record)
+            print(f"[Server] 成功加载 {len(self._groups)} 个群组")
+        except Exception as e:
+            print(f"[Server] ✗ 加载群组失败: {e}")
+            return
+        if self._log_lines > max(self._record_count() * self.COMPACT_RATIO, 64):
+            self.compact()
+
+    def _record_count(self) -> int:
+        return len(self._groups) + sum(len(members) for members in self._members.values())
+
+    def _apply(self, record: dict) -> bool:
+        op = record['op']
+        group_id = record['group']
+        if op == 'create':
+            if group_id in self._groups:
+                return False
+            self._groups[group_id] = {
+                'name': record.get('name', ''),
+                'owner': record.get('owner'),
+                'created_at': record.get('created_at')
+            }
+            self._members[group_id] = set()
+            return True
+        if group_id not in self._groups:
+            return False
+        members = self._members[group_id]
+        user_id = record['user']
+        if op == 'add':
+            if user_id in members:
+                return False
+            members.add(user_id)
+            self._user_groups.setdefault(user_id, set()).add(group_id)
+            return True
+        if op == 'remove':
+            if user_id not in members:
+                return False
+            members.discard(user_id)
+            groups = self._user_groups.get(user_id)
+            if groups is not None:
+                groups.discard(group_id)
+                if not groups:
+                    del self._user_groups[user_id]
+            return True
+        return False
+
+    def _append(self, records: List[dict]) -> None:
+        """追加变更记录（调用方持有锁）"""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record) + '\n' for record in records))
+        self._log_lines += len(records)
+
+    def create_group(self, owner_id: str, name: str, member_ids: Iterable[str] = ()) -> str:
+        """创建群组，创建者自动成为成员，返回group_id"""
+        group_id = uuid.uuid4().hex
+        records = [{'op': 'create', 'group': group_id, 'name': name, 'owner': owner_id,
+                    'created_at': time.time()}]
+        for user_id in dict.fromkeys([owner_id, *member_ids]):
+            records.append({'op': 'add', 'group': group_id, 'user': user_id})
+        with self._lock:
+            for record in records:
+                self._apply(record)
+            self._append(records)
+        return group_id
+
+    def add_member(self, group_id: str, user_id: str) -> bool:
+        """添加成员，返回是否为新成员"""
+        record = {'op': 'add', 'group': group_id, 'user': user_id}
+        with self._lock:
+            if not self._apply(record):
+                return False
+            self._append([record])
+            return True
+
+    def remove_member(self, group_id: str, user_id: str) -> bool:
+        """移除成员，返回之前是否为成员"""
+        record = {'op': 'remove', 'group': group_id, 'user': user_id}
+        with self._lock:
+            if not self._apply(record):
+                return False
+            self._append([record])
+            return True
+
+    def exists(self, group_id: str) -> bool:
+        return group_id in self._groups
+
+    def is_member(self, group_id: str, user_id: str) -> bool:
+        return user_id in self._members.get(group_id, ())
+
+    def members_of(self, group_id: str) -> List[str]:
+        """获取群组的全部成员ID"""
+        with self._lock:
+            return list(self._members.get(group_id, ()))
+
+    def groups_of(self, user_id: str) -> List[str]:
+        """获取用户加入的全部群组ID"""
+        with self._lock:
+            return list(self._user_groups.get(user_id, ()))
+
+    def get_group(self, group_id: str) -> Optional[dict]:
+        """群组信息 {group_id, name, owner, members}，不存在时返回None"""
+        with self._lock:
+            group = self._groups.get(group_id)
+            if group is None:
+                return None
+            return {
+                'group_id': group_id,
+                'name': group['name'],
+                'owner': group['owner'],
+                'members': sorted(self._members[group_id])
+            }
+
+    def compact(self) -> None:
+        """用当前的群组与成员重写日志，去掉已被抵消的增删记录"""
+        with self._lock:
+            records = []
+            for group_id, group in self._groups.items():
+                records.append({'op': 'create', 'group': group_id, 'name': group['name'],
+                                'owner': group['owner'], 'created_at': group['created_at']})
+                records.extend({'op': 'add', 'group': group_id, 'user': user_id}
+                               for user_id in sorted(self._members[group_id]))
+            serialization.write_atomic(self.path,
+                                       ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8'))
+            self._log_lines = len(records)
+            print(f"[Server] 群组日志已压缩: {len(records)} 条")
@@ -1,36 +1,112 @@
+import bisect
+import threading
 from dataclasses import dataclass, asdict
-from typing import Optional, Dict , List
-from chate2e.model.message import Message
+from typing import Optional, Dict , List, Tuple
+from chate2e.model.message import Message, PRIMARY_DEVICE_ID
 
 class MessageManager:
     """消息管理"""
+    DEFAULT_PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+
     def __init__(self):
         self.messages: Dict[str, List[Message]] = {}  # user_id -> messages
         self.offline_messages: Dict[str, List[Message]] = {}  # user_id -> messages
-        
+        # 离线消息序号，与offline_messages一一对应并保持递增，用作分页游标
+        self.offline_seqs: Dict[str, List[int]] = {}  # user_id -> seqs
+        self._next_seq: Dict[str, int] = {}  # user_id -> 下一个序号
+        self._offline_lock = threading.Lock()
+
+    @staticmethod
+    def queue_key(user_id: str, device_id: Optional[str] = None) -> str:
+        """离线队列键：主设备以及不指定设备的消息使用user_id，其他设备各自一个队列"""
+        if not device_id or device_id == PRIMARY_DEVICE_ID:
+            return user_id
+        return f"{user_id}/{device_id}"
+
     def add_message(self, message: Message) -> None:
         """添加消息到历史记录"""
         if message.header.receiver_id not in self.messages:
             self.messages[message.header.receiver_id] = []
         self.messages[message.header.receiver_id].append(message)
-        
+
     def get_session_messages(self, session_id: str) -> List[Message]:
         """获取会话的所有消息"""
         return self.messages.get(session_id, [])
-        
-    def add_offline_message(self, message: Message) -> None:
-        """添加离线消息"""
-        if message.header.receiver_id not in self.offline_messages:
-            self.offline_messages[message.header.receiver_id] = []
-        self.offline_messages[message.header.receiver_id].append(message)
-        
+
+    def _enqueue(self, message: Message, user_id: str) -> int:
+        """加入离线队列并分配序号（调用方持有锁）"""
+        seq = self._next_seq.get(user_id, 1)
+        self._next_seq[user_id] = seq + 1
+        self.offline_messages.setdefault(user_id, []).append(message)
+        self.offline_seqs.setdefault(user_id, []).append(seq)
+        return seq
+
+    def add_offline_message(self, message: Message, user_id: Optional[str] = None) -> int:
+        """添加离线消息，返回分配的序号
+
+        Args:
+            message: 消息
+            user_id: 离线队列键，默认为消息头中的接收者（及接收设备）
+        """
+        if user_id is None:
+            user_id = self.queue_key(message.header.receiver_id, message.header.receiver_device_id)
+        with self._offline_lock:
+            return self._enqueue(message, user_id)
+
+    def add_offline_messages(self, message: Message, user_ids: List[str]) -> None:
+        """把同一条消息（群消息）加入多个接收者的离线队列，只加锁一次"""
+        with self._offline_lock:
+            for user_id in user_ids:
+                self._enqueue(message, user_id)
+
+    def get_offline_page(self, user_id: str, cursor: int = 0,
+                         limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Message], int, bool]:
+        """按游标分页读取离线消息（不删除）
+
+        Args:
+            user_id: 接收者ID
+            cursor: 上一页返回的游标，只返回序号大于该值的消息
+            limit: 每页最大消息数
+
+        Returns:
+            (消息列表, 本页最后一条消息的序号, 是否还有更多)
+        """
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
+        with self._offline_lock:
+            seqs = self.offline_seqs.get(user_id, [])
+            start = bisect.bisect_right(seqs, cursor)
+            end = min(start + limit, len(seqs))
+            page = self.offline_messages[user_id][start:end] if end > start else []
+            next_cursor = seqs[end - 1] if end > start else cursor
+            return page, next_cursor, end < len(seqs)
+
+    def ack_offline_messages(self, user_id: str, cursor: int) -> int:
+        """确认并删除序号不大于cursor的离线消息，返回删除数量"""
+        with self._offline_lock:
+            seqs = self.offline_seqs.get(user_id)
+            if not seqs:
+                return 0
+            count = bisect.bisect_right(seqs, cursor)
+            del seqs[:count]
+            del self.offline_messages[user_id][:count]
+            if not seqs:
+                del self.offline_seqs[user_id]
+                del self.offline_messages[user_id]
+            return count
+
+    def get_offline_count(self, user_id: str) -> int:
+        """获取用户待拉取的离线消息数量"""
+        with self._offline_lock:
+            return len(self.offline_seqs.get(user_id, []))
+
     def get_offline_messages(self, user_id: str) -> List[Message]:
         """获取并清空用户的离线消息"""
-        messages = self.offline_messages.get(user_id, [])
-        if user_id in self.offline_messages:
-            del self.offline_messages[user_id]
+        with self._offline_lock:
+            messages = self.offline_messages.pop(user_id, [])
+            self.offline_seqs.pop(user_id, None)
         return messages
 
     def get_recent_messages(self, user_id: str) -> List[Message]:
         """获取最近的消息"""
-        return self.get_session_messages(user_id)
\ No newline at end of file
+        return self.get_session_messages(user_id)
@@ -0,0 +1,299 @@
+import bisect
+import functools
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class _ShardedCells:
+    """按线程分片的累加单元
+
+    每个线程只写自己的单元（以线程ID为键），热路径上没有锁，也没有多个线程对同一数值的读-改-写；
+    采集时把全部分片相加。线程结束后其线程ID会被新线程复用，单元继续累加，
+    因此分片数量不超过同时存在过的线程数。
+    """
+    __slots__ = ('_cells', '_width')
+
+    def __init__(self, width: int = 1):
+        self._cells: Dict[int, List[float]] = {}
+        self._width = width
+
+    def cell(self) -> List[float]:
+        ident = threading.get_ident()
+        cell = self._cells.get(ident)
+        if cell is None:
+            # setdefault是原子操作，同一线程也只会走到这里一次
+            cell = self._cells.setdefault(ident, [0] * self._width)
+        return cell
+
+    def totals(self) -> List[float]:
+        result = [0] * self._width
+        for cell in list(self._cells.values()):
+            for index in range(self._width):
+                result[index] += cell[index]
+        return result
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric(ABC):
+    TYPE = ''
+    SUFFIX = ''  # 文本格式中的样本名后缀（计数器为_total）
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _header(self) -> List[str]:
+        name = self.name + self.SUFFIX
+        return [f'# HELP {name} {_escape_help(self.documentation)}', f'# TYPE {name} {self.TYPE}']
+
+    @abstractmethod
+    def collect(self) -> List[str]:
+        """文本格式的HELP、TYPE与全部样本行"""
+
+
+class _SampledMetric(_Metric):
+    """在热路径上累加的指标（计数器、直方图），有标签时每组标签值对应一个子指标"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._children: Dict[Tuple[str, ...], '_SampledMetric'] = {}
+
+    def labels(self, **labels) -> '_SampledMetric':
+        """按标签取子指标；热路径上应在模块加载时取好子指标，避免每次查字典"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self) -> '_SampledMetric':
+        """与本指标同名、没有标签的子指标"""
+
+    def _series(self) -> Iterable[Tuple[Tuple[str, ...], '_SampledMetric']]:
+        if self.labelnames:
+            return sorted(list(self._children.items()))
+        return [((), self)]
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        for values, child in self._series():
+            lines.extend(child._samples(self.name + self.SUFFIX, self.labelnames, values))
+        return lines
+
+    @abstractmethod
+    def _samples(self, name: str, labelnames: Sequence[str], values: Sequence[str]) -> List[str]:
+        """本指标（子指标）以给定标签值输出的样本行"""
+
+
+class Counter(_SampledMetric):
+    """只增计数器"""
+    TYPE = 'counter'
+    SUFFIX = '_total'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = _ShardedCells()
+
+    def _new_child(self) -> 'Counter':
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1) -> None:
+        self._value.cell()[0] += amount
+
+    def value(self) -> float:
+        return self._value.totals()[0]
+
+    def _samples(self, name, labelnames, values):
+        return [f'{name}{_format_labels(labelnames, values)} {_format_value(self.value())}']
+
+
+class Gauge(_Metric):
+    """采集时由回调计算的瞬时值，热路径上没有任何开销
+
+    回调返回单个数值（无标签），或 [(标签值元组, 数值)]（有标签）。
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], object],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        lines = self._header()
+        try:
+            result = self.callback()
+        except Exception as e:
+            print(f"[Server] ✗ 指标 {self.name} 采集失败: {e}")
+            return lines
+        series = result if self.labelnames else [((), result)]
+        for values, value in series:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}')
+        return lines
+
+
+class Histogram(_SampledMetric):
+    """累积分桶直方图（桶上界为秒等原始单位）"""
+    TYPE = 'histogram'
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每个桶一个计数 + 溢出桶 + 总和
+        self._cells = _ShardedCells(len(self.buckets) + 2)
+
+    def _new_child(self) -> 'Histogram':
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self) -> '_Timer':
+        """with histogram.time(): ... 记录代码块耗时（秒）"""
+        return _Timer(self)
+
+    def _samples(self, name, labelnames, values):
+        totals = self._cells.totals()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), totals[:-1]):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{name}_bucket{_format_labels(labelnames, values, le)} {_format_value(cumulative)}')
+        labels = _format_labels(labelnames, values)
+        lines.append(f'{name}_sum{labels} {_format_value(totals[-1])}')
+        lines.append(f'{name}_count{labels} {_format_value(cumulative)}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_start')
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+
+def timed(histogram: Histogram):
+    """装饰器：记录函数耗时（秒），异常返回同样计入"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class MetricsRegistry:
+    """指标注册表，按Prometheus文本格式(0.0.4)输出"""
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已注册: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str) -> None:
+        self._metrics.pop(name, None)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], object],
+              labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, callback, labelnames))
+
+    def exposition(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+# 服务器全局指标；与运行状态相关的Gauge由ChatServer注册
+registry = MetricsRegistry()
+
+messages_total = registry.counter(
+    'chate2e_messages', '两两消息的投递结果（forwarded: 实时转发，undelivered: 接收者离线）', ['result'])
+MESSAGES_FORWARDED = messages_total.labels(result='forwarded')
+MESSAGES_UNDELIVERED = messages_total.labels(result='undelivered')
+
+handle_message_seconds = registry.histogram(
+    'chate2e_handle_message_seconds', '消息发送接口的处理耗时', ['endpoint'])
+HANDLE_MESSAGE_SECONDS = handle_message_seconds.labels(endpoint='handle_message')
+HANDLE_MESSAGES_SECONDS = handle_message_seconds.labels(endpoint='handle_messages')
+
+SESSION_VALIDATION_FAILURES = registry.counter(
+    'chate2e_session_validation_failures', '会话验证失败（非会话参与者或会话不存在）的消息数')
+
+bundle_fetches_total = registry.counter(
+    'chate2e_bundle_fetches', '密钥Bundle查询次数（ok/not_modified/missing）', ['result'])
+BUNDLE_FETCH_OK = bundle_fetches_total.labels(result='ok')
+BUNDLE_FETCH_NOT_MODIFIED = bundle_fetches_total.labels(result='not_modified')
+BUNDLE_FETCH_MISSING = bundle_fetches_total.labels(result='missing')
+
+SAVE_USERS_SECONDS = registry.histogram(
+    'chate2e_save_users_seconds', '用户数据整体写盘耗时',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+rate_limited_total = registry.counter(
+    'chate2e_rate_limited', '被限流拒绝的请求数（message: HTTP消息, socket: Socket.IO消息, register: 注册）', ['scope'])
+RATE_LIMITED_MESSAGE = rate_limited_total.labels(scope='message')
+RATE_LIMITED_SOCKET = rate_limited_total.labels(scope='socket')
+RATE_LIMITED_REGISTER = rate_limited_total.labels(scope='register')
+
+RECEIVER_CONGESTED = registry.counter(
+    'chate2e_receiver_congested', '接收者连接待发送队列已满、要求发送方稍后重试的消息数')
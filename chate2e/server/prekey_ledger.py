@@ -0,0 +1,59 @@
+import json
+import os
+import threading
+from base64 import b64decode, b64encode
+from typing import List, Tuple
+
+
+class PrekeyLedger:
+    """已分配一次性预密钥的追加式日志
+
+    每分配一个预密钥只向日志追加一行 {"user", "device", "key"}，
+    不需要在会话建立的路径上重写整个users.json。
+    启动时回放日志合并到用户数据中，users.json保存成功后清空日志。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._needs_newline = False  # 日志末尾是写入中断留下的残缺行
+
+    def load(self) -> List[Tuple[str, str, bytes]]:
+        """读取全部分配记录 [(user_id, device_id, key)]"""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with self._lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        self._needs_newline = not line.endswith('\n')
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json.loads(line)
+                            records.append((record['user'], record['device'], b64decode(record['key'])))
+                        except (ValueError, KeyError):
+                            # 写入中断留下的残缺行
+                            continue
+            except OSError as e:
+                print(f"[Server] ✗ 加载预密钥分配记录失败: {e}")
+        return records
+
+    def append(self, user_id: str, device_id: str, key: bytes) -> None:
+        """追加一条分配记录"""
+        line = json.dumps({'user': user_id, 'device': device_id, 'key': b64encode(key).decode('utf-8')})
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                if self._needs_newline:
+                    f.write('\n')
+                    self._needs_newline = False
+                f.write(line + '\n')
+
+    def reset(self) -> None:
+        """分配记录已全部写入users.json后清空日志"""
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._needs_newline = False
@@ -0,0 +1,118 @@
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+ONLINE = "online"
+OFFLINE = "offline"
+
+
+class PresenceService:
+    """在线状态服务
+
+    按用户统计socket连接数，只有连接数在0与非0之间变化时才产生状态变更。
+    状态变更先在一个短时间窗口内合并，窗口结束后按观察者（把该用户当作联系人的用户）
+    分组，每个在线观察者只收到一条批量的 presence 事件。
+    大量用户在服务器重启后同时重连时，避免了O(N²)的广播。
+    """
+
+    def __init__(self,
+                 contacts_of: Callable[[str], Iterable[str]],
+                 sockets_of: Callable[[str], Iterable[str]],
+                 emit: Callable[[str, dict, str], None],
+                 window: float = 0.5):
+        """
+        Args:
+            contacts_of: 返回把指定用户当作联系人的用户ID（即需要被通知的观察者）
+            sockets_of: 返回指定用户当前的socket ID
+            emit: 发送事件的回调 emit(event, payload, socket_id)
+            window: 状态变更合并窗口（秒），为0时立即推送
+        """
+        self.contacts_of = contacts_of
+        self.sockets_of = sockets_of
+        self.emit = emit
+        self.window = window
+        self._connections: Dict[str, int] = {}  # user_id -> socket连接数
+        self._published: Dict[str, str] = {}  # user_id -> 观察者最近一次看到的状态
+        self._pending: Dict[str, str] = {}  # user_id -> 窗口内的最新状态
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def connect(self, user_id: str) -> bool:
+        """记录一个新连接，返回用户是否由离线变为在线"""
+        with self._lock:
+            count = self._connections.get(user_id, 0) + 1
+            self._connections[user_id] = count
+            changed = count == 1
+            if changed:
+                self._mark_changed(user_id, ONLINE)
+        if changed and self.window <= 0:
+            self.flush()
+        return changed
+
+    def disconnect(self, user_id: str) -> bool:
+        """记录一个连接断开，返回用户是否由在线变为离线"""
+        with self._lock:
+            count = self._connections.get(user_id, 0) - 1
+            changed = count <= 0
+            if changed:
+                self._connections.pop(user_id, None)
+                self._mark_changed(user_id, OFFLINE)
+            else:
+                self._connections[user_id] = count
+        if changed and self.window <= 0:
+            self.flush()
+        return changed
+
+    def is_online(self, user_id: str) -> bool:
+        return self._connections.get(user_id, 0) > 0
+
+    def connection_count(self, user_id: str) -> int:
+        return self._connections.get(user_id, 0)
+
+    def status_of(self, user_ids: Iterable[str]) -> Dict[str, str]:
+        """批量查询在线状态"""
+        return {user_id: ONLINE if self.is_online(user_id) else OFFLINE for user_id in user_ids}
+
+    def _mark_changed(self, user_id: str, status: str):
+        """记录状态变更并确保合并窗口已启动（调用方持有锁）"""
+        self._pending[user_id] = status
+        if self.window > 0 and self._timer is None:
+            self._timer = threading.Timer(self.window, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> int:
+        """推送窗口内合并后的状态变更，返回发送的事件数"""
+        with self._lock:
+            self._timer = None
+            pending = self._pending
+            self._pending = {}
+            # 窗口内上线又下线（或相反）的用户，观察者看到的状态没有变化，不推送
+            changes = {
+                user_id: status for user_id, status in pending.items()
+                if self._published.get(user_id, OFFLINE) != status
+            }
+            for user_id, status in changes.items():
+                if status == OFFLINE:
+                    self._published.pop(user_id, None)
+                else:
+                    self._published[user_id] = status
+
+        batches: Dict[str, List[dict]] = {}
+        for user_id, status in changes.items():
+            for watcher_id in self.contacts_of(user_id):
+                if self.is_online(watcher_id):
+                    batches.setdefault(watcher_id, []).append({'user_id': user_id, 'status': status})
+
+        sent = 0
+        for watcher_id, updates in batches.items():
+            for socket_id in self.sockets_of(watcher_id):
+                self.emit('presence', {'updates': updates}, socket_id)
+                sent += 1
+        return sent
+
+    def send_snapshot(self, user_id: str, contact_ids: Iterable[str], socket_id: str):
+        """向刚连接的socket推送其联系人的当前状态"""
+        updates = [{'user_id': contact_id, 'status': status}
+                   for contact_id, status in self.status_of(contact_ids).items()]
+        if updates:
+            self.emit('presence', {'updates': updates}, socket_id)
@@ -0,0 +1,197 @@
+import cProfile
+import functools
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+MODE_OFF = 'off'
+MODE_SAMPLE = 'sample'
+MODE_CPROFILE = 'cprofile'
+MODES = (MODE_OFF, MODE_SAMPLE, MODE_CPROFILE)
+
+
+def _file_name(label: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', label)
+
+
+class RequestProfiler:
+    """服务器请求处理的按需剖析
+
+    两种模式，均只对按比例抽中的请求生效，结果按接口/Socket.IO事件分别汇总：
+      - sample: 后台线程每隔interval读取正在处理被抽中请求的线程的调用栈（sys._current_frames），
+        累计为折叠栈（"帧;帧;帧 次数"，可直接交给flamegraph.pl / speedscope / inferno生成火焰图）
+      - cprofile: 被抽中的请求在cProfile下执行，统计累加后写为pstats文件（snakeviz / flameprof可视化）；
+        cProfile同一时刻只能剖析一个请求，其余请求照常处理不计入
+
+    关闭时begin()只做一次属性判断，请求路径上没有其他开销。
+    """
+    MAX_DEPTH = 128
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.mode = MODE_OFF
+        self.rate = 1.0
+        self.interval = 0.005
+        self.started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        # 正在被采样的线程 -> 标签
+        self._active: Dict[int, str] = {}
+        # 标签 -> {折叠栈: 次数}
+        self._stacks: Dict[str, Dict[str, int]] = {}
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._cprofile_busy = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != MODE_OFF
+
+    def start(self, mode: str, rate: float = 1.0, interval: float = 0.005) -> None:
+        """开始剖析；已在运行时先停止并写出之前的结果"""
+        if mode not in MODES:
+            raise ValueError(f"未知的剖析模式: {mode}")
+        if not 0 < rate <= 1:
+            raise ValueError("采样比例应在(0, 1]之间")
+        if interval <= 0:
+            raise ValueError("采样间隔应大于0")
+        self.stop()
+        if mode == MODE_OFF:
+            return
+        with self._lock:
+            self._stacks = {}
+            self._stats = {}
+            self.rate = rate
+            self.interval = interval
+            self.started_at = time.time()
+            if mode == MODE_SAMPLE:
+                self._stop.clear()
+                self._sampler = threading.Thread(target=self._sample_loop, name='request-profiler', daemon=True)
+                self._sampler.start()
+            self.mode = mode
+        print(f"[Server] 开始剖析: mode={mode} rate={rate} interval={interval}s")
+
+    def stop(self) -> Dict[str, str]:
+        """停止剖析并写出结果，返回 {标签: 文件路径}"""
+        with self._lock:
+            if self.mode == MODE_OFF:
+                return {}
+            self.mode = MODE_OFF
+            sampler, self._sampler = self._sampler, None
+        if sampler is not None:
+            self._stop.set()
+            sampler.join()
+        written = self.dump()
+        print(f"[Server] 停止剖析，已写出 {len(written)} 个文件")
+        return written
+
+    def begin(self, label: str):
+        """请求开始；返回的令牌交给end()。未抽中时返回None"""
+        if self.mode == MODE_OFF or random.random() >= self.rate:
+            return None
+        if self.mode == MODE_SAMPLE:
+            ident = threading.get_ident()
+            self._active[ident] = label
+            return ident
+        if not self._cprofile_busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return label, profile
+
+    def end(self, token) -> None:
+        if token is None:
+            return
+        if isinstance(token, int):
+            self._active.pop(token, None)
+            return
+        label, profile = token
+        profile.disable()
+        self._cprofile_busy.release()
+        with self._lock:
+            stats = self._stats.get(label)
+            if stats is None:
+                self._stats[label] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+    def profiled(self, label: str):
+        """装饰器：按label剖析被装饰的处理函数（用于Socket.IO事件）"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.mode == MODE_OFF:
+                    return func(*args, **kwargs)
+                token = self.begin(label)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.end(token)
+            return wrapper
+        return decorator
+
+    def _sample_loop(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            for ident, label in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                stack = self._collapse(frame)
+                with self._lock:
+                    counts = self._stacks.setdefault(label, {})
+                    counts[stack] = counts.get(stack, 0) + 1
+
+    def _collapse(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.MAX_DEPTH:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def folded(self, label: str) -> str:
+        """label的折叠栈文本"""
+        with self._lock:
+            counts = dict(self._stacks.get(label, {}))
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+    def status(self) -> dict:
+        with self._lock:
+            labels = sorted(set(self._stacks) | set(self._stats))
+            samples = {label: sum(counts.values()) for label, counts in self._stacks.items()}
+        return {
+            'mode': self.mode,
+            'rate': self.rate,
+            'interval': self.interval,
+            'started_at': self.started_at,
+            'labels': labels,
+            'samples': samples,
+            'output_dir': self.output_dir,
+        }
+
+    def dump(self) -> Dict[str, str]:
+        """把已收集的结果写到output_dir：<标签>.folded（sample）或 <标签>.prof（cprofile）"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        written = {}
+        with self._lock:
+            stacks = {label: dict(counts) for label, counts in self._stacks.items()}
+            stats = dict(self._stats)
+        for label, counts in stacks.items():
+            path = os.path.join(self.output_dir, _file_name(label) + '.folded')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(''.join(f"{stack} {count}\n" for stack, count in sorted(counts.items())))
+            written[label] = path
+        for label, stat in stats.items():
+            path = os.path.join(self.output_dir, _file_name(label) + '.prof')
+            stat.dump_stats(path)
+            written[label] = path
+        return written
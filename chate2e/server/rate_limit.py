@@ -0,0 +1,92 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List
+
+
+class RateLimiter:
+    """按键（用户ID、远端地址等）独立计数的令牌桶限流器
+
+    每个键只保存 [剩余令牌, 上次更新时间] 两个数；令牌按rate匀速补充，上限为burst。
+    键按最近访问时间排列（OrderedDict），每次访问把键移到末尾，
+    并从头部淘汰空闲超过idle_timeout的键，淘汰的均摊开销为O(1)，内存只与活跃键数相关。
+    idle_timeout默认为令牌从0补满所需的时间，此时淘汰的桶与新建的桶等价，不影响限流结果。
+    """
+
+    def __init__(self, rate: float, burst: float, idle_timeout: float = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 桶容量（允许的突发请求数）
+            idle_timeout: 空闲多久后淘汰该键（秒）
+            clock: 单调时钟，测试时可替换
+        """
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate与burst必须大于0")
+        self.rate = rate
+        self.burst = burst
+        self.idle_timeout = idle_timeout if idle_timeout is not None else burst / rate
+        self.clock = clock
+        self._buckets: 'OrderedDict[Hashable, List[float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_eviction = 0.0  # 头部的键空闲到期的时间
+
+    def acquire(self, key: Hashable, cost: float = 1.0) -> float:
+        """尝试取出cost个令牌
+
+        Returns:
+            0表示允许；否则为需要等待的秒数（本次不扣令牌）
+        """
+        now = self.clock()
+        with self._lock:
+            buckets = self._buckets
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [self.burst, now]
+            else:
+                buckets.move_to_end(key)
+                tokens = bucket[0] + (now - bucket[1]) * self.rate
+                bucket[0] = tokens if tokens < self.burst else self.burst
+                bucket[1] = now
+            # 键按更新时间有序，头部的键最早到期；未到期时不需要检查
+            if now >= self._next_eviction:
+                self._evict(now, bucket)
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / self.rate
+
+    def refund(self, key: Hashable, cost: float = 1.0) -> None:
+        """退还acquire()已扣除的令牌（同一请求的其他限流未通过时），不超过桶容量"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                tokens = bucket[0] + cost
+                bucket[0] = tokens if tokens < self.burst else self.burst
+
+    def _evict(self, now: float, current: List[float]) -> None:
+        """淘汰头部空闲的键（调用方持有锁，当前键已在末尾）"""
+        buckets = self._buckets
+        deadline = now - self.idle_timeout
+        while True:
+            oldest = next(iter(buckets.values()))
+            if oldest is current or oldest[1] > deadline:
+                break
+            buckets.popitem(last=False)
+        self._next_eviction = oldest[1] + self.idle_timeout
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self._next_eviction = 0.0
+
+
+def retry_after_header(wait: float) -> str:
+    """Retry-After响应头（整秒，至少1秒）"""
+    return str(max(1, math.ceil(wait)))
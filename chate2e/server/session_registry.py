@@ -0,0 +1,111 @@
+import json
+import os
+import sys
+import threading
+import uuid
+from typing import Dict, Optional, Tuple
+
+
+class SessionRegistry:
+    """服务端两两会话登记表
+
+    会话只记录参与者，用于验证消息发送者；按会话保存排序后的参与者元组，
+    用户ID与会话ID都经过sys.intern，同一个ID在内存中只有一份，验证时只需一次哈希查找：
+        self._sessions[session_id] -> (user1_id, user2_id)
+    另外按用户保存 {对方ID: 会话ID}，用于查找已有会话与联系人。
+
+    每新建一个会话只向日志追加一行 {"id", "a", "b"}，服务器重启后已有会话仍然有效，
+    客户端不需要重新发起X3DH。日志在第一次查询时才加载，不拖慢服务器启动。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._sessions: Dict[str, Tuple[str, str]] = {}
+        self._peers: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._needs_newline = False  # 日志末尾是写入中断留下的残缺行
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self) -> None:
+        """回放日志重建会话表（调用方持有锁）"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._needs_newline = not line.endswith('\n')
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 写入中断留下的残缺行
+                        continue
+                    self._add(record['id'], record['a'], record['b'])
+            print(f"[Server] 成功加载 {len(self._sessions)} 个会话")
+        except Exception as e:
+            print(f"[Server] ✗ 加载会话失败: {e}")
+
+    def _add(self, session_id: str, user1_id: str, user2_id: str) -> str:
+        session_id = sys.intern(session_id)
+        user1_id, user2_id = sys.intern(user1_id), sys.intern(user2_id)
+        self._sessions[session_id] = (user1_id, user2_id) if user1_id <= user2_id else (user2_id, user1_id)
+        self._peers.setdefault(user1_id, {})[user2_id] = session_id
+        self._peers.setdefault(user2_id, {})[user1_id] = session_id
+        return session_id
+
+    def _append(self, session_id: str, user1_id: str, user2_id: str) -> None:
+        """追加一条会话记录（调用方持有锁）"""
+        line = json.dumps({'id': session_id, 'a': user1_id, 'b': user2_id}) + '\n'
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('\n' + line if self._needs_newline else line)
+        self._needs_newline = False
+
+    def get(self, user1_id: str, user2_id: str) -> Optional[str]:
+        """两个用户之间已有的会话ID"""
+        self._ensure_loaded()
+        return self._peers.get(user1_id, {}).get(user2_id)
+
+    def get_or_create(self, user1_id: str, user2_id: str) -> Tuple[str, bool]:
+        """获取或创建两个用户之间的会话，返回 (session_id, 是否新建)"""
+        session_id = self.get(user1_id, user2_id)
+        if session_id is not None:
+            return session_id, False
+        with self._lock:
+            # 加锁后再查一次，避免双方同时发起时创建两个会话
+            session_id = self._peers.get(user1_id, {}).get(user2_id)
+            if session_id is not None:
+                return session_id, False
+            session_id = self._add(str(uuid.uuid4()), user1_id, user2_id)
+            self._append(session_id, user1_id, user2_id)
+            return session_id, True
+
+    def validate(self, session_id: str, user_id: str) -> bool:
+        """会话存在且用户是参与者"""
+        if not self._loaded:
+            self._ensure_loaded()
+        participants = self._sessions.get(session_id)
+        return participants is not None and user_id in participants
+
+    def participants(self, session_id: str) -> Optional[Tuple[str, str]]:
+        self._ensure_loaded()
+        return self._sessions.get(session_id)
+
+    def peers_of(self, user_id: str) -> Dict[str, str]:
+        """用户建立过会话的对方 -> 会话ID"""
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._peers.get(user_id, {}))
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._sessions)
@@ -1,28 +1,99 @@
-from typing import Optional, List
+import hashlib
+from base64 import b64encode
+from typing import Dict, Optional, List
 from chate2e.model.bundle import Bundle
-from chate2e.model.message import Message
+from chate2e.model.message import Message, PRIMARY_DEVICE_ID
+from chate2e.server.device import Device
 
 class User:
     def __init__(self, username: str, uuid: str):
         self.username = username
         self.uuid = uuid
-        self.bundle: Optional[Bundle] = None
-        self.used_pre_keys: set = set()
+        # 设备ID -> 设备；只有一个设备的用户使用PRIMARY_DEVICE_ID
+        self.devices: Dict[str, Device] = {PRIMARY_DEVICE_ID: Device(PRIMARY_DEVICE_ID)}
         self.offline_messages: List[Message] = []
         self.is_online: bool = False
+
+    @property
+    def primary(self) -> Device:
+        return self.devices[PRIMARY_DEVICE_ID]
+
+    @property
+    def bundle(self) -> Optional[Bundle]:
+        """主设备的密钥Bundle"""
+        return self.primary.bundle
+
+    @property
+    def used_pre_keys(self) -> set:
+        return self.primary.used_pre_keys
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """主设备的长期密钥指纹"""
+        return self.primary.fingerprint
     
     def to_dict(self) -> dict:
         return {
             'username': self.username,
             'uuid': self.uuid,
             'bundle': self.bundle.to_dict() if self.bundle else None,
+            'used_pre_keys': [b64encode(key).decode('utf-8') for key in self.used_pre_keys],
+            'devices': [device.to_dict() for device_id, device in self.devices.items()
+                        if device_id != PRIMARY_DEVICE_ID],
             'is_online': self.is_online
         }
         
-    def set_bundle(self, bundle: Bundle) -> None:
-        """设置用户的密钥Bundle"""
-        self.bundle = bundle
-        self.used_pre_keys.clear()
+    def set_bundle(self, bundle: Bundle, device_id: str = PRIMARY_DEVICE_ID) -> None:
+        """设置用户某个设备的密钥Bundle，设备不存在时添加"""
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices[device_id] = Device(device_id)
+        device.set_bundle(bundle)
+
+    def get_device(self, device_id: str) -> Optional[Device]:
+        return self.devices.get(device_id)
+
+    def remove_device(self, device_id: str) -> bool:
+        """移除非主设备"""
+        if device_id == PRIMARY_DEVICE_ID:
+            return False
+        return self.devices.pop(device_id, None) is not None
+
+    def active_devices(self) -> List[Device]:
+        """已上传Bundle的设备"""
+        return [device for device in self.devices.values() if device.bundle is not None]
+
+    @property
+    def etag(self) -> str:
+        """用户公开信息（用户名+各设备密钥指纹）的版本标识，增删设备或更换密钥都会改变"""
+        fingerprints = ','.join(f"{device.device_id}:{device.fingerprint}"
+                                for device in sorted(self.active_devices(), key=lambda d: d.device_id))
+        digest = hashlib.sha256(f"{self.username}|{fingerprints}".encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def public_info(self) -> dict:
+        """可公开查询的用户信息"""
+        return {
+            'username': self.username,
+            'fingerprint': self.fingerprint,
+            'devices': {device.device_id: device.fingerprint for device in self.active_devices()},
+            'etag': self.etag
+        }
+
+    def available_pre_keys(self, device_id: str = PRIMARY_DEVICE_ID) -> List[bytes]:
+        """设备尚未分配给任何发起方的一次性预密钥"""
+        device = self.devices.get(device_id)
+        return device.available_pre_keys() if device else []
+
+    def claim_pre_key(self, device_id: str = PRIMARY_DEVICE_ID) -> Optional[bytes]:
+        """分配设备的一个一次性预密钥并标记为已使用，耗尽时返回None"""
+        device = self.devices.get(device_id)
+        return device.claim_pre_key() if device else None
+
+    def public_bundle(self, device_id: str = PRIMARY_DEVICE_ID) -> Optional[Bundle]:
+        """设备对外发布的Bundle，只包含未使用的一次性预密钥"""
+        device = self.devices.get(device_id)
+        return device.public_bundle() if device else None
 
     def get_bundle(self) -> Optional[Bundle]:
         """获取用户的密钥Bundle"""
@@ -1,2 +1,51 @@
+import os
+
 DEFAULT_HOST = "localhost"
-DEFAULT_PORT = 12345
\ No newline at end of file
+DEFAULT_PORT = 12345
+
+# 本地密码KDF配置
+# pbkdf2: PBKDF2-HMAC-SHA256（兼容旧版本用户档案）
+# scrypt: 内存困难型KDF，抵抗GPU/ASIC暴力破解
+DEFAULT_PASSWORD_KDF = "pbkdf2"
+PBKDF2_ITERATIONS = 100000
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+# 端到端延迟追踪（默认关闭）
+# CHATE2E_TRACE_FILE: 追踪记录写入的JSON行文件
+# CHATE2E_TRACE_OTLP: OTLP/HTTP采集器地址（优先于文件）
+# CHATE2E_TRACE_SAMPLE: 发送方采样率（0~1）
+TRACE_FILE = os.environ.get("CHATE2E_TRACE_FILE")
+TRACE_OTLP_ENDPOINT = os.environ.get("CHATE2E_TRACE_OTLP")
+TRACE_SAMPLE_RATE = float(os.environ.get("CHATE2E_TRACE_SAMPLE", "1.0"))
+
+# 服务器管理接口（/admin/*）的令牌，未设置时管理接口不可用
+# CHATE2E_PROFILE_DIR: 请求剖析结果的输出目录（默认为服务器数据目录下的profiles）
+ADMIN_TOKEN = os.environ.get("CHATE2E_ADMIN_TOKEN")
+PROFILE_DIR = os.environ.get("CHATE2E_PROFILE_DIR")
+
+# 服务器限流（令牌桶：每秒补充的请求数, 允许的突发请求数）
+# 消息发送按发送者与远端地址分别限流，注册只按远端地址限流
+MESSAGE_RATE_PER_USER = (50.0, 100.0)
+MESSAGE_RATE_PER_ADDRESS = (1000.0, 2000.0)
+REGISTER_RATE_PER_ADDRESS = (1.0, 20.0)
+# 接收者每个连接待发送的数据包超过该值时视为拥塞，发送方收到429后重试
+MAX_EMIT_BACKLOG = 256
+
+# 持久化文件使用的JSON后端：auto（依次尝试orjson、msgspec，都未安装时使用标准库）/ orjson / msgspec / stdlib
+# CHATE2E_JSON_PRETTY=1 时以缩进格式写入用户/会话文件，便于手工查看
+JSON_BACKEND = os.environ.get("CHATE2E_JSON_BACKEND", "auto")
+JSON_PRETTY = os.environ.get("CHATE2E_JSON_PRETTY") == "1"
+
+# 两两会话消息先压缩再加密：双方都支持时，不小于COMPRESSION_MIN_SIZE字节的明文先压缩，
+# 再按PADDING_POLICY填充长度后加密（CHATE2E_COMPRESSION=0 关闭，且不再向对方声明支持压缩）
+MESSAGE_COMPRESSION = os.environ.get("CHATE2E_COMPRESSION", "1") != "0"
+COMPRESSION_MIN_SIZE = 256
+# 解压结果的上限，超过时按解密失败处理（防止压缩炸弹）
+MAX_DECOMPRESSED_SIZE = 4 * 1024 * 1024
+
+# 两两会话消息的明文长度填充策略，由CHATE2E_PADDING选择：padme（开销≤12%）/ pow2（2的幂）/ none
+# 对方声明支持去除填充时才会填充；所有策略至少填充到PADDING_MIN_SIZE字节
+PADDING_POLICY = os.environ.get("CHATE2E_PADDING", "padme")
+PADDING_MIN_SIZE = 32
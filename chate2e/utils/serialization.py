@@ -0,0 +1,192 @@
+import json
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Any, Callable, List, Type, TypeVar, Union
+
+from chate2e.utils import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+T = TypeVar('T')
+
+
+class SerializationError(ValueError):
+    """JSON编码/解码失败，或解码结果不符合目标类型"""
+
+
+class _Backend(ABC):
+    """JSON编解码后端：dumps返回UTF-8字节，loads接受bytes或str"""
+    name = ''
+
+    @abstractmethod
+    def dumps(self, obj: Any, pretty: bool = False) -> bytes:
+        ...
+
+    @abstractmethod
+    def loads(self, data: Union[bytes, str]) -> Any:
+        ...
+
+
+class StdlibBackend(_Backend):
+    name = 'stdlib'
+
+    def dumps(self, obj, pretty=False):
+        return json.dumps(obj, ensure_ascii=False, indent=2 if pretty else None,
+                          separators=None if pretty else (',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonBackend(_Backend):
+    name = 'orjson'
+
+    def dumps(self, obj, pretty=False):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class MsgspecBackend(_Backend):
+    name = 'msgspec'
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj, pretty=False):
+        data = self._encoder.encode(obj)
+        return msgspec.json.format(data, indent=2) if pretty else data
+
+    def loads(self, data):
+        return self._decoder.decode(data)
+
+
+_BACKENDS = {
+    'orjson': (lambda: orjson is not None, OrjsonBackend),
+    'msgspec': (lambda: msgspec is not None, MsgspecBackend),
+    'stdlib': (lambda: True, StdlibBackend),
+}
+
+
+def create_backend(name: str = 'auto') -> _Backend:
+    """按名称创建后端；auto依次尝试orjson、msgspec，都未安装时使用标准库"""
+    if name == 'auto':
+        for candidate in ('orjson', 'msgspec', 'stdlib'):
+            available, factory = _BACKENDS[candidate]
+            if available():
+                return factory()
+    if name not in _BACKENDS:
+        raise ValueError(f"未知的JSON后端: {name}")
+    available, factory = _BACKENDS[name]
+    if not available():
+        print(f"[Serialization] ⚠ {name} 未安装，使用标准库json")
+        return StdlibBackend()
+    return factory()
+
+
+_backend = create_backend(config.JSON_BACKEND)
+
+
+def get_backend() -> _Backend:
+    return _backend
+
+
+def set_backend(backend: _Backend) -> _Backend:
+    """替换当前后端，返回原来的后端"""
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
+
+
+def dumps(obj: Any, pretty: bool = False) -> bytes:
+    """编码为UTF-8 JSON字节（非ASCII字符不转义）"""
+    try:
+        return _backend.dumps(obj, pretty)
+    except (TypeError, ValueError, OverflowError) as e:
+        raise SerializationError(f"JSON编码失败: {e}") from e
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode('utf-8')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    try:
+        return _backend.loads(data)
+    except (TypeError, ValueError) as e:
+        # orjson.JSONDecodeError与msgspec.DecodeError都是ValueError的子类
+        raise SerializationError(f"JSON解码失败: {e}") from e
+
+
+def _from_dict(cls: Type[T]) -> Callable[[dict], T]:
+    from_dict = getattr(cls, 'from_dict', None)
+    if from_dict is None:
+        raise TypeError(f"{cls.__name__} 没有from_dict")
+    return from_dict
+
+
+def decode(data: Union[bytes, str], cls: Type[T]) -> T:
+    """解码为指定模型（Bundle、LocalBundle、UserProfile、ChatSession、Message等带from_dict的类）"""
+    obj = loads(data)
+    if not isinstance(obj, dict):
+        raise SerializationError(f"{cls.__name__} 应为JSON对象，实际为 {type(obj).__name__}")
+    return _convert(_from_dict(cls), obj, cls)
+
+
+def decode_list(data: Union[bytes, str], cls: Type[T]) -> List[T]:
+    """解码为指定模型的列表"""
+    obj = loads(data)
+    if not isinstance(obj, list) or not all(isinstance(item, dict) for item in obj):
+        raise SerializationError(f"应为 {cls.__name__} 对象的JSON数组")
+    from_dict = _from_dict(cls)
+    return [_convert(from_dict, item, cls) for item in obj]
+
+
+def _convert(from_dict: Callable[[dict], T], obj: dict, cls: type) -> T:
+    try:
+        return from_dict(obj)
+    except (KeyError, TypeError, ValueError) as e:
+        raise SerializationError(f"{cls.__name__} 字段无效: {e!r}") from e
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """原子写入文件：在同一目录创建唯一的临时文件，写入并fsync后替换目标文件
+
+    临时文件名由mkstemp生成，多个线程或进程同时写同一路径时互不覆盖对方的临时文件；
+    写入失败时删除临时文件，目标文件保持原样。
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                    prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def dump_file(path: str, obj: Any, pretty: bool = False) -> None:
+    """写入JSON文件：先写临时文件再替换，写入中断不会留下半个文件"""
+    write_atomic(path, dumps(obj, pretty))
+
+
+def load_file(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return loads(f.read())
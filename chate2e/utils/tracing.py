@@ -0,0 +1,191 @@
+import json
+import queue
+import random
+import secrets
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from chate2e.utils import config
+
+# 进程内单调时钟对齐到墙上时钟：同一进程内的时间戳不会因系统校时回退，
+# 不同进程（客户端、服务器、接收方）之间按墙上时钟比较
+_CLOCK_OFFSET_NS = time.time_ns() - time.monotonic_ns()
+
+
+def now_ns() -> int:
+    """单调递增的Unix纳秒时间戳"""
+    return time.monotonic_ns() + _CLOCK_OFFSET_NS
+
+
+class TraceContext:
+    """随消息头传递的追踪上下文：追踪ID + 各阶段时间戳
+
+    发送方、服务器与接收方在各自的阶段调用mark()追加时间戳，
+    相邻两个阶段之间的时间即该阶段的耗时。
+    """
+    __slots__ = ('trace_id', 'stages')
+
+    def __init__(self, trace_id: Optional[str] = None, stages: Optional[List[list]] = None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.stages: List[list] = stages if stages is not None else []
+
+    def mark(self, stage: str, timestamp: Optional[int] = None) -> None:
+        self.stages.append([stage, now_ns() if timestamp is None else timestamp])
+
+    def copy(self) -> 'TraceContext':
+        return TraceContext(self.trace_id, [list(stage) for stage in self.stages])
+
+    def to_dict(self) -> dict:
+        return {'id': self.trace_id, 'stages': self.stages}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'TraceContext':
+        return cls(data['id'], [[stage, int(timestamp)] for stage, timestamp in data.get('stages', [])])
+
+
+class FileSpanExporter:
+    """把追踪记录按JSON行追加到本地文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, records: List[dict]) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+
+
+class OTLPSpanExporter:
+    """以OTLP/HTTP JSON格式发送到采集器（/v1/traces），相邻阶段之间各为一个span"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint.rstrip('/')
+        if not self.endpoint.endswith('/v1/traces'):
+            self.endpoint += '/v1/traces'
+        self.timeout = timeout
+
+    @staticmethod
+    def to_otlp(records: List[dict]) -> dict:
+        by_source: Dict[str, list] = {}
+        for record in records:
+            stages = record['stages']
+            spans = by_source.setdefault(record['source'], [])
+            for (start_stage, start), (end_stage, end) in zip(stages, stages[1:]):
+                spans.append({
+                    'traceId': record['trace_id'],
+                    'spanId': secrets.token_hex(8),
+                    'name': f"{start_stage}->{end_stage}",
+                    'kind': 1,
+                    'startTimeUnixNano': str(start),
+                    'endTimeUnixNano': str(end),
+                })
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': source}}]},
+            'scopeSpans': [{'scope': {'name': 'chate2e'}, 'spans': spans}]
+        } for source, spans in by_source.items()]}
+
+    def export(self, records: List[dict]) -> None:
+        requests.post(self.endpoint, json=self.to_otlp(records), timeout=self.timeout)
+
+
+class Tracer:
+    """追踪入口
+
+    没有配置导出器时start()返回None，消息头中不带追踪上下文，除一次判断外没有任何开销。
+    带有上下文的消息在每个阶段打时间戳（与导出器无关），
+    export()只把记录放入队列，由后台线程批量写出，不阻塞消息处理。
+    """
+    BATCH_SIZE = 256
+
+    def __init__(self, exporter=None, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self._queue: 'queue.SimpleQueue[Optional[dict]]' = queue.SimpleQueue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> 'Tracer':
+        """按环境变量配置：CHATE2E_TRACE_FILE / CHATE2E_TRACE_OTLP / CHATE2E_TRACE_SAMPLE"""
+        exporter = None
+        if config.TRACE_OTLP_ENDPOINT:
+            exporter = OTLPSpanExporter(config.TRACE_OTLP_ENDPOINT)
+        elif config.TRACE_FILE:
+            exporter = FileSpanExporter(config.TRACE_FILE)
+        return cls(exporter, config.TRACE_SAMPLE_RATE)
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start(self) -> Optional[TraceContext]:
+        """按采样率开始一条新的追踪"""
+        if self.exporter is None or random.random() >= self.sample_rate:
+            return None
+        return TraceContext()
+
+    def export(self, trace: Optional[TraceContext], source: str) -> None:
+        """导出source视角下的追踪记录（目前为止的全部阶段）"""
+        if trace is None or self.exporter is None:
+            return
+        self._ensure_worker()
+        self._queue.put({'trace_id': trace.trace_id, 'source': source, 'stages': [list(s) for s in trace.stages]})
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                return
+            batch = [record]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    self._write(batch)
+                    return
+                batch.append(record)
+            self._write(batch)
+
+    def _write(self, batch: List[dict]) -> None:
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            print(f"[Trace] ✗ 导出 {len(batch)} 条追踪记录失败: {e}")
+
+    def shutdown(self) -> None:
+        """写出队列中剩余的记录并停止后台线程"""
+        if self._worker is None:
+            return
+        self._queue.put(None)
+        self._worker.join()
+        self._worker = None
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """进程内共享的Tracer（首次调用时按环境变量创建）"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer.from_config()
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> Tracer:
+    """替换进程内共享的Tracer，返回原来的Tracer"""
+    global _tracer
+    previous, _tracer = _tracer, tracer
+    return previous
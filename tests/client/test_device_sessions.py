@@ -0,0 +1,172 @@
+import contextlib
+import io
+import threading
+
+from chate2e.client.device_sessions import DeviceSessions
+from chate2e.client.models import DataManager
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+
+
+def make_device(user_id: str, device_id: str) -> DeviceSessions:
+    protocol = SignalProtocol()
+    protocol.initialize_identity(user_id)
+    return DeviceSessions(protocol, device_id)
+
+
+def connect(sender: DeviceSessions, receiver: DeviceSessions, session_id: str = "s1"):
+    """sender发起与receiver所在设备的会话，receiver处理INITIATE"""
+    bundle = receiver.identity.create_bundle()
+    one_time_prekey = receiver.identity.one_time_prekeys_pub[0]
+    initiate = sender.initiate(receiver.identity.user_id, receiver.device_id, session_id,
+                               bundle, one_time_prekey.public_bytes_raw())
+    receiver.accept(initiate)
+    return initiate
+
+
+def test_each_device_gets_its_own_session():
+    with contextlib.redirect_stdout(io.StringIO()):
+        alice = make_device("alice", "primary")
+        bob_phone = make_device("bob", "primary")
+        bob_laptop = make_device("bob", "laptop")
+        initiate = connect(alice, bob_phone)
+        connect(alice, bob_laptop)
+
+        assert (initiate.header.sender_device_id, initiate.header.receiver_device_id) == ("primary", "primary")
+        assert sorted(alice.devices_of("bob")) == ["laptop", "primary"]
+
+        to_phone = alice.encrypt("bob", "primary", "你好")
+        to_laptop = alice.encrypt("bob", "laptop", "你好")
+        assert to_laptop.header.receiver_device_id == "laptop"
+        assert bob_phone.decrypt(to_phone) == "你好"
+        assert bob_laptop.decrypt(to_laptop) == "你好"
+
+        # 回复走同一个设备会话
+        reply = bob_laptop.encrypt("alice", "primary", "收到")
+        assert alice.decrypt(reply) == "收到"
+
+
+def test_fork_shares_one_time_prekeys():
+    with contextlib.redirect_stdout(io.StringIO()):
+        alice = make_device("alice", "primary")
+        bob = make_device("bob", "primary")
+        before = len(bob.identity.one_time_prekeys)
+        connect(alice, bob)
+        # 响应方会话使用过的一次性预密钥也从设备的预密钥池中删除
+        assert len(bob.identity.one_time_prekeys) == before - 1
+        assert alice.forget_device("bob", "primary")
+        assert alice.get("bob", "primary") is None
+
+
+def initiate_to(sender: DeviceSessions, receiver: DeviceSessions, session_id: str = "s1"):
+    bundle = receiver.identity.create_bundle()
+    one_time_prekey = receiver.identity.one_time_prekeys_pub[0]
+    return sender.initiate(receiver.identity.user_id, receiver.device_id, session_id,
+                           bundle, one_time_prekey.public_bytes_raw())
+
+
+def test_glare_converges_on_lower_device_and_keeps_in_flight_messages():
+    with contextlib.redirect_stdout(io.StringIO()):
+        alice = make_device("alice", "primary")
+        bob = make_device("bob", "primary")
+        # 双方同时发起，各自的第一条消息已经发出
+        from_alice = initiate_to(alice, bob)
+        from_bob = initiate_to(bob, alice)
+        alice_first = alice.encrypt("bob", "primary", "alice-1")
+        bob_first = bob.encrypt("alice", "primary", "bob-1")
+
+        alice.accept(from_bob)
+        bob.accept(from_alice)
+
+        # 两端都使用alice（较小的一方）发起的会话
+        assert alice.get("bob", "primary").is_initiator
+        assert not bob.get("alice", "primary").is_initiator
+        # 切换前发出的消息仍可解密
+        assert bob.decrypt(alice_first) == "alice-1"
+        assert alice.decrypt(bob_first) == "bob-1"
+        assert alice.decrypt(bob.encrypt("alice", "primary", "bob-2")) == "bob-2"
+        assert bob.decrypt(alice.encrypt("bob", "primary", "alice-2")) == "alice-2"
+
+
+def test_reinitiate_keeps_previous_session_for_in_flight_messages():
+    with contextlib.redirect_stdout(io.StringIO()):
+        alice = make_device("alice", "primary")
+        bob = make_device("bob", "primary")
+        connect(alice, bob)
+        in_flight = alice.encrypt("bob", "primary", "旧会话")
+        # alice重新发起，bob先收到新的INITIATE
+        connect(alice, bob, session_id="s2")
+        assert bob.decrypt(alice.encrypt("bob", "primary", "新会话")) == "新会话"
+        assert bob.decrypt(in_flight) == "旧会话"
+
+
+def test_duplicate_initiate_does_not_reset_ratchet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        alice = make_device("alice", "primary")
+        bob = make_device("bob", "primary")
+        initiate = connect(alice, bob)
+        assert bob.decrypt(alice.encrypt("bob", "primary", "1")) == "1"
+        session = bob.get("alice", "primary")
+        assert bob.accept(initiate) is session
+        assert bob.decrypt(alice.encrypt("bob", "primary", "2")) == "2"
+
+
+def test_sessions_survive_restart_through_data_manager(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        protocol = SignalProtocol()
+        protocol.initialize_identity("bob")
+        data_manager = DataManager(None, str(tmp_path))
+        assert data_manager.register_user("bob", "password123", "bob",
+                                          protocol.create_bundle(), protocol.create_local_bundle())
+        bob = DeviceSessions(protocol, "primary", persist=data_manager.save_device_session)
+        alice = make_device("alice", "primary")
+        connect(alice, bob)
+        assert bob.decrypt(alice.encrypt("bob", "primary", "重启前")) == "重启前"
+
+        # 重新登录：从本地档案加载身份密钥，恢复会话后继续使用同一棘轮
+        restored_manager = DataManager(None, str(tmp_path))
+        restored_manager.find_user_profile("bob")
+        restored_manager.unlock("password123")
+        identity = SignalProtocol()
+        identity.user_id = "bob"
+        identity.load_signal_from_local_bundle(restored_manager.get_local_bundle())
+        restored = DeviceSessions(identity, "primary", persist=restored_manager.save_device_session)
+        assert restored.restore(restored_manager.load_device_sessions()) == 1
+        assert restored.decrypt(alice.encrypt("bob", "primary", "重启后")) == "重启后"
+        assert alice.decrypt(restored.encrypt("alice", "primary", "回复")) == "回复"
+
+        assert restored.forget_device("alice", "primary")
+        assert restored_manager.load_device_sessions() == {}
+
+
+def test_device_session_log_is_compacted(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        protocol = SignalProtocol()
+        protocol.initialize_identity("carol")
+        data_manager = DataManager(None, str(tmp_path))
+        assert data_manager.register_user("carol", "password123", "carol",
+                                          protocol.create_bundle(), protocol.create_local_bundle())
+        for n in range(DataManager.DEVICE_SESSION_LOG_SLACK + 10):
+            data_manager.save_device_session("peer", "primary", {'n': n})
+
+        records = data_manager.load_device_sessions()
+        assert records == {("peer", "primary"): {'n': DataManager.DEVICE_SESSION_LOG_SLACK + 9}}
+        assert len(data_manager._device_session_log) == 1
+        assert data_manager.load_device_sessions() == records
+
+
+def test_sessions_lock_independently():
+    with contextlib.redirect_stdout(io.StringIO()):
+        alice = make_device("alice", "primary")
+        bob = make_device("bob", "primary")
+        carol = make_device("carol", "primary")
+        connect(bob, alice)
+        connect(carol, alice)
+        from_carol = carol.encrypt("alice", "primary", "hi")
+
+        # 与bob的会话正被占用时，与carol的会话仍然可以解密
+        result = []
+        with alice.lock_for("bob", "primary"):
+            thread = threading.Thread(target=lambda: result.append(alice.decrypt(from_carol)))
+            thread.start()
+            thread.join(timeout=2)
+        assert result == ["hi"]
@@ -0,0 +1,95 @@
+import threading
+import time
+
+from chate2e.client.dispatcher import MessageDispatcher
+
+
+def test_same_key_runs_in_order():
+    dispatcher = MessageDispatcher(workers=4, queue_size=1000)
+    results = {'a': [], 'b': []}
+    for i in range(200):
+        dispatcher.submit('a', results['a'].append, i)
+        dispatcher.submit('b', results['b'].append, i)
+    dispatcher.join()
+    dispatcher.shutdown()
+
+    assert results['a'] == list(range(200))
+    assert results['b'] == list(range(200))
+    stats = dispatcher.stats()
+    assert stats['submitted'] == 400
+    assert stats['processed'] == 400
+    assert stats['dropped'] == 0
+
+
+def test_submit_never_blocks_when_full():
+    dispatcher = MessageDispatcher(workers=1, queue_size=2)
+    gate = threading.Event()
+    dispatcher.submit('s', gate.wait)
+    time.sleep(0.05)  # 等待工作线程取走第一个任务并阻塞
+
+    assert dispatcher.submit('s', lambda: None)
+    assert dispatcher.submit('s', lambda: None)
+    start = time.monotonic()
+    assert not dispatcher.submit('s', lambda: None)
+    assert time.monotonic() - start < 0.1
+    assert dispatcher.stats()['dropped'] == 1
+
+    gate.set()
+    dispatcher.shutdown()
+
+
+def test_spilled_tasks_run_in_order_without_blocking():
+    dispatcher = MessageDispatcher(workers=1, queue_size=1)
+    gate = threading.Event()
+    done = []
+    dispatcher.submit('s', gate.wait)
+    time.sleep(0.05)
+    assert dispatcher.submit('s', done.append, 1)
+
+    # 队列已满：溢出提交立即返回，不等待工作线程
+    start = time.monotonic()
+    for n in range(2, 6):
+        assert dispatcher.submit('s', done.append, n, spill=True)
+    assert time.monotonic() - start < 0.1
+    # 溢出列表非空时，即使队列有空位，后续任务也排在溢出任务之后
+    assert not dispatcher.submit('s', done.append, 99)
+    assert dispatcher.stats()['overflow_depths'] == [4]
+
+    gate.set()
+    dispatcher.join()
+    assert done == [1, 2, 3, 4, 5]
+    stats = dispatcher.stats()
+    assert stats['dropped'] == 1
+    assert stats['spilled'] == 4
+    assert stats['max_overflow'] == 4
+    assert stats['overflow_depths'] == [0]
+    dispatcher.shutdown()
+
+
+def test_shutdown_runs_spilled_tasks():
+    dispatcher = MessageDispatcher(workers=1, queue_size=1)
+    gate = threading.Event()
+    done = []
+    dispatcher.submit('s', gate.wait)
+    time.sleep(0.05)
+    for n in range(3):
+        dispatcher.submit('s', done.append, n, spill=True)
+    gate.set()
+    dispatcher.shutdown()
+    assert done == [0, 1, 2]
+
+
+def test_failed_handler_does_not_stop_worker():
+    dispatcher = MessageDispatcher(workers=1)
+    done = []
+
+    def boom():
+        raise RuntimeError("boom")
+
+    dispatcher.submit('s', boom)
+    dispatcher.submit('s', done.append, 1)
+    dispatcher.join()
+    dispatcher.shutdown()
+
+    assert done == [1]
+    assert dispatcher.stats()['failed'] == 1
@@ -0,0 +1,85 @@
+import contextlib
+import io
+import os
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+import chate2e.server.app as server_app
+from chate2e.client.file_transfer import (
+    FileTransfer, encode_file_message, parse_file_message
+)
+from chate2e.crypto.file_cipher import FileCipher
+from chate2e.server.blob_store import BlobStore, UploadError
+from chate2e.server.user import User
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(server_app, 'blob_store', BlobStore(str(tmp_path / "blobs")))
+    monkeypatch.setitem(server_app.chat_server.users, "uploader", User("uploader", "uploader"))
+    httpd = make_server('127.0.0.1', 0, server_app.app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_upload_and_download_roundtrip(server, tmp_path):
+    source = tmp_path / "source.bin"
+    data = os.urandom(10 * 1024 + 123)
+    source.write_bytes(data)
+
+    transfer = FileTransfer(server, chunk_size=1024)
+    progress = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        descriptor = transfer.upload_file(str(source), "uploader", ["receiver"],
+                                          progress=lambda done, total: progress.append(done))
+    assert progress[-1] == descriptor['encrypted_size']
+
+    # 描述经消息明文传递
+    received = parse_file_message(encode_file_message(descriptor))
+    target = tmp_path / "received.bin"
+    assert transfer.download_file(received, str(target), "receiver") == len(data)
+    assert target.read_bytes() == data
+    # 接收者凭描述中的令牌确认下载
+    assert server_app.blob_store._read_object_meta(descriptor['blob_id'])['pending'] == []
+
+    # 服务器上只有密文
+    stored = server_app.blob_store.open_blob(descriptor['blob_id'])
+    with open(stored, 'rb') as f:
+        assert data[:64] not in f.read()
+
+
+def test_parse_file_message_ignores_plain_text():
+    assert parse_file_message("hello") is None
+    assert parse_file_message(b"\xff\xfe") is None
+
+
+def test_resume_from_mid_chunk_offset(tmp_path):
+    source = tmp_path / "source.bin"
+    data = os.urandom(5000)
+    source.write_bytes(data)
+    cipher = FileCipher.generate(chunk_size=1024)
+    transfer = FileTransfer("http://unused", chunk_size=1024)
+    transfer.SEGMENT_CHUNKS = 100
+
+    with open(source, 'rb') as f:
+        full = b''.join(transfer._segment(f, cipher, len(data), 0))
+        resumed = b''.join(transfer._segment(f, cipher, len(data), 1500))
+    assert resumed == full[1500:]
+
+    store = BlobStore(str(tmp_path / "blobs"))
+    upload_id = store.create_upload(len(full), "uploader")
+    assert store.write_chunk(upload_id, 0, io.BytesIO(full[:1500])) == 1500
+    with pytest.raises(UploadError) as excinfo:
+        store.write_chunk(upload_id, 0, io.BytesIO(full))
+    assert excinfo.value.offset == 1500
+    store.write_chunk(upload_id, 1500, io.BytesIO(resumed))
+    blob_id = store.complete_upload(upload_id)
+
+    out = io.BytesIO()
+    with open(store.open_blob(blob_id), 'rb') as f:
+        cipher.decrypt_stream([f.read()], out, len(full))
+    assert out.getvalue() == data
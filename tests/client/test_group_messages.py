@@ -0,0 +1,68 @@
+import contextlib
+import io
+import threading
+import time
+
+import pytest
+
+from chate2e.client.client_server import ChatClient
+from chate2e.client.models import DataManager
+from chate2e.crypto.protocol.sender_key import GroupCipher, encode_sender_key_message
+
+
+@pytest.fixture
+def client(tmp_path):
+    chat_client = ChatClient("http://server.invalid", DataManager(None, str(tmp_path)))
+    chat_client.user_id = "bob"
+    received = []
+    chat_client.register_group_message_handler(lambda message, plaintext: received.append(plaintext))
+    chat_client.received = received
+    yield chat_client
+    chat_client.dispatcher.shutdown()
+
+
+@pytest.fixture
+def alice():
+    return GroupCipher()
+
+
+def distribution_text(alice: GroupCipher) -> str:
+    return encode_sender_key_message(alice.get_distribution("g1", "alice"))
+
+
+def test_stashed_messages_replay_without_dispatcher(client, alice, monkeypatch):
+    distribution = distribution_text(alice)
+    messages = [alice.encrypt("g1", "alice", f"m{i}") for i in range(3)]
+    for message in messages:
+        assert client._handle_group_message(message) is None
+    assert client.received == []
+
+    # 分发队列已满时也不能丢失暂存的消息
+    monkeypatch.setattr(client.dispatcher, 'submit', lambda *args, **kwargs: False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert client.consume_sender_key(distribution, "alice")
+    assert client.received == ["m0", "m1", "m2"]
+    assert client._pending_group_messages == {}
+
+
+def test_key_arriving_during_failed_decrypt_is_not_missed(client, alice):
+    distribution = distribution_text(alice)
+    message = alice.encrypt("g1", "alice", "hello")
+    threads = []
+
+    class RacingPending(dict):
+        def setdefault(self, key, default=None):
+            if not threads:
+                # 解密失败之后、暂存之前，发送者密钥在另一个分片中到达
+                thread = threading.Thread(target=client.consume_sender_key, args=(distribution, "alice"))
+                threads.append(thread)
+                thread.start()
+                time.sleep(0.05)
+            return super().setdefault(key, default)
+
+    client._pending_group_messages = RacingPending()
+    with contextlib.redirect_stdout(io.StringIO()):
+        client._handle_group_message(message)
+        threads[0].join(timeout=2)
+    assert client.received == ["hello"]
+    assert client._pending_group_messages == {}
@@ -0,0 +1,58 @@
+import pytest
+
+from chate2e.client.login_worker import LoginError, LoginStage, run_login_pipeline
+from chate2e.client.models import DataManager, UserProfile
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+
+
+@pytest.fixture
+def registered_dir(tmp_path):
+    """创建一个已注册用户的本地数据目录"""
+    protocol = SignalProtocol()
+    protocol.initialize_identity("login001")
+    data_manager = DataManager(None, str(tmp_path))
+    data_manager.register_user("alice", "password123", "login001",
+                               protocol.create_bundle(), protocol.create_local_bundle())
+    return str(tmp_path)
+
+
+def test_login_pipeline_loads_keys(registered_dir):
+    stages = []
+    protocol = SignalProtocol()
+    uuid = run_login_pipeline(DataManager(None, registered_dir), protocol,
+                              "alice", "password123", progress=stages.append)
+
+    assert uuid == "login001"
+    assert protocol.user_id == "login001"
+    assert protocol.identity_key is not None
+    assert len(protocol.one_time_prekeys) == protocol.MAX_ONE_TIME_PREKEYS
+    assert stages == [LoginStage.PROFILE, LoginStage.KDF, LoginStage.UNLOCK,
+                      LoginStage.KEYS, LoginStage.DONE]
+
+
+def test_login_pipeline_rejects_bad_credentials(registered_dir):
+    with pytest.raises(LoginError):
+        run_login_pipeline(DataManager(None, registered_dir), SignalProtocol(),
+                           "alice", "wrong")
+    with pytest.raises(LoginError):
+        run_login_pipeline(DataManager(None, registered_dir), SignalProtocol(),
+                           "nobody", "password123")
+
+
+def test_scrypt_password_round_trip():
+    user = UserProfile(user_id="u1", username="u", avatar_path="")
+    user.set_password("secret", kdf="scrypt")
+    restored = UserProfile.from_dict(user.to_dict())
+
+    assert restored.kdf == "scrypt"
+    assert restored.verify_password("secret")
+    assert not restored.verify_password("other")
+
+
+def test_legacy_profile_defaults_to_pbkdf2():
+    user = UserProfile(user_id="u1", username="u", avatar_path="")
+    user.set_password("secret", kdf="pbkdf2")
+    data = user.to_dict()
+    del data['kdf'], data['kdf_params']
+
+    assert UserProfile.from_dict(data).verify_password("secret")
@@ -0,0 +1,120 @@
+import contextlib
+import io
+import threading
+import time
+
+import pytest
+
+from chate2e.client import client_server
+from chate2e.client.client_server import ChatClient
+from chate2e.client.dispatcher import MessageDispatcher
+from chate2e.client.models import DataManager
+from chate2e.model.message import Message, MessageType
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self.payload
+
+
+def make_message(n: int, session_id: str = "s1") -> dict:
+    return Message(
+        message_id=f"m{n}",
+        sender_id="peer",
+        session_id=session_id,
+        receiver_id="other-user",  # 不是发给本用户的消息，处理时直接跳过
+        encrypted_content=b"x",
+        message_type=MessageType.MESSAGE
+    ).to_dict()
+
+
+@pytest.fixture
+def client(tmp_path):
+    chat_client = ChatClient("http://server.invalid", DataManager(None, str(tmp_path)))
+    chat_client.user_id = "me"
+    yield chat_client
+    chat_client.dispatcher.shutdown()
+
+
+def test_live_messages_held_during_sync_run_after_it(client, monkeypatch):
+    handled = []
+    monkeypatch.setattr(client, '_handle_new_message', lambda data, received_at=None: handled.append(data['header']['message_id']))
+    on_new_message = client.sio.handlers['/']['new_message']
+
+    client._held_live = []
+    on_new_message(make_message(1))
+    on_new_message(make_message(2))
+    client.dispatcher.join()
+    assert handled == []
+
+    client._release_live_messages()
+    assert handled == ["m1", "m2"]
+    assert client._held_live is None
+
+    on_new_message(make_message(3))
+    client.dispatcher.join()
+    assert handled == ["m1", "m2", "m3"]
+
+
+def test_page_is_acked_after_it_is_persisted(client, monkeypatch):
+    events = []
+    pages = {0: {'messages': [make_message(1), make_message(2)], 'cursor': 2, 'has_more': True},
+             2: {'messages': [make_message(3)], 'cursor': 3, 'has_more': False}}
+    monkeypatch.setattr(client_server.requests, 'get',
+                        lambda url, params, timeout: FakeResponse(pages[params['cursor']]))
+    monkeypatch.setattr(client_server.requests, 'post',
+                        lambda url, json, timeout: events.append(('ack', json['cursor'])) or FakeResponse({}))
+    monkeypatch.setattr(client.data_manager, 'add_messages', lambda batch: events.append(('persist',)))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        iterator = client.iter_offline_messages(limit=2)
+        next(iterator)
+    # 产出第一条消息之前，第一页已经保存并确认
+    assert events == [('persist',), ('ack', 2)]
+
+
+def test_page_is_not_acked_when_persisting_fails(client, monkeypatch):
+    acks = []
+    page = {'messages': [make_message(1)], 'cursor': 1, 'has_more': False}
+    monkeypatch.setattr(client_server.requests, 'get', lambda url, params, timeout: FakeResponse(page))
+    monkeypatch.setattr(client_server.requests, 'post',
+                        lambda url, json, timeout: acks.append(json['cursor']) or FakeResponse({}))
+
+    def fail(batch):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(client.data_manager, 'add_messages', fail)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert list(client.iter_offline_messages()) == []
+    assert acks == []
+
+
+def test_connect_schedules_login_even_when_shard_is_full(client, monkeypatch):
+    monkeypatch.setattr(client.sio, 'connect', lambda *args, **kwargs: None)
+    client.dispatcher.shutdown()
+    client.dispatcher = MessageDispatcher(workers=1, queue_size=1)
+    logged_in = threading.Event()
+    monkeypatch.setattr(client, '_login_and_sync', logged_in.set)
+    gate = threading.Event()
+    client.dispatcher.submit("busy", gate.wait)
+    time.sleep(0.05)
+    client.dispatcher.submit("busy", lambda: None)
+
+    assert client.connect_sync()
+    gate.set()
+    assert logged_in.wait(timeout=2)
+
+
+def test_connect_fails_when_login_cannot_be_scheduled(client, monkeypatch):
+    disconnected = []
+    monkeypatch.setattr(client.sio, 'connect', lambda *args, **kwargs: None)
+    monkeypatch.setattr(client.sio, 'disconnect', lambda: disconnected.append(True))
+    client.dispatcher.shutdown()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert not client.connect_sync()
+    assert disconnected == [True]
@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import uuid
+
+import pytest
+
+from chate2e.client.models import DataManager
+from chate2e.client.secure_store import EncryptedRecordLog, SecureStore
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+from chate2e.model.message import Message, MessageType
+
+
+@pytest.fixture
+def store():
+    return SecureStore(os.urandom(32))
+
+
+def test_record_log_round_trip(store, tmp_path):
+    path = str(tmp_path / "records.log")
+    log = store.open_log(path, b"test")
+    log.append({'n': 0})
+    log.append_many([{'n': 1}, {'n': 2}])
+
+    reopened = store.open_log(path, b"test")
+    assert len(reopened) == 3
+    assert [record['n'] for record in reopened] == [0, 1, 2]
+
+
+def test_record_log_rejects_wrong_key_or_context(store, tmp_path):
+    path = str(tmp_path / "records.log")
+    store.open_log(path, b"test").append({'secret': 'value'})
+
+    with pytest.raises(ValueError):
+        list(SecureStore(os.urandom(32)).open_log(path, b"test"))
+    with pytest.raises(ValueError):
+        list(store.open_log(path, b"other"))
+
+
+def test_record_log_truncates_partial_tail(store, tmp_path):
+    path = str(tmp_path / "records.log")
+    store.open_log(path, b"test").append_many([{'n': 0}, {'n': 1}])
+    with open(path, 'ab') as f:
+        f.write(b'\x00\x00\x01\x00partial')
+
+    log = store.open_log(path, b"test")
+    assert len(log) == 2
+    log.append({'n': 2})
+    assert [record['n'] for record in log] == [0, 1, 2]
+
+
+def test_record_log_concurrent_appends_keep_unique_indexes(store, tmp_path):
+    path = str(tmp_path / "records.log")
+    log = store.open_log(path, b"test")
+
+    def writer(worker):
+        for n in range(200):
+            log.append({'worker': worker, 'n': n})
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    records = list(store.open_log(path, b"test"))
+    assert len(records) == 800
+    for worker in range(4):
+        assert [r['n'] for r in records if r['worker'] == worker] == list(range(200))
+
+
+def test_record_log_skips_corrupt_record(store, tmp_path):
+    path = str(tmp_path / "records.log")
+    store.open_log(path, b"test").append_many([{'n': 0}, {'n': 1}, {'n': 2}])
+    with open(path, 'r+b') as f:
+        # 破坏第二条记录的密文（第一条记录之后，跳过长度前缀与nonce）
+        (first_length,) = EncryptedRecordLog.LENGTH.unpack(f.read(4))
+        f.seek(4 + first_length + 4 + 20)
+        f.write(b'\xff\xff\xff\xff')
+
+    assert [record['n'] for record in store.open_log(path, b"test")] == [0, 2]
+
+
+def test_data_manager_encrypts_at_rest(tmp_path):
+    protocol = SignalProtocol()
+    protocol.initialize_identity("enc001")
+    data_manager = DataManager(None, str(tmp_path))
+    assert data_manager.register_user("alice", "password123", "enc001",
+                                      protocol.create_bundle(), protocol.create_local_bundle())
+
+    session = data_manager.get_or_create_session("peer001")
+    message = Message(
+        message_id=str(uuid.uuid4()),
+        session_id=session.session_id,
+        sender_id="enc001",
+        receiver_id="peer001",
+        encrypted_content=b"top secret text",
+        message_type=MessageType.MESSAGE
+    )
+    data_manager.add_message(session.session_id, message)
+
+    # 磁盘上不应出现私钥或消息明文
+    with open(data_manager.user_file, encoding='utf-8') as f:
+        profile = json.load(f)
+    assert profile['localBundle'] is None
+    assert profile['sealedLocalBundle']
+    with open(data_manager.sessions_file, encoding='utf-8') as f:
+        assert json.load(f)[0]['messages'] == []
+    with open(data_manager.messages_file, 'rb') as f:
+        assert b"top secret" not in f.read()
+
+    # 重新登录后可以解密恢复
+    restored = DataManager(None, str(tmp_path))
+    restored.find_user_profile("alice")
+    restored.unlock("password123")
+    restored.load_sessions()
+    assert restored.get_local_bundle().identity_key_pair.private_key == \
+        protocol.create_local_bundle().identity_key_pair.private_key
+    restored_session = restored.sessions[session.session_id]
+    assert [m.header.message_id for m in restored_session.messages] == [message.header.message_id]
+    assert restored_session.last_message.encrypted_content == b"top secret text"
+
+
+def test_data_manager_concurrent_writers(tmp_path):
+    protocol = SignalProtocol()
+    protocol.initialize_identity("enc002")
+    data_manager = DataManager(None, str(tmp_path))
+    assert data_manager.register_user("bob", "password123", "enc002",
+                                      protocol.create_bundle(), protocol.create_local_bundle())
+
+    def writer(worker):
+        session = data_manager.get_or_create_session_with_id(f"session{worker}", f"peer{worker}")
+        for n in range(50):
+            data_manager.add_message(session.session_id, Message(
+                message_id=f"{worker}-{n}",
+                session_id=session.session_id,
+                sender_id=f"peer{worker}",
+                receiver_id="enc002",
+                encrypted_content=b"hello",
+                message_type=MessageType.MESSAGE
+            ))
+            if n % 10 == 0:
+                data_manager.save_data()
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    restored = DataManager(None, str(tmp_path))
+    restored.find_user_profile("bob")
+    restored.unlock("password123")
+    restored.load_sessions()
+    for worker in range(4):
+        messages = restored.sessions[f"session{worker}"].messages
+        assert [m.header.message_id for m in messages] == [f"{worker}-{n}" for n in range(50)]
@@ -0,0 +1,45 @@
+import threading
+
+from chate2e.client.send_worker import MessageSendWorker, create_send_pool
+
+
+class FakeClient:
+    def __init__(self, result=True):
+        self.result = result
+        self.sent = []
+        self.threads = set()
+
+    def send_text_sync(self, peer_id, session_id, text):
+        self.threads.add(threading.get_ident())
+        if isinstance(self.result, Exception):
+            raise self.result
+        self.sent.append((peer_id, session_id, text))
+        return self.result
+
+
+def run_worker(client):
+    worker = MessageSendWorker(client, "bob", "s1", "hello")
+    events = []
+    worker.signals.succeeded.connect(lambda: events.append('ok'))
+    worker.signals.failed.connect(events.append)
+    worker.run()
+    return events
+
+
+def test_worker_reports_result():
+    client = FakeClient()
+    assert run_worker(client) == ['ok']
+    assert client.sent == [("bob", "s1", "hello")]
+    assert run_worker(FakeClient(result=False)) == ["消息发送失败"]
+    assert run_worker(FakeClient(result=RuntimeError("boom"))) == ["消息发送失败: boom"]
+
+
+def test_send_pool_keeps_order_off_caller_thread():
+    client = FakeClient()
+    pool = create_send_pool()
+    for index in range(20):
+        pool.start(MessageSendWorker(client, "bob", "s1", str(index)))
+    assert pool.waitForDone(5000)
+
+    assert [text for _, _, text in client.sent] == [str(index) for index in range(20)]
+    assert threading.get_ident() not in client.threads
@@ -0,0 +1,92 @@
+import pytest
+
+from chate2e.client.user_cache import UserCache
+
+
+class FakeServer:
+    def __init__(self):
+        self.users = {
+            'u1': {'username': 'alice', 'fingerprint': 'f1', 'etag': 'e1'},
+            'u2': {'username': 'bob', 'fingerprint': 'f2', 'etag': 'e2'},
+        }
+        self.calls = []
+        self.down = False
+
+    def __call__(self, user_ids, known):
+        self.calls.append((list(user_ids), dict(known)))
+        if self.down:
+            return None
+        users, unchanged, missing = {}, [], []
+        for user_id in user_ids:
+            info = self.users.get(user_id)
+            if info is None:
+                missing.append(user_id)
+            elif known.get(user_id) == info['etag']:
+                unchanged.append(user_id)
+            else:
+                users[user_id] = dict(info)
+        return {'users': users, 'unchanged': unchanged, 'missing': missing}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_batch_miss_then_hit(server, clock):
+    cache = UserCache(server, ttl=10, clock=clock)
+    result = cache.get_many(['u1', 'u2', 'nobody'])
+    assert {k: v['username'] for k, v in result.items()} == {'u1': 'alice', 'u2': 'bob'}
+    assert len(server.calls) == 1
+
+    assert cache.get('u1')['username'] == 'alice'
+    assert len(server.calls) == 1
+    stats = cache.stats()
+    assert stats['misses'] == 3
+    assert stats['hits'] == 1
+
+
+def test_expired_entries_are_revalidated_with_etag(server, clock):
+    cache = UserCache(server, ttl=10, clock=clock)
+    cache.get_many(['u1', 'u2'])
+    clock.now = 11
+    server.users['u2'] = {'username': 'bobby', 'fingerprint': 'f2b', 'etag': 'e2b'}
+
+    result = cache.get_many(['u1', 'u2'])
+    assert server.calls[-1] == (['u1', 'u2'], {'u1': 'e1', 'u2': 'e2'})
+    assert result['u1']['username'] == 'alice'
+    assert result['u2']['username'] == 'bobby'
+    stats = cache.stats()
+    assert stats['revalidated'] == 1
+    assert stats['refreshed'] == 1
+
+
+def test_stale_entry_served_when_server_unreachable(server, clock):
+    cache = UserCache(server, ttl=10, clock=clock)
+    cache.get('u1')
+    clock.now = 11
+    server.down = True
+    assert cache.get('u1')['username'] == 'alice'
+    assert cache.get('u2') is None
+
+
+def test_lru_eviction(server, clock):
+    cache = UserCache(server, maxsize=1, clock=clock)
+    cache.get('u1')
+    cache.get('u2')
+    assert cache.stats()['evictions'] == 1
+    cache.get('u1')
+    assert len(server.calls) == 3
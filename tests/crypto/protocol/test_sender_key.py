@@ -0,0 +1,79 @@
+import pytest
+
+from chate2e.crypto.protocol.sender_key import (GroupCipher, encode_sender_key_message,
+                                                parse_sender_key_message)
+from chate2e.model.message import Message, MessageType
+
+
+@pytest.fixture
+def members():
+    """alice、bob、carol互相交换了发送者密钥"""
+    ciphers = {name: GroupCipher() for name in ("alice", "bob", "carol")}
+    for sender, cipher in ciphers.items():
+        distribution = cipher.get_distribution("g1", sender)
+        for receiver, other in ciphers.items():
+            if receiver != sender:
+                other.process_distribution(distribution)
+    return ciphers
+
+
+def roundtrip(message: Message) -> Message:
+    return Message.deserialize(message.serialize())
+
+
+def test_one_ciphertext_for_all_members(members):
+    message = members["alice"].encrypt("g1", "alice", "你好，群组")
+    assert message.header.message_type == MessageType.BROADCAST
+    assert message.header.receiver_id == "g1"
+    wire = roundtrip(message)
+    assert members["bob"].decrypt(wire) == "你好，群组"
+    assert members["carol"].decrypt(roundtrip(message)) == "你好，群组"
+
+
+def test_out_of_order_and_replay(members):
+    messages = [members["alice"].encrypt("g1", "alice", f"m{i}") for i in range(3)]
+    bob = members["bob"]
+    assert bob.decrypt(roundtrip(messages[2])) == "m2"
+    assert bob.decrypt(roundtrip(messages[0])) == "m0"
+    assert bob.decrypt(roundtrip(messages[1])) == "m1"
+    with pytest.raises(ValueError):
+        bob.decrypt(roundtrip(messages[1]))
+
+
+def test_member_cannot_impersonate_sender(members):
+    # carol持有alice的链密钥，但没有alice的签名私钥
+    forged = members["carol"].encrypt("g1", "carol", "我是alice")
+    forged.header.sender_id = "alice"
+    with pytest.raises(ValueError):
+        members["bob"].decrypt(roundtrip(forged))
+
+
+def test_failed_decryption_keeps_chain(members):
+    message = members["alice"].encrypt("g1", "alice", "原文")
+    tampered = roundtrip(message)
+    tampered.encrypted_content = bytes([tampered.encrypted_content[0] ^ 1]) + tampered.encrypted_content[1:]
+    with pytest.raises(ValueError):
+        members["bob"].decrypt(tampered)
+    assert members["bob"].decrypt(roundtrip(message)) == "原文"
+
+
+def test_rotation_excludes_removed_member(members):
+    alice = members["alice"]
+    in_flight = alice.encrypt("g1", "alice", "轮换前")
+    alice.rotate("g1")
+    members["bob"].process_distribution(alice.get_distribution("g1", "alice"))
+
+    message = alice.encrypt("g1", "alice", "轮换后")
+    assert members["bob"].decrypt(roundtrip(message)) == "轮换后"
+    assert members["bob"].decrypt(roundtrip(in_flight)) == "轮换前"
+    with pytest.raises(KeyError):
+        members["carol"].decrypt(roundtrip(message))
+
+
+def test_distribution_message_encoding(members):
+    distribution = members["alice"].get_distribution("g1", "alice")
+    text = encode_sender_key_message(distribution)
+    assert parse_sender_key_message(text) == distribution
+    assert parse_sender_key_message(text.encode('utf-8')) == distribution
+    assert parse_sender_key_message("普通消息") is None
+    assert parse_sender_key_message("chate2e-sender-key:{}") is None
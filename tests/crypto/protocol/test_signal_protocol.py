@@ -106,13 +106,14 @@ class TestSignalProtocol:
         alice.set_peer_bundle("bob", bob_bundle)
         bob.set_peer_bundle("alice", alice_bundle)
 
-        alice.initiate_session(
+        init_message = alice.initiate_session(
             peer_id="bob",
             session_id=session_id,
             recipient_identity_key=bob.identity_key_pub,
             recipient_signed_prekey=bob.signed_prekey_pub,
             recipient_one_time_prekey=bob.one_time_prekeys_pub[0],
-            is_initiator=True
+            is_initiator=True,
+            peer_codecs=bob_bundle.codecs
         )
         
         bob.initiate_session(
@@ -122,7 +123,8 @@ class TestSignalProtocol:
             recipient_signed_prekey=alice.signed_prekey_pub,
             recipient_ephemeral_key=alice.ephemeral_key_pub,
             own_one_time_prekey=bob.one_time_prekeys_pub[0],
-            is_initiator=False
+            is_initiator=False,
+            peer_codecs=init_message.X3DHparams.codecs
         )
 
         # 测试消息交换
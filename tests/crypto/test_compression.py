@@ -0,0 +1,113 @@
+import os
+import zlib
+
+import pytest
+
+from chate2e.crypto.compression import CHAT_DICTIONARY, ZLIB_CODEC, MessageCompressor
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+from chate2e.model.message import Message
+
+LOG_TEXT = "\n".join(
+    f"2024-05-01T12:00:{index:02d}.000Z [ERROR] request {index} failed: KeyError: 'user_id'"
+    for index in range(40)
+)
+
+
+def make_session(alice_codecs=None, bob_codecs=None):
+    alice, bob = SignalProtocol(), SignalProtocol()
+    alice.initialize_identity("alice")
+    bob.initialize_identity("bob")
+    if alice_codecs is not None:
+        alice.codecs = alice_codecs
+    if bob_codecs is not None:
+        bob.codecs = bob_codecs
+    init = alice.initiate_session(
+        peer_id="bob", session_id="s1",
+        recipient_identity_key=bob.identity_key_pub,
+        recipient_signed_prekey=bob.signed_prekey_pub,
+        recipient_one_time_prekey=bob.one_time_prekeys_pub[0],
+        is_initiator=True,
+        peer_codecs=bob.create_bundle().codecs
+    )
+    init = Message.deserialize(init.serialize())
+    bob.initiate_session(
+        peer_id="alice", session_id="s1",
+        recipient_identity_key=alice.identity_key_pub,
+        recipient_signed_prekey=alice.signed_prekey_pub,
+        recipient_ephemeral_key=alice.ephemeral_key_pub,
+        own_one_time_prekey=bob.one_time_prekeys_pub[0],
+        is_initiator=False,
+        peer_codecs=init.X3DHparams.codecs
+    )
+    return alice, bob
+
+
+def test_round_trip():
+    compressor = MessageCompressor()
+    data = LOG_TEXT.encode('utf-8')
+    codec, payload = compressor.compress(data, ZLIB_CODEC)
+    assert codec == ZLIB_CODEC
+    assert len(payload) < len(data)
+    assert compressor.decompress(payload, codec) == data
+    assert compressor.decompress(memoryview(payload), codec) == data
+
+
+def test_small_or_incompressible_payload_is_sent_as_is():
+    compressor = MessageCompressor()
+    assert compressor.compress(b"hello", ZLIB_CODEC) == (None, b"hello")
+    noise = os.urandom(4096)
+    assert compressor.compress(noise, ZLIB_CODEC) == (None, noise)
+    assert compressor.compress(LOG_TEXT.encode('utf-8'), None)[0] is None
+
+
+def test_rejects_bombs_and_truncated_data():
+    compressor = MessageCompressor(max_size=1024)
+    bomb = zlib.compressobj(zdict=CHAT_DICTIONARY)
+    payload = bomb.compress(bytes(1024 * 1024)) + bomb.flush()
+    with pytest.raises(ValueError):
+        compressor.decompress(payload, ZLIB_CODEC)
+    with pytest.raises(ValueError):
+        compressor.decompress(payload[:8], ZLIB_CODEC)
+    with pytest.raises(ValueError):
+        compressor.decompress(b"abc", "lz4")
+
+
+def test_negotiation():
+    assert MessageCompressor.negotiate(("zstd-d1", "zlib-d1"), ["zlib-d1"]) == "zlib-d1"
+    assert MessageCompressor.negotiate(("zlib-d1",), ()) is None
+    # 填充能力不是压缩算法
+    assert MessageCompressor.negotiate(("pad-v1", "zlib-d1"), ["pad-v1"]) is None
+
+
+def test_session_compresses_long_messages_both_ways():
+    alice, bob = make_session()
+    assert alice.send_codec is not None and alice.send_codec == bob.send_codec
+
+    message = Message.deserialize(alice.encrypt_message(LOG_TEXT).serialize())
+    assert message.encryption.codec == alice.send_codec
+    assert len(message.encrypted_content) < len(LOG_TEXT)
+    assert bob.decrypt_message(message) == LOG_TEXT
+
+    reply = bob.encrypt_message(LOG_TEXT)
+    assert reply.encryption.codec is not None
+    assert alice.decrypt_message(reply) == LOG_TEXT
+
+    short = alice.encrypt_message("好的")
+    assert short.encryption.codec is None
+    assert bob.decrypt_message(short) == "好的"
+
+
+def test_peer_without_compression_gets_plain_messages():
+    alice, bob = make_session(bob_codecs=())
+    assert alice.send_codec is None and bob.send_codec is None
+    message = alice.encrypt_message(LOG_TEXT)
+    assert message.encryption.codec is None
+    assert bob.decrypt_message(message) == LOG_TEXT
+
+
+def test_codec_flag_is_authenticated():
+    alice, bob = make_session()
+    message = alice.encrypt_message(LOG_TEXT)
+    message.encryption.codec = None
+    with pytest.raises(Exception, match="decryption failed"):
+        bob.decrypt_message(message)
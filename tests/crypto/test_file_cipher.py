@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+from chate2e.crypto.file_cipher import FileCipher
+
+
+def encrypt_all(cipher: FileCipher, data: bytes) -> bytes:
+    return b''.join(cipher.encrypt_stream(io.BytesIO(data), len(data)))
+
+
+@pytest.mark.parametrize("size", [0, 1, 63, 64, 65, 640, 1000])
+def test_roundtrip_with_arbitrary_splits(size):
+    cipher = FileCipher.generate(chunk_size=64)
+    data = bytes(range(256)) * 4
+    data = data[:size]
+    encrypted = encrypt_all(cipher, data)
+    assert len(encrypted) == cipher.encrypted_size(size)
+
+    # 接收端收到的数据切分方式与块边界无关
+    pieces = [encrypted[i:i + 7] for i in range(0, len(encrypted), 7)]
+    out = io.BytesIO()
+    receiver = FileCipher.from_dict(cipher.to_dict())
+    assert receiver.decrypt_stream(pieces, out, len(encrypted)) == size
+    assert out.getvalue() == data
+
+
+def test_encryption_is_deterministic_for_resume():
+    cipher = FileCipher.generate(chunk_size=64)
+    data = b"x" * 300
+    first = encrypt_all(cipher, data)
+    resumed = b''.join(cipher.encrypt_stream(io.BytesIO(data), len(data), start_chunk=2))
+    assert resumed == first[2 * cipher.encrypted_chunk_size:]
+
+
+def test_truncation_is_detected():
+    cipher = FileCipher.generate(chunk_size=64)
+    data = b"y" * 200
+    encrypted = encrypt_all(cipher, data)
+    # 去掉最后一块，剩下的块边界完整但不是"最后一块"
+    truncated = encrypted[:3 * cipher.encrypted_chunk_size]
+    with pytest.raises(ValueError):
+        cipher.decrypt_stream([truncated], io.BytesIO(), len(truncated))
+
+
+def test_reordered_chunks_fail():
+    cipher = FileCipher.generate(chunk_size=64)
+    encrypted = encrypt_all(cipher, b"z" * 200)
+    block = cipher.encrypted_chunk_size
+    swapped = encrypted[block:2 * block] + encrypted[:block] + encrypted[2 * block:]
+    with pytest.raises(ValueError):
+        cipher.decrypt_stream([swapped], io.BytesIO(), len(swapped))
+
+
+def test_wrong_key_fails():
+    cipher = FileCipher.generate(chunk_size=64)
+    encrypted = encrypt_all(cipher, b"secret")
+    other = FileCipher.generate(chunk_size=64)
+    with pytest.raises(ValueError):
+        other.decrypt_stream([encrypted], io.BytesIO(), len(encrypted))
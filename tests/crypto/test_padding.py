@@ -0,0 +1,107 @@
+import pytest
+
+from chate2e.crypto.padding import PADDING_CAPABILITY, MessagePadding, padme_length, pow2_length
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+from chate2e.model.message import Message
+
+
+def make_session(bob_codecs=None, tamper_bundle=None, tamper_initiate=None):
+    alice, bob = SignalProtocol(), SignalProtocol()
+    alice.initialize_identity("alice")
+    bob.initialize_identity("bob")
+    if bob_codecs is not None:
+        bob.codecs = bob_codecs
+    init = alice.initiate_session(
+        peer_id="bob", session_id="s1",
+        recipient_identity_key=bob.identity_key_pub,
+        recipient_signed_prekey=bob.signed_prekey_pub,
+        recipient_one_time_prekey=bob.one_time_prekeys_pub[0],
+        is_initiator=True,
+        peer_codecs=(tamper_bundle or tuple)(bob.create_bundle().codecs)
+    )
+    bob.initiate_session(
+        peer_id="alice", session_id="s1",
+        recipient_identity_key=alice.identity_key_pub,
+        recipient_signed_prekey=alice.signed_prekey_pub,
+        recipient_ephemeral_key=alice.ephemeral_key_pub,
+        own_one_time_prekey=bob.one_time_prekeys_pub[0],
+        is_initiator=False,
+        peer_codecs=(tamper_initiate or tuple)(init.X3DHparams.codecs)
+    )
+    return alice, bob
+
+
+def test_policy_lengths():
+    assert [pow2_length(n) for n in (1, 2, 3, 33, 64, 65)] == [1, 2, 4, 64, 64, 128]
+    assert [padme_length(n) for n in (9, 100, 1000, 1025)] == [10, 104, 1024, 1088]
+    for length in range(2, 100_000, 97):
+        assert length <= padme_length(length) <= length * 1.125 + 1
+
+
+def test_pad_unpad_round_trip_without_copy():
+    padding = MessagePadding('padme', min_size=32)
+    for data in (b"", b"hi", "你好".encode('utf-8') * 300):
+        padded = padding.pad(data)
+        assert len(padded) == padding.padded_length(len(data))
+        assert len(padded) >= 32
+        view = MessagePadding.unpad(padded)
+        assert view == data
+        assert view.obj is padded
+
+
+def test_short_messages_share_one_length():
+    padding = MessagePadding('pow2', min_size=32)
+    assert {len(padding.pad(b"x" * n)) for n in range(28)} == {32}
+
+
+def test_invalid_padding_rejected():
+    with pytest.raises(ValueError):
+        MessagePadding.unpad(b"\x00\x00")
+    with pytest.raises(ValueError):
+        MessagePadding.unpad(b"abc\x00\x00\x00\xff")
+    with pytest.raises(ValueError):
+        MessagePadding('random')
+
+
+def test_session_pads_messages():
+    alice, bob = make_session()
+    assert alice.send_padding == bob.send_padding == alice.padding.policy
+    lengths = set()
+    for text in ("好", "好的", "明天见", "ok"):
+        message = Message.deserialize(alice.encrypt_message(text).serialize())
+        assert message.encryption.padding == alice.padding.policy
+        lengths.add(len(message.encrypted_content))
+        assert bob.decrypt_message(message) == text
+    assert len(lengths) == 1
+
+
+def test_old_peer_gets_unpadded_messages():
+    alice, bob = make_session(bob_codecs=())
+    assert PADDING_CAPABILITY in alice.codecs
+    assert alice.send_padding is None
+    message = alice.encrypt_message("hello")
+    assert message.encryption.padding is None
+    assert len(message.encrypted_content) == 5
+    assert bob.decrypt_message(message) == "hello"
+
+
+def test_padding_flag_is_authenticated():
+    alice, bob = make_session()
+    message = alice.encrypt_message("hello")
+    message.encryption.padding = None
+    with pytest.raises(Exception, match="decryption failed"):
+        bob.decrypt_message(message)
+
+
+def strip_padding(codecs):
+    return tuple(codec for codec in codecs if codec != PADDING_CAPABILITY)
+
+
+@pytest.mark.parametrize('side', ['bundle', 'initiate'])
+def test_stripped_capability_breaks_session(side):
+    # 服务器去掉转发的填充能力以降级时，两端派生的根密钥不同
+    alice, bob = make_session(**{f'tamper_{side}': strip_padding})
+    with pytest.raises(Exception):
+        bob.decrypt_message(alice.encrypt_message("hello"))
+    with pytest.raises(Exception):
+        alice.decrypt_message(bob.encrypt_message("hello"))
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from chate2e.model.message import Encryption, Message, MessageType, MessageView, X3DHparams
+from chate2e.utils.tracing import TraceContext
+
+
+def make_message(**kwargs) -> Message:
+    fields = dict(
+        message_id=Message.generate_id(),
+        sender_id="alice",
+        session_id="session-1",
+        receiver_id="bob",
+        encrypted_content=b"ciphertext",
+        message_type=MessageType.MESSAGE,
+        encryption=Encryption("AES-GCM", b"iv", b"tag", True),
+        timestamp=1.5
+    )
+    fields.update(kwargs)
+    return Message(**fields)
+
+
+def test_instances_have_no_dict():
+    message = make_message(X3DHparams=X3DHparams(b"ik", b"spk", b"opk", b"ek"))
+    for obj in (message, message.header, message.encryption, message.X3DHparams):
+        assert not hasattr(obj, '__dict__')
+    with pytest.raises(AttributeError):
+        message.header.unknown_field = 1
+
+
+def test_ids_are_interned_and_type_is_enum():
+    # 从JSON解析出的ID是各自独立的字符串对象
+    first = Message.from_dict(json.loads(make_message().serialize()))
+    second = Message.from_dict(json.loads(make_message().serialize()))
+    assert first.header.sender_id is second.header.sender_id
+    assert first.header.session_id is second.header.session_id
+    assert first.header.message_type is MessageType.MESSAGE
+    assert make_message(message_type=3).header.message_type is MessageType.BROADCAST
+
+
+def test_from_dict_does_not_mutate_input():
+    data = make_message(X3DHparams=X3DHparams(b"ik", b"spk", b"opk", b"ek")).to_dict()
+    snapshot = json.loads(json.dumps(data))
+    restored = Message.from_dict(data)
+    assert data == snapshot
+    assert restored.to_dict() == snapshot
+
+
+def test_view_routes_without_decoding():
+    data = make_message(message_type=MessageType.INITIATE,
+                        X3DHparams=X3DHparams(b"ik", b"spk", b"opk", b"ek")).to_dict()
+    snapshot = json.loads(json.dumps(data))
+    view = MessageView.from_dict(data)
+    assert view.header.sender_id == "alice" and view.header.message_type is MessageType.INITIATE
+    # 原始dict原样转发
+    assert view.to_dict() is data
+    assert data == snapshot
+    assert view.to_message().to_dict() == snapshot
+
+
+def test_view_stamps_trace_into_forwarded_dict():
+    trace = TraceContext()
+    trace.mark('client.send')
+    data = make_message(trace=trace).to_dict()
+    view = MessageView.from_dict(data)
+    view.header.trace.mark('server.received')
+    assert [stage for stage, _ in data['header']['trace']['stages']] == ['client.send', 'server.received']
+
+
+@pytest.mark.parametrize('mutate', [
+    lambda data: data.pop('header'),
+    lambda data: data['header'].pop('receiver_id'),
+    lambda data: data['header'].update(sender_id=42),
+    lambda data: data['header'].update(message_type=99),
+    lambda data: data.update(encrypted_content=None),
+    lambda data: data['header'].update(trace="not-a-dict"),
+    lambda data: data['header'].update(trace=['id', []]),
+    lambda data: data['header'].update(trace={'stages': []}),
+    lambda data: data['header'].update(trace={'id': 7, 'stages': []}),
+])
+def test_view_rejects_malformed_routing_fields(mutate):
+    data = make_message().to_dict()
+    mutate(data)
+    with pytest.raises(ValueError):
+        MessageView.from_dict(data)
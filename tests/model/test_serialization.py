@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+
+import pytest
+
+from chate2e.client.models import ChatSession, DataManager, UserProfile, UserStatus
+from chate2e.model.message import Encryption, Message, MessageType
+from chate2e.utils import serialization
+from chate2e.utils.serialization import SerializationError, StdlibBackend, create_backend
+
+BACKENDS = ['stdlib'] + [name for name, module in (('orjson', serialization.orjson),
+                                                   ('msgspec', serialization.msgspec)) if module]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    previous = serialization.set_backend(create_backend(request.param))
+    yield request.param
+    serialization.set_backend(previous)
+
+
+def make_message() -> Message:
+    return Message(
+        message_id=Message.generate_id(),
+        sender_id="alice",
+        session_id="session-1",
+        receiver_id="bob",
+        encrypted_content=b"ciphertext",
+        message_type=MessageType.MESSAGE,
+        encryption=Encryption("AES-GCM", b"iv", b"tag", True),
+        timestamp=1.5
+    )
+
+
+def test_output_matches_stdlib_json(backend):
+    obj = {'name': '张三', 'count': 3, 'ratio': 0.25, 'items': [None, True, "x"]}
+    data = serialization.dumps(obj)
+    assert isinstance(data, bytes)
+    assert json.loads(data) == obj
+    assert '张三'.encode('utf-8') in data  # 非ASCII字符不转义
+    assert json.loads(serialization.dumps(obj, pretty=True)) == obj
+    assert serialization.loads(json.dumps(obj)) == obj
+
+
+def test_message_round_trip(backend):
+    message = make_message()
+    restored = Message.deserialize(message.serialize())
+    assert restored.to_dict() == message.to_dict()
+    assert Message.deserialize(message.serialize().encode('utf-8')).to_dict() == message.to_dict()
+
+
+def test_invalid_input_raises_value_error(backend):
+    with pytest.raises(SerializationError):
+        serialization.loads(b'{"header": ')
+    with pytest.raises(SerializationError):
+        serialization.decode(b'[1, 2]', Message)
+    with pytest.raises(ValueError):
+        serialization.decode(b'{"header": {}}', Message)
+    with pytest.raises(SerializationError):
+        serialization.dumps({'bad': object()})
+
+
+def test_data_manager_files_readable_by_other_backends(backend, tmp_path):
+    manager = DataManager("test001", str(tmp_path))
+    manager.set_user(UserProfile(user_id="test001", username="测试用户",
+                                 avatar_path="a.png", status=UserStatus.ONLINE))
+    session = manager.get_or_create_session("friend001")
+    manager.add_message(session.session_id, make_message())
+    manager.save_data()
+
+    previous = serialization.set_backend(StdlibBackend())
+    try:
+        reloaded = DataManager("test001", str(tmp_path))
+    finally:
+        serialization.set_backend(previous)
+    assert reloaded.user.username == "测试用户"
+    assert [s.session_id for s in reloaded.sessions.values()] == [session.session_id]
+    assert isinstance(reloaded.sessions[session.session_id], ChatSession)
+    assert len(reloaded.sessions[session.session_id].messages) == 1
+
+
+def test_unknown_backend_falls_back_or_fails():
+    with pytest.raises(ValueError):
+        create_backend('yaml')
+    if serialization.msgspec is None:
+        assert create_backend('msgspec').name == 'stdlib'
+
+
+def test_incomplete_backend_cannot_be_created():
+    class DumpsOnly(serialization._Backend):
+        def dumps(self, obj, pretty=False):
+            return b"{}"
+
+    with pytest.raises(TypeError):
+        DumpsOnly()
+
+
+def test_concurrent_dump_file_writers_do_not_collide(tmp_path):
+    path = str(tmp_path / "users.json")
+    errors = []
+
+    def writer(worker):
+        try:
+            for n in range(50):
+                serialization.dump_file(path, {'worker': worker, 'n': n, 'padding': "x" * 4096})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert serialization.load_file(path)['n'] == 49
+    # 每次写入使用独立的临时文件，全部替换后不留下临时文件
+    assert os.listdir(tmp_path) == ["users.json"]
+
+
+def test_failed_dump_file_keeps_original(tmp_path, monkeypatch):
+    path = str(tmp_path / "users.json")
+    serialization.dump_file(path, {'version': 1})
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(serialization.os, 'replace', fail)
+    with pytest.raises(OSError):
+        serialization.dump_file(path, {'version': 2})
+    monkeypatch.undo()
+    assert serialization.load_file(path) == {'version': 1}
+    assert os.listdir(tmp_path) == ["users.json"]
@@ -0,0 +1,31 @@
+import pytest
+
+import chate2e.server.app as server_app
+from chate2e.server.group_registry import GroupRegistry
+from chate2e.server.message_manager import MessageManager
+from chate2e.server.prekey_ledger import PrekeyLedger
+from chate2e.server.session_registry import SessionRegistry
+from chate2e.server.user import User
+
+
+@pytest.fixture
+def users():
+    """服务器上注册的用户，测试模块可以覆盖（如需要更多用户或带Bundle的用户）"""
+    return {name: User(name, name) for name in ("alice", "bob")}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, users):
+    """全局chat_server换成隔离的空状态（数据文件都在tmp_path中）后的Flask测试客户端
+
+    测试模块需要额外的替换（如限流器）时，定义同名fixture依赖本fixture再修改。
+    """
+    chat_server = server_app.chat_server
+    monkeypatch.setattr(server_app, 'message_manager', MessageManager())
+    monkeypatch.setattr(chat_server, 'pending_events', {})
+    monkeypatch.setattr(chat_server, 'users_file', str(tmp_path / "users.json"))
+    monkeypatch.setattr(chat_server, 'users', users)
+    monkeypatch.setattr(chat_server, 'session_registry', SessionRegistry(str(tmp_path / "sessions.log")))
+    monkeypatch.setattr(chat_server, 'prekey_ledger', PrekeyLedger(str(tmp_path / "prekeys.log")))
+    monkeypatch.setattr(chat_server, 'group_registry', GroupRegistry(str(tmp_path / "groups.log")))
+    return server_app.app.test_client()
@@ -0,0 +1,143 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+import chate2e.server.app as server_app
+from chate2e.server.blob_store import BlobStore
+
+
+def upload(store: BlobStore, data: bytes, recipients=("bob",)) -> str:
+    upload_id = store.create_upload(len(data), "alice", recipients)
+    store.write_chunk(upload_id, 0, io.BytesIO(data))
+    return store.complete_upload(upload_id)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+def test_objects_are_content_addressed_and_sharded(store):
+    data = os.urandom(1000)
+    blob_id = upload(store, data)
+    assert blob_id == hashlib.sha256(data).hexdigest()
+    path = store.open_blob(blob_id)
+    assert path.endswith(os.path.join(blob_id[:2], blob_id[2:4], blob_id))
+
+
+def test_hash_recomputed_when_incremental_state_lost(store):
+    data = os.urandom(3000)
+    upload_id = store.create_upload(len(data), "alice", ["bob"])
+    store.write_chunk(upload_id, 0, io.BytesIO(data[:1000]))
+    store._hashers.clear()  # 模拟服务器重启
+    store.write_chunk(upload_id, 1000, io.BytesIO(data[1000:]))
+    assert store.complete_upload(upload_id) == hashlib.sha256(data).hexdigest()
+
+
+def test_duplicate_uploads_are_deduplicated(store):
+    data = os.urandom(500)
+    first = upload(store, data, ["bob"])
+    second = upload(store, data, ["carol"])
+    assert first == second
+    assert os.listdir(store.uploads_dir) == []
+    assert store._read_object_meta(first)['pending'] == ["bob", "carol"]
+
+
+def test_gc_after_all_recipients_fetch(store):
+    blob_id = upload(store, b"ciphertext", ["bob", "carol"])
+    assert not store.acknowledge(blob_id, "mallory")
+    assert store.acknowledge(blob_id, "bob")
+    fetched_at = store._read_object_meta(blob_id)['fetched_at']
+    assert fetched_at is None
+    assert store.collect_garbage() == []
+
+    assert store.acknowledge(blob_id, "carol")
+    fetched_at = store._read_object_meta(blob_id)['fetched_at']
+    assert store.collect_garbage(now=fetched_at + 1) == []
+    assert store.collect_garbage(now=fetched_at + store.FETCHED_GRACE + 1) == [blob_id]
+    assert store.open_blob(blob_id) is None
+
+
+def test_unfetched_objects_expire(store):
+    blob_id = upload(store, b"ciphertext", ["bob"])
+    created = store._read_object_meta(blob_id)['created_at']
+    assert store.collect_garbage(now=created + store.MAX_TTL + 1) == [blob_id]
+
+
+def test_reupload_restarts_expiry(store, monkeypatch):
+    data = b"ciphertext"
+    blob_id = upload(store, data, ["bob"])
+    assert store.acknowledge(blob_id, "bob")
+    fetched_at = store._read_object_meta(blob_id)['fetched_at']
+
+    later = fetched_at + store.FETCHED_GRACE + 1
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert upload(store, data, ["carol"]) == blob_id
+    meta = store._read_object_meta(blob_id)
+    assert meta['created_at'] == later and meta['fetched_at'] is None
+    assert store.collect_garbage(now=later + 1) == []
+
+
+def test_start_gc_only_once(store):
+    assert store.start_gc(interval=3600)
+    assert not store.start_gc(interval=3600)
+    store._gc_timer.cancel()
+
+
+def test_http_ack_requires_token(store, monkeypatch):
+    monkeypatch.setattr(server_app, 'blob_store', store)
+    blob_id = upload(store, b"ciphertext", ["bob"])
+    client = server_app.app.test_client()
+
+    response = client.post(f'/blobs/{blob_id}/ack', json={'user_id': "bob"})
+    assert response.status_code == 400
+    response = client.post(f'/blobs/{blob_id}/ack',
+                           json={'user_id': "bob", 'token': store.ack_token(blob_id, "mallory")})
+    assert response.status_code == 403
+    assert store._read_object_meta(blob_id)['pending'] == ["bob"]
+
+    response = client.post(f'/blobs/{blob_id}/ack',
+                           json={'user_id': "bob", 'token': store.ack_token(blob_id, "bob")})
+    assert response.status_code == 200 and response.get_json()['acknowledged']
+    assert store._read_object_meta(blob_id)['pending'] == []
+
+    # 重启后令牌仍然有效
+    assert BlobStore(store.root).ack_token(blob_id, "bob") == store.ack_token(blob_id, "bob")
+
+
+def test_iter_range_yields_bytes(store):
+    # WSGI服务器只接受bytes
+    data = os.urandom(store.SERVE_BUFFER + 10)
+    path = store.open_blob(upload(store, data))
+    pieces = list(store.iter_range(path, 5, len(data)))
+    assert all(type(piece) is bytes for piece in pieces)
+    assert b"".join(pieces) == data[5:]
+
+
+def test_http_range_reads(store, monkeypatch):
+    monkeypatch.setattr(server_app, 'blob_store', store)
+    data = os.urandom(600 * 1024)
+    blob_id = upload(store, data)
+    client = server_app.app.test_client()
+
+    response = client.get(f'/blobs/{blob_id}')
+    assert response.status_code == 200
+    assert response.data == data
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+    response = client.get(f'/blobs/{blob_id}', headers={'Range': 'bytes=100-300000'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-300000/{len(data)}'
+    assert response.data == data[100:300001]
+
+    response = client.get(f'/blobs/{blob_id}', headers={'Range': 'bytes=-10'})
+    assert response.data == data[-10:]
+
+    response = client.get(f'/blobs/{blob_id}', headers={'Range': f'bytes={len(data)}-'})
+    assert response.status_code == 416
+
+    response = client.get(f'/blobs/{blob_id}', headers={'If-None-Match': f'"{blob_id}"'})
+    assert response.status_code == 304
@@ -0,0 +1,91 @@
+import pytest
+
+import chate2e.server.app as server_app
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+from chate2e.model.message import Encryption, Message, MessageType, PRIMARY_DEVICE_ID
+from chate2e.server.message_manager import MessageManager
+from chate2e.server.user import User
+
+
+def make_bundle(user_id: str):
+    protocol = SignalProtocol()
+    protocol.initialize_identity(user_id)
+    return protocol.create_bundle()
+
+
+def test_devices_have_separate_prekey_pools():
+    user = User("bob", "bob")
+    user.set_bundle(make_bundle("bob"))
+    user.set_bundle(make_bundle("bob"), "laptop")
+    primary_key = user.claim_pre_key()
+    laptop_key = user.claim_pre_key("laptop")
+    assert primary_key in user.bundle.one_time_pre_keys_pub
+    assert laptop_key in user.get_device("laptop").bundle.one_time_pre_keys_pub
+    assert laptop_key not in user.used_pre_keys
+    assert [device.device_id for device in user.active_devices()] == [PRIMARY_DEVICE_ID, "laptop"]
+
+    etag = user.etag
+    assert user.remove_device("laptop")
+    assert not user.remove_device(PRIMARY_DEVICE_ID)
+    assert user.etag != etag
+
+
+def test_offline_queue_per_device():
+    assert MessageManager.queue_key("bob") == "bob"
+    assert MessageManager.queue_key("bob", PRIMARY_DEVICE_ID) == "bob"
+    assert MessageManager.queue_key("bob", "laptop") == "bob/laptop"
+
+
+@pytest.fixture
+def users():
+    users = {name: User(name, name) for name in ("alice", "bob")}
+    for name, user in users.items():
+        user.set_bundle(make_bundle(name))
+    return users
+
+
+def device_message(session_id: str, receiver_device_id: str) -> dict:
+    return Message(
+        message_id=Message.generate_id(),
+        sender_id="alice",
+        session_id=session_id,
+        receiver_id="bob",
+        encrypted_content=b"ciphertext",
+        message_type=MessageType.MESSAGE,
+        encryption=Encryption("AES-GCM", b"iv", b"tag", True),
+        sender_device_id=PRIMARY_DEVICE_ID,
+        receiver_device_id=receiver_device_id
+    ).to_dict()
+
+
+def test_register_device_and_list_bundles(client):
+    response = client.put("/devices/bob/laptop", json={'key_bundle': make_bundle("bob").to_dict()})
+    assert response.status_code == 200
+    devices = client.get("/key_bundle/bob/devices").get_json()['devices']
+    assert [device['device_id'] for device in devices] == [PRIMARY_DEVICE_ID, "laptop"]
+
+    claimed = client.post("/key_bundle/bob/prekey", json={'device_id': "laptop"}).get_json()
+    assert claimed['version'] == devices[1]['version']
+    assert client.post("/key_bundle/bob/prekey", json={'device_id': "tablet"}).status_code == 404
+
+    assert client.delete("/devices/bob/laptop").status_code == 200
+    assert client.delete(f"/devices/bob/{PRIMARY_DEVICE_ID}").status_code == 404
+
+
+def test_batch_is_queued_per_device(client):
+    client.put("/devices/bob/laptop", json={'key_bundle': make_bundle("bob").to_dict()})
+    session_id = server_app.chat_server.get_or_create_session("alice", "bob")
+    response = client.post("/handle_messages", json={'messages': [
+        device_message(session_id, PRIMARY_DEVICE_ID),
+        device_message(session_id, "laptop"),
+        device_message("forged", "laptop"),
+    ]})
+    results = response.get_json()['results']
+    assert [result['code'] for result in results] == [200, 200, 403]
+
+    primary = client.get("/messages/offline/bob").get_json()['messages']
+    laptop = client.get("/messages/offline/bob", query_string={'device_id': "laptop"}).get_json()['messages']
+    assert [m['header']['receiver_device_id'] for m in primary] == [PRIMARY_DEVICE_ID]
+    assert [m['header']['receiver_device_id'] for m in laptop] == ["laptop"]
+
+    assert client.post("/handle_messages", json={'messages': {}}).status_code == 400
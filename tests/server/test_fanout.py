@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from chate2e.server.fanout import FanoutEngine
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event, payload, socket_ids):
+        with self._lock:
+            self.calls.append((event, payload, list(socket_ids)))
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+def make_engine(recorder, sockets, batch_size=3):
+    return FanoutEngine(sockets_of=lambda user_id: sockets.get(user_id, []),
+                        emit=recorder, workers=2, batch_size=batch_size)
+
+
+def test_batches_share_one_payload(recorder):
+    sockets = {f"u{i}": [f"s{i}"] for i in range(7)}
+    sockets["u0"].append("s0b")
+    engine = make_engine(recorder, sockets)
+    payload = {'header': {}}
+
+    delivered, offline = engine.fanout('new_message', payload, list(sockets) + ["ghost"], exclude="u6")
+
+    assert sorted(delivered) == [f"u{i}" for i in range(6)]
+    assert offline == ["ghost"]
+    # 7个连接分3批，每批一次emit，负载对象复用
+    assert sorted(len(ids) for _, _, ids in recorder.calls) == [1, 3, 3]
+    assert all(p is payload for _, p, _ in recorder.calls)
+    sent = sorted(s for _, _, ids in recorder.calls for s in ids)
+    assert sent == sorted(["s0", "s0b", "s1", "s2", "s3", "s4", "s5"])
+
+
+def test_failed_batch_does_not_stop_others(recorder):
+    sockets = {f"u{i}": [f"s{i}"] for i in range(6)}
+
+    def flaky(event, payload, socket_ids):
+        if "s0" in socket_ids:
+            raise RuntimeError("boom")
+        recorder(event, payload, socket_ids)
+
+    engine = FanoutEngine(sockets_of=lambda user_id: sockets.get(user_id, []), emit=flaky, batch_size=3)
+    delivered, offline = engine.fanout('new_message', {}, list(sockets))
+    assert [ids for _, _, ids in recorder.calls] == [["s3", "s4", "s5"]]
+    # 失败批次中的成员转为离线投递
+    assert delivered == ["u3", "u4", "u5"]
+    assert offline == ["u0", "u1", "u2"]
+
+
+def test_member_with_socket_in_failed_worker_batch_goes_offline(recorder):
+    sockets = {"a": ["s1", "s2", "s3", "s4"], "b": ["s5"]}
+
+    def flaky(event, payload, socket_ids):
+        if "s4" in socket_ids:
+            raise RuntimeError("boom")
+        recorder(event, payload, socket_ids)
+
+    engine = FanoutEngine(sockets_of=lambda user_id: sockets.get(user_id, []), emit=flaky, batch_size=3)
+    delivered, offline = engine.fanout('new_message', {}, ["a", "b"])
+    assert delivered == []
+    assert offline == ["a", "b"]
+
+
+def test_stats(recorder):
+    engine = make_engine(recorder, {"a": ["sa"], "b": ["sb"]})
+    engine.fanout('new_message', {}, ["a", "b", "c"])
+    engine.fanout('new_message', {}, ["a"])
+    stats = engine.stats()
+    assert stats['fanouts'] == 2
+    assert stats['sockets'] == 3
+    assert stats['batches'] == 2
+    assert stats['offline_members'] == 1
+    assert stats['latency_p99_ms'] >= stats['latency_p50_ms'] >= 0
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from chate2e.server.friend_graph import FriendGraph
+
+
+def test_add_and_remove_are_symmetric(tmp_path):
+    graph = FriendGraph(str(tmp_path / "friends.log"))
+    assert graph.add_friend("alice", "bob")
+    assert not graph.add_friend("bob", "alice")
+    assert not graph.add_friend("alice", "alice")
+    assert graph.are_friends("bob", "alice")
+    assert graph.friends_of("alice") == ["bob"]
+
+    assert graph.remove_friend("bob", "alice")
+    assert not graph.remove_friend("alice", "bob")
+    assert graph.friends_of("alice") == []
+    assert graph.edge_count() == 0
+
+
+def test_changes_persist_incrementally(tmp_path):
+    path = tmp_path / "friends.log"
+    graph = FriendGraph(str(path))
+    graph.add_friend("alice", "bob")
+    graph.add_friend("alice", "carol")
+    graph.remove_friend("alice", "bob")
+
+    # 每次变更只追加一行
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 3
+
+    reloaded = FriendGraph(str(path))
+    assert reloaded.friends_of("alice") == ["carol"]
+    assert reloaded.friends_of("bob") == []
+
+
+def test_truncated_line_is_ignored(tmp_path):
+    path = tmp_path / "friends.log"
+    graph = FriendGraph(str(path))
+    graph.add_friend("alice", "bob")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "a": "alice"')
+
+    reloaded = FriendGraph(str(path))
+    assert reloaded.edges() == [("alice", "bob")]
+
+
+def test_compact_rewrites_log(tmp_path):
+    path = tmp_path / "friends.log"
+    graph = FriendGraph(str(path))
+    for _ in range(50):
+        graph.add_friend("alice", "bob")
+        graph.remove_friend("alice", "bob")
+    graph.add_friend("alice", "carol")
+
+    # 启动时冗余记录过多会自动压缩
+    reloaded = FriendGraph(str(path))
+    assert reloaded.edges() == [("alice", "carol")]
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+
+
+def test_failed_compact_keeps_log(tmp_path, monkeypatch):
+    path = tmp_path / "friends.log"
+    graph = FriendGraph(str(path))
+    graph.add_friend("alice", "bob")
+    graph.add_friend("alice", "carol")
+    graph.remove_friend("alice", "bob")
+    before = path.read_bytes()
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, 'replace', fail)
+    with pytest.raises(OSError):
+        graph.compact()
+    assert path.read_bytes() == before
+    assert os.listdir(tmp_path) == ["friends.log"]
@@ -0,0 +1,83 @@
+import pytest
+
+import chate2e.server.app as server_app
+from chate2e.model.message import Encryption, Message, MessageType
+from chate2e.server.group_registry import GroupRegistry
+from chate2e.server.user import User
+
+
+def test_membership_and_reverse_index(tmp_path):
+    registry = GroupRegistry(str(tmp_path / "groups.log"))
+    group_id = registry.create_group("alice", "周末", ["bob", "carol", "bob"])
+    assert sorted(registry.members_of(group_id)) == ["alice", "bob", "carol"]
+    assert registry.groups_of("bob") == [group_id]
+
+    assert registry.remove_member(group_id, "bob")
+    assert not registry.remove_member(group_id, "bob")
+    assert registry.groups_of("bob") == []
+    assert not registry.is_member(group_id, "bob")
+    assert registry.add_member(group_id, "dave")
+    assert registry.get_group(group_id) == {
+        'group_id': group_id, 'name': "周末", 'owner': "alice", 'members': ["alice", "carol", "dave"]
+    }
+
+
+def test_log_replay_and_compact(tmp_path):
+    path = tmp_path / "groups.log"
+    registry = GroupRegistry(str(path))
+    group_id = registry.create_group("alice", "g", ["bob"])
+    for _ in range(40):
+        registry.remove_member(group_id, "bob")
+        registry.add_member(group_id, "bob")
+    registry.remove_member(group_id, "alice")
+
+    reloaded = GroupRegistry(str(path))
+    assert reloaded.members_of(group_id) == ["bob"]
+    # 创建记录 + 一个成员
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 2
+
+
+@pytest.fixture
+def users():
+    return {name: User(name, name) for name in ("alice", "bob", "carol", "eve")}
+
+
+def broadcast(group_id: str, sender_id: str) -> dict:
+    message = Message(
+        message_id=Message.generate_id(),
+        sender_id=sender_id,
+        session_id=group_id,
+        receiver_id=group_id,
+        encrypted_content=b"ciphertext",
+        message_type=MessageType.BROADCAST,
+        encryption=Encryption("AES-GCM+Ed25519", b"iv", b"tag", False, key_id=0, counter=0, signature=b"sig")
+    )
+    return message.to_dict()
+
+
+def test_broadcast_is_fanned_out_to_offline_members(client):
+    response = client.post('/groups', json={'user_id': "alice", 'name': "g", 'members': ["bob", "carol"]})
+    group_id = response.get_json()['group']['group_id']
+
+    response = client.post('/handle_message', json=broadcast(group_id, "alice"))
+    assert response.get_json()['queued'] == 2
+    manager = server_app.message_manager
+    assert manager.get_offline_count("bob") == manager.get_offline_count("carol") == 1
+    assert manager.get_offline_count("alice") == 0
+    # 服务器保存的是收到的原始消息，完整解析后发送者密钥字段不变
+    stored = manager.get_offline_messages("bob")[0].to_message()
+    assert stored.encryption.counter == 0 and stored.encryption.signature == b"sig"
+
+    response = client.post('/handle_message', json=broadcast(group_id, "eve"))
+    assert response.status_code == 403
+
+
+def test_only_owner_removes_others(client):
+    group_id = client.post('/groups', json={'user_id': "alice", 'members': ["bob", "carol"]}) \
+        .get_json()['group']['group_id']
+    response = client.post(f'/groups/{group_id}/members/remove', json={'user_id': "bob", 'member_id': "carol"})
+    assert response.status_code == 403
+    response = client.post(f'/groups/{group_id}/members/remove', json={'user_id': "bob", 'member_id': "bob"})
+    assert response.get_json()['group']['members'] == ["alice", "carol"]
+    # 被移除者离线，群组变更事件暂存待补发
+    assert server_app.chat_server.pending_events["bob"][-1][0] == 'group_updated'
@@ -0,0 +1,63 @@
+import pytest
+
+from chate2e.model.message import Message, MessageType
+from chate2e.server.message_manager import MessageManager
+
+
+def make_message(index: int, receiver_id: str = "bob") -> Message:
+    return Message(
+        message_id=f"msg{index}",
+        sender_id="alice",
+        session_id="session1",
+        receiver_id=receiver_id,
+        encrypted_content=b"content",
+        message_type=MessageType.MESSAGE
+    )
+
+
+@pytest.fixture
+def manager():
+    manager = MessageManager()
+    for i in range(25):
+        manager.add_offline_message(make_message(i))
+    manager.add_offline_message(make_message(99, receiver_id="carol"))
+    return manager
+
+
+def test_offline_paging_with_cursor(manager):
+    page, cursor, has_more = manager.get_offline_page("bob", 0, 10)
+    assert [m.header.message_id for m in page] == [f"msg{i}" for i in range(10)]
+    assert has_more
+
+    page, cursor, has_more = manager.get_offline_page("bob", cursor, 10)
+    assert page[0].header.message_id == "msg10"
+
+    page, cursor, has_more = manager.get_offline_page("bob", cursor, 10)
+    assert len(page) == 5
+    assert not has_more
+
+    # 页面读取不会删除消息
+    assert manager.get_offline_count("bob") == 25
+
+
+def test_ack_removes_up_to_cursor(manager):
+    _, cursor, _ = manager.get_offline_page("bob", 0, 10)
+    assert manager.ack_offline_messages("bob", cursor) == 10
+    assert manager.get_offline_count("bob") == 15
+
+    page, _, _ = manager.get_offline_page("bob", 0, 100)
+    assert page[0].header.message_id == "msg10"
+
+    # 重复确认是幂等的，且不影响其他用户
+    assert manager.ack_offline_messages("bob", cursor) == 0
+    assert manager.get_offline_count("carol") == 1
+
+
+def test_sequence_survives_full_ack(manager):
+    _, cursor, _ = manager.get_offline_page("bob", 0, 100)
+    manager.ack_offline_messages("bob", cursor)
+    manager.add_offline_message(make_message(100))
+
+    page, new_cursor, _ = manager.get_offline_page("bob", cursor, 10)
+    assert [m.header.message_id for m in page] == ["msg100"]
+    assert new_cursor > cursor
@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+import chate2e.server.app as server_app
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+from chate2e.model.message import Encryption, Message, MessageType
+from chate2e.server import metrics
+from chate2e.server.metrics import MetricsRegistry
+from chate2e.server.user import User
+
+
+def test_counter_sums_thread_shards():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_events', '事件数')
+
+    def work():
+        for _ in range(10000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.value() == 80000
+    assert 'test_events_total 80000' in registry.exposition()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_seconds', '耗时', ['op'], buckets=(0.1, 1.0))
+    child = histogram.labels(op='save')
+    for value in (0.05, 0.1, 0.5, 3.0):
+        child.observe(value)
+    text = registry.exposition()
+    assert 'test_seconds_bucket{op="save",le="0.1"} 2' in text
+    assert 'test_seconds_bucket{op="save",le="1"} 3' in text
+    assert 'test_seconds_bucket{op="save",le="+Inf"} 4' in text
+    assert 'test_seconds_count{op="save"} 4' in text
+    assert 'test_seconds_sum{op="save"} 3.65' in text
+
+    with pytest.raises(ValueError):
+        registry.histogram('test_seconds', '重复')
+
+
+def test_gauge_is_computed_at_scrape():
+    registry = MetricsRegistry()
+    depth = {'a': 3}
+    registry.gauge('test_depth', '深度', lambda: [((user,), value) for user, value in depth.items()], ['user'])
+    depth['b'] = 1
+    text = registry.exposition()
+    assert 'test_depth{user="a"} 3' in text
+    assert 'test_depth{user="b"} 1' in text
+
+
+def test_incomplete_metric_cannot_be_created():
+    class NoSamples(metrics._SampledMetric):
+        def _new_child(self):
+            return NoSamples(self.name, self.documentation)
+
+    with pytest.raises(TypeError):
+        NoSamples('test_broken', '缺少样本')
+
+
+@pytest.fixture
+def users():
+    protocol = SignalProtocol()
+    protocol.initialize_identity("bob")
+    bob = User("bob", "bob")
+    bob.set_bundle(protocol.create_bundle())
+    return {"alice": User("alice", "alice"), "bob": bob}
+
+
+def test_metrics_endpoint(client):
+    undelivered = metrics.MESSAGES_UNDELIVERED.value()
+    failures = metrics.SESSION_VALIDATION_FAILURES.value()
+    session_id = server_app.chat_server.get_or_create_session("alice", "bob")
+    for sid in (session_id, "forged"):
+        client.post("/handle_message", json=Message(
+            message_id=Message.generate_id(),
+            sender_id="alice",
+            session_id=sid,
+            receiver_id="bob",
+            encrypted_content=b"ciphertext",
+            message_type=MessageType.MESSAGE,
+            encryption=Encryption("AES-GCM", b"iv", b"tag", True)
+        ).to_dict())
+    client.get("/key_bundle/bob")
+
+    response = client.get("/metrics")
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    text = response.get_data(as_text=True)
+    assert metrics.MESSAGES_UNDELIVERED.value() == undelivered + 1
+    assert metrics.SESSION_VALIDATION_FAILURES.value() == failures + 1
+    assert '# TYPE chate2e_messages_total counter' in text
+    assert 'chate2e_prekey_pool_depth{user="bob",device="primary"} 10' in text
+    assert 'chate2e_handle_message_seconds_count{endpoint="handle_message"}' in text
+    assert 'chate2e_connected_sockets ' in text
@@ -0,0 +1,109 @@
+import pytest
+
+from chate2e.server.presence import OFFLINE, ONLINE, PresenceService
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event, payload, socket_id):
+        self.events.append((event, payload, socket_id))
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+@pytest.fixture
+def service(recorder):
+    # alice和bob互为联系人，carol只是bob的联系人
+    contacts = {
+        'alice': ['bob'],
+        'bob': ['alice', 'carol'],
+        'carol': ['bob'],
+        'dave': [],
+    }
+    sockets = {'alice': ['sa'], 'bob': ['sb1', 'sb2'], 'carol': ['sc'], 'dave': ['sd']}
+    return PresenceService(
+        contacts_of=lambda user_id: contacts.get(user_id, []),
+        sockets_of=lambda user_id: sockets.get(user_id, []),
+        emit=recorder,
+        window=10  # 测试中手动flush
+    )
+
+
+def test_connection_counting(service):
+    assert service.connect('bob')
+    assert not service.connect('bob')
+    assert service.connection_count('bob') == 2
+    assert not service.disconnect('bob')
+    assert service.is_online('bob')
+    assert service.disconnect('bob')
+    assert not service.is_online('bob')
+    assert service.status_of(['bob']) == {'bob': OFFLINE}
+
+
+def test_changes_are_batched_per_watcher(service, recorder):
+    service.connect('bob')
+    service.flush()
+    recorder.events.clear()
+
+    service.connect('alice')
+    service.connect('carol')
+    service.connect('dave')
+    sent = service.flush()
+
+    # bob的两个连接各收到一条包含alice和carol的批量事件；dave没有观察者
+    assert sent == 2
+    assert {socket_id for _, _, socket_id in recorder.events} == {'sb1', 'sb2'}
+    updates = recorder.events[0][1]['updates']
+    assert sorted(u['user_id'] for u in updates) == ['alice', 'carol']
+    assert all(u['status'] == ONLINE for u in updates)
+
+
+def test_flapping_within_window_is_coalesced(service, recorder):
+    service.connect('bob')
+    service.flush()
+    recorder.events.clear()
+
+    service.connect('alice')
+    service.disconnect('alice')
+    service.connect('alice')
+    service.flush()
+    assert len(recorder.events) == 2
+    assert recorder.events[0][1]['updates'] == [{'user_id': 'alice', 'status': ONLINE}]
+
+    recorder.events.clear()
+    service.disconnect('alice')
+    service.connect('alice')
+    assert service.flush() == 0
+    assert recorder.events == []
+
+
+def test_offline_watchers_are_skipped(service, recorder):
+    service.connect('alice')
+    assert service.flush() == 0
+    assert recorder.events == []
+
+
+def test_zero_window_flushes_immediately(recorder):
+    service = PresenceService(
+        contacts_of=lambda user_id: ['bob'] if user_id == 'alice' else [],
+        sockets_of=lambda user_id: ['sb'],
+        emit=recorder,
+        window=0
+    )
+    service.connect('bob')
+    service.connect('alice')
+    assert recorder.events == [('presence', {'updates': [{'user_id': 'alice', 'status': ONLINE}]}, 'sb')]
+
+
+def test_snapshot(service, recorder):
+    service.connect('alice')
+    service.send_snapshot('bob', ['alice', 'carol'], 'sb1')
+    assert recorder.events == [('presence', {'updates': [
+        {'user_id': 'alice', 'status': ONLINE},
+        {'user_id': 'carol', 'status': OFFLINE},
+    ]}, 'sb1')]
@@ -0,0 +1,75 @@
+import os
+import pstats
+import time
+
+import pytest
+
+import chate2e.server.app as server_app
+from chate2e.server.profiling import RequestProfiler
+
+TOKEN = "secret-admin-token"
+
+
+def slow_handler():
+    time.sleep(0.05)
+
+
+def test_sampler_collects_folded_stacks(tmp_path):
+    profiler = RequestProfiler(str(tmp_path))
+    handler = profiler.profiled('socket.slow')(slow_handler)
+    handler()  # 关闭时不采样
+    assert profiler.status()['labels'] == []
+
+    profiler.start('sample', interval=0.001)
+    handler()
+    written = profiler.stop()
+
+    with open(written['socket.slow'], encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) > 0
+    assert stack.split(';')[-1].startswith('slow_handler (test_profiling.py:')
+
+
+def test_rate_limits_profiled_requests(tmp_path):
+    profiler = RequestProfiler(str(tmp_path))
+    with pytest.raises(ValueError):
+        profiler.start('sample', rate=0)
+    with pytest.raises(ValueError):
+        profiler.start('trace')
+    profiler.start('cprofile', rate=1.0)
+    token = profiler.begin('http.test')
+    # cProfile同一时刻只剖析一个请求
+    assert profiler.begin('http.test') is None
+    profiler.end(token)
+    profiler.stop()
+
+
+@pytest.fixture
+def admin(tmp_path, monkeypatch):
+    monkeypatch.setattr(server_app.config, 'ADMIN_TOKEN', TOKEN)
+    monkeypatch.setattr(server_app.profiler, 'output_dir', str(tmp_path))
+    yield server_app.app.test_client()
+    server_app.profiler.stop()
+
+
+def test_admin_toggle_requires_token(admin, monkeypatch):
+    assert admin.post('/admin/profiling', json={'mode': 'sample'}).status_code == 403
+    assert admin.get('/admin/profiling', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    monkeypatch.setattr(server_app.config, 'ADMIN_TOKEN', None)
+    assert admin.get('/admin/profiling', headers={'X-Admin-Token': ''}).status_code == 403
+
+
+def test_cprofile_writes_stats_per_endpoint(admin, tmp_path):
+    headers = {'X-Admin-Token': TOKEN}
+    response = admin.post('/admin/profiling', json={'mode': 'cprofile', 'rate': 1}, headers=headers)
+    assert response.get_json()['profiling']['mode'] == 'cprofile'
+    for _ in range(3):
+        assert admin.get('/metrics').status_code == 200
+
+    files = admin.post('/admin/profiling', json={'mode': 'off'}, headers=headers).get_json()['files']
+    path = files['http.get_metrics']
+    assert os.path.dirname(path) == str(tmp_path)
+    stats = pstats.Stats(path)
+    assert any(name == 'exposition' for _, _, name in stats.stats)
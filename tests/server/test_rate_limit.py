@@ -0,0 +1,166 @@
+import pytest
+
+import chate2e.server.app as server_app
+from chate2e.model.message import Encryption, Message, MessageType
+from chate2e.server import metrics
+from chate2e.server.rate_limit import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_burst_and_refill():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=2.0, burst=3.0, clock=clock)
+    assert [limiter.acquire("alice") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("alice") == pytest.approx(0.5)
+    # 其他键不受影响
+    assert limiter.acquire("bob") == 0.0
+
+    clock.now = 0.5
+    assert limiter.acquire("alice") == 0.0
+    assert limiter.acquire("alice", cost=2) == pytest.approx(1.0)
+    # 空闲足够久后桶被补满，不会超过容量
+    clock.now = 100.0
+    assert limiter.acquire("alice", cost=3) == 0.0
+    assert limiter.acquire("alice") > 0
+
+
+def test_refund_restores_tokens_up_to_burst():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=1.0, burst=2.0, clock=clock)
+    assert limiter.acquire("alice", cost=2) == 0.0
+    limiter.refund("alice", cost=2)
+    assert limiter.acquire("alice", cost=2) == 0.0
+    limiter.refund("alice", cost=5)
+    assert limiter.acquire("alice", cost=3) > 0
+    # 不存在的键不创建桶
+    limiter.refund("ghost")
+    assert len(limiter) == 1
+
+
+def test_idle_keys_are_evicted():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=10.0, burst=10.0, clock=clock)
+    for index in range(1000):
+        clock.now = index * 0.01
+        limiter.acquire(f"user{index}")
+    # 空闲超过 burst/rate = 1秒 的键已被淘汰
+    assert len(limiter) <= 101
+    clock.now = 100.0
+    limiter.acquire("late")
+    assert len(limiter) == 1
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    monkeypatch.setattr(server_app, 'user_limiter', RateLimiter(rate=0.01, burst=2))
+    monkeypatch.setattr(server_app, 'address_limiter', RateLimiter(rate=1000, burst=1000))
+    return client
+
+
+def make_message(session_id: str, sender_id: str = "alice", receiver_id: str = "bob") -> dict:
+    return Message(
+        message_id=Message.generate_id(),
+        sender_id=sender_id,
+        session_id=session_id,
+        receiver_id=receiver_id,
+        encrypted_content=b"ciphertext",
+        message_type=MessageType.MESSAGE,
+        encryption=Encryption("AES-GCM", b"iv", b"tag", True)
+    ).to_dict()
+
+
+def test_handle_message_returns_429_per_sender(client):
+    session_id = server_app.chat_server.get_or_create_session("alice", "bob")
+    limited = metrics.RATE_LIMITED_MESSAGE.value()
+    assert client.post("/handle_message", json=make_message(session_id)).status_code == 200
+    assert client.post("/handle_message", json=make_message(session_id)).status_code == 200
+    response = client.post("/handle_message", json=make_message(session_id))
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after'] > 0
+    assert metrics.RATE_LIMITED_MESSAGE.value() == limited + 1
+    # 另一个发送者有自己的令牌桶
+    assert client.post("/handle_message", json=make_message(session_id, "bob", "alice")).status_code == 200
+    # 批量发送按消息条数计费
+    batch = {'messages': [make_message(session_id, "bob", "alice") for _ in range(2)]}
+    assert client.post("/handle_messages", json=batch).status_code == 429
+
+
+def test_register_is_limited_per_address(client, monkeypatch):
+    monkeypatch.setattr(server_app, 'register_limiter', RateLimiter(rate=0.01, burst=1))
+    monkeypatch.setattr(server_app.chat_server, '_save_users', lambda: None)
+    monkeypatch.setattr(server_app.chat_server, 'username_map', {})
+    assert client.post("/register", json={'username': "carol"}).status_code == 200
+    response = client.post("/register", json={'username': "dave"}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert response.status_code == 200
+    assert client.post("/register", json={'username': "erin"}).status_code == 429
+
+
+def test_congested_receiver_applies_backpressure(client, monkeypatch):
+    chat_server = server_app.chat_server
+    session_id = chat_server.get_or_create_session("alice", "bob")
+    monkeypatch.setattr(chat_server, 'user_sockets', {"bob": {"sid-1", "sid-2"}})
+    backlog = {"sid-1": 10_000, "sid-2": 10_000}
+    monkeypatch.setattr(chat_server, 'emit_backlog', lambda socket_id: backlog[socket_id])
+    response = client.post("/handle_message", json=make_message(session_id))
+    assert response.status_code == 429
+    assert response.get_json()['message'] == '接收方繁忙，请稍后重试'
+    assert server_app.message_manager.get_offline_page("bob", 0, 10)[0] == []
+
+    # 只要还有一个连接能继续发送就正常投递
+    backlog["sid-2"] = 0
+    forwarded = []
+    monkeypatch.setattr(chat_server, 'forward_message', lambda message: forwarded.append(message) or True)
+    assert client.post("/handle_message", json=make_message(session_id)).status_code == 200
+    assert len(forwarded) == 1
+
+
+def test_rejected_request_consumes_no_address_tokens(client, monkeypatch):
+    session_id = server_app.chat_server.get_or_create_session("alice", "bob")
+    monkeypatch.setattr(server_app, 'address_limiter', RateLimiter(rate=0.01, burst=3))
+    assert client.post("/handle_message", json=make_message(session_id)).status_code == 200
+    assert client.post("/handle_message", json=make_message(session_id)).status_code == 200
+    # alice的令牌桶已空，被拒绝的请求不消耗地址配额
+    for _ in range(5):
+        assert client.post("/handle_message", json=make_message(session_id)).status_code == 429
+    assert client.post("/handle_message", json=make_message(session_id, "bob", "alice")).status_code == 200
+
+
+def test_socket_messages_are_limited_by_login_not_header(client, monkeypatch):
+    monkeypatch.setattr(server_app.chat_server, 'socket_sessions', {})
+    monkeypatch.setattr(server_app.chat_server, 'user_sockets', {})
+    session_id = server_app.chat_server.get_or_create_session("alice", "bob")
+    socket_client = server_app.socketio.test_client(server_app.app, flask_test_client=client)
+    try:
+        # 未登录的连接自称alice，不消耗alice的令牌桶
+        for _ in range(3):
+            assert socket_client.emit('new_message', make_message(session_id), callback=True)['status'] == 'success'
+        assert client.post("/handle_message", json=make_message(session_id)).status_code == 200
+
+        # 登录后按登录的用户限流，无论消息头写的是谁
+        socket_client.emit('login', {'user_id': "bob"}, callback=True)
+        forged = make_message(session_id, "alice", "bob")
+        assert socket_client.emit('new_message', forged, callback=True)['status'] == 'success'
+        assert socket_client.emit('new_message', forged, callback=True)['status'] == 'success'
+        assert 'retry_after' in socket_client.emit('new_message', forged, callback=True)
+        assert client.post("/handle_message", json=make_message(session_id)).status_code == 200
+    finally:
+        socket_client.disconnect()
+
+
+@pytest.mark.parametrize('trace', ["not-a-dict", {'stages': []}])
+def test_malformed_trace_is_a_bad_request(client, trace):
+    session_id = server_app.chat_server.get_or_create_session("alice", "bob")
+    data = make_message(session_id)
+    data['header']['trace'] = trace
+    assert client.post("/handle_message", json=data).status_code == 400
+    assert client.post("/handle_messages", json={'messages': [data]}).status_code == 400
+    assert client.post("/handle_message", json={'header': "garbage"}).status_code == 400
+    assert client.post("/handle_messages", json={'messages': [{'header': []}]}).status_code == 400
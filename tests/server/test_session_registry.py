@@ -0,0 +1,59 @@
+from chate2e.server.session_registry import SessionRegistry
+
+
+def test_get_or_create_is_symmetric(tmp_path):
+    registry = SessionRegistry(str(tmp_path / "sessions.log"))
+    session_id, created = registry.get_or_create("bob", "alice")
+    assert created
+    assert registry.get_or_create("alice", "bob") == (session_id, False)
+    assert registry.get("alice", "bob") == session_id
+    assert registry.participants(session_id) == ("alice", "bob")
+    assert registry.validate(session_id, "alice") and registry.validate(session_id, "bob")
+    assert not registry.validate(session_id, "mallory")
+    assert not registry.validate("forged", "alice")
+    assert registry.peers_of("alice") == {"bob": session_id}
+
+
+def test_sessions_survive_restart(tmp_path):
+    path = tmp_path / "sessions.log"
+    registry = SessionRegistry(str(path))
+    first, _ = registry.get_or_create("alice", "bob")
+    second, _ = registry.get_or_create("alice", "carol")
+    # 每个新会话只追加一行，已有会话不再写入
+    registry.get_or_create("bob", "alice")
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 2
+
+    reloaded = SessionRegistry(str(path))
+    # 第一次查询时才读取日志
+    assert not reloaded._loaded
+    assert reloaded.validate(first, "bob")
+    assert reloaded._loaded
+    assert reloaded.get("carol", "alice") == second
+    assert len(reloaded) == 2
+
+
+def test_ids_are_interned(tmp_path):
+    path = tmp_path / "sessions.log"
+    SessionRegistry(str(path)).get_or_create("alice", "bob")
+    reloaded = SessionRegistry(str(path))
+    session_id = reloaded.get("alice", "bob")
+    alice, bob = reloaded.participants(session_id)
+    # 同一个ID在会话表与用户索引中是同一个对象
+    assert alice is next(iter(reloaded.peers_of("bob")))
+    assert bob is next(iter(reloaded.peers_of("alice")))
+    assert reloaded.peers_of("alice")[bob] is session_id
+
+
+def test_truncated_line_does_not_swallow_next_session(tmp_path):
+    path = tmp_path / "sessions.log"
+    registry = SessionRegistry(str(path))
+    first, _ = registry.get_or_create("alice", "bob")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"id": "half", "a": "alice"')
+
+    reloaded = SessionRegistry(str(path))
+    second, _ = reloaded.get_or_create("alice", "carol")
+    again = SessionRegistry(str(path))
+    assert again.validate(first, "alice")
+    assert again.validate(second, "carol")
+    assert not again.validate("half", "alice")
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import chate2e.server.app as server_app
+from chate2e.model.message import Encryption, Message, MessageType
+from chate2e.utils.tracing import FileSpanExporter, OTLPSpanExporter, TraceContext, Tracer, set_tracer
+
+
+def make_message(session_id: str, trace=None) -> Message:
+    return Message(
+        message_id=Message.generate_id(),
+        sender_id="alice",
+        session_id=session_id,
+        receiver_id="bob",
+        encrypted_content=b"ciphertext",
+        message_type=MessageType.MESSAGE,
+        encryption=Encryption("AES-GCM", b"iv", b"tag", True),
+        trace=trace
+    )
+
+
+def test_trace_round_trips_in_header():
+    trace = TraceContext()
+    trace.mark('client.encrypt')
+    trace.mark('client.send')
+    restored = Message.deserialize(make_message("s1", trace).serialize())
+    assert restored.header.trace.trace_id == trace.trace_id
+    assert [stage for stage, _ in restored.header.trace.stages] == ['client.encrypt', 'client.send']
+    assert restored.header.trace.stages[0][1] <= restored.header.trace.stages[1][1]
+    # 没有追踪时消息头不带该字段
+    assert 'trace' not in make_message("s1").to_dict()['header']
+
+
+def test_disabled_tracer_starts_nothing():
+    assert Tracer().start() is None
+    assert Tracer(FileSpanExporter("unused"), sample_rate=0.0).start() is None
+
+
+def test_otlp_spans_cover_adjacent_stages():
+    payload = OTLPSpanExporter.to_otlp([{'trace_id': "t" * 32, 'source': "server",
+                                         'stages': [['a', 1], ['b', 5], ['c', 9]]}])
+    spans = payload['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert [(s['name'], s['startTimeUnixNano'], s['endTimeUnixNano']) for s in spans] == [
+        ('a->b', '1', '5'), ('b->c', '5', '9')]
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    tracer = Tracer(FileSpanExporter(str(tmp_path / "traces.jsonl")))
+    previous = set_tracer(tracer)
+    yield tracer
+    tracer.shutdown()
+    set_tracer(previous)
+
+
+def test_server_stamps_and_exports(client, tracer):
+    session_id = server_app.chat_server.get_or_create_session("alice", "bob")
+    trace = tracer.start()
+    trace.mark('client.send')
+    assert client.post("/handle_message", json=make_message(session_id, trace).to_dict()).status_code == 200
+    tracer.shutdown()
+
+    with open(tracer.exporter.path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert [record['source'] for record in records] == ['server']
+    assert [stage for stage, _ in records[0]['stages']] == [
+        'client.send', 'server.received', 'server.validated', 'server.queued', 'server.done']
+    # 离线保存的消息带着服务器阶段，接收方拉取后继续追加
+    queued = server_app.message_manager.get_offline_page("bob", 0, 10)[0][0]
+    assert queued.header.trace.trace_id == trace.trace_id
@@ -0,0 +1,79 @@
+import os
+
+import chate2e.server.app as server_app
+from chate2e.crypto.protocol.signal_protocol import SignalProtocol
+from chate2e.model.message import PRIMARY_DEVICE_ID
+from chate2e.server.prekey_ledger import PrekeyLedger
+from chate2e.server.user import User
+
+
+def make_user() -> User:
+    protocol = SignalProtocol()
+    protocol.initialize_identity("bob")
+    user = User("bob", "bob")
+    user.set_bundle(protocol.create_bundle())
+    return user
+
+
+def test_prekeys_are_claimed_once():
+    user = make_user()
+    total = len(user.bundle.one_time_pre_keys_pub)
+    claimed = {user.claim_pre_key() for _ in range(total)}
+    assert len(claimed) == total
+    assert user.claim_pre_key() is None
+    assert user.public_bundle().one_time_pre_keys_pub == frozenset()
+
+
+def test_fingerprint_ignores_prekey_consumption():
+    user = make_user()
+    fingerprint = user.fingerprint
+    user.claim_pre_key()
+    assert user.public_bundle().fingerprint() == fingerprint
+    assert user.to_dict()['used_pre_keys']
+
+
+def test_new_bundle_resets_claims_and_fingerprint():
+    user = make_user()
+    old_fingerprint = user.fingerprint
+    user.claim_pre_key()
+    protocol = SignalProtocol()
+    protocol.initialize_identity("bob")
+    user.set_bundle(protocol.create_bundle())
+    assert user.used_pre_keys == set()
+    assert user.fingerprint != old_fingerprint
+
+
+def test_ledger_round_trip_skips_torn_line(tmp_path):
+    ledger = PrekeyLedger(str(tmp_path / "prekeys.log"))
+    ledger.append("bob", "primary", b"k1")
+    with open(ledger.path, 'a', encoding='utf-8') as f:
+        f.write('{"user": "bob", "dev')
+    reopened = PrekeyLedger(ledger.path)
+    assert reopened.load() == [("bob", "primary", b"k1")]
+    reopened.append("bob", "laptop", b"k2")
+    assert reopened.load() == [("bob", "primary", b"k1"), ("bob", "laptop", b"k2")]
+    reopened.reset()
+    assert reopened.load() == []
+
+
+def test_claims_are_logged_and_replayed_on_restart(tmp_path, monkeypatch):
+    chat_server = server_app.chat_server
+    user = make_user()
+    bundle = user.bundle
+    monkeypatch.setattr(chat_server, 'users', {"bob": user})
+    monkeypatch.setattr(chat_server, 'users_file', str(tmp_path / "users.json"))
+    monkeypatch.setattr(chat_server, 'prekey_ledger', PrekeyLedger(str(tmp_path / "prekeys.log")))
+
+    key = chat_server.claim_one_time_prekey("bob")
+    # 分配只追加日志，不整体重写users.json
+    assert not os.path.exists(chat_server.users_file)
+    assert chat_server.prekey_ledger.load() == [("bob", PRIMARY_DEVICE_ID, key)]
+
+    # 模拟重启：users.json中没有这次分配，回放日志后恢复
+    restarted = User("bob", "bob")
+    restarted.set_bundle(bundle)
+    monkeypatch.setattr(chat_server, 'users', {"bob": restarted})
+    chat_server._replay_prekey_claims()
+    assert restarted.used_pre_keys == {key}
+    assert os.path.exists(chat_server.users_file)
+    assert chat_server.prekey_ledger.load() == []